@@ -0,0 +1,84 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Basic blocks that the simulator can run back to back
+
+A basic block here is a run of straight-line instructions (in the sense of
+shared.control_flow: no branches, jumps, LOOP/LOOPI or ECALL) that ends at
+the first instruction that isn't one, or just after the last instruction of
+a loop body. OTBNSim compiles each block into a function that runs it without
+going through the generic per-cycle code in OTBNSim.step().
+
+'''
+
+from typing import Callable, Dict, List, Optional, Set
+
+from shared.control_flow import loop_end_pc
+
+from .insn import BNWSRR, BNWSRW, CSRRS, CSRRW
+from .isa import OTBNInsn
+
+# A compiled block. This is called with a function that should be run at the
+# start of each cycle after the first (see OTBNSim.step_block) and returns the
+# number of cycles that it ran.
+BlockRunner = Callable[[Callable[[], None]], int]
+
+# Instructions that access CSRs and WSRs. These can talk to the outside world
+# (RND, URND, KMAC), which might need to respond on the very next cycle, so
+# they are always run through OTBNSim.step().
+_EXTERNAL_INSNS = (CSRRS, CSRRW, BNWSRR, BNWSRW)
+
+
+def _fits_in_block(insn: OTBNInsn) -> bool:
+    return (insn.has_bits and
+            insn.insn.straight_line and
+            not isinstance(insn, _EXTERNAL_INSNS))
+
+
+class BlockCache:
+    '''The compiled basic blocks of a program, keyed by their start PC
+
+    Blocks are found and compiled (with compile_block) the first time that
+    they are asked for.
+
+    '''
+    def __init__(self,
+                 program: List[OTBNInsn],
+                 compile_block: Callable[[int, List[OTBNInsn]],
+                                         BlockRunner]) -> None:
+        self._program = program
+        self._compile_block = compile_block
+        self._blocks: Dict[int, Optional[BlockRunner]] = {}
+
+        # The last instruction in each loop body. A block must stop after one
+        # of these, since the loop might jump back to its start.
+        self._loop_ends: Set[int] = set()
+        for idx, insn in enumerate(program):
+            end_pc = loop_end_pc(insn.insn, insn.op_vals, 4 * idx)
+            if end_pc is not None:
+                self._loop_ends.add(end_pc)
+
+    def get(self, pc: int) -> Optional[BlockRunner]:
+        '''Get the block that starts at pc
+
+        Returns None if the instruction at pc can't go in a block.
+
+        '''
+        try:
+            return self._blocks[pc]
+        except KeyError:
+            pass
+
+        insns = []
+        for word_pc in range(pc >> 2, len(self._program)):
+            insn = self._program[word_pc]
+            if not _fits_in_block(insn):
+                break
+            insns.append(insn)
+            if 4 * word_pc in self._loop_ends:
+                break
+
+        block = self._compile_block(pc, insns) if insns else None
+        self._blocks[pc] = block
+        return block
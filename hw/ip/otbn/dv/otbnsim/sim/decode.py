@@ -8,31 +8,14 @@
 
 '''Code to load instruction words into a simulator'''
 
-import os
 import struct
-from typing import Iterator, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
 
 from .constants import ErrBits
-from .isa import get_insns_file, OTBNInsn
+from .isa import OTBNInsn
+from .isa_version import ISAVersion
 from .state import OTBNState
 
-def get_insn():
-    '''Import INSN_CLASSES from the correct insn module depending on the
-    environment variable set either by the user or by standalone.py.
-    '''
-    bnmulv_version_id = os.environ.get('BNMULV_VER', '0')
-
-    if bnmulv_version_id == '1':
-        from .insn_ver1 import INSN_CLASSES
-    elif bnmulv_version_id == '2':
-        from .insn_ver2 import INSN_CLASSES
-    elif bnmulv_version_id == '3':
-        from .insn_ver3 import INSN_CLASSES
-    else:
-        from .insn import INSN_CLASSES
-    mnem_to_class = {cls.insn.mnemonic: cls for cls in INSN_CLASSES}
-
-    return mnem_to_class
 
 class IllegalInsn(OTBNInsn):
     '''A catch-all subclass of Instruction for bad data
@@ -81,13 +64,13 @@ class EmptyInsn(OTBNInsn):
         return None
 
 
-def _decode_word(pc: int, word: int) -> OTBNInsn:
-    insns_file = get_insns_file()
-    mnem = insns_file.mnem_for_word(word)
+def _decode_word(pc: int, word: int,
+                 mnem_for_word: Callable[[int], Optional[str]],
+                 mnem_to_class: Dict[str, Type[OTBNInsn]]) -> OTBNInsn:
+    mnem = mnem_for_word(word)
     if mnem is None:
         return IllegalInsn(pc, word, 'No legal decoding')
 
-    mnem_to_class = get_insn()
     cls = mnem_to_class.get(mnem)
     if cls is None:
         return IllegalInsn(pc, word, f'No insn class for mnemonic {mnem}')
@@ -105,16 +88,25 @@ def _decode_word(pc: int, word: int) -> OTBNInsn:
 
 
 def decode_words(base_addr: int,
-                 data: List[Tuple[bool, int]]) -> List[OTBNInsn]:
-    '''Decode instruction bytes as instructions'''
-    ret = []
+                 data: List[Tuple[bool, int]],
+                 isa_version: ISAVersion) -> List[OTBNInsn]:
+    '''Decode instruction bytes as instructions for isa_version'''
+    # Look up the decode tables once, rather than once per word.
+    mnem_for_word = isa_version.insns_file.mnem_for_word
+    mnem_to_class = isa_version.mnem_to_class
+
+    ret = []  # type: List[OTBNInsn]
     for idx, (vld, w32) in enumerate(data):
         pc = 4 * idx
-        ret.append(_decode_word(pc, w32) if vld else EmptyInsn(pc))
+        if vld:
+            ret.append(_decode_word(pc, w32, mnem_for_word, mnem_to_class))
+        else:
+            ret.append(EmptyInsn(pc))
     return ret
 
 
-def decode_file(base_addr: int, path: str) -> List[OTBNInsn]:
+def decode_file(base_addr: int, path: str,
+                isa_version: ISAVersion) -> List[OTBNInsn]:
     with open(path, 'rb') as handle:
         raw_bytes = handle.read()
 
@@ -134,4 +126,4 @@ def decode_file(base_addr: int, path: str) -> List[OTBNInsn]:
 
         data.append((vld == 1, u32))
 
-    return decode_words(base_addr, data)
+    return decode_words(base_addr, data, isa_version)
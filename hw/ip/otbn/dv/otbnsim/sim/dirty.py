@@ -0,0 +1,79 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Tracking of which parts of the architectural state have pending changes'''
+
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+
+class DirtySet:
+    '''The parts of the architectural state that have pending changes
+
+    OTBNState commits (or aborts) just the components in here, rather than
+    visiting every register file, WSR and so on each cycle.
+
+    '''
+    def __init__(self) -> None:
+        self._components: List['DirtyTracked'] = []
+
+    def add(self, component: 'DirtyTracked') -> None:
+        self._components.append(component)
+
+    def commit(self) -> None:
+        '''Commit the pending changes of each dirty component
+
+        A component may mark itself as dirty again while committing (if it
+        has changes that take more than one cycle to land).
+
+        '''
+        components = self._components
+        self._components = []
+        for component in components:
+            component.is_dirty = False
+            component.commit()
+
+    def abort(self) -> None:
+        '''Abort the pending changes of each dirty component
+
+        The components stay dirty, so they also get committed at the next
+        commit. This matters for the few components whose abort doesn't
+        discard everything (RND, for example, still has to pass on a value
+        from the EDN).
+
+        '''
+        for component in self._components:
+            component.abort()
+
+
+class DirtyTracked(ABC):
+    '''A part of the architectural state that tells a DirtySet about changes
+
+    Subclasses should call mark_dirty() whenever they get a change that
+    commit() or abort() needs to see. If no DirtySet has been attached, this
+    does nothing (and the owner must call commit() and abort() itself).
+
+    '''
+    _dirty_set: Optional[DirtySet] = None
+    is_dirty = False
+
+    def track_dirty(self, dirty_set: DirtySet) -> None:
+        '''Report changes to dirty_set'''
+        self._dirty_set = dirty_set
+        # Start off dirty, in case there were changes before now.
+        self.is_dirty = False
+        self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        if not self.is_dirty and self._dirty_set is not None:
+            self.is_dirty = True
+            self._dirty_set.add(self)
+
+    @abstractmethod
+    def commit(self) -> None:
+        '''Apply the pending changes'''
+
+    @abstractmethod
+    def abort(self) -> None:
+        '''Discard the pending changes'''
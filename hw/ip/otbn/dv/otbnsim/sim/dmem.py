@@ -5,11 +5,11 @@
 # Copyright "Towards ML-KEM & ML-DSA on OpenTitan" Authors.
 
 
-import struct
-from typing import Dict, List, Sequence, Optional
+from typing import List, Optional, Sequence, Tuple
 
 from shared.mem_layout import get_memory_layout
 
+from .dirty import DirtyTracked
 from .trace import Trace
 
 
@@ -25,13 +25,18 @@ class TraceDmemStore(Trace):
         return 'dmem[{:#x}..{:#x}] = {:#x}'.format(self.addr, top, self.value)
 
 
-class Dmem:
+
+
+class Dmem(DirtyTracked):
     '''An object representing OTBN's DMEM.
 
-    Memory is stored as an array of 32-byte words (the native width for the
-    OTBN wide side). These words are stored as 256-bit unsigned integers. This
-    is the same width as the wide-side registers (to avoid unnecessary
-    packing/unpacking work), but the unsigned values simplify tracing.
+    Memory is stored as a flat bytearray in little-endian order, so a 256-bit
+    word (the native width for the OTBN wide side) can be converted to or from
+    an unsigned integer with a single int.from_bytes/int.to_bytes on a slice.
+    Alongside it, we keep a validity map with one byte per 32-bit word (the
+    granularity of the integrity bits in the RTL). A word whose byte in the
+    map is zero has invalid integrity bits and we'll get an error if we try to
+    read it. Invalid words always hold zero bytes in the bytearray.
 
     '''
 
@@ -50,12 +55,9 @@ class Dmem:
             raise RuntimeError('DMEM size ({}) is not divisible by 32.'
                                .format(dmem_size))
 
-        # We represent the contents of DMEM as a list of 32-bit words (unlike
-        # the RTL, which uses a 256-bit array). An entry in self.data is None
-        # if the word has invalid integrity bits and we'll get an error if we
-        # try to read it. Otherwise, we store the integer value.
-        num_words = dmem_size // 4
-        self.data: List[Optional[int]] = [None] * num_words
+        self.num_words = dmem_size // 4
+        self.mem = bytearray(dmem_size)
+        self.valid = bytearray(self.num_words)
 
         # Because it's an actual memory, stores to DMEM take two cycles in the
         # RTL. We wouldn't need to model this except that a DMEM invalidation
@@ -64,10 +66,10 @@ class Dmem:
         # trace/commit dance that all the other blocks do. A memory write will
         # generate a trace entry which will appear in changes() at the end of
         # this cycle. However, the first commit() will then move it to the
-        # self.pending list. Entries here will only make it to self.data on the
-        # next commit().
+        # self.pending list (as a byte address and the bytes to write there).
+        # Entries here will only make it to memory on the next commit().
         self.trace: List[TraceDmemStore] = []
-        self.pending: Dict[int, int] = {}
+        self.pending: List[Tuple[int, bytes]] = []
 
     def _load_5byte_le_words(self, data: bytes) -> None:
         '''Replace the start of memory with data
@@ -83,24 +85,29 @@ class Dmem:
                              .format(len(data)))
 
         len_data_32 = len(data) // 5
-        len_mem_32 = (256 // 32) * len(self.data)
 
-        if len_data_32 > len_mem_32:
+        if len_data_32 > self.num_words:
             raise ValueError('Trying to load {} bytes of data, but DMEM '
                              'is only {} bytes long.'
-                             .format(4 * len_data_32, 32 * len(self.data)))
-
-        # Zero-pad up to the next 32-bit word, represented by 5 bytes. Because
-        # things are little-endian, this is like zero-extending the last word.
-        if len(data) % 5:
-            data = data + b'0' * (5 - (len(data) % 5))
+                             .format(4 * len_data_32, len(self.mem)))
 
-        for idx32, (vld, u32) in enumerate(struct.iter_unpack('<BI', data)):
-            if vld not in [0, 1]:
+        vld = data[0::5]
+        for idx32, vld_byte in enumerate(vld):
+            if vld_byte not in [0, 1]:
                 raise ValueError('The validity byte for 32-bit word {} '
                                  'in the input data is {}, not 0 or 1.'
-                                 .format(idx32, vld))
-            self.data[idx32] = u32 if vld else None
+                                 .format(idx32, vld_byte))
+
+        # Strip out the validity bytes, then zero any invalid words.
+        words = bytearray(4 * len_data_32)
+        for i in range(4):
+            words[i::4] = data[i + 1::5]
+        for idx32, vld_byte in enumerate(vld):
+            if not vld_byte:
+                words[4 * idx32:4 * idx32 + 4] = bytes(4)
+
+        self.mem[:len(words)] = words
+        self.valid[:len_data_32] = vld
 
     def _load_4byte_le_words(self, data: bytes) -> None:
         '''Replace the start of memory with data
@@ -109,17 +116,18 @@ class Dmem:
         little-endian format.
 
         '''
-        if len(data) > 32 * len(self.data):
+        if len(data) > len(self.mem):
             raise ValueError('Trying to load {} bytes of data, but DMEM '
                              'is only {} bytes long.'
-                             .format(len(data), 32 * len(self.data)))
+                             .format(len(data), len(self.mem)))
         # Zero-pad bytes up to the next multiple of 32 bits (because things
         # are little-endian, is like zero-extending the last word).
         if len(data) % 4:
-            data = data + b'0' * (32 - (len(data) % 32))
+            data = data + bytes(4 - (len(data) % 4))
 
-        for idx32, u32 in enumerate(struct.iter_unpack('<I', data)):
-            self.data[idx32] = u32[0]
+        len_data_32 = len(data) // 4
+        self.mem[:len(data)] = data
+        self.valid[:len_data_32] = b'\x01' * len_data_32
 
     def load_le_words(self, data: bytes, has_validity: bool) -> None:
         '''Replace the start of memory with data
@@ -140,26 +148,90 @@ class Dmem:
         words are themselves packed little-endian into 256-bit words.
 
         '''
-        ret = b''
-        pack_format = '<BI'
-        if include_validity is False:
-            pack_format = '<I'
-        for idx, u32 in enumerate(self.data):
-            # If there's a pending store, apply it. This matches the RTL, where
-            # we only observe the memory after that store has landed.
-            u32 = self.pending.get(idx, u32)
-            if include_validity:
-                if u32 is None:
-                    ret += struct.pack(pack_format, 0, 0)
-                else:
-                    ret += struct.pack(pack_format, 1, u32)
-            else:
-                if u32 is None:
-                    ret += struct.pack(pack_format, 0)
-                else:
-                    ret += struct.pack(pack_format, u32)
-
-        return ret
+        mem = self.mem
+        valid = self.valid
+
+        # If there's a pending store, apply it. This matches the RTL, where we
+        # only observe the memory after that store has landed.
+        if self.pending:
+            mem = bytearray(mem)
+            valid = bytearray(valid)
+            for addr, data in self.pending:
+                mem[addr:addr + len(data)] = data
+                valid[addr // 4:(addr + len(data)) // 4] = \
+                    b'\x01' * (len(data) // 4)
+
+        if not include_validity:
+            return bytes(mem)
+
+        ret = bytearray(5 * self.num_words)
+        ret[0::5] = valid
+        for i in range(4):
+            ret[i + 1::5] = mem[i::4]
+        return bytes(ret)
+
+    def _check_byte_range(self, offset: int, num_bytes: int) -> None:
+        '''Raise a ValueError unless [offset, offset + num_bytes) is in DMEM'''
+        end = offset + num_bytes
+        if offset < 0 or num_bytes < 0 or end > len(self.mem):
+            raise ValueError('Byte range [{:#x}, {:#x}) is not inside DMEM, '
+                             'which is {} bytes long.'
+                             .format(offset, end, len(self.mem)))
+
+    def _overlaps_pending(self, addr: int, num_bytes: int) -> bool:
+        '''Return true if a pending store touches [addr, addr + num_bytes)'''
+        for p_addr, p_data in self.pending:
+            if p_addr < addr + num_bytes and addr < p_addr + len(p_data):
+                return True
+        return False
+
+    def write_bytes(self, offset: int, buf: bytes) -> None:
+        '''Write buf to DMEM, starting at byte address offset
+
+        This is a backdoor write, like load_le_words, so it doesn't go through
+        the trace/commit machinery. Only the 32-bit words that overlap buf are
+        touched. Any invalid bytes of a partially written word are zeroed
+        (which matches what happens with a dump then a reload).
+
+        '''
+        self._check_byte_range(offset, len(buf))
+        if not buf:
+            return
+
+        first = offset // 4
+        end = (offset + len(buf) + 3) // 4
+
+        # Invalid words hold zero bytes, so we can just overwrite the bytes we
+        # were given and mark every word that they touch as valid.
+        self.mem[offset:offset + len(buf)] = buf
+        self.valid[first:end] = b'\x01' * (end - first)
+
+    def make_all_valid(self) -> None:
+        '''Mark every word of DMEM as valid
+
+        Invalid words hold zero bytes, so this gives the same memory as
+        dumping DMEM without validity and loading the dump again.
+
+        '''
+        self.valid[:] = b'\x01' * self.num_words
+
+    def read_bytes(self, offset: int, num_bytes: int) -> bytes:
+        '''Read num_bytes bytes from DMEM, starting at byte address offset
+
+        Like dump_le_words with include_validity=False, this sees pending
+        stores and reads invalid words as zero. Only the 32-bit words that
+        overlap the requested range are touched.
+
+        '''
+        self._check_byte_range(offset, num_bytes)
+        end = offset + num_bytes
+        ret = self.mem[offset:end]
+        for p_addr, p_data in self.pending:
+            lo = max(offset, p_addr)
+            hi = min(end, p_addr + len(p_data))
+            if lo < hi:
+                ret[lo - offset:hi - offset] = p_data[lo - p_addr:hi - p_addr]
+        return bytes(ret)
 
     def is_valid_256b_addr(self, addr: int) -> bool:
         '''Return true if this is a valid address for a BN.LID/BN.SID'''
@@ -168,7 +240,7 @@ class Dmem:
             return False
 
         word_addr = addr // 4
-        if word_addr >= len(self.data):
+        if word_addr >= self.num_words:
             return False
 
         return True
@@ -177,14 +249,23 @@ class Dmem:
         '''Read a u256 little-endian value from an aligned address'''
         assert addr >= 0
         assert self.is_valid_256b_addr(addr)
-        ret_data = 0
-        for i in range(256 // 32):
-            rd_data = self.load_u32(addr + 4 * i)
-            if rd_data is None:
-                return None
-            ret_data = ret_data | (rd_data << (i * 32))
 
-        return ret_data
+        # Handle "read under write" hazards properly. This is rare, so we just
+        # fall back to reading one 32-bit word at a time.
+        if self.pending and self._overlaps_pending(addr, 32):
+            ret_data = 0
+            for i in range(256 // 32):
+                rd_data = self.load_u32(addr + 4 * i)
+                if rd_data is None:
+                    return None
+                ret_data = ret_data | (rd_data << (i * 32))
+            return ret_data
+
+        word_addr = addr // 4
+        if 0 in self.valid[word_addr:word_addr + 8]:
+            return None
+
+        return int.from_bytes(self.mem[addr:addr + 32], 'little')
 
     def store_u256(self, addr: int, value: int) -> None:
         '''Write a u256 little-endian value to an aligned address'''
@@ -193,6 +274,7 @@ class Dmem:
         assert self.is_valid_256b_addr(addr)
 
         self.trace.append(TraceDmemStore(addr, value, True))
+        self.mark_dirty()
 
     def is_valid_32b_addr(self, addr: int) -> bool:
         '''Return true if this is a valid address for a LW/SW instruction'''
@@ -200,7 +282,7 @@ class Dmem:
         if addr & 3:
             return False
 
-        if (addr + 3) // 4 >= len(self.data):
+        if (addr + 3) // 4 >= self.num_words:
             return False
 
         return True
@@ -215,14 +297,19 @@ class Dmem:
         assert addr >= 0
         assert self.is_valid_32b_addr(addr)
 
-        idx = addr // 4
+        # Handle "read under write" hazards properly. Pending stores are
+        # word-aligned, so a 32-bit read is either entirely inside one or
+        # doesn't touch it. If several pending stores hit the word, the last
+        # one wins.
+        for p_addr, p_data in reversed(self.pending):
+            offset = addr - p_addr
+            if 0 <= offset < len(p_data):
+                return int.from_bytes(p_data[offset:offset + 4], 'little')
 
-        # Handle "read under write" hazards properly
-        pending_val = self.pending.get(idx)
-        if pending_val is not None:
-            return pending_val
+        if not self.valid[addr // 4]:
+            return None
 
-        return self.data[addr // 4]
+        return int.from_bytes(self.mem[addr:addr + 4], 'little')
 
     def store_u32(self, addr: int, value: int) -> None:
         '''Store a 32-bit unsigned value to memory.
@@ -235,6 +322,7 @@ class Dmem:
         assert self.is_valid_32b_addr(addr)
 
         self.trace.append(TraceDmemStore(addr, value, False))
+        self.mark_dirty()
 
     def changes(self) -> Sequence[Trace]:
         return self.trace
@@ -243,28 +331,33 @@ class Dmem:
         '''Apply a trace entry to self.pending'''
         if item.is_wide:
             assert 0 <= item.value < (1 << 256)
-            mask = (1 << 32) - 1
-            for i in range(256 // 32):
-                wr_data = (item.value >> (i * 32)) & mask
-                self.pending[(item.addr // 4) + i] = wr_data
+            self.pending.append((item.addr, item.value.to_bytes(32, 'little')))
 
         else:
             assert 0 <= item.value <= (1 << 32) - 1
-            self.pending[item.addr // 4] = item.value
+            self.pending.append((item.addr, item.value.to_bytes(4, 'little')))
 
     def commit(self) -> None:
-        # Move items from self.pending to self.data
-        for idx, value in self.pending.items():
-            self.data[idx] = value
-        self.pending = {}
+        # Move items from self.pending to memory
+        for addr, data in self.pending:
+            self.mem[addr:addr + len(data)] = data
+            self.valid[addr // 4:(addr + len(data)) // 4] = \
+                b'\x01' * (len(data) // 4)
+        self.pending = []
 
         # Apply trace entries to self.pending
         for item in self.trace:
             self._commit_trace_entry(item)
         self.trace = []
 
+        # Anything that we just moved to self.pending lands on the next
+        # commit.
+        if self.pending:
+            self.mark_dirty()
+
     def abort(self) -> None:
         self.trace = []
 
     def empty_dmem(self) -> None:
-        self.data = [None] * len(self.data)
+        self.mem = bytearray(len(self.mem))
+        self.valid = bytearray(self.num_words)
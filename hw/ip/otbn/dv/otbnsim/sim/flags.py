@@ -4,6 +4,7 @@
 
 from typing import List, Optional, cast
 
+from .dirty import DirtyTracked
 from .trace import Trace
 
 
@@ -100,7 +101,7 @@ class FlagReg:
         return FlagReg(C=C, M=M, L=L, Z=Z)
 
 
-class FlagGroups:
+class FlagGroups(DirtyTracked):
     def __init__(self) -> None:
         self._groups = {0: FlagReg(False, False, False, False),
                         1: FlagReg(False, False, False, False)}
@@ -114,6 +115,7 @@ class FlagGroups:
     def __setitem__(self, key: int, value: FlagReg) -> None:
         assert 0 <= key <= 1
         self._dirty = True
+        self.mark_dirty()
         self._groups[key].set_flags(value)
 
     def changes(self) -> List[TraceFlags]:
@@ -149,5 +151,6 @@ class FlagGroups:
         assert 0 <= value
         mask4 = (1 << 4) - 1
         self._dirty = True
+        self.mark_dirty()
         self._groups[0].write_unsigned((value >> 0) & mask4)
         self._groups[1].write_unsigned((value >> 4) & mask4)
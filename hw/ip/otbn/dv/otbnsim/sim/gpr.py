@@ -2,7 +2,7 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import List
+from typing import List, Optional
 
 from .constants import ErrBits
 from .reg import Reg, RegFile
@@ -28,6 +28,9 @@ class CallStackReg(Reg):
             # turns out to be empty, return some "obviously bogus" value.
             return self.stack[-1] if self.stack else 0xcafef00d
 
+        # Either way, the read changes what happens on commit (or abort).
+        self.gpr_parent.mark_dirty()
+
         if not self.stack:
             self.gpr_parent.call_stack_err = True
             return 0
@@ -74,6 +77,18 @@ class GPRs(RegFile):
         self._x1 = CallStackReg(self)
         self.call_stack_err = False
 
+        # Stack usage tracking (see stack_usage()). sp_start is the value
+        # that x2 (the stack pointer) held when the program first moved it
+        # and sp_min is the lowest value written to x2 since then.
+        self.sp_start: Optional[int] = None
+        self.sp_min: Optional[int] = None
+
+        # Set by note_stack_move() and note_lui_to_sp() for the current
+        # instruction, and whether x2 was last written by a LUI.
+        self._sp_move = False
+        self._sp_lui = False
+        self._sp_from_lui = False
+
     def get_reg(self, idx: int) -> Reg:
         if idx == 0:
             # If idx == 0, this is a zeros register that should ignore writes.
@@ -98,6 +113,11 @@ class GPRs(RegFile):
         return ErrBits.CALL_STACK if self.call_stack_err else 0
 
     def commit(self) -> None:
+        if 2 in self._pending_writes:
+            self._commit_stack_pointer()
+        self._sp_move = False
+        self._sp_lui = False
+
         super().commit()
         assert not self.call_stack_err
         self._x1.commit()
@@ -106,6 +126,56 @@ class GPRs(RegFile):
         super().abort()
         self._x1.abort()
         self.call_stack_err = False
+        self._sp_move = False
+        self._sp_lui = False
+
+    def note_stack_move(self) -> None:
+        '''Record that an ADD, ADDI or SUB is writing x2 based on x2.'''
+        self._sp_move = True
+
+    def note_lui_to_sp(self) -> None:
+        '''Record that a LUI is writing x2.'''
+        self._sp_lui = True
+
+    def _commit_stack_pointer(self) -> None:
+        '''Update the stack usage tracking for a write to x2
+
+        Programs set up x2 with something like "la x2, stack_end" and then
+        move it with ADDI, ADD or SUB. The first of these moves gives the
+        start of the stack. The ADDI that is the second half of an "la" (after
+        a LUI) moves x2 too, but it doesn't count: the LUI wrote a bogus
+        value.
+
+        '''
+        reg = self.get_reg(2)
+        if (self.sp_start is None and self._sp_move and
+                not self._sp_from_lui):
+            self.sp_start = reg.read_unsigned()
+        self._sp_from_lui = self._sp_lui
+
+        value = reg.read_next()
+        if self.sp_start is None or value is None:
+            return
+        if self.sp_min is None or value < self.sp_min:
+            self.sp_min = value
+
+    def stack_usage(self) -> int:
+        '''Get the maximum stack usage (in bytes) seen since start.
+
+        This is how far below its starting value the stack pointer has been
+        (zero if the program never moved it). After the stack starts, every
+        write to x2 counts, whichever instruction makes it.
+
+        '''
+        if self.sp_start is None or self.sp_min is None:
+            return 0
+        return max(0, self.sp_start - self.sp_min)
+
+    def clear_stack_usage(self) -> None:
+        '''Forget the stack pointer values seen so far.'''
+        self.sp_start = None
+        self.sp_min = None
+        self._sp_from_lui = False
 
     def empty_call_stack(self) -> None:
         '''Clear call stack.'''
@@ -8,16 +8,17 @@
 # (https://eprint.iacr.org/2025/2028)
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
-from typing import Dict, Iterator, Optional
+from typing import (Callable, Dict, Iterator, List, Optional, Sequence, Tuple,
+                    Type)
+import operator
 import sys
-import os
 
 from .constants import ErrBits
 from .flags import FlagReg
 from .isa import (OTBNInsn, RV32RegReg, RV32RegImm,
-                  RV32ImmShift, insn_for_mnemonic, logical_byte_shift,
+                  RV32ImmShift, logical_byte_shift,
                   bit_shift,
-                  extract_quarter_word, extract_sub_word)
+                  extract_quarter_word, extract_sub_word, lane_struct)
 from .state import OTBNState
 
 DEBUG_MEM = False
@@ -26,14 +27,6 @@ DEBUG_ARITH = False
 DEBUG_KMAC = False
 DEBUG_FLOW = False
 
-STACK_BENCH = False
-STACK_SIZE = 20000
-
-# For stack benchmarking, STACK_BENCH, STACK_SIZE and REPO_TOP is passed from --action_env.
-if os.environ.get('STACK_BENCH', '0') == '1':
-    STACK_BENCH = True
-STACK_SIZE = int(os.environ.get('STACK_SIZE', '20000'))
-REPO_TOP = os.environ.get('REPO_TOP', '/home/dev/src')
 
 def eprint(text):
     print(text, file=sys.stderr)
@@ -55,9 +48,21 @@ def cmod_single(n, q):
         return n
 
 
-class ADD(RV32RegReg):
-    insn = insn_for_mnemonic('add', 3)
+def cond_sub(n, q):
+    "Conditional subtraction from q."
+    if n >= q:
+        n -= q
+    return n
+
+
+def cond_add(n, q):
+    "Conditional addition with q."
+    if n < 0:
+        n += q
+    return n
+
 
+class ADD(RV32RegReg):
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned()
@@ -66,28 +71,15 @@ class ADD(RV32RegReg):
             return
 
         result = (val1 + val2) & ((1 << 32) - 1)
-        if DEBUG_ARITH or (STACK_BENCH and self.grd == 2):
+        if DEBUG_ARITH:
             eprint(f"add {val1} + {val2} = {result}")
-
-        if STACK_BENCH and self.grd == 2:
-            with open(f"{REPO_TOP}/stack_benchmark.txt", "r") as f:
-                try:
-                    prev_min = int(f.readline(), 10)
-                except ValueError:
-                    prev_min = 0
-            print(f"result: {result} ")
-            print(f"prev_min: {prev_min} ")
-            print(f"STACK_SIZE - result: {STACK_SIZE - result}")
-            if (STACK_SIZE - result) > prev_min:
-                with open(f"{REPO_TOP}/stack_benchmark.txt", "w") as f:
-                    f.write(str(STACK_SIZE - result))
+        if self.grd == 2 and 2 in (self.grs1, self.grs2):
+            state.gprs.note_stack_move()
 
         state.gprs.get_reg(self.grd).write_unsigned(result)
 
 
 class ADDI(RV32RegImm):
-    insn = insn_for_mnemonic('addi', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         if state.gprs.call_stack_err:
@@ -95,40 +87,27 @@ class ADDI(RV32RegImm):
             return
 
         result = (val1 + self.imm) & ((1 << 32) - 1)
-        if DEBUG_ARITH or (STACK_BENCH and self.grd == 2):
+        if DEBUG_ARITH:
             eprint(f"addi {val1} + {self.imm} = {result}")
-
-        if STACK_BENCH and self.grd == 2 and self.imm != 0:
-            with open(f"{REPO_TOP}/stack_benchmark.txt", "r") as f:
-                try:
-                    prev_min = int(f.readline(), 10)
-                except ValueError:
-                    prev_min = 0
-            print(f"result: {result} ")
-            print(f"prev_min: {prev_min} ")
-            print(f"STACK_SIZE - result: {STACK_SIZE - result}")
-            if (STACK_SIZE - result) > prev_min:
-                with open(f"{REPO_TOP}/stack_benchmark.txt", "w") as f:
-                    f.write(str(STACK_SIZE - result))
+        if self.grd == 2 and self.grs1 == 2:
+            state.gprs.note_stack_move()
 
         state.gprs.get_reg(self.grd).write_unsigned(result)
 
 
 class LUI(OTBNInsn):
-    insn = insn_for_mnemonic('lui', 2)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grd = op_vals['grd']
         self.imm = op_vals['imm']
 
     def execute(self, state: OTBNState) -> None:
+        if self.grd == 2:
+            state.gprs.note_lui_to_sp()
         state.gprs.get_reg(self.grd).write_unsigned(self.imm << 12)
 
 
 class SUB(RV32RegReg):
-    insn = insn_for_mnemonic('sub', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned()
@@ -139,12 +118,12 @@ class SUB(RV32RegReg):
         result = (val1 - val2) & ((1 << 32) - 1)
         if DEBUG_ARITH:
             eprint(f"sub {val1} - {val2} = {result}")
+        if self.grd == 2 and 2 in (self.grs1, self.grs2):
+            state.gprs.note_stack_move()
         state.gprs.get_reg(self.grd).write_unsigned(result)
 
 
 class SLL(RV32RegReg):
-    insn = insn_for_mnemonic('sll', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned() & 0x1f
@@ -159,8 +138,6 @@ class SLL(RV32RegReg):
 
 
 class SLLI(RV32ImmShift):
-    insn = insn_for_mnemonic('slli', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         if state.gprs.call_stack_err:
@@ -173,8 +150,6 @@ class SLLI(RV32ImmShift):
 
 
 class SRL(RV32RegReg):
-    insn = insn_for_mnemonic('srl', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned() & 0x1f
@@ -189,8 +164,6 @@ class SRL(RV32RegReg):
 
 
 class SRLI(RV32ImmShift):
-    insn = insn_for_mnemonic('srli', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         if state.gprs.call_stack_err:
@@ -203,8 +176,6 @@ class SRLI(RV32ImmShift):
 
 
 class SRA(RV32RegReg):
-    insn = insn_for_mnemonic('sra', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_signed()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned() & 0x1f
@@ -219,8 +190,6 @@ class SRA(RV32RegReg):
 
 
 class SRAI(RV32ImmShift):
-    insn = insn_for_mnemonic('srai', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_signed()
         val2 = self.shamt
@@ -233,8 +202,6 @@ class SRAI(RV32ImmShift):
 
 
 class AND(RV32RegReg):
-    insn = insn_for_mnemonic('and', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned()
@@ -249,8 +216,6 @@ class AND(RV32RegReg):
 
 
 class ANDI(RV32RegImm):
-    insn = insn_for_mnemonic('andi', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = self.to_2s_complement(self.imm)
@@ -264,8 +229,6 @@ class ANDI(RV32RegImm):
 
 
 class OR(RV32RegReg):
-    insn = insn_for_mnemonic('or', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned()
@@ -279,8 +242,6 @@ class OR(RV32RegReg):
 
 
 class ORI(RV32RegImm):
-    insn = insn_for_mnemonic('ori', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = self.to_2s_complement(self.imm)
@@ -293,8 +254,6 @@ class ORI(RV32RegImm):
 
 
 class XOR(RV32RegReg):
-    insn = insn_for_mnemonic('xor', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = state.gprs.get_reg(self.grs2).read_unsigned()
@@ -307,8 +266,6 @@ class XOR(RV32RegReg):
 
 
 class XORI(RV32RegImm):
-    insn = insn_for_mnemonic('xori', 3)
-
     def execute(self, state: OTBNState) -> None:
         val1 = state.gprs.get_reg(self.grs1).read_unsigned()
         val2 = self.to_2s_complement(self.imm)
@@ -321,8 +278,6 @@ class XORI(RV32RegImm):
 
 
 class LW(OTBNInsn):
-    insn = insn_for_mnemonic('lw', 3)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grd = op_vals['grd']
@@ -369,8 +324,6 @@ class LW(OTBNInsn):
 
 
 class SW(OTBNInsn):
-    insn = insn_for_mnemonic('sw', 3)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grs2 = op_vals['grs2']
@@ -402,7 +355,6 @@ class SW(OTBNInsn):
 
 
 class BEQ(OTBNInsn):
-    insn = insn_for_mnemonic('beq', 3)
     affects_control = True
     has_fetch_stall = True
 
@@ -434,7 +386,6 @@ class BEQ(OTBNInsn):
 
 
 class BNE(OTBNInsn):
-    insn = insn_for_mnemonic('bne', 3)
     affects_control = True
     has_fetch_stall = True
 
@@ -467,7 +418,6 @@ class BNE(OTBNInsn):
 
 
 class JAL(OTBNInsn):
-    insn = insn_for_mnemonic('jal', 2)
     affects_control = True
     has_fetch_stall = True
 
@@ -490,7 +440,6 @@ class JAL(OTBNInsn):
 
 
 class JALR(OTBNInsn):
-    insn = insn_for_mnemonic('jalr', 3)
     affects_control = True
     has_fetch_stall = True
 
@@ -519,8 +468,6 @@ class JALR(OTBNInsn):
 
 
 class CSRRS(OTBNInsn):
-    insn = insn_for_mnemonic('csrrs', 3)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grd = op_vals['grd']
@@ -557,8 +504,6 @@ class CSRRS(OTBNInsn):
 
 
 class CSRRW(OTBNInsn):
-    insn = insn_for_mnemonic('csrrw', 3)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grd = op_vals['grd']
@@ -597,15 +542,12 @@ class CSRRW(OTBNInsn):
 
 
 class ECALL(OTBNInsn):
-    insn = insn_for_mnemonic('ecall', 0)
-
     def execute(self, state: OTBNState) -> None:
         # Set INTR_STATE.done and STATUS, reflecting the fact we've stopped.
         state.stop_at_end_of_cycle(err_bits=0)
 
 
 class LOOP(OTBNInsn):
-    insn = insn_for_mnemonic('loop', 2)
     affects_control = True
 
     def __init__(self, raw: int, op_vals: Dict[str, int]):
@@ -626,7 +568,6 @@ class LOOP(OTBNInsn):
 
 
 class LOOPI(OTBNInsn):
-    insn = insn_for_mnemonic('loopi', 2)
     affects_control = True
 
     def __init__(self, raw: int, op_vals: Dict[str, int]):
@@ -644,8 +585,6 @@ class LOOPI(OTBNInsn):
 
 
 class BNADD(OTBNInsn):
-    insn = insn_for_mnemonic('bn.add', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -675,8 +614,6 @@ class BNADD(OTBNInsn):
 
 
 class BNADDC(OTBNInsn):
-    insn = insn_for_mnemonic('bn.addc', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -703,8 +640,6 @@ class BNADDC(OTBNInsn):
 
 
 class BNADDI(OTBNInsn):
-    insn = insn_for_mnemonic('bn.addi', 4)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -730,8 +665,6 @@ class BNADDI(OTBNInsn):
 
 
 class BNADDM(OTBNInsn):
-    insn = insn_for_mnemonic('bn.addm', 3)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -759,8 +692,49 @@ class BNADDM(OTBNInsn):
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
 
-class BNADDV(OTBNInsn):
-    insn = insn_for_mnemonic('bn.addv', 4)
+def _reduce_none(lanes: Iterator[int], q: int, mask: int) -> List[int]:
+    '''Truncate the results of a vector add or subtract'''
+    return [x & mask for x in lanes]
+
+
+def _reduce_cmod(lanes: Iterator[int], q: int, mask: int) -> List[int]:
+    '''Reduce the results of a vector add or subtract with cmod_single'''
+    return [((x + q) if x < 0 else (x - q) if x >= q else x) & mask
+            for x in lanes]
+
+
+def _reduce_cond_sub(lanes: Iterator[int], q: int, mask: int) -> List[int]:
+    '''Reduce the results of a vector add or subtract with cond_sub'''
+    return [((x - q) if x >= q else x) & mask for x in lanes]
+
+
+def _reduce_cond_add(lanes: Iterator[int], q: int, mask: int) -> List[int]:
+    '''Reduce the results of a vector add or subtract with cond_add'''
+    return [((x + q) if x < 0 else x) & mask for x in lanes]
+
+
+class BNADDSUBVBase(OTBNInsn):
+    '''Code shared by BN.ADDV and BN.SUBV
+
+    The type field is decoded when the instruction is decoded, which picks
+    the Structs that split the operands into lanes and the kernel that
+    reduces the results. Executing the instruction is then a couple of list
+    comprehensions over the lanes.
+
+    '''
+    # The operation on each pair of lanes (set by subclasses)
+    lane_op: Callable[[int, int], int] = operator.add
+
+    # If true, the lanes of the operands are signed (BNMULV version 0).
+    signed_lanes = False
+
+    # If true, the type field has a bit for conditional subtraction from
+    # each lane of wrs2 (BNMULV version 3).
+    has_cond_type = False
+
+    # The reduction to use for the reducing types
+    reduce_lanes: Callable[[Iterator[int], int, int], List[int]] = \
+        staticmethod(_reduce_cmod)
 
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
@@ -769,33 +743,94 @@ class BNADDV(OTBNInsn):
         self.wrs2 = op_vals['wrs2']
         self.type = op_vals['type']
 
+        if self.has_cond_type:
+            data_type = self.type & 0b1
+            self.red = bool((self.type & 0b10) >> 1)
+            self.cond = bool((self.type & 0b100) >> 2)
+            self.size = 16 if data_type else 32
+        else:
+            self.red = True if self.type > 1 else False
+            self.cond = False
+            self.size = 32 if (self.type % 2 == 0) else 16
+
+        num_lanes = 256 // self.size
+        self.mask = (1 << self.size) - 1
+        self.in_lanes = lane_struct(num_lanes, self.size, self.signed_lanes)
+        self.out_lanes = lane_struct(num_lanes, self.size)
+        self.reduce = self.reduce_lanes if self.red else _reduce_none
+
     def execute(self, state: OTBNState) -> None:
         a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         b = state.wdrs.get_reg(self.wrs2).read_unsigned()
-        mod_val = state.wsrs.MOD.read_unsigned()
-        red = True if self.type > 1 else False
-        size = 32 if (self.type % 2 == 0) else 16
-        mod_val = extract_sub_word(mod_val, size, 0)
-        result = 0
+        mod_val = state.wsrs.MOD.read_unsigned() & self.mask
 
-        for i in range(256 // size - 1, -1, -1):
-            ai = OTBNInsn.from_2s_complement(extract_sub_word(a, size, i), size)
-            bi = OTBNInsn.from_2s_complement(extract_sub_word(b, size, i), size)
-            resulti = ai + bi
-            if red:
-                resulti = cmod_single(resulti, mod_val)
-            if DEBUG_ARITH:
-                eprint(f"addvm {ai} + {bi} = {ai + bi} = {resulti}")
-            result <<= size
-            result |= (OTBNInsn.to_2s_complement(resulti, size) & ((1 << size) - 1))
+        a_v = self.in_lanes.unpack(a.to_bytes(32, 'little'))
+        b_v = self.in_lanes.unpack(b.to_bytes(32, 'little'))
+        if self.cond:
+            b_v = tuple((bi - mod_val) if bi >= mod_val else bi
+                        for bi in b_v)
 
-        result = result & ((1 << 256) - 1)
+        result_v = self.reduce(map(self.lane_op, a_v, b_v),
+                               mod_val, self.mask)
+
+        if DEBUG_ARITH:
+            eprint(f"{self.insn.mnemonic} (type {self.type}) "
+                   f"{list(a_v)}, {list(b_v)} = {result_v}")
+
+        result = int.from_bytes(self.out_lanes.pack(*result_v), 'little')
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
 
-class BNMULV(OTBNInsn):
-    insn = insn_for_mnemonic('bn.mulv', 5)
+class BNADDV(BNADDSUBVBase):
+    '''BN.ADDV with unsigned lanes (BNMULV versions 1 and 2)'''
+    lane_op = operator.add
+
+
+class BNADDVSigned(BNADDV):
+    '''BN.ADDV with signed lanes (BNMULV version 0)'''
+    signed_lanes = True
+
+
+class BNADDVCond(BNADDV):
+    '''BN.ADDV with conditional subtraction (BNMULV version 3)
+
+    This has an extra bit in the type field, which asks for MOD to be
+    conditionally subtracted from each lane of wrs2 before the addition.
 
+    '''
+    has_cond_type = True
+    reduce_lanes = staticmethod(_reduce_cond_sub)
+
+
+def _mulv_lanes(a_v: Sequence[int], b_v: Sequence[int],
+                mask: int) -> List[int]:
+    '''Multiply lanes, truncating the products'''
+    return [(ai * bi) & mask for ai, bi in zip(a_v, b_v)]
+
+
+def _mulv_mont_lanes(a_v: Sequence[int], b_v: Sequence[int], size: int,
+                     mod_val: int, qinv_val: int) -> List[int]:
+    '''Multiply lanes with a Montgomery reduction of each product'''
+    mask = (1 << size) - 1
+    result_v = []
+    for ai, bi in zip(a_v, b_v):
+        resulti = ai * bi
+        t = ((resulti & mask) * qinv_val) & mask
+        resulti = (resulti + t * mod_val) >> size
+        if resulti >= mod_val:
+            resulti -= mod_val
+        result_v.append(resulti & mask)
+    return result_v
+
+
+class BNMULVMont(OTBNInsn):
+    '''BN.MULV from BNMULV version 0
+
+    This has a lane operand (used by the lane-mode types) and optionally
+    does a Montgomery reduction of each product. Later versions replace it
+    with BNMULV and BNMULVL.
+
+    '''
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -804,49 +839,47 @@ class BNMULV(OTBNInsn):
         self.type = op_vals['type']
         self.lane = op_vals['lane']
 
+        # the lower 4 types are without reduction
+        self.red = True if self.type > 3 else False
+        # see instruction scheme for details
+        self.lane_mode = True if self.type in [2, 3, 6, 7] else False
+        self.size = 32 if (self.type % 2) == 0 else 16
+        self.num_lanes = 256 // self.size
+        self.mask = (1 << self.size) - 1
+        # The lanes of both operands are signed
+        self.in_lanes = lane_struct(self.num_lanes, self.size, True)
+        self.out_lanes = lane_struct(self.num_lanes, self.size)
+
     def execute(self, state: OTBNState) -> None:
         a = state.wdrs.get_reg(self.wrs1).read_unsigned()
         b = state.wdrs.get_reg(self.wrs2).read_unsigned()
-
-        # the lower 4 types are without reduction
-        red = True if self.type > 3 else False
-        # see instruction scheme for details
-        lane_mode = True if self.type in [2, 3, 6, 7] else False
-        size = None
-        if (self.type % 2) == 0:
-            size = 32
+        size = self.size
+
+        a_v = self.in_lanes.unpack(a.to_bytes(32, 'little'))
+        if self.lane_mode:
+            # Extract the lane
+            bi = OTBNInsn.from_2s_complement(
+                extract_sub_word(b, size, self.lane), size)
+            b_v: Sequence[int] = [bi] * self.num_lanes
         else:
-            size = 16
-        mod_val = extract_sub_word(state.wsrs.MOD.read_unsigned(), size, 0)
-        qinv_val = extract_sub_word(state.wsrs.MOD.read_unsigned(), size, (32 // size))
-        result = state.wdrs.get_reg(self.wrd).read_unsigned()
-
-        # Extract the lane
-        if lane_mode:
-            bi = OTBNInsn.from_2s_complement(extract_sub_word(b, size, self.lane), size)
-
-        for i in range(256 // size - 1, -1, -1):
-            ai = OTBNInsn.from_2s_complement(extract_sub_word(a, size, i), size)
-            if not lane_mode:
-                bi = OTBNInsn.from_2s_complement(extract_sub_word(b, size, i), size)
-
-            resulti = (ai * bi)  # TODO: match to hw implementation
-
-            if red:
-                t = ((resulti % (2**size)) * qinv_val) % (2**size)
-                resulti = (resulti + t * mod_val) >> size
-                if resulti >= mod_val:
-                    resulti -= mod_val
+            b_v = self.in_lanes.unpack(b.to_bytes(32, 'little'))
 
+        if self.red:
+            mod = state.wsrs.MOD.read_unsigned()
+            mod_val = mod & self.mask
+            qinv_val = (mod >> 32) & self.mask
+            result_v = _mulv_mont_lanes(a_v, b_v, size, mod_val, qinv_val)
             if DEBUG_ARITH:
                 eprint(f"modulus {mod_val}")
-                eprint(f"mulmv {ai} * {bi} = {ai * bi} = {resulti}")
+        else:
+            result_v = _mulv_lanes(a_v, b_v, self.mask)
+
+        if DEBUG_ARITH:
+            eprint(f"mulmv {list(a_v)} * {list(b_v)} = {result_v}")
 
-            result <<= size
-            result |= (OTBNInsn.to_2s_complement(resulti, size) & ((1 << size) - 1))
-        result &= ((1 << 256) - 1)
+        result = int.from_bytes(self.out_lanes.pack(*result_v), 'little')
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
-        if red:
+        if self.red:
             yield None
             yield None
             yield None
@@ -868,8 +901,6 @@ class BNMULV(OTBNInsn):
 
 
 class BNMULQACC(OTBNInsn):
-    insn = insn_for_mnemonic('bn.mulqacc', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.zero_acc = op_vals['zero_acc']
@@ -903,8 +934,6 @@ class BNMULQACC(OTBNInsn):
 
 
 class BNMULQACCWO(OTBNInsn):
-    insn = insn_for_mnemonic('bn.mulqacc.wo', 8)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.zero_acc = op_vals['zero_acc']
@@ -940,8 +969,6 @@ class BNMULQACCWO(OTBNInsn):
 
 
 class BNMULQACCSO(OTBNInsn):
-    insn = insn_for_mnemonic('bn.mulqacc.so', 9)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.zero_acc = op_vals['zero_acc']
@@ -1002,8 +1029,6 @@ class BNMULQACCSO(OTBNInsn):
 
 
 class BNSUB(OTBNInsn):
-    insn = insn_for_mnemonic('bn.sub', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1033,8 +1058,6 @@ class BNSUB(OTBNInsn):
 
 
 class BNSUBB(OTBNInsn):
-    insn = insn_for_mnemonic('bn.subb', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1061,8 +1084,6 @@ class BNSUBB(OTBNInsn):
 
 
 class BNSUBI(OTBNInsn):
-    insn = insn_for_mnemonic('bn.subi', 4)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1085,8 +1106,6 @@ class BNSUBI(OTBNInsn):
 
 
 class BNSUBM(OTBNInsn):
-    insn = insn_for_mnemonic('bn.subm', 3)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1111,43 +1130,28 @@ class BNSUBM(OTBNInsn):
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
 
-class BNSUBV(OTBNInsn):
-    insn = insn_for_mnemonic('bn.subv', 4)
+class BNSUBV(BNADDSUBVBase):
+    '''BN.SUBV with unsigned lanes (BNMULV versions 1 and 2)'''
+    lane_op = operator.sub
 
-    def __init__(self, raw: int, op_vals: Dict[str, int]):
-        super().__init__(raw, op_vals)
-        self.wrd = op_vals['wrd']
-        self.wrs1 = op_vals['wrs1']
-        self.wrs2 = op_vals['wrs2']
-        self.type = op_vals['type']
 
-    def execute(self, state: OTBNState) -> None:
-        a = state.wdrs.get_reg(self.wrs1).read_unsigned()
-        b = state.wdrs.get_reg(self.wrs2).read_unsigned()
-        mod_val = state.wsrs.MOD.read_unsigned()
-        red = True if self.type > 1 else False
-        size = 32 if (self.type % 2 == 0) else 16
-        mod_val = extract_sub_word(mod_val, size, 0)
-        result = 0
+class BNSUBVSigned(BNSUBV):
+    '''BN.SUBV with signed lanes (BNMULV version 0)'''
+    signed_lanes = True
 
-        for i in range(256 // size - 1, -1, -1):
-            ai = OTBNInsn.from_2s_complement(extract_sub_word(a, size, i), size)
-            bi = OTBNInsn.from_2s_complement(extract_sub_word(b, size, i), size)
-            resulti = ai - bi
-            if red:
-                resulti = cmod_single(resulti, mod_val)
-            if DEBUG_ARITH:
-                eprint(f"subvm {ai} - {bi} = {ai - bi} = {resulti}")
-            result <<= size
-            result |= (OTBNInsn.to_2s_complement(resulti, size) & ((1 << size) - 1))
 
-        result &= ((1 << 256) - 1)
-        state.wdrs.get_reg(self.wrd).write_unsigned(result)
+class BNSUBVCond(BNSUBV):
+    '''BN.SUBV with conditional subtraction (BNMULV version 3)
 
+    This has an extra bit in the type field, which asks for MOD to be
+    conditionally subtracted from each lane of wrs2 before the subtraction.
 
-class BNAND(OTBNInsn):
-    insn = insn_for_mnemonic('bn.and', 6)
+    '''
+    has_cond_type = True
+    reduce_lanes = staticmethod(_reduce_cond_add)
 
+
+class BNAND(OTBNInsn):
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1173,8 +1177,6 @@ class BNAND(OTBNInsn):
 
 
 class BNOR(OTBNInsn):
-    insn = insn_for_mnemonic('bn.or', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1200,8 +1202,6 @@ class BNOR(OTBNInsn):
 
 
 class BNNOT(OTBNInsn):
-    insn = insn_for_mnemonic('bn.not', 5)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1220,8 +1220,6 @@ class BNNOT(OTBNInsn):
 
 
 class BNXOR(OTBNInsn):
-    insn = insn_for_mnemonic('bn.xor', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1245,8 +1243,6 @@ class BNXOR(OTBNInsn):
 
 
 class BNRSHI(OTBNInsn):
-    insn = insn_for_mnemonic('bn.rshi', 4)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1265,8 +1261,6 @@ class BNRSHI(OTBNInsn):
 
 
 class BNSHV(OTBNInsn):
-    insn = insn_for_mnemonic('bn.shv', 6)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1297,8 +1291,6 @@ class BNSHV(OTBNInsn):
 
 
 class BNSEL(OTBNInsn):
-    insn = insn_for_mnemonic('bn.sel', 5)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1317,8 +1309,6 @@ class BNSEL(OTBNInsn):
 
 
 class BNCMP(OTBNInsn):
-    insn = insn_for_mnemonic('bn.cmp', 5)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrs1 = op_vals['wrs1']
@@ -1347,8 +1337,6 @@ class BNCMP(OTBNInsn):
 
 
 class BNCMPB(OTBNInsn):
-    insn = insn_for_mnemonic('bn.cmpb', 5)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrs1 = op_vals['wrs1']
@@ -1373,8 +1361,6 @@ class BNCMPB(OTBNInsn):
 
 
 class BNLID(OTBNInsn):
-    insn = insn_for_mnemonic('bn.lid', 5)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grd = op_vals['grd']
@@ -1444,8 +1430,6 @@ class BNLID(OTBNInsn):
 
 
 class BNSID(OTBNInsn):
-    insn = insn_for_mnemonic('bn.sid', 5)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grs2 = op_vals['grs2']
@@ -1503,8 +1487,6 @@ class BNSID(OTBNInsn):
 
 
 class BNMOV(OTBNInsn):
-    insn = insn_for_mnemonic('bn.mov', 2)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1516,8 +1498,6 @@ class BNMOV(OTBNInsn):
 
 
 class BNMOVR(OTBNInsn):
-    insn = insn_for_mnemonic('bn.movr', 4)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.grd = op_vals['grd']
@@ -1574,8 +1554,6 @@ class BNMOVR(OTBNInsn):
 
 
 class BNWSRR(OTBNInsn):
-    insn = insn_for_mnemonic('bn.wsrr', 2)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1620,8 +1598,6 @@ class BNWSRR(OTBNInsn):
 
 
 class BNWSRW(OTBNInsn):
-    insn = insn_for_mnemonic('bn.wsrw', 2)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wsr = op_vals['wsr']
@@ -1647,8 +1623,6 @@ class BNWSRW(OTBNInsn):
 
 
 class BNTRN(OTBNInsn):
-    insn = insn_for_mnemonic('bn.trn', 4)
-
     def __init__(self, raw: int, op_vals: Dict[str, int]):
         super().__init__(raw, op_vals)
         self.wrd = op_vals['wrd']
@@ -1689,25 +1663,235 @@ class BNTRN(OTBNInsn):
         state.wdrs.get_reg(self.wrd).write_unsigned(result)
 
 
-INSN_CLASSES = [
-    ADD, ADDI, LUI, SUB, SLL, SLLI, SRL, SRLI, SRA, SRAI,
-    AND, ANDI, OR, ORI, XOR, XORI,
-    LW, SW,
-    BEQ, BNE, JAL, JALR,
-    CSRRS, CSRRW,
-    ECALL,
-    LOOP, LOOPI,
-
-    BNADD, BNADDC, BNADDI, BNADDM, BNADDV,
-    BNMULV,
-    BNMULQACC, BNMULQACCWO, BNMULQACCSO,
-    BNSUB, BNSUBB, BNSUBI, BNSUBM, BNSUBV,
-    BNAND, BNOR, BNNOT, BNXOR,
-    BNSHV,
-    BNRSHI,
-    BNSEL,
-    BNCMP, BNCMPB,
-    BNLID, BNSID,
-    BNMOV, BNMOVR, BNTRN,
-    BNWSRR, BNWSRW
+def _read_acc(state: OTBNState) -> int:
+    '''Read the accumulator for BN.MULV when there is no ACCH'''
+    return state.wsrs.ACC.read_unsigned()
+
+
+def _write_acc(state: OTBNState, value: int) -> None:
+    '''Write the accumulator for BN.MULV when there is no ACCH'''
+    state.wsrs.ACC.write_unsigned(value & ((1 << 256) - 1))
+
+
+def _read_acc_acch(state: OTBNState) -> int:
+    '''Read the 512-bit accumulator, with ACCH as its top half'''
+    return ((state.wsrs.ACCH.read_unsigned() << 256) |
+            state.wsrs.ACC.read_unsigned())
+
+
+def _write_acc_acch(state: OTBNState, value: int) -> None:
+    '''Write the 512-bit accumulator, with ACCH as its top half'''
+    state.wsrs.ACC.write_unsigned(value & ((1 << 256) - 1))
+    state.wsrs.ACCH.write_unsigned((value >> 256) & ((1 << 256) - 1))
+
+
+class BNMULVBase(OTBNInsn):
+    '''Code shared by BN.MULV and BN.MULV.L (BNMULV versions 1 and up)
+
+    The differences between versions are given by the has_acch and
+    lo_hi_all_lanes class variables, which are set when the instruction
+    classes get bound to an ISA version (see ISAVersion). They are only
+    looked at when an instruction is decoded, which works out which lanes
+    get multiplied, where the results go and picks the kernel that writes
+    them back for the execution mode.
+
+    '''
+    # If true, the accumulator is ACCH:ACC (512 bits) and each multiplied
+    # lane i accumulates into the i'th double-width lane of it. If false, the
+    # accumulator is just ACC and the multiplied lanes use its double-width
+    # lanes in order.
+    has_acch = False
+
+    # If true, the .lo/.hi execution modes for .16H multiply every lane
+    # (rather than just the even or odd ones).
+    lo_hi_all_lanes = False
+
+    def __init__(self, raw: int, op_vals: Dict[str, int]):
+        super().__init__(raw, op_vals)
+        self.wrd = op_vals['wrd']
+        self.wrs1 = op_vals['wrs1']
+        self.type = op_vals['type']
+
+        # Extract fields in the encoding:
+        #    data_type:    0 = .16H, 1 = .8S
+        #    sel:       0 = .even, 1 = .odd
+        #    acc_mode:  0 = disabled, 1 = .acc, 2 = .acc.z
+        #    exec_mode: 0 = standard, 1 = .lo, 2 = .hi
+        self.data_type = self.type & 0b01
+        self.sel = (self.type & 0b10) >> 1
+        self.acc_mode = (self.type & 0b1100) >> 2
+        self.exec_mode = (self.type & 0b110000) >> 4
+
+        self.size = 32 if self.data_type else 16
+        self.num_lanes = 256 // self.size
+        self.mask = (1 << self.size) - 1
+        self.dmask = (1 << 2 * self.size) - 1
+
+        if (self.lo_hi_all_lanes and
+                self.data_type == 0 and self.exec_mode != 0):
+            self.lane_indices = range(self.num_lanes)
+        elif self.sel:
+            self.lane_indices = range(1, self.num_lanes, 2)
+        else:
+            self.lane_indices = range(0, self.num_lanes, 2)
+
+        self.acc_en = (self.acc_mode == 1) or (self.acc_mode == 2)
+        if self.has_acch:
+            self.num_acc_lanes = self.num_lanes
+            self.acc_indices = list(self.lane_indices)
+            self.read_acc = _read_acc_acch
+            self.write_acc = _write_acc_acch
+        else:
+            self.num_acc_lanes = self.num_lanes // 2
+            self.acc_indices = list(range(len(self.lane_indices)))
+            self.read_acc = _read_acc
+            self.write_acc = _write_acc
+
+        self.lanes = lane_struct(self.num_lanes, self.size)
+        self.acc_lanes = lane_struct(self.num_acc_lanes, 2 * self.size)
+        self.acc_bytes = self.num_acc_lanes * 2 * self.size // 8
+        self.lane_pairs = list(zip(self.lane_indices, self.acc_indices))
+
+        # In the standard execution mode, the low and high halves of the
+        # product of lane i go into a pair of adjacent lanes of wrd.
+        self.lo_hi_pos = [(i - 1, i) if self.sel else (i, i + 1)
+                          for i in self.lane_indices]
+
+        if self.exec_mode == 0:
+            self.write_lanes = self._write_lo_hi
+        elif self.exec_mode == 1:
+            self.write_lanes = self._write_lo
+        elif self.exec_mode == 2:
+            self.write_lanes = self._write_hi
+        else:
+            self.write_lanes = self._write_none
+
+    def _write_lo_hi(self, wrd_v: List[int], prods: List[int]) -> None:
+        '''Write both halves of each product to wrd_v (standard mode)'''
+        size = self.size
+        mask = self.mask
+        for (lo_pos, hi_pos), prodi in zip(self.lo_hi_pos, prods):
+            wrd_v[lo_pos] = prodi & mask
+            wrd_v[hi_pos] = (prodi >> size) & mask
+
+    def _write_lo(self, wrd_v: List[int], prods: List[int]) -> None:
+        '''Write the low half of each product to wrd_v (.lo)'''
+        mask = self.mask
+        for i, prodi in zip(self.lane_indices, prods):
+            wrd_v[i] = prodi & mask
+
+    def _write_hi(self, wrd_v: List[int], prods: List[int]) -> None:
+        '''Write the high half of each product to wrd_v (.hi)'''
+        size = self.size
+        mask = self.mask
+        for i, prodi in zip(self.lane_indices, prods):
+            wrd_v[i] = (prodi >> size) & mask
+
+    def _write_none(self, wrd_v: List[int], prods: List[int]) -> None:
+        '''Leave wrd_v alone (for the unused execution mode)'''
+        return
+
+    def mulv(self, state: OTBNState, wrs1: int,
+             wrs2_v: Sequence[int]) -> None:
+        '''Multiply wrs1 lane-wise by wrs2_v and write back the results'''
+        wrs1_v = self.lanes.unpack(wrs1.to_bytes(32, 'little'))
+        wrd_v = list(wrs1_v)
+
+        if self.acc_en:
+            if self.acc_mode == 2:
+                acc_v = [0] * self.num_acc_lanes
+            else:
+                acc = self.read_acc(state)
+                acc_v = list(self.acc_lanes.unpack(
+                    acc.to_bytes(self.acc_bytes, 'little')))
+
+            prods = []
+            for i, j in self.lane_pairs:
+                prodi = wrs1_v[i] * wrs2_v[i] + acc_v[j]
+                acc_v[j] = prodi
+                prods.append(prodi)
+        else:
+            prods = [wrs1_v[i] * wrs2_v[i] for i in self.lane_indices]
+
+        self.write_lanes(wrd_v, prods)
+
+        result = int.from_bytes(self.lanes.pack(*wrd_v), 'little')
+        state.wdrs.get_reg(self.wrd).write_unsigned(result)
+
+        if self.acc_en:
+            dmask = self.dmask
+            acc = int.from_bytes(
+                self.acc_lanes.pack(*[acci & dmask for acci in acc_v]),
+                'little')
+            self.write_acc(state, acc)
+
+        if DEBUG_ARITH:
+            eprint(f"exec_mode | acc_mode | sel | data_type = "
+                   f"{self.exec_mode} | {self.acc_mode} | {self.sel} | "
+                   f"{self.data_type}")
+            eprint(f'lane_indices = {self.lane_indices}')
+            eprint(f"products = {[hex(prodi) for prodi in prods]}")
+            eprint(f"result at the end = {hex(result)}")
+            if self.acc_en:
+                eprint(f"acc at the end = {hex(acc)}")
+
+
+class BNMULV(BNMULVBase):
+    def __init__(self, raw: int, op_vals: Dict[str, int]):
+        super().__init__(raw, op_vals)
+        self.wrs2 = op_vals['wrs2']
+
+    def execute(self, state: OTBNState) -> None:
+        wrs1 = state.wdrs.get_reg(self.wrs1).read_unsigned()
+        wrs2 = state.wdrs.get_reg(self.wrs2).read_unsigned()
+        self.mulv(state, wrs1, self.lanes.unpack(wrs2.to_bytes(32, 'little')))
+
+
+class BNMULVL(BNMULVBase):
+    def __init__(self, raw: int, op_vals: Dict[str, int]):
+        super().__init__(raw, op_vals)
+        self.lane_reg = op_vals['lane_reg']
+        self.lane_index = op_vals['lane_index']
+
+    def execute(self, state: OTBNState) -> None:
+        wrs1 = state.wdrs.get_reg(self.wrs1).read_unsigned()
+        # The lane comes from w17 (if lane_reg is set) or w16.
+        wrs2 = state.wdrs.get_reg(17 if self.lane_reg else 16).read_unsigned()
+        wrs2_v = ([extract_sub_word(wrs2, self.size, self.lane_index)] *
+                  self.num_lanes)
+        self.mulv(state, wrs1, wrs2_v)
+
+
+# The instructions that behave the same in every BNMULV version, as
+# (mnemonic, number of operands, implementation). The instructions that
+# differ between versions (BN.ADDV, BN.SUBV, BN.MULV and BN.MULV.L) get
+# added by ISAVersion, which binds each implementation to the encoding from
+# the version's YAML file.
+COMMON_INSNS: List[Tuple[str, int, Type[OTBNInsn]]] = [
+    ('add', 3, ADD), ('addi', 3, ADDI), ('lui', 2, LUI), ('sub', 3, SUB),
+    ('sll', 3, SLL), ('slli', 3, SLLI), ('srl', 3, SRL), ('srli', 3, SRLI),
+    ('sra', 3, SRA), ('srai', 3, SRAI),
+    ('and', 3, AND), ('andi', 3, ANDI), ('or', 3, OR), ('ori', 3, ORI),
+    ('xor', 3, XOR), ('xori', 3, XORI),
+    ('lw', 3, LW), ('sw', 3, SW),
+    ('beq', 3, BEQ), ('bne', 3, BNE), ('jal', 2, JAL), ('jalr', 3, JALR),
+    ('csrrs', 3, CSRRS), ('csrrw', 3, CSRRW),
+    ('ecall', 0, ECALL),
+    ('loop', 2, LOOP), ('loopi', 2, LOOPI),
+
+    ('bn.add', 6, BNADD), ('bn.addc', 6, BNADDC), ('bn.addi', 4, BNADDI),
+    ('bn.addm', 3, BNADDM),
+    ('bn.mulqacc', 6, BNMULQACC), ('bn.mulqacc.wo', 8, BNMULQACCWO),
+    ('bn.mulqacc.so', 9, BNMULQACCSO),
+    ('bn.sub', 6, BNSUB), ('bn.subb', 6, BNSUBB), ('bn.subi', 4, BNSUBI),
+    ('bn.subm', 3, BNSUBM),
+    ('bn.and', 6, BNAND), ('bn.or', 6, BNOR), ('bn.not', 5, BNNOT),
+    ('bn.xor', 6, BNXOR),
+    ('bn.shv', 6, BNSHV),
+    ('bn.rshi', 4, BNRSHI),
+    ('bn.sel', 5, BNSEL),
+    ('bn.cmp', 5, BNCMP), ('bn.cmpb', 5, BNCMPB),
+    ('bn.lid', 5, BNLID), ('bn.sid', 5, BNSID),
+    ('bn.mov', 2, BNMOV), ('bn.movr', 4, BNMOVR), ('bn.trn', 4, BNTRN),
+    ('bn.wsrr', 2, BNWSRR), ('bn.wsrw', 2, BNWSRW),
 ]
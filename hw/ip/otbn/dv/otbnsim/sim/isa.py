@@ -9,11 +9,11 @@
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
 
-import os
+import struct
 import sys
 from typing import Dict, Iterator, Optional, Tuple
 
-from shared.insn_yaml import Insn, DummyInsn, load_insns_yaml
+from shared.insn_yaml import Insn, InsnsFile, DummyInsn, load_insns_yaml
 
 from .state import OTBNState
 
@@ -23,12 +23,15 @@ from .state import OTBNState
 # a particular Insn object from shared.insn_yaml, so we want a class variable
 # on the OTBNInsn that points at the corresponding Insn.
 
-def get_insns_file():
-    ''' Get the correct INSNS_FILE from the correct yaml file depending on the
-    environment variable BNMULV_VER set either by the user or by standalone.py
+def get_insns_file(bnmulv_version_id: str = '0') -> InsnsFile:
+    '''Get the INSNS_FILE for the given BNMULV version
+
+    The result is cached per version (by load_insns_yaml), so this is cheap to
+    call more than once. If the file can't be loaded, print a message to
+    stderr and exit.
+
     '''
     try:
-        bnmulv_version_id = os.environ.get('BNMULV_VER', '0')
         insns_file = load_insns_yaml(bnmulv_version_id)
     except RuntimeError as err:
         sys.stderr.write('{}\n'.format(err))
@@ -36,17 +39,19 @@ def get_insns_file():
 
     return insns_file
 
-def insn_for_mnemonic(mnemonic: str, num_operands: int) -> Insn:
+def insn_for_mnemonic(mnemonic: str, num_operands: int,
+                      bnmulv_version_id: str = '0') -> Insn:
     '''Look up the named instruction in the loaded YAML data.
 
-    To make sure nothing's gone really wrong, make sure it has the expected
-    number of operands. If we fail to find the right instruction, print a
-    message to stderr and exit (rather than raising a RuntimeError: this
-    happens on module load time, so it's a lot clearer to the user what's going
-    on this way).
+    The instruction is looked up in the instruction file for
+    bnmulv_version_id. To make sure nothing's gone really wrong, make sure it
+    has the expected number of operands. If we fail to find the right
+    instruction, print a message to stderr and exit (rather than raising a
+    RuntimeError: this happens on module load time, so it's a lot clearer to
+    the user what's going on this way).
 
     '''
-    insns_file = get_insns_file()
+    insns_file = get_insns_file(bnmulv_version_id)
     insn = insns_file.mnemonic_to_insn.get(mnemonic)
     if insn is None:
         sys.stderr.write('Failed to find an instruction for mnemonic {!r} in '
@@ -231,3 +236,31 @@ def extract_sub_word(value: int, size: int, index: int) -> int:
     assert 0 <= value < (1 << 256)
     assert 0 <= index <= 256 // size
     return (value >> (index * size)) & ((1 << size) - 1)
+
+
+_LANE_STRUCTS: Dict[Tuple[int, int, bool], struct.Struct] = {}
+
+
+def lane_struct(num_lanes: int, size: int,
+                signed: bool = False) -> struct.Struct:
+    '''Get a Struct that splits a little-endian value into lanes.
+
+    The value is num_lanes * size bits wide and size should be 16, 32 or 64.
+    Lane 0 is the least significant, matching extract_sub_word. Unpacking
+    the bytes of the value (from int.to_bytes(..., 'little')) gives a tuple of
+    lanes and packing a sequence of lanes gives the bytes back. If signed is
+    true, the lanes are interpreted as 2's complement values.
+
+    The Structs are cached, so this is cheap to call when decoding an
+    instruction.
+
+    '''
+    key = (num_lanes, size, signed)
+    lanes = _LANE_STRUCTS.get(key)
+    if lanes is None:
+        fmt_char = {16: 'h', 32: 'i', 64: 'q'}[size]
+        if not signed:
+            fmt_char = fmt_char.upper()
+        lanes = struct.Struct('<{}{}'.format(num_lanes, fmt_char))
+        _LANE_STRUCTS[key] = lanes
+    return lanes
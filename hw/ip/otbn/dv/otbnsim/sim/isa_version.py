@@ -0,0 +1,155 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Selection of the BNMULV ISA variant that a simulator runs'''
+
+import os
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from shared.insn_yaml import InsnsFile
+
+from . import insn
+from .isa import OTBNInsn, get_insns_file, insn_for_mnemonic
+
+_VERSION_IDS = ['0', '1', '2', '3']
+
+# A row in the instruction table of an ISA version: (mnemonic, number of
+# operands, implementation, class variables to set on the bound class).
+_InsnRow = Tuple[str, int, Type[OTBNInsn], Dict[str, Any]]
+
+
+class ISAVersion:
+    '''A BNMULV version of the OTBN ISA
+
+    This bundles together the instruction encodings (from the matching insns
+    YAML file) and the instruction classes that implement them. Everything is
+    loaded lazily and then cached, so several simulators in the same process
+    can share an ISAVersion (and several versions can coexist).
+
+    The versions differ in a handful of bignum vector instructions. The
+    differences are described by the feature flags below, which pick the
+    implementation of each of those instructions when the instruction
+    classes are made (so nothing needs to check the version when executing
+    an instruction).
+
+    Use get_isa_version() rather than constructing these directly.
+
+    '''
+    def __init__(self, version_id: str) -> None:
+        if version_id not in _VERSION_IDS:
+            raise ValueError('Unknown BNMULV version {!r}. Valid versions '
+                             'are {}.'
+                             .format(version_id, ', '.join(_VERSION_IDS)))
+        self.version_id = version_id
+
+        version = int(version_id)
+
+        # Versions 2 and up have an ACCH register, which extends the
+        # accumulator of BN.MULV and BN.MULV.L (and whose changes should
+        # appear in the trace).
+        self.has_acch = version >= 2
+
+        # Version 0 has a single BN.MULV instruction with a lane operand and
+        # optional Montgomery reduction. Later versions split it into
+        # BN.MULV and BN.MULV.L, which have accumulation and execution modes.
+        self.has_mulv_l = version >= 1
+
+        # Version 0 treats the lanes of BN.ADDV and BN.SUBV as signed.
+        self.signed_vec_lanes = version == 0
+
+        # In versions 2 and up, the .lo and .hi execution modes of BN.MULV
+        # and BN.MULV.L multiply every .16H lane.
+        self.lo_hi_all_lanes = version >= 2
+
+        # Version 3 adds a conditional subtraction mode to BN.ADDV and
+        # BN.SUBV.
+        self.has_cond_sub = version >= 3
+
+        self._insns_file: Optional[InsnsFile] = None
+        self._insn_classes: Optional[List[Type[OTBNInsn]]] = None
+        self._mnem_to_class: Optional[Dict[str, Type[OTBNInsn]]] = None
+
+    @property
+    def insns_file(self) -> InsnsFile:
+        '''The parsed instruction encodings for this version'''
+        if self._insns_file is None:
+            self._insns_file = get_insns_file(self.version_id)
+        return self._insns_file
+
+    def _insn_table(self) -> List[_InsnRow]:
+        '''The instruction table for this version'''
+        table: List[_InsnRow] = [(mnemonic, num_operands, impl, {})
+                                 for mnemonic, num_operands, impl
+                                 in insn.COMMON_INSNS]
+
+        if self.signed_vec_lanes:
+            table += [('bn.addv', 4, insn.BNADDVSigned, {}),
+                      ('bn.subv', 4, insn.BNSUBVSigned, {})]
+        elif self.has_cond_sub:
+            table += [('bn.addv', 4, insn.BNADDVCond, {}),
+                      ('bn.subv', 4, insn.BNSUBVCond, {})]
+        else:
+            table += [('bn.addv', 4, insn.BNADDV, {}),
+                      ('bn.subv', 4, insn.BNSUBV, {})]
+
+        if self.has_mulv_l:
+            mulv_vars = {'has_acch': self.has_acch,
+                         'lo_hi_all_lanes': self.lo_hi_all_lanes}
+            table += [('bn.mulv', 4, insn.BNMULV, mulv_vars),
+                      ('bn.mulv.l', 5, insn.BNMULVL, mulv_vars)]
+        else:
+            table += [('bn.mulv', 5, insn.BNMULVMont, {})]
+
+        return table
+
+    @property
+    def insn_classes(self) -> List[Type[OTBNInsn]]:
+        '''The instruction classes that implement this version
+
+        Each of these is a subclass of an implementation in insn.py, with its
+        insn class variable pointing at the encoding from this version's
+        YAML file.
+
+        '''
+        if self._insn_classes is None:
+            classes = []
+            for mnemonic, num_operands, impl, class_vars in self._insn_table():
+                attrs = dict(class_vars)
+                attrs['insn'] = insn_for_mnemonic(mnemonic, num_operands,
+                                                  self.version_id)
+                classes.append(type(impl.__name__, (impl,), attrs))
+            self._insn_classes = classes
+        return self._insn_classes
+
+    @property
+    def mnem_to_class(self) -> Dict[str, Type[OTBNInsn]]:
+        '''A map from mnemonic to the instruction class that implements it'''
+        if self._mnem_to_class is None:
+            self._mnem_to_class = {cls.insn.mnemonic: cls
+                                   for cls in self.insn_classes}
+        return self._mnem_to_class
+
+    def insn_class(self, mnemonic: str) -> Type[OTBNInsn]:
+        '''Get the instruction class for mnemonic'''
+        return self.mnem_to_class[mnemonic]
+
+
+_ISA_VERSIONS: Dict[str, ISAVersion] = {}
+
+
+def get_isa_version(version_id: Optional[str] = None) -> ISAVersion:
+    '''Get the (cached) ISAVersion for version_id
+
+    If version_id is None, fall back to the BNMULV_VER environment variable
+    (which is set by the Bazel rules) and then to version 0.
+
+    '''
+    if version_id is None:
+        version_id = os.environ.get('BNMULV_VER', '0')
+
+    isa_version = _ISA_VERSIONS.get(version_id)
+    if isa_version is None:
+        isa_version = ISAVersion(version_id)
+        _ISA_VERSIONS[version_id] = isa_version
+    return isa_version
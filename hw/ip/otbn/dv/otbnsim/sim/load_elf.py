@@ -14,7 +14,9 @@ from typing import Optional, Dict
 from shared.elf import read_elf
 
 from .decode import decode_words
+from .isa_version import ISAVersion
 from .sim import LoopWarps, OTBNSim
+from .standalonesim import StandaloneSim
 
 
 def _get_exp_end_addr(symbols: Dict[str, int]) -> Optional[int]:
@@ -72,25 +74,63 @@ def _get_loop_warps(symbols: Dict[str, int]) -> LoopWarps:
     return ret
 
 
-def load_elf(sim: OTBNSim, path: str, dump_rtl_sim: bool = False) -> Optional[int]:
-    '''Load ELF file at path and inject its contents into sim
+class PreparedProgram:
+    '''An OTBN ELF file that has been read and decoded, ready to simulate
 
-    Returns the expected end address, if set, otherwise None.
+    Loading an ELF file means reading it, decoding every instruction word and
+    parsing its symbols for loop warps. This object does that work once and
+    keeps the results (which are never modified by a simulation), so that the
+    program can then be loaded into any number of simulators cheaply.
 
     '''
-    (imem_bytes, dmem_bytes, symbols) = read_elf(path)
+    def __init__(self, path: str, isa_version: ISAVersion) -> None:
+        (imem_bytes, dmem_bytes, symbols) = read_elf(path)
+
+        # Collect imem bytes into 32-bit words and set the validity bit for
+        # each
+        assert len(imem_bytes) & 3 == 0
+        imem_words = [(True, w32s[0])
+                      for w32s in struct.iter_unpack('<I', imem_bytes)]
+
+        self.path = path
+        self.isa_version = isa_version
+        self.imem_insns = decode_words(0, imem_words, isa_version)
+        self.dmem_bytes = dmem_bytes
+        self.symbols = symbols
+        self.loop_warps = _get_loop_warps(symbols)
+        self.exp_end_addr = _get_exp_end_addr(symbols)
+
+    def load(self, sim: OTBNSim) -> None:
+        '''Load the program and its initial DMEM contents into sim'''
+        if sim.isa_version is not self.isa_version:
+            raise ValueError('Cannot load a program decoded for BNMULV '
+                             'version {} into a simulator for version {}.'
+                             .format(self.isa_version.version_id,
+                                     sim.isa_version.version_id))
+
+        sim.load_program(self.imem_insns)
+        sim.loop_warps = {addr: warps.copy()
+                          for addr, warps in self.loop_warps.items()}
+        sim.load_data(self.dmem_bytes, has_validity=False)
+
+    def reset(self, sim: OTBNSim) -> None:
+        '''Reset sim to a freshly loaded copy of the program'''
+        sim.reset()
+        self.load(sim)
+
+    def new_sim(self) -> StandaloneSim:
+        '''Make a new standalone simulator with the program loaded'''
+        sim = StandaloneSim(self.isa_version)
+        self.load(sim)
+        return sim
 
-    # Collect imem bytes into 32-bit words and set the validity bit for each
-    assert len(imem_bytes) & 3 == 0
-    imem_words = [(True, w32s[0])
-                  for w32s in struct.iter_unpack('<I', imem_bytes)]
 
-    imem_insns = decode_words(0, imem_words)
-    loop_warps = _get_loop_warps(symbols)
-    exp_end = _get_exp_end_addr(symbols)
+def load_elf(sim: OTBNSim, path: str, dump_rtl_sim: bool = False) -> Optional[int]:
+    '''Load ELF file at path and inject its contents into sim
 
-    sim.load_program(imem_insns)
-    sim.loop_warps = loop_warps
-    sim.load_data(dmem_bytes, has_validity=False)
+    Returns the expected end address, if set, otherwise None.
 
-    return exp_end
+    '''
+    prepared = PreparedProgram(path, sim.isa_version)
+    prepared.load(sim)
+    return prepared.exp_end_addr
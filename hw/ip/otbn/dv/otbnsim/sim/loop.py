@@ -5,6 +5,7 @@
 from typing import Dict, List, Optional
 
 from .constants import ErrBits
+from .dirty import DirtyTracked
 from .trace import Trace
 
 
@@ -56,7 +57,7 @@ class LoopLevel:
         return self.start_addr - 4
 
 
-class LoopStack:
+class LoopStack(DirtyTracked):
     '''An object representing the loop stack
 
     The loop stack holds up to 8 LoopLevel objects, corresponding to nested
@@ -93,6 +94,7 @@ class LoopStack:
             self.err_flag = True
 
         self.trace.append(TraceLoopStart(depth, loop_count, insn_count))
+        self.mark_dirty()
         self.stack.append(LoopLevel(start_addr, insn_count, loop_count - 1))
 
     def is_last_insn_in_loop_body(self, pc: int) -> bool:
@@ -111,6 +113,7 @@ class LoopStack:
             # Make sure that it isn't a jump, branch or another loop
             # instruction.
             self.err_flag = True
+            self.mark_dirty()
 
     def step(self, pc: int, warps: Dict[int, int]) -> Optional[int]:
         '''Update loop stack. If we should loop, return new PC'''
@@ -137,6 +140,7 @@ class LoopStack:
 
             self.trace.append(TraceLoopIteration(len(self.stack),
                                                  loop_idx, top.loop_count))
+            self.mark_dirty()
             return ret_val
 
         return None
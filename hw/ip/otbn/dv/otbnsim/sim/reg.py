@@ -4,6 +4,7 @@
 
 from typing import List, Optional, Set
 
+from .dirty import DirtyTracked
 from .trace import Trace
 
 
@@ -82,7 +83,7 @@ class Reg:
         self._next_uval = None
 
 
-class RegFile:
+class RegFile(DirtyTracked):
     '''A base class for register files (used for both GPRs and WDRs).
 
     For GPRs, we override it (see gpr.py) to support our magic x0 and x1
@@ -105,6 +106,7 @@ class RegFile:
         '''Mark a register as having been written'''
         assert 0 <= idx < len(self._registers)
         self._pending_writes.add(idx)
+        self.mark_dirty()
 
     def get_reg(self, idx: int) -> Reg:
         assert 0 <= idx < len(self._registers)
@@ -5,11 +5,13 @@
 # Copyright "Towards ML-KEM & ML-DSA on OpenTitan" Authors.
 
 
-from typing import Dict, Iterator, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+from .blocks import BlockCache, BlockRunner
 from .constants import ErrBits, LcTx, Status, read_lc_tx_t
 from .decode import EmptyInsn
 from .isa import OTBNInsn
+from .isa_version import ISAVersion, get_isa_version
 from .state import OTBNState, FsmState
 from .stats import ExecutionStats
 from .trace import Trace
@@ -26,17 +28,55 @@ StepRes = Tuple[Optional[OTBNInsn], List[Trace]]
 
 
 class OTBNSim:
-    def __init__(self) -> None:
-        self.state = OTBNState()
+    def __init__(self, isa_version: Optional[ISAVersion] = None) -> None:
+        # The ISA variant that this simulator runs. If none is given, this
+        # comes from the BNMULV_VER environment variable.
+        self.isa_version = isa_version or get_isa_version()
+        self.state = OTBNState(self.isa_version.has_acch)
         self.program: List[OTBNInsn] = []
         self.loop_warps: LoopWarps = {}
         self.stats: Optional[ExecutionStats] = None
         self._execute_generator: Optional[Iterator[None]] = None
         self._next_insn: Optional[OTBNInsn] = None
 
+        # If this is false, step() doesn't build the list of architectural
+        # changes for each cycle (and returns an empty list instead) unless it
+        # is printing a verbose trace. Nothing else depends on those changes,
+        # so this saves a lot of work when no-one is looking at them.
+        self.collect_changes = True
+
+        # The compiled basic blocks of self.program for step_block(). This is
+        # built on first use and thrown away if the program changes.
+        self._blocks: Optional[BlockCache] = None
+
+        # Pairs: (stepper, handles_injected_err) for each FSM state. If
+        # handles_injected_err is False then the generic code in step() will
+        # deal with any pending errors in self.state.injected_err_bits. If
+        # True, then we expect the stepper function to handle them.
+        self._steppers = {
+            FsmState.MEM_SEC_WIPE: (self._step_ext_wipe, False),
+            FsmState.IDLE: (self._step_idle, False),
+            FsmState.PRE_EXEC: (self._step_pre_exec, False),
+            FsmState.EXEC: (self._step_exec, True),
+            FsmState.PRE_WIPE: (self._step_pre_wipe, False),
+            FsmState.WIPING: (self._step_wiping, False),
+            FsmState.LOCKED: (self._step_idle, False)
+        }
+
+    def reset(self) -> None:
+        '''Throw away all simulation state, as if newly constructed'''
+        self.state = OTBNState(self.isa_version.has_acch)
+        self.program = []
+        self.loop_warps = {}
+        self.stats = None
+        self._execute_generator = None
+        self._next_insn = None
+        self._blocks = None
+
     def load_program(self, program: List[OTBNInsn]) -> None:
         self.program = program.copy()
         self.state.clear_imem_invalidation()
+        self._blocks = None
 
     def add_loop_warp(self, addr: int, from_cnt: int, to_cnt: int) -> None:
         '''Add a new loop warp to the simulation'''
@@ -54,13 +94,17 @@ class OTBNSim:
         '''
         self.state.dmem.load_le_words(data, has_validity)
 
-    def start(self, collect_stats: bool) -> None:
+    def start(self, collect_stats: bool, collect_profile: bool = False) -> None:
         '''Prepare to start the execution.
 
-        Use run() or step() to actually execute the program.
+        Use run() or step() to actually execute the program. If
+        collect_profile is true, the statistics also include call stack
+        samples (see ExecutionStats.stack_samples).
 
         '''
-        self.stats = ExecutionStats(self.program) if collect_stats else None
+        self.stats = (ExecutionStats(self.program, self.isa_version,
+                                     collect_profile)
+                      if collect_stats or collect_profile else None)
         self._execute_generator = None
         self._next_insn = None
         self.state.start()
@@ -96,13 +140,19 @@ class OTBNSim:
 
         return self.program[word_pc]
 
+    def _changes(self, verbose: bool) -> List[Trace]:
+        '''Get the pending changes for this cycle, if anyone wants them'''
+        if verbose or self.collect_changes:
+            return self.state.changes()
+        return []
+
     def _on_stall(self,
                   verbose: bool,
                   fetch_next: bool,
                   no_count: bool = False) -> List[Trace]:
         '''This is run on a stall cycle'''
         self.state.stop_if_pending_halt()
-        changes = self.state.changes()
+        changes = self._changes(verbose)
         self.state.commit(sim_stalled=True)
         if fetch_next:
             self._next_insn = self._fetch(self.state.pc)
@@ -126,8 +176,10 @@ class OTBNSim:
             if insn.has_fetch_stall or halting:
                 # Count a stall towards the fetch stalling instruction
                 self.stats.record_stall(self.state)
+            if halting:
+                self.stats.stack_usage = self.state.gprs.stack_usage()
 
-        changes = self.state.changes()
+        changes = self._changes(verbose)
 
         # Program counter before commit
         pc_before = self.state.pc
@@ -138,8 +190,8 @@ class OTBNSim:
         no_fetch = halting or insn.has_fetch_stall
         self._next_insn = None if no_fetch else self._fetch(self.state.pc)
 
-        disasm = insn.disassemble(pc_before)
         if verbose:
+            disasm = insn.disassemble(pc_before)
             self._print_trace(pc_before, disasm, changes)
 
         return changes
@@ -190,25 +242,104 @@ class OTBNSim:
 
         '''
         fsm_state = self.state.get_fsm_state()
-        # Pairs: (stepper, handles_injected_err). If handles_injected_err is
-        # False then the generic code here will deal with any pending errors in
-        # self.state.injected_err_bits. If True, then we expect the stepper
-        # function to handle them.
-        steppers = {
-            FsmState.MEM_SEC_WIPE: (self._step_ext_wipe, False),
-            FsmState.IDLE: (self._step_idle, False),
-            FsmState.PRE_EXEC: (self._step_pre_exec, False),
-            FsmState.EXEC: (self._step_exec, True),
-            FsmState.PRE_WIPE: (self._step_pre_wipe, False),
-            FsmState.WIPING: (self._step_wiping, False),
-            FsmState.LOCKED: (self._step_idle, False)
-        }
-
-        stepper, handles_injected_err = steppers[fsm_state]
+        stepper, handles_injected_err = self._steppers[fsm_state]
         self.state.step(not handles_injected_err)
 
         return stepper(verbose)
 
+    def step_block(self, start_cycle: Callable[[], None]) -> int:
+        '''Run the basic block at the current PC, if possible.
+
+        This is equivalent to calling step() (with verbose false) once for
+        each cycle of the block, but doesn't go through the generic code that
+        step() runs on every cycle. It only does anything if we're executing
+        and at the start of an instruction that can go in a block (see
+        sim/blocks.py), with no errors, escalations, RMA requests or IMEM
+        invalidation pending and no changes to collect.
+
+        The caller should call start_cycle() before calling this: it is the
+        work to do at the start of each cycle (such as providing EDN data) and
+        gets called for each later cycle in the block.
+
+        Returns the number of cycles that were run. If this is zero, the
+        caller should use step() instead.
+
+        '''
+        state = self.state
+        rnd = state.wsrs.RND
+        if (self._execute_generator is not None or
+                self._next_insn is None or
+                self.collect_changes or
+                state.get_fsm_state() != FsmState.EXEC or
+                state.pending_halt or
+                state.injected_err_bits or
+                state.rma_req == LcTx.ON or
+                rnd.rep_err_escalate or rnd.fips_err_escalate or
+                state.imem_invalidation_pending() or
+                not state.init_sec_wipe_is_done()):
+            return 0
+
+        if self._blocks is None:
+            self._blocks = BlockCache(self.program, self._compile_block)
+
+        block = self._blocks.get(state.pc)
+        if block is None:
+            return 0
+
+        return block(start_cycle)
+
+    def _compile_block(self,
+                       start_pc: int,
+                       insns: List[OTBNInsn]) -> BlockRunner:
+        '''Make a function that runs the block of insns at start_pc
+
+        Each cycle does the same as the corresponding call to _step_exec would
+        (given the checks in step_block), including the stall cycles of
+        multi-cycle instructions. The function stops early if an instruction
+        causes the simulation to halt.
+
+        '''
+        def run_block(start_cycle: Callable[[], None]) -> int:
+            state = self.state
+            wsrs = state.wsrs
+            cycles = 0
+            for insn in insns:
+                if cycles:
+                    start_cycle()
+                state.step(False)
+                wsrs.URND.step()
+                wsrs.KMAC_MSG.step()
+
+                state.pre_insn(insn.affects_control)
+                generator = insn.execute(state)
+                while generator is not None:
+                    try:
+                        next(generator)
+                    except StopIteration:
+                        break
+
+                    # If an error has been flagged, the instruction is
+                    # finished (but aborted).
+                    if state.pending_halt:
+                        break
+
+                    self._on_stall(False, fetch_next=False)
+                    cycles += 1
+                    start_cycle()
+                    state.step(False)
+                    wsrs.URND.step()
+                    wsrs.KMAC_MSG.step()
+
+                cycles += 1
+                self._on_retire(False, insn)
+                if self._next_insn is None:
+                    # We're halting
+                    break
+
+            return cycles
+
+        return run_block
+
     def _step_idle(self, verbose: bool) -> StepRes:
         '''Step the simulation when OTBN is IDLE or LOCKED'''
         self.state.stop_if_pending_halt()
@@ -267,14 +398,14 @@ class OTBNSim:
                     if is_locked:
                         self.state.lock_after_wipe = True
 
-        changes = self.state.changes()
+        changes = self._changes(verbose)
         self.state.commit(sim_stalled=True)
         return (None, changes)
 
     def _step_ext_wipe(self, verbose: bool) -> StepRes:
         '''Step the simulation DMEM/IMEM wipe operation'''
         self.state.stop_if_pending_halt()
-        changes = self.state.changes()
+        changes = self._changes(verbose)
         self.state.commit(sim_stalled=True)
         return (None, changes)
 
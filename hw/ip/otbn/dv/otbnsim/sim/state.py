@@ -10,6 +10,7 @@ from shared.mem_layout import get_memory_layout
 from .csr import CSRFile
 from .dmem import Dmem
 from .constants import ErrBits, LcTx, Status
+from .dirty import DirtySet
 from .edn_client import EdnClient
 from .ext_regs import OTBNExtRegs
 from .flags import FlagReg
@@ -76,12 +77,16 @@ class InitSecWipeState(IntEnum):
 
 
 class OTBNState:
-    def __init__(self) -> None:
+    def __init__(self, trace_acch: bool = False) -> None:
+        # The components below tell this about any pending changes, so that
+        # commit() and _abort() only need to visit the ones that changed.
+        self._dirty = DirtySet()
+
         self.gprs = GPRs()
         self.wdrs = RegFile('w', 256, 32)
 
         self.ext_regs = OTBNExtRegs()
-        self.wsrs = WSRFile(self.ext_regs)
+        self.wsrs = WSRFile(self.ext_regs, trace_acch)
         self.csrs = CSRFile()
 
         self.pc = 0
@@ -108,6 +113,10 @@ class OTBNState:
 
         self.loop_stack = LoopStack()
 
+        for component in [self.gprs, self.wdrs, self.dmem, self.loop_stack,
+                          self.wsrs, self.csrs.flags]:
+            component.track_dirty(self._dirty)
+
         self._err_bits = 0
         self.pending_halt = False
 
@@ -326,12 +335,7 @@ class OTBNState:
         if old_state not in [FsmState.EXEC, FsmState.WIPING]:
             return
 
-        self.gprs.commit()
-        self.dmem.commit()
-        self.loop_stack.commit()
-        self.wsrs.commit()
-        self.csrs.flags.commit()
-        self.wdrs.commit()
+        self._dirty.commit()
 
         if not sim_stalled:
             self.pc = self.get_next_pc()
@@ -339,14 +343,9 @@ class OTBNState:
 
     def _abort(self) -> None:
         '''Abort any pending state changes'''
-        self.gprs.abort()
         self._pc_next_override = None
-        self.dmem.abort()
-        self.loop_stack.abort()
         self.ext_regs.abort()
-        self.wsrs.abort()
-        self.csrs.flags.abort()
-        self.wdrs.abort()
+        self._dirty.abort()
 
     def start(self) -> None:
         '''Start running; perform state init'''
@@ -360,13 +359,16 @@ class OTBNState:
 
         self.pc = 0
 
-        # Reset CSRs, WSRs, loop stack and call stack. WSRs have special
-        # treatment because some of them have values that persist across
-        # operations.
+        # Reset CSRs, WSRs, loop stack, call stack and stack usage
+        # tracking. WSRs have special treatment because some of them have
+        # values that persist across operations.
         self.csrs = CSRFile()
+        self.csrs.flags.track_dirty(self._dirty)
         self.wsrs.on_start()
         self.loop_stack = LoopStack()
+        self.loop_stack.track_dirty(self._dirty)
         self.gprs.empty_call_stack()
+        self.gprs.clear_stack_usage()
 
         # Poison the requester so that we'll discard the rest of any in-flight
         # request.
@@ -543,6 +545,11 @@ class OTBNState:
     def invalidate_imem(self) -> None:
         self._time_to_imem_invalidation = 2
 
+    def imem_invalidation_pending(self) -> bool:
+        '''IMEM has been invalidated or is going to be soon'''
+        return (self.invalidated_imem or
+                self._time_to_imem_invalidation is not None)
+
     def clear_imem_invalidation(self) -> None:
         '''Clear any effective or pending IMEM invalidation'''
         self._time_to_imem_invalidation = None
@@ -8,7 +8,7 @@
 # (https://eprint.iacr.org/2025/2028)
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
-import os
+from bisect import bisect_right
 from collections import Counter, defaultdict
 from typing import Dict, List, Optional, Tuple
 import re
@@ -19,30 +19,49 @@ from elftools.elf.sections import SymbolTableSection  # type: ignore
 from tabulate import tabulate
 from operator import add
 
-bnmulv_version_id = os.environ.get('BNMULV_VER', '0')
-if bnmulv_version_id == '1':
-    from .insn_ver1 import BEQ, BNE, ECALL, JAL, JALR, LOOP, LOOPI
-elif bnmulv_version_id == '2':
-    from .insn_ver2 import BEQ, BNE, ECALL, JAL, JALR, LOOP, LOOPI
-elif bnmulv_version_id == '3':
-    from .insn_ver3 import BEQ, BNE, ECALL, JAL, JALR, LOOP, LOOPI
-else:
-    from .insn import BEQ, BNE, ECALL, JAL, JALR, LOOP, LOOPI
-
 from .isa import OTBNInsn
+from .isa_version import ISAVersion
 from .state import OTBNState
 
 
+# A call stack sample: the return addresses on the x1 call stack (bottom-first)
+# and the PC.
+StackSample = Tuple[Tuple[int, ...], int]
+
+
 class ExecutionStats:
-    def __init__(self, program: List[OTBNInsn]) -> None:
+    def __init__(self, program: List[OTBNInsn],
+                 isa_version: ISAVersion,
+                 collect_profile: bool = False) -> None:
         # Executed program (the contents of the instruction memory).
         self.program = program
 
+        # Instruction classes that change control flow, from the ISA variant
+        # that the program was decoded for.
+        self._jump_classes = (isa_version.insn_class('jal'),
+                              isa_version.insn_class('jalr'))
+        self._branch_classes = (isa_version.insn_class('beq'),
+                                isa_version.insn_class('bne'))
+        self._loop_class = isa_version.insn_class('loop')
+        self._loopi_class = isa_version.insn_class('loopi')
+        self._ecall_class = isa_version.insn_class('ecall')
+
         self.stall_count = 0
+
+        # Maximum stack usage in bytes (see GPRs.stack_usage()). This gets
+        # filled in when the program stops.
+        self.stack_usage = 0
+
         self.insn_histo: Counter[str] = Counter()
-        self.func_calls: List[Dict[str, int]] = []
         self.func_instrs: Dict[int, Dict[str, List[int]]] = {}
-        self.loops: List[Dict[str, int]] = []
+
+        # Function calls, counted by (caller function, callee function) and
+        # by (callee function, call site).
+        self.call_counts: Counter[Tuple[int, int]] = Counter()
+        self.call_site_counts: Counter[Tuple[int, int]] = Counter()
+
+        # Loop entries, counted by (loop address, body length, iterations).
+        self.loop_counts: Counter[Tuple[int, int, int]] = Counter()
 
         # Histogram indexed by the length of the (extended) basic block.
         self.basic_block_histo: Counter[int] = Counter()
@@ -51,6 +70,12 @@ class ExecutionStats:
         self._current_basic_block_len = 0
         self._current_ext_basic_block_len = 0
 
+        # Cycles counted by call stack sample, as [instruction count, stall
+        # count]. This needs a copy of the call stack on every cycle, so it is
+        # only collected if collect_profile is true (and is None otherwise).
+        self.stack_samples: Optional[Dict[StackSample, List[int]]] = \
+            {} if collect_profile else None
+
     def get_insn_count(self) -> int:
         '''Get the number of executed instructions.'''
         return sum(self.insn_histo.values())
@@ -71,6 +96,24 @@ class ExecutionStats:
             self.func_instrs[state_bc.pc] = {}
             self.func_instrs[state_bc.pc][mnemonic] = [0, 1]
 
+        if self.stack_samples is not None:
+            self._record_stack_sample(state_bc, 1)
+
+    def _record_stack_sample(self, state_bc: OTBNState, idx: int) -> None:
+        '''Count a cycle for the current call stack and PC
+
+        idx is 0 for an instruction and 1 for a stall (the index into the
+        counts in stack_samples).
+
+        '''
+        assert self.stack_samples is not None
+        key = (tuple(state_bc.peek_call_stack()), state_bc.pc)
+        counts = self.stack_samples.get(key)
+        if counts is None:
+            counts = [0, 0]
+            self.stack_samples[key] = counts
+        counts[idx] += 1
+
     def _insn_at_addr(self, addr: int) -> Optional[OTBNInsn]:
         '''Get the instruction at a given address.'''
         assert addr % 4 == 0
@@ -89,8 +132,8 @@ class ExecutionStats:
         '''
         pc = state_bc.pc
 
-        is_jump = isinstance(insn, JAL) or isinstance(insn, JALR)
-        is_branch = isinstance(insn, BEQ) or isinstance(insn, BNE)
+        is_jump = isinstance(insn, self._jump_classes)
+        is_branch = isinstance(insn, self._branch_classes)
 
         # Instruction histogram
         self.insn_histo[insn.insn.mnemonic] += 1
@@ -105,6 +148,11 @@ class ExecutionStats:
             self.func_instrs[pc] = {}
             self.func_instrs[pc][insn.insn.mnemonic] = [1, 0]
 
+        # Call stack sample. The stack is from before the instruction commits,
+        # so a call is counted in the caller and a return in the callee.
+        if self.stack_samples is not None:
+            self._record_stack_sample(state_bc, 0)
+
         # Function calls
         # - Direct function calls: jal x1, <offset>
         # - Indirect function calls: jalr x1, <grs1>, 0
@@ -115,21 +163,15 @@ class ExecutionStats:
             else:
                 caller_func = 0  # (start address)
 
-            self.func_calls.append({
-                'call_site': pc,
-                'caller_func': caller_func,
-                'callee_func': state_bc.get_next_pc(),
-            })
+            callee_func = state_bc.get_next_pc()
+            self.call_counts[(caller_func, callee_func)] += 1
+            self.call_site_counts[(callee_func, pc)] += 1
 
         # Loops
-        if isinstance(insn, LOOP) or isinstance(insn, LOOPI):
+        if isinstance(insn, (self._loop_class, self._loopi_class)):
             assert state_bc.in_loop()
             iterations = state_bc.loop_stack.stack[-1].loop_count
-            self.loops.append({
-                'loop_addr': pc,
-                'loop_len': insn.bodysize,
-                'iterations': iterations,
-            })
+            self.loop_counts[(pc, insn.bodysize, iterations)] += 1
 
         last_in_loop_body = state_bc.loop_stack.is_last_insn_in_loop_body(pc)
 
@@ -142,7 +184,7 @@ class ExecutionStats:
         # the basic block.
         self._current_basic_block_len += 1
         if (is_jump or is_branch or last_in_loop_body or
-                isinstance(insn, ECALL)):
+                isinstance(insn, self._ecall_class)):
 
             self.basic_block_histo[self._current_basic_block_len] += 1
             self._current_basic_block_len = 0
@@ -160,86 +202,181 @@ class ExecutionStats:
         if last_in_loop_body:
             loop_insn_addr = state_bc.loop_stack.stack[-1].get_loop_insn_addr()
             last_insn = self._insn_at_addr(loop_insn_addr)
-            finishing_loop = isinstance(last_insn, LOOP)
+            finishing_loop = isinstance(last_insn, self._loop_class)
 
         self._current_ext_basic_block_len += 1
-        if is_branch or finishing_loop or isinstance(insn, ECALL):
+        if is_branch or finishing_loop or isinstance(insn, self._ecall_class):
             self.ext_basic_block_histo[self._current_ext_basic_block_len] += 1
             self._current_ext_basic_block_len = 0
 
 
-def _dwarf_decode_file_line(dwarf_info: DWARFInfo,
-                            address: int) -> Optional[Tuple[str, int]]:
-    # Go over all the line programs in the DWARF information, looking for
-    # one that describes the given address.
-    for CU in dwarf_info.iter_CUs():
-        # First, look at line programs to find the file/line for the address
-        lineprog = dwarf_info.line_program_for_CU(CU)
-        prevstate = None
-        for entry in lineprog.get_entries():
-            # We're interested in those entries where a new state is assigned
-            if entry.state is None:
-                continue
-            if entry.state.end_sequence:
-                # if the line number sequence ends, clear prevstate.
-                prevstate = None
-                continue
-            # Looking for a range of addresses in two consecutive states that
-            # contain the required address.
-            if ((prevstate and
-                 prevstate.address <= address < entry.state.address)):
-                raw_name = lineprog['file_entry'][prevstate.file - 1].name
-                filename = raw_name.decode('utf-8')
-                line = prevstate.line
-                return filename, line
-            prevstate = entry.state
-    return None
+class _DwarfLineTable:
+    '''A map from addresses to (file, line) pairs, from DWARF line programs
+
+    The line programs are decoded once, into a sorted list of boundaries
+    between address ranges that have the same file and line, so lookups are a
+    binary search.
+    '''
+    def __init__(self, dwarf_info: DWARFInfo) -> None:
+        # Address ranges [start, end) and their file and line, in the order
+        # that they appear in the line programs.
+        ranges: List[Tuple[int, int, Tuple[str, int]]] = []
+        for CU in dwarf_info.iter_CUs():
+            lineprog = dwarf_info.line_program_for_CU(CU)
+            prevstate = None
+            for entry in lineprog.get_entries():
+                # We're interested in those entries where a new state is
+                # assigned
+                if entry.state is None:
+                    continue
+                if entry.state.end_sequence:
+                    # if the line number sequence ends, clear prevstate.
+                    prevstate = None
+                    continue
+                # Two consecutive states give a range of addresses.
+                if prevstate and prevstate.address < entry.state.address:
+                    raw_name = lineprog['file_entry'][prevstate.file - 1].name
+                    ranges.append((prevstate.address, entry.state.address,
+                                   (raw_name.decode('utf-8'), prevstate.line)))
+                prevstate = entry.state
+
+        # Split the address space at each range boundary. If ranges overlap,
+        # the one that comes first in the line programs wins, so fill in the
+        # ranges in reverse order.
+        self._bounds = sorted({addr
+                               for start, end, _ in ranges
+                               for addr in (start, end)})
+        bound_idx = {addr: idx for idx, addr in enumerate(self._bounds)}
+        self._file_lines: List[Optional[Tuple[str, int]]] = \
+            [None] * max(len(self._bounds) - 1, 0)
+        for start, end, file_line in reversed(ranges):
+            for idx in range(bound_idx[start], bound_idx[end]):
+                self._file_lines[idx] = file_line
+
+    def lookup(self, address: int) -> Optional[Tuple[str, int]]:
+        idx = bisect_right(self._bounds, address) - 1
+        if 0 <= idx < len(self._file_lines):
+            return self._file_lines[idx]
+        return None
 
 
 def _get_addr_symbol_map(elf_file: ELFFile) -> Dict[int, str]:
+    '''The names of the labels in IMEM, by address
+
+    Mapping symbols ($x, $d) and assembler-local labels (.L*), which some
+    assemblers write, aren't labels in the source and are left out. If a
+    function label shares its address with other labels (such as main and
+    _imem_start), the function label wins.
+
+    '''
     section = elf_file.get_section_by_name('.symtab')
 
     if not isinstance(section, SymbolTableSection):
         return {}
 
-    return {sym.entry.st_value: sym.name
-            for sym in section.iter_symbols() if sym.entry['st_shndx'] == 1}
+    addr_symbol_map: Dict[int, str] = {}
+    for sym in section.iter_symbols():
+        if (sym.entry['st_shndx'] != 1 or not sym.name or
+                sym.name.startswith(('$', '.L'))):
+            continue
+        addr = sym.entry.st_value
+        prev = addr_symbol_map.get(addr)
+        if (prev is not None and not prev.startswith('_') and
+                sym.name.startswith('_')):
+            continue
+        addr_symbol_map[addr] = sym.name
+    return addr_symbol_map
+
+
+class _SymbolIndex:
+    '''Finds the symbol and function that contain an IMEM address
+
+    By convention, labels that do not start with an "_" are functions and
+    labels that do are used inside functions. The function containing an
+    address is the closest preceding function label.
+    '''
+    def __init__(self, addr_symbol_map: Dict[int, str]) -> None:
+        self._addr_symbol_map = addr_symbol_map
+        self._addrs = sorted(addr_symbol_map)
+        self._names = [addr_symbol_map[addr] for addr in self._addrs]
+
+        # For each symbol, the index of the function that contains it (None
+        # if there is no preceding function label).
+        self._func_idx: List[Optional[int]] = []
+        func_idx = None
+        for idx, name in enumerate(self._names):
+            if not name.startswith('_'):
+                func_idx = idx
+            self._func_idx.append(func_idx)
+
+    def _index(self, address: int) -> int:
+        '''The index of the last symbol at or before address'''
+        idx = bisect_right(self._addrs, address) - 1
+        if idx < 0:
+            raise KeyError(address)
+        return idx
+
+    def symbol(self, address: int) -> Tuple[int, str]:
+        '''The address and name of the symbol that contains address'''
+        idx = self._index(address)
+        return self._addrs[idx], self._names[idx]
+
+    def function_symbol(self, address: int) -> Tuple[int, str]:
+        '''The address and name of the function that contains address'''
+        func_idx = self._func_idx[self._index(address)]
+        if func_idx is None:
+            # Only local labels before address: use the first symbol.
+            return 0, self._addr_symbol_map[0]
+        return self._addrs[func_idx], self._names[func_idx]
+
+    def function(self, address: int) -> str:
+        '''The name of the function that contains address'''
+        return self.function_symbol(address)[1]
+
+
+class ElfDebugInfo:
+    '''The symbols and line information of an ELF file, ready for analysis
+
+    Reading these (the DWARF line programs in particular) can take longer than
+    the rest of an analysis, so a caller that analyzes many runs of the same
+    program can read them once and pass them to each ExecutionStatAnalyzer.
+    They are never modified by an analysis.
+
+    '''
+    def __init__(self, elf_file_path: str) -> None:
+        with open(elf_file_path, 'rb') as handle:
+            elf_file = ELFFile(handle)
+            self.symbols = _SymbolIndex(_get_addr_symbol_map(elf_file))
+            self.line_table: Optional[_DwarfLineTable] = None
+            if elf_file.has_dwarf_info():
+                self.line_table = _DwarfLineTable(elf_file.get_dwarf_info())
 
 
 class ExecutionStatAnalyzer:
     # Assumed clock frequency of OTBN, in MHz.
     FREQ_MHZ = 100
 
-    def __init__(self, stats: ExecutionStats, elf_file_path: str):
-        self._elf_file = ELFFile(open(elf_file_path, 'rb'))
+    def __init__(self, stats: ExecutionStats, elf_file_path: str,
+                 debug_info: Optional[ElfDebugInfo] = None):
+        if debug_info is None:
+            debug_info = ElfDebugInfo(elf_file_path)
         self._stats = stats
-        self._addr_symbol_map = _get_addr_symbol_map(self._elf_file)
+        self._symbols = debug_info.symbols
+        self._line_table = debug_info.line_table
         self.func_cycles = None
         self.func_instrs = None
         self.func_calls = {}
 
     def _describe_imem_addr(self, address: int, name_only: bool = False) -> str:
-        symbol_name = None
-        if address in self._addr_symbol_map:
-            symbol_name = self._addr_symbol_map[address]
-            if name_only:
-                return symbol_name
-        else:
-            # |func_addr| is the largest possible |sym_addr| which is at most
-            # |address|.
-            func_addr = 0
-            for sym_addr in self._addr_symbol_map.keys():
-                if sym_addr <= address and sym_addr > func_addr:
-                    func_addr = sym_addr
-            func_name = self._addr_symbol_map[func_addr]
-            if name_only:
-                return func_name
-            symbol_name = func_name + f"+{address - func_addr:#x}"
+        sym_addr, symbol_name = self._symbols.symbol(address)
+        if name_only:
+            return symbol_name
+        if sym_addr != address:
+            symbol_name += f"+{address - sym_addr:#x}"
 
         file_line = None
-        if self._elf_file.has_dwarf_info():
-            dwarf_info = self._elf_file.get_dwarf_info()
-            file_line = _dwarf_decode_file_line(dwarf_info, address)
+        if self._line_table is not None:
+            file_line = self._line_table.lookup(address)
 
         add_info = []
         if symbol_name:
@@ -292,12 +429,147 @@ class ExecutionStatAnalyzer:
         stat_data = {
             "insn_count": self._stats.get_insn_count(),
             "stall_count": self._stats.stall_count,
+            "stack_usage": self._stats.stack_usage,
             "func_cycles": self.func_cycles,
             "func_instrs": self.func_instrs,
             "func_calls": {f: dict(m) for f, m in self.func_calls.items()}
         }
         return stat_data
 
+    def _get_stack_samples(self) -> Dict[StackSample, List[int]]:
+        if self._stats.stack_samples is None:
+            raise RuntimeError('No call stack samples were collected (pass '
+                               'collect_profile to ExecutionStats).')
+        return self._stats.stack_samples
+
+    def _function_symbol(self, address: int) -> Tuple[int, str]:
+        '''Like _SymbolIndex.function_symbol, but never fails
+
+        The x1 call stack can also hold values that aren't return addresses,
+        which might not be in any function. These get named by address.
+
+        '''
+        try:
+            return self._symbols.function_symbol(address)
+        except KeyError:
+            return address, f'{address:#x}'
+
+    def _stack_frames(self, sample: StackSample) -> List[Tuple[int, str]]:
+        '''The function (address and name) of each frame, outermost first
+
+        A return address is just after its call site, so the calling function
+        is the one that contains the address before it.
+
+        '''
+        call_stack, pc = sample
+        frames = [self._function_symbol(ret_addr - 4)
+                  for ret_addr in call_stack]
+        frames.append(self._function_symbol(pc))
+        return frames
+
+    def dump_collapsed_stacks(self, insn_frames: bool = True) -> str:
+        '''Dump the call stack samples in collapsed stack format
+
+        This is the format read by flame graph tools (such as flamegraph.pl
+        or speedscope): one line per call stack, with the frames separated by
+        semicolons, followed by the number of cycles (including stalls) spent
+        in it. If insn_frames is true, each stack ends with a frame for the
+        instruction (named by its address and mnemonic), so the flame graph
+        shows which instructions in each function take the cycles.
+
+        '''
+        cycles: Counter[str] = Counter()
+        for sample, counts in self._get_stack_samples().items():
+            frames = [name for _, name in self._stack_frames(sample)]
+            if insn_frames:
+                pc = sample[1]
+                mnemonic = self._stats.program[pc >> 2].insn.mnemonic
+                frames.append(f'{pc:#x}:{mnemonic}')
+            cycles[';'.join(frames)] += sum(counts)
+
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in sorted(cycles.items()))
+
+    def _position(self, address: int) -> Tuple[str, int]:
+        '''The source file and line of address (??? and 0 if unknown)'''
+        file_line = None
+        if self._line_table is not None:
+            file_line = self._line_table.lookup(address)
+        return file_line if file_line is not None else ('???', 0)
+
+    def dump_callgrind(self) -> str:
+        '''Dump the call stack samples in callgrind format
+
+        This can be read by KCachegrind or callgrind_annotate. The costs are
+        counted per instruction (with its source line, if the ELF file has
+        DWARF line information), with the events Cycles, Instructions and
+        Stalls. Calls between functions get the number of times that they
+        happened (from the function call statistics) and their inclusive cost.
+
+        '''
+        # Exclusive cost by function and PC, and inclusive cost by caller and
+        # (call site, callee).
+        self_costs: Dict[str, Dict[int, List[int]]] = {}
+        call_costs: Dict[str, Dict[Tuple[int, Tuple[int, str]], List[int]]] = {}
+        for sample, counts in self._get_stack_samples().items():
+            call_stack, pc = sample
+            frames = self._stack_frames(sample)
+
+            fn_costs = self_costs.setdefault(frames[-1][1], {})
+            fn_costs[pc] = list(map(add, fn_costs.get(pc, [0, 0]), counts))
+
+            for (_, caller), ret_addr, callee in zip(frames, call_stack,
+                                                     frames[1:]):
+                calls = call_costs.setdefault(caller, {})
+                key = (ret_addr - 4, callee)
+                calls[key] = list(map(add, calls.get(key, [0, 0]), counts))
+
+        # Call counts by (call site, callee function)
+        call_counts: Counter[Tuple[int, str]] = Counter()
+        for (callee_addr, call_site), cnt in self._stats.call_site_counts.items():
+            call_counts[(call_site, self._function_symbol(callee_addr)[1])] += cnt
+
+        def cost_line(address: int, counts: List[int]) -> str:
+            line = self._position(address)[1]
+            return f'{address:#x} {line} {sum(counts)} {counts[0]} {counts[1]}'
+
+        insn_count = self._stats.get_insn_count()
+        stall_count = self._stats.stall_count
+        out = [
+            '# callgrind format',
+            'version: 1',
+            'creator: otbnsim',
+            'positions: instr line',
+            'events: Cycles Instructions Stalls',
+            f'summary: {insn_count + stall_count} {insn_count} {stall_count}',
+        ]
+        for func_name in sorted(self_costs.keys() | call_costs.keys()):
+            out.append('')
+            cur_file = None
+            for pc, counts in sorted(self_costs.get(func_name, {}).items()):
+                file_name = self._position(pc)[0]
+                if cur_file is None:
+                    out += [f'fl={file_name}', f'fn={func_name}']
+                    cur_file = file_name
+                elif file_name not in (cur_file, '???'):
+                    out.append(f'fi={file_name}')
+                    cur_file = file_name
+                out.append(cost_line(pc, counts))
+
+            calls = sorted(call_costs.get(func_name, {}).items())
+            for (call_site, (callee_addr, callee)), counts in calls:
+                if cur_file is None:
+                    cur_file = self._position(call_site)[0]
+                    out += [f'fl={cur_file}', f'fn={func_name}']
+                callee_file, callee_line = self._position(callee_addr)
+                out += [f'cfl={callee_file}',
+                        f'cfn={callee}',
+                        f'calls={call_counts[(call_site, callee)]} '
+                        f'{callee_addr:#x} {callee_line}',
+                        cost_line(call_site, counts)]
+
+        return '\n'.join(out) + '\n'
+
     def _dump_execution_time(self) -> str:
         insn_count = self._stats.get_insn_count()
         stall_count = self._stats.stall_count
@@ -312,6 +584,8 @@ class ExecutionStatAnalyzer:
 
         out += f"The execution would take {time_ms:.02f} ms "
         out += f"@ {self.FREQ_MHZ} MHz.\n"
+
+        out += f"The stack grew to {self._stats.stack_usage} bytes.\n"
         return out
 
     def _dump_insn_histo(self) -> str:
@@ -332,7 +606,7 @@ class ExecutionStatAnalyzer:
     def _dump_function_call_stats(self) -> str:
         '''Dump function call statistics'''
 
-        if not self._stats.func_calls:
+        if not self._stats.call_counts:
             return "No functions were called.\n"
 
         out = ""
@@ -346,18 +620,19 @@ class ExecutionStatAnalyzer:
         callgraph: Dict[int, Counter[int]] = {}  # type
         rev_callgraph: Dict[int, Counter[int]] = {}
         rev_callsites: Dict[int, Counter[int]] = {}
-        for c in self._stats.func_calls:
-            if c['caller_func'] not in callgraph:
-                callgraph[c['caller_func']] = Counter()
-            callgraph[c['caller_func']][c['callee_func']] += 1
+        for (caller_func, callee_func), cnt in self._stats.call_counts.items():
+            if caller_func not in callgraph:
+                callgraph[caller_func] = Counter()
+            callgraph[caller_func][callee_func] += cnt
 
-            if c['callee_func'] not in rev_callgraph:
-                rev_callgraph[c['callee_func']] = Counter()
-            rev_callgraph[c['callee_func']][c['caller_func']] += 1
+            if callee_func not in rev_callgraph:
+                rev_callgraph[callee_func] = Counter()
+            rev_callgraph[callee_func][caller_func] += cnt
 
-            if c['callee_func'] not in rev_callsites:
-                rev_callsites[c['callee_func']] = Counter()
-            rev_callsites[c['callee_func']][c['call_site']] += 1
+        for (callee_func, call_site), cnt in self._stats.call_site_counts.items():
+            if callee_func not in rev_callsites:
+                rev_callsites[callee_func] = Counter()
+            rev_callsites[callee_func][call_site] += cnt
 
         total_leaf_calls = 0
         total_calls_to_funcs_with_one_callsite = 0
@@ -422,21 +697,25 @@ class ExecutionStatAnalyzer:
         return out
 
     def _dump_loop_stats(self) -> str:
-        loops = self._stats.loops
-        loop_cnt = len(loops)
+        loop_counts = self._stats.loop_counts
+        loop_cnt = sum(loop_counts.values())
 
         out = f"Loops: {loop_cnt}\n"
 
         if loop_cnt != 0:
-            loop_len_values = [loop['loop_len'] for loop in loops]
+            loop_len_values = [loop_len for _, loop_len, _ in loop_counts]
             loop_len_min = min(loop_len_values)
             loop_len_max = max(loop_len_values)
-            loop_len_avg = sum(loop_len_values) / loop_cnt
+            loop_len_avg = sum(loop_len * cnt for (_, loop_len, _), cnt
+                               in loop_counts.items()) / loop_cnt
 
-            loop_iterations_values = [loop['iterations'] for loop in loops]
+            loop_iterations_values = [iterations
+                                      for _, _, iterations in loop_counts]
             loop_iterations_min = min(loop_iterations_values)
             loop_iterations_max = max(loop_iterations_values)
-            loop_iterations_avg = sum(loop_iterations_values) / loop_cnt
+            loop_iterations_avg = sum(iterations * cnt
+                                      for (_, _, iterations), cnt
+                                      in loop_counts.items()) / loop_cnt
 
             out += "Loop body length (instructions): "
             out += f"min: {loop_len_min}, max: {loop_len_max}, "
@@ -451,14 +730,7 @@ class ExecutionStatAnalyzer:
     def _dump_func_cycles(self) -> str:
         accumulated = dict()
         for func_addr, histdata in self._stats.func_instrs.items():
-            # find the next label that does not start with an "_". By
-            # convention, labels that do not start with an "_" are functions,
-            # labels that do are used inside functions.
-            _func_addr = func_addr
-            func_name = self._describe_imem_addr(_func_addr, name_only=True)
-            while func_name.startswith("_") and _func_addr > 0:
-                _func_addr -= 1
-                func_name = self._describe_imem_addr(_func_addr, name_only=True)
+            func_name = self._symbols.function(func_addr)
 
             for _, counts in histdata.items():
                 if func_name in accumulated:
@@ -477,14 +749,7 @@ class ExecutionStatAnalyzer:
         out = ''
         accumulated = dict()
         for func_addr, histdata in self._stats.func_instrs.items():
-            # find the next label that does not start with an "_". By
-            # convention, labels that do not start with an "_" are functions,
-            # labels that do are used inside functions.
-            _func_addr = func_addr
-            func_name = self._describe_imem_addr(_func_addr, name_only=True)
-            while func_name.startswith("_") and _func_addr > 0:
-                _func_addr -= 1
-                func_name = self._describe_imem_addr(_func_addr, name_only=True)
+            func_name = self._symbols.function(func_addr)
 
             for instr, counts in histdata.items():
                 if func_name in accumulated:
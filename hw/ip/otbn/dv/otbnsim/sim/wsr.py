@@ -8,10 +8,10 @@
 # (https://eprint.iacr.org/2025/2028)
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
-import os
 from typing import List, Optional, Sequence, Tuple
 from Crypto.Hash import cSHAKE128, cSHAKE256, SHAKE128, SHAKE256, SHA3_224, \
     SHA3_256, SHA3_384, SHA3_512
+from .dirty import DirtySet, DirtyTracked
 from .trace import Trace
 from .ext_regs import OTBNExtRegs
 DEBUG_KMAC = False
@@ -35,7 +35,7 @@ class TraceWSR(Trace):
                                  Trace.hex_value(self.new_value, 256))
 
 
-class WSR:
+class WSR(DirtyTracked):
     '''Models a Wide Status Register'''
     def __init__(self, name: str):
         self.name = name
@@ -99,10 +99,12 @@ class DumbWSR(WSR):
         assert 0 <= value < (1 << 256)
         self._next_value = value
         self._pending_write = True
+        self.mark_dirty()
 
     def write_invalid(self) -> None:
         self._next_value = None
         self._pending_write = True
+        self.mark_dirty()
 
     def commit(self) -> None:
         if self._next_value is not None:
@@ -154,6 +156,7 @@ class RandWSR(WSR):
     def read_unsigned(self) -> int:
         assert self._random_value is not None
         self._next_random_value = None
+        self.mark_dirty()
         self.rep_err_escalate = self._rep_err
         self.fips_err_escalate = self._fips_err
         return self._random_value
@@ -175,6 +178,7 @@ class RandWSR(WSR):
     def on_start(self) -> None:
         self._next_random_value = None
         self._next_pending_request = False
+        self.mark_dirty()
         self.fips_err_escalate = False
         self.rep_err_escalate = False
 
@@ -188,6 +192,7 @@ class RandWSR(WSR):
             return True
         if not self._pending_request:
             self._next_pending_request = True
+            self.mark_dirty()
             self._ext_regs.rnd_request()
         return False
 
@@ -208,22 +213,158 @@ class RandWSR(WSR):
         self.rep_err_escalate = False
         self._next_random_value = value
         self._next_pending_request = False
+        self.mark_dirty()
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _rol64(n: int, d: int) -> int:
+    '''Rotate the 64-bit value n left by d bits'''
+    return ((n << d) & _MASK64) | (n >> (64 - d))
+
+
+def _urnd_advance(state: Tuple[int, int, int, int],
+                  steps: int) -> Tuple[int, int, int, int]:
+    '''Advance the URND PRNG state by the given number of steps
+
+    Each step is four rounds of URNDWSR.state_update. For long advances,
+    this jumps ahead with _URNDJump instead of running the rounds.
+
+    '''
+    if steps >= _URNDJump.MIN_STEPS:
+        return _URNDJump.advance(state, steps)
+
+    d, c, b, a = state
+    for _ in range(4 * steps):
+        a, b, c, d = (a ^ b ^ d,
+                      a ^ b ^ c,
+                      a ^ ((b << 17) & _MASK64) ^ c,
+                      _rol64(d ^ b, 45))
+    return (d, c, b, a)
+
+
+def _urnd_output(state: Tuple[int, int, int, int]) -> int:
+    '''The 256-bit URND value from the step that starts at state'''
+    d, c, b, a = state
+    value = 0
+    for i in range(4):
+        mid = (a + d) & _MASK64
+        value |= ((_rol64(mid, 23) + a) & _MASK64) << (64 * i)
+        a, b, c, d = (a ^ b ^ d,
+                      a ^ b ^ c,
+                      a ^ ((b << 17) & _MASK64) ^ c,
+                      _rol64(d ^ b, 45))
+    return value
+
+
+class _URNDJump:
+    '''Jump-ahead for the URND PRNG state
+
+    The state update is linear over GF(2), so advancing the (256-bit) state
+    by 2^i steps is multiplication by a 256x256 bit matrix. We store the
+    matrix for each power of 2 as 32 lookup tables (one per byte of the
+    state) and build them when they are first needed. Advancing by n steps
+    then costs 32 table lookups for each set bit of n.
+
+    '''
+    # Below this many steps, it's quicker to just run the rounds.
+    MIN_STEPS = 64
+
+    # For each power of 2: the columns of its matrix, and its lookup tables
+    _levels: List[Tuple[List[int], List[List[int]]]] = []
+
+    @staticmethod
+    def _pack(state: Tuple[int, int, int, int]) -> int:
+        return (state[0] | (state[1] << 64) |
+                (state[2] << 128) | (state[3] << 192))
+
+    @staticmethod
+    def _unpack(value: int) -> Tuple[int, int, int, int]:
+        return (value & _MASK64, (value >> 64) & _MASK64,
+                (value >> 128) & _MASK64, value >> 192)
+
+    @staticmethod
+    def _tables(columns: List[int]) -> List[List[int]]:
+        tables = []
+        for byte_idx in range(32):
+            table = [0] * 256
+            for byte in range(1, 256):
+                low = byte & -byte
+                table[byte] = (table[byte ^ low] ^
+                               columns[8 * byte_idx + low.bit_length() - 1])
+            tables.append(table)
+        return tables
+
+    @staticmethod
+    def _apply(tables: List[List[int]], value: int) -> int:
+        result = 0
+        for table in tables:
+            result ^= table[value & 0xff]
+            value >>= 8
+        return result
+
+    @classmethod
+    def _level(cls, level: int) -> List[List[int]]:
+        '''Get the lookup tables that advance the state by 2^level steps'''
+        while len(cls._levels) <= level:
+            if not cls._levels:
+                columns = [cls._pack(_urnd_advance(cls._unpack(1 << bit), 1))
+                           for bit in range(256)]
+            else:
+                prev_columns, prev_tables = cls._levels[-1]
+                columns = [cls._apply(prev_tables, col)
+                           for col in prev_columns]
+            cls._levels.append((columns, cls._tables(columns)))
+        return cls._levels[level][1]
+
+    @classmethod
+    def advance(cls, state: Tuple[int, int, int, int],
+                steps: int) -> Tuple[int, int, int, int]:
+        value = cls._pack(state)
+        level = 0
+        while steps:
+            if steps & 1:
+                value = cls._apply(cls._level(level), value)
+            steps >>= 1
+            level += 1
+        return cls._unpack(value)
 
 
 class URNDWSR(WSR):
-    '''Models URND PRNG Structure'''
+    '''Models URND PRNG Structure
+
+    The PRNG steps every cycle while it is running, but programs rarely read
+    URND. So we don't run the PRNG on every step. Instead, we count the steps
+    and only work out the state (and the value to read) when URND is
+    actually read.
+
+    '''
     def __init__(self, name: str):
         super().__init__(name)
-        seed = [0x84ddfadaf7e1134d, 0x70aa1c59de6197ff,
-                0x25a4fe335d095f1e, 0x2cba89acbe4a07e9]
-        self._state = [seed, 4 * [0], 4 * [0], 4 * [0], 4 * [0]]
-        self._next_value = 0
-        self._value = 0
+        seed = (0x84ddfadaf7e1134d, 0x70aa1c59de6197ff,
+                0x25a4fe335d095f1e, 0x2cba89acbe4a07e9)
+        # The PRNG state after _state_steps steps. A step goes from one state
+        # to the next (and computes a value to read). _steps is the number of
+        # steps since the last seed.
+        self._state = seed
+        self._state_steps = 0
+        self._steps = 0
+
+        # The value computed by the last step and the current value of the
+        # WSR. Once the PRNG is running, _next_value is None: the value is
+        # computed by the step before the current one. _value is None when
+        # that was the case at the last commit, and _value_at is then the
+        # state that starts that step, as a pair (state, steps) with an
+        # earlier state and the number of steps to take from it.
+        self._next_value: Optional[int] = 0
+        self._value: Optional[int] = 0
+        self._value_at: Optional[Tuple[Tuple[int, int, int, int], int]] = None
         self.running = False
 
     def rol(self, n: int, d: int) -> int:
         '''Rotate n left by d bits'''
-        return ((n << d) & ((1 << 64) - 1)) | (n >> (64 - d))
+        return _rol64(n, d)
 
     def read_u32(self) -> int:
         '''Read a 32-bit unsigned result'''
@@ -237,45 +378,43 @@ class URNDWSR(WSR):
         self.running = False
 
     def read_unsigned(self) -> int:
+        if self._value is None:
+            assert self._value_at is not None
+            state, steps = self._value_at
+            state = _urnd_advance(state, steps)
+            self._value = _urnd_output(state)
+            # If the value came from the current seed, keep the state that we
+            # worked out, so that the next read can start from there.
+            if self._value_at[0] is self._state:
+                self._state = state
+                self._state_steps += steps
         return self._value
 
     def state_update(self, data_in: List[int]) -> List[int]:
-        a_in = data_in[3]
-        b_in = data_in[2]
-        c_in = data_in[1]
-        d_in = data_in[0]
-
-        a_out = a_in ^ b_in ^ d_in
-        b_out = a_in ^ b_in ^ c_in
-        c_out = a_in ^ ((b_in << 17) & ((1 << 64) - 1)) ^ c_in
-        d_out = self.rol(d_in ^ b_in, 45)
-        assert a_out < (1 << 64)
-        assert b_out < (1 << 64)
-        assert c_out < (1 << 64)
-        assert d_out < (1 << 64)
-        return [d_out, c_out, b_out, a_out]
+        '''Run one round of the PRNG on data_in = [d, c, b, a]'''
+        d, c, b, a = data_in
+        return [_rol64(d ^ b, 45), a ^ ((b << 17) & _MASK64) ^ c,
+                a ^ b ^ c, a ^ b ^ d]
 
     def set_seed(self, value: List[int]) -> None:
         assert len(value) == 4
         self.running = True
-        self._state[0] = value
+        self._state = (value[0], value[1], value[2], value[3])
+        self._state_steps = 0
+        self._steps = 0
         # Step immediately to update the internal state with the new seed
         self.step()
 
     def step(self) -> None:
         if self.running:
-            mask64 = (1 << 64) - 1
-            mid = 4 * [0]
-            nv = 0
-            for i in range(4):
-                st_i = self._state[i]
-                self._state[(i + 1) & 3] = self.state_update(st_i)
-                mid[i] = (st_i[3] + st_i[0]) & mask64
-                nv |= ((self.rol(mid[i], 23) + st_i[3]) & mask64) << (64 * i)
-            self._next_value = nv
+            self._steps += 1
+            self._next_value = None
 
     def commit(self) -> None:
         self._value = self._next_value
+        if self._value is None:
+            self._value_at = (self._state,
+                              self._steps - 1 - self._state_steps)
 
     def changes(self) -> List[TraceWSR]:
         # Our URND model doesn't track (or report) changes to its internal
@@ -293,7 +432,7 @@ class KeyTrace(Trace):
         return '{} = {}'.format(self.name, val_desc)
 
 
-class SideloadKey:
+class SideloadKey(DirtyTracked):
     '''Represents a sideloaded key, with 384 bits of data and a valid signal'''
     def __init__(self, name: str):
         self.name = name
@@ -321,6 +460,7 @@ class SideloadKey:
         assert value is None or (0 <= value < (1 << 384))
         self._value = value
         self._new_value = (False, 0) if value is None else (True, value)
+        self.mark_dirty()
 
     def changes(self) -> List[KeyTrace]:
         if self._new_value is not None:
@@ -332,6 +472,11 @@ class SideloadKey:
     def commit(self) -> None:
         self._new_value = None
 
+    def abort(self) -> None:
+        # We commit changes to the sideloaded keys from outside, even if the
+        # instruction itself gets aborted.
+        self.commit()
+
 
 class KeyWSR(WSR):
     def __init__(self, name: str, shift: int, key_reg: SideloadKey):
@@ -350,8 +495,70 @@ class KeyWSR(WSR):
         return
 
 
+class ByteRing:
+    '''A fixed-size FIFO of bytes, stored in a circular buffer.
+
+    This models the FIFOs between OTBN and the Keccak core without copying
+    the remaining contents each time some bytes are pushed or popped.
+    '''
+    def __init__(self, size: int):
+        self._buf = bytearray(size)
+        self._size = size
+        self._head = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def clear(self) -> None:
+        self._head = 0
+        self._len = 0
+
+    def push(self, data: bytes) -> None:
+        '''Append data, which must fit in the space that is left.'''
+        num_bytes = len(data)
+        assert num_bytes <= self._size - self._len
+        tail = self._head + self._len
+        if tail >= self._size:
+            tail -= self._size
+        first = min(num_bytes, self._size - tail)
+        self._buf[tail:tail + first] = data[:first]
+        if first < num_bytes:
+            self._buf[:num_bytes - first] = data[first:]
+        self._len += num_bytes
+
+    def peek(self, num_bytes: int) -> bytes:
+        '''Return (up to) the first num_bytes bytes without removing them.'''
+        num_bytes = min(num_bytes, self._len)
+        end = self._head + num_bytes
+        if end <= self._size:
+            return bytes(self._buf[self._head:end])
+        return bytes(self._buf[self._head:]) + \
+            bytes(self._buf[:end - self._size])
+
+    def pop(self, num_bytes: int) -> bytes:
+        '''Remove and return (up to) the first num_bytes bytes.'''
+        ret = self.peek(num_bytes)
+        if len(ret) == self._len:
+            self.clear()
+        else:
+            self._head = (self._head + len(ret)) % self._size
+            self._len -= len(ret)
+        return ret
+
+
 class KmacBlock:
-    '''Emulates the KMAC hardware block.'''
+    '''Emulates the KMAC hardware block.
+
+    Most cycles, the block is either waiting for the Keccak core to count
+    down the cycles of a permutation or is sitting in a state where step()
+    changes nothing (for example, holding a digest that the program hasn't
+    asked for yet). After each full step, we check whether the block is in
+    one of these states. If so, step() just counts down until something
+    changes, which gives the same timing as running through the whole state
+    machine each cycle. Any other method that changes the state of the block
+    calls _wake() to leave this mode.
+    '''
     _CMD_START = 0x1d
     _CMD_PROCESS = 0x2e
     _CMD_RUN = 0x31
@@ -415,6 +622,9 @@ class KmacBlock:
         _KECCAK_LATENCY_DIGEST_EXPOSED + _SHIFT_DIGEST_LATENCY
 
     def __init__(self):
+        self._msg_fifo = ByteRing(self._MSG_FIFO_SIZE_BYTES +
+                                  self._MSG_PACKER_SIZE_BYTES)
+        self._app_intf_fifo = ByteRing(self._APP_INTF_FIFO_SIZE_BYTES)
         self._reset()
         self._status = self._STATUS_IDLE
         self._mode = self._MODE_SHA3
@@ -444,6 +654,7 @@ class KmacBlock:
         self._skip_digest_shift_cycle = False
 
     def _reset(self) -> None:
+        self._quiet = False
         self._status = self._STATUS_IDLE
         self._core_cycles_remaining = None
         self._state = None
@@ -453,8 +664,8 @@ class KmacBlock:
         self._padded = False
         self._padding_only = False
         self._mode = self._MODE_SHA3
-        self._msg_fifo = bytes()
-        self._app_intf_fifo = bytes()
+        self._msg_fifo.clear()
+        self._app_intf_fifo.clear()
         self._app_intf_ready = False
         self._app_intf_ready_pending_ctr = None
         self._app_intf_last = False
@@ -483,6 +694,7 @@ class KmacBlock:
     def set_configuration(self, mode: int, strength: int, msg_len: int) -> None:
         if DEBUG_KMAC:
             print(f"\tSetting KMAC config: mode = {mode}, strength = {strength}, len = {msg_len}")
+        self._wake()
         self._mode = mode
         self._strength = strength
         self._msg_len = msg_len
@@ -503,6 +715,7 @@ class KmacBlock:
         # Don't issue the `process` command yet; wait for FIFOs to clear.
         if DEBUG_KMAC:
             print("\tKMAC message done, pending process")
+        self._wake()
         self._pending_process = True
 
     def is_idle(self) -> bool:
@@ -523,6 +736,7 @@ class KmacBlock:
                   read={self._digest_read} ready={self._digest_ready} \
                   read_offset={self._read_offset} \
                   leftover={self._leftover_digest_bytes}")
+        self._wake()
         if self._automatically_write_digest:
             if self._digest_ready:
                 self._digest_read = True
@@ -563,6 +777,7 @@ class KmacBlock:
         if not self.is_idle():
             raise ValueError('KMAC: Cannot issue `start` command in '
                              f'{self._status} status.')
+        self._wake()
         self._status = self._STATUS_ABSORB
         self._msg_fifo_flush_ctr = 0
 
@@ -633,7 +848,8 @@ class KmacBlock:
                   fifo len = {len(self._app_intf_fifo)}")
         if not self.app_intf_fifo_ready() or len(self._app_intf_fifo) != 0:
             return False
-        self._app_intf_fifo += msg
+        self._wake()
+        self._app_intf_fifo.push(msg)
         return True
 
     def _start_keccak_core(self, absorbed) -> None:
@@ -669,6 +885,7 @@ class KmacBlock:
                              f'{self._status} status.')
         if DEBUG_KMAC:
             print("\tKMAC START PROCESS")
+        self._wake()
         self._status = self._STATUS_SQUEEZE
         self._start_keccak_core(True)
 
@@ -684,6 +901,7 @@ class KmacBlock:
         if not self.is_squeezing():
             raise ValueError('KMAC: Cannot issue `run` command in '
                              f'{self._status} status.')
+        self._wake()
         self._start_keccak_core(True)
         self._read_offset = 0
 
@@ -697,7 +915,84 @@ class KmacBlock:
         self._state = None
         self._reset()
 
+    def _wake(self) -> None:
+        '''Make the next step() run the whole state machine.'''
+        self._quiet = False
+
+    def _is_quiet(self) -> bool:
+        '''True if the next step() will only count down the Keccak core.
+
+        This holds if the core is busy (but not close enough to done that it
+        can absorb new data) or idle, and nothing else in the block would
+        change. The checks below follow the sections of step().
+        '''
+        if DEBUG_KMAC or self.is_idle():
+            return False
+
+        remaining = self._core_cycles_remaining
+        if remaining is not None and 0 < remaining <= 2:
+            return False
+        settled = not remaining
+
+        if (self._app_intf_ready_pending_ctr is not None or
+                self._core_pending_bytes != self._core_pending_bytes_next):
+            return False
+
+        # MSG FIFO -> KECCAK STATE
+        if settled and self._rate_bytes - self._core_pending_bytes >= 1:
+            if (self._msg_fifo_flush or self._pending_process or
+                    len(self._msg_fifo) >= self._MSG_FIFO_ABSORB_BYTES_PER_CYCLE):
+                return False
+
+        # APP FIFO -> MSG FIFO
+        if self._msg_fifo_flush != self._pending_process:
+            return False
+        if self._app_intf_last and self._app_intf_ready:
+            return False
+        if self._msg_len == 0 and not self._app_intf_last:
+            return False
+        app_intf_fifo_empty = len(self._app_intf_fifo) == 0
+        if (self._app_intf_fifo_ready != self._app_intf_fifo_ready_next or
+                self._app_intf_fifo_ready_next != app_intf_fifo_empty):
+            return False
+        if (self.msg_fifo_bytes_available() >= self._APP_INTF_BYTES_PER_CYCLE and
+                not self._msg_fifo_packer_flushing):
+            if not app_intf_fifo_empty and self._msg_len != 0:
+                return False
+        else:
+            flush_ctr = self._msg_fifo_packer_flush_ctr
+            if flush_ctr == 0 and not self._msg_fifo_packer_flushing:
+                return False
+            if settled and \
+                    self._rate_bytes - self._core_pending_bytes >= \
+                    self._MSG_FIFO_ABSORB_BYTES_PER_CYCLE:
+                return False
+            if flush_ctr == self._MSG_FIFO_PACKER_FLUSH_LATENCY:
+                return False
+
+        # Digest Register
+        if self._shift_digest_reg or self._new_permutation:
+            return False
+        digest_ready_next = self.is_squeezing() and remaining == 0
+        if (self._digest_ready != self._digest_ready_next or
+                self._digest_ready_next != digest_ready_next):
+            return False
+
+        # Keccak core
+        if settled and self._core_pending_bytes == self._rate_bytes:
+            return False
+
+        return True
+
     def step(self) -> None:
+        if self._quiet:
+            remaining = self._core_cycles_remaining
+            if not remaining:
+                return
+            if remaining > 2:
+                self._core_cycles_remaining = remaining - 1
+                return
+
         if self.is_idle():
             return
 
@@ -731,11 +1026,10 @@ class KmacBlock:
             if len(self._msg_fifo) >= absorb_rate:
                 if DEBUG_KMAC:
                     print(f"\tMSG FIFO -> STATE: Absorbing 64-bit: \
-                          {self._msg_fifo[:absorb_rate][::-1].hex()}")
+                          {self._msg_fifo.peek(absorb_rate)[::-1].hex()}")
                 # Absorb a new chunk of the message.
                 self._core_pending_bytes_next = self._core_pending_bytes + absorb_rate
-                self._state.update(self._msg_fifo[:absorb_rate])
-                self._msg_fifo = self._msg_fifo[absorb_rate:]
+                self._state.update(self._msg_fifo.pop(absorb_rate))
             elif self._pending_process:
                 # Push the remainder of the message (if present) plus some
                 # padding. We model the timing of pushing the padding but not
@@ -752,13 +1046,12 @@ class KmacBlock:
                         if DEBUG_KMAC:
                             print(f"\tMSG FIFO -> STATE: \
                                   Absorbing last data (smaller than word): \
-                                  {self._msg_fifo[:absorb_rate][::-1].hex()}, \
+                                  {self._msg_fifo.peek(absorb_rate)[::-1].hex()}, \
                                   flush_ctr = {self._msg_fifo_flush_ctr}")
                         # model cycle for consuming the last data
-                        self._state.update(self._msg_fifo)
                         self._core_pending_bytes_next = \
                             self._core_pending_bytes + len(self._msg_fifo)
-                        self._msg_fifo = bytes()
+                        self._state.update(self._msg_fifo.pop(len(self._msg_fifo)))
                 elif not self._msg_fifo_packer_flushed and self._msg_fifo_flush_ctr <= 2 \
                         and not self._padding_only:
                     if DEBUG_KMAC:
@@ -787,11 +1080,11 @@ class KmacBlock:
             if DEBUG_KMAC and nbytes > 0:
                 print(f"\tAPP FIFO -> MSG FIFO: Absorbing {nbytes} \
                       bytes: \
-                      {hex(int.from_bytes(self._app_intf_fifo[:nbytes], 'little'))}, \
+                      {hex(int.from_bytes(self._app_intf_fifo.peek(nbytes), 'little'))}, \
                       size of contents in MSG FIFO before new data: {len(self._msg_fifo)}")
-            self._msg_fifo += self._app_intf_fifo[:nbytes]
-            self._app_intf_fifo = self._app_intf_fifo[nbytes:]
-            self._msg_len -= nbytes
+            if nbytes > 0:
+                self._msg_fifo.push(self._app_intf_fifo.pop(nbytes))
+                self._msg_len -= nbytes
         else:
             # Once the FIFO fills up completely, the packer must flush completely until it can
             # consume new data.
@@ -867,6 +1160,8 @@ class KmacBlock:
                 self._msg_fifo_flushed = False
                 self._msg_fifo_packer_flushed = False
 
+        self._quiet = self._is_quiet()
+
     def max_read_bytes(self) -> int:
         '''Returns the maximum readable bytes before a `run` command.'''
         # SHA3
@@ -919,10 +1214,12 @@ class KmacMsgWSR(WSR):
         assert 0 <= value < (1 << 256)
         self._next_value = value
         self._pending_write = True
+        self.mark_dirty()
 
     def write_invalid(self) -> None:
         self._next_value = None
         self._pending_write = True
+        self.mark_dirty()
 
     def step(self) -> None:
 
@@ -975,6 +1272,7 @@ class KmacCfgWSR(WSR):
     def write_unsigned(self, value: int) -> None:
         self._next_value = value
         self._pending_write = True
+        self.mark_dirty()
 
     def commit(self) -> None:
         if self._pending_write:
@@ -1066,6 +1364,7 @@ class KmacDigestWSR(WSR):
     def write_invalid(self) -> None:
         self._next_value = None
         self._pending_write = True
+        self.mark_dirty()
 
     def commit(self) -> None:
         if self._next_value is not None:
@@ -1076,8 +1375,16 @@ class KmacDigestWSR(WSR):
 
 
 class WSRFile:
-    '''A model of the WSR file'''
-    def __init__(self, ext_regs: OTBNExtRegs) -> None:
+    '''A model of the WSR file
+
+    The ACCH register always exists in the model, but its changes only appear
+    in the trace if trace_acch is true (for BNMULV versions that have it).
+
+    '''
+    def __init__(self, ext_regs: OTBNExtRegs,
+                 trace_acch: bool = False) -> None:
+        self._trace_acch = trace_acch
+
         self.KeyS0 = SideloadKey('KeyS0')
         self.KeyS1 = SideloadKey('KeyS1')
         self.Kmac = KmacBlock()
@@ -1148,6 +1455,18 @@ class WSRFile:
         '''
         return self._by_idx[idx].write_unsigned(value)
 
+    def track_dirty(self, dirty_set: DirtySet) -> None:
+        '''Report changes to the WSRs (and sideloaded keys) to dirty_set
+
+        URND isn't included: it changes every cycle and OTBNState commits it
+        separately.
+
+        '''
+        for component in [self.MOD, self.RND, self.ACC, self.ACCH,
+                          self.KeyS0, self.KeyS1, self.KMAC_MSG,
+                          self.KMAC_CFG, self.KMAC_DIGEST]:
+            component.track_dirty(dirty_set)
+
     def commit(self) -> None:
         self.MOD.commit()
         self.RND.commit()
@@ -1166,21 +1485,18 @@ class WSRFile:
         self.URND.abort()
         self.ACC.abort()
         self.ACCH.abort()
-        # We commit changes to the sideloaded keys from outside, even if the
-        # instruction itself gets aborted.
-        self.KeyS0.commit()
-        self.KeyS1.commit()
+        self.KeyS0.abort()
+        self.KeyS1.abort()
         self.KMAC_MSG.abort()
         self.KMAC_CFG.abort()
         self.KMAC_DIGEST.abort()
 
     def changes(self) -> List[Trace]:
-        bnmulv_version_id = int(os.environ.get("BNMULV_VER", '0'))
         ret: List[Trace] = []
         ret += self.MOD.changes()
         ret += self.RND.changes()
         ret += self.ACC.changes()
-        if bnmulv_version_id >= 2:
+        if self._trace_acch:
             ret += self.ACCH.changes()
         ret += self.KeyS0.changes()
         ret += self.KeyS1.changes()
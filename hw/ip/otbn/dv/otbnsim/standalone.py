@@ -10,15 +10,26 @@
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
 
-import os
 import argparse
 import sys
 
+from sim.isa_version import get_isa_version
+from sim.load_elf import load_elf
+from sim.standalonesim import StandaloneSim
+from sim.stats import ExecutionStatAnalyzer
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument('elf')
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('--dump-rtl-sim', action="store_true")
+    parser.add_argument(
+        '--single-step',
+        action='store_true',
+        help=("step one cycle at a time, rather than running straight-line "
+              "code a basic block at a time (the results are the same).")
+    )
     parser.add_argument(
         '--bnmulv_version_id',
         type=str,
@@ -46,20 +57,44 @@ def main() -> int:
         help=("after execution, write execution statistics to this file. "
               "Use '-' to write to STDOUT.")
     )
+    parser.add_argument(
+        '--dump-flamegraph',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        help=("after execution, write the cycles spent in each call stack "
+              "(down to the instruction) to this file, in the collapsed "
+              "stack format of flame graph tools. Use '-' to write to "
+              "STDOUT.")
+    )
+    parser.add_argument(
+        '--dump-callgrind',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        help=("after execution, write a profile with the cycles and stalls "
+              "of each instruction and call to this file, in callgrind "
+              "format (for KCachegrind). Use '-' to write to STDOUT.")
+    )
+    parser.add_argument(
+        '--dump-stack-usage',
+        metavar="FILE",
+        type=argparse.FileType('w'),
+        help=("after execution, write the maximum stack usage (in bytes) to "
+              "this file. Use '-' to write to STDOUT.")
+    )
 
     args = parser.parse_args()
 
-    # Read --bnmulv_version_id given by user and set the os variable BNMULV_VER.
-    # Since all of the dependencies depends on isa.py, we need to set
-    # the environment variable first before importing them.
-    os.environ['BNMULV_VER'] = args.bnmulv_version_id
-    from sim.stats import ExecutionStatAnalyzer
-    from sim.standalonesim import StandaloneSim
-    from sim.load_elf import load_elf
+    try:
+        isa_version = get_isa_version(args.bnmulv_version_id)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
 
     collect_stats = args.dump_stats is not None
+    collect_profile = (args.dump_flamegraph is not None or
+                       args.dump_callgrind is not None)
 
-    sim = StandaloneSim()
+    sim = StandaloneSim(isa_version)
     exp_end_addr = load_elf(sim, args.elf, args.dump_rtl_sim)
     key0 = int((str("deadbeef") * 12), 16)
     key1 = int((str("baadf00d") * 12), 16)
@@ -67,8 +102,9 @@ def main() -> int:
 
     sim.state.ext_regs.commit()
 
-    sim.start(collect_stats)
-    sim.run(verbose=args.verbose, dump_file=args.dump_regs)
+    sim.start(collect_stats, collect_profile)
+    sim.run(verbose=args.verbose, dump_file=args.dump_regs,
+            use_blocks=not args.single_step)
 
     if exp_end_addr is not None:
         if sim.state.pc != exp_end_addr:
@@ -80,10 +116,18 @@ def main() -> int:
     if args.dump_dmem is not None:
         args.dump_dmem.write(sim.dump_data())
 
-    if collect_stats:
+    if collect_stats or collect_profile:
         assert sim.stats is not None
         stat_analyzer = ExecutionStatAnalyzer(sim.stats, args.elf)
-        args.dump_stats.write(stat_analyzer.dump())
+        if collect_stats:
+            args.dump_stats.write(stat_analyzer.dump())
+        if args.dump_flamegraph is not None:
+            args.dump_flamegraph.write(stat_analyzer.dump_collapsed_stacks())
+        if args.dump_callgrind is not None:
+            args.dump_callgrind.write(stat_analyzer.dump_callgrind())
+
+    if args.dump_stack_usage is not None:
+        args.dump_stack_usage.write(f'{sim.state.gprs.stack_usage()}\n')
 
     return 0
 
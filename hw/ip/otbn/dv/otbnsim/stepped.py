@@ -17,6 +17,19 @@ prefixed with "0x" if they are hexadecimal.
     step                    Run one instruction. Print trace information to
                             stdout.
 
+    step_n <count>          Run <count> cycles, as if with <count> step
+                            commands, but with a single reply. The trace
+                            output of each cycle that has any is preceded by
+                            a line "@ <n>", where <n> is the index of the cycle
+                            in the batch (starting at zero). The reply ends
+                            with a line "STEPS <count>".
+
+    run_until <max_cycles>  Like step_n, but stop early after the cycle in
+                            which the current operation finishes (whose trace
+                            shows the STATUS register becoming idle or
+                            locked). The "STEPS <n>" line gives the number of
+                            cycles that were actually run.
+
     load_elf <path>         Load the ELF file at <path>, replacing current
                             contents of DMEM and IMEM.
 
@@ -37,6 +50,14 @@ prefixed with "0x" if they are hexadecimal.
     dump_d <path>           Write the current contents of DMEM to <path> (same
                             format as for load).
 
+    load_d_bin <nbytes>     Like load_d, but the data is the <nbytes> raw bytes
+                            that follow the command's newline on stdin, rather
+                            than the contents of a file.
+
+    dump_d_bin              Like dump_d, but the data is written to stdout:
+                            a line "DUMP_D_BIN <nbytes>", then <nbytes> raw
+                            bytes, then the usual "." line.
+
     print_regs              Write the hex contents of all registers to stdout
 
     edn_rnd_step            Send 32b RND Data to the model.
@@ -76,6 +97,7 @@ import binascii
 import sys
 from typing import List, Optional
 
+from sim.constants import Status
 from sim.decode import decode_file
 from sim.load_elf import load_elf
 from sim.sim import OTBNSim
@@ -132,10 +154,8 @@ def on_start_operation(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     return None
 
 
-def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
-    '''Step one instruction'''
-    check_arg_count('step', 0, args)
-
+def _step_trace(sim: OTBNSim) -> List[str]:
+    '''Step one cycle and return the lines of trace that it prints'''
     pc = sim.state.pc
     assert 0 == pc & 3
 
@@ -174,14 +194,68 @@ def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     if hdr is None and rtl_changes:
         hdr = 'STALL'
 
-    if hdr is not None:
-        print(hdr)
-        for rt in rtl_changes:
-            print(rt)
+    if hdr is None:
+        return []
+
+    return [hdr] + rtl_changes
+
+
+def on_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Step one instruction'''
+    check_arg_count('step', 0, args)
+
+    for line in _step_trace(sim):
+        print(line)
 
     return None
 
 
+# The trace lines that show an operation finishing. These are what the RTL
+# testbench (ISSWrapper::step) looks for to decide that the ISS is done.
+_STOPPED_STATUS_LINES = {'! otbn.STATUS: 0x{:08x}'.format(status)
+                         for status in [Status.IDLE, Status.LOCKED]}
+
+
+def _step_batch(sim: OTBNSim, count: int, until_stopped: bool) -> None:
+    '''Step up to count cycles, printing the trace of each
+
+    If until_stopped is true, stop after a cycle whose trace shows the STATUS
+    register becoming idle or locked.
+
+    '''
+    lines = []  # type: List[str]
+    steps = 0
+    while steps < count:
+        trace = _step_trace(sim)
+        steps += 1
+        if not trace:
+            continue
+
+        lines.append('@ {}'.format(steps - 1))
+        lines += trace
+        if until_stopped and not _STOPPED_STATUS_LINES.isdisjoint(trace):
+            break
+
+    lines.append('STEPS {}'.format(steps))
+    print('\n'.join(lines))
+
+
+def on_step_n(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Step a given number of cycles'''
+    check_arg_count('step_n', 1, args)
+    count = read_word('count', args[0], 32)
+    _step_batch(sim, count, False)
+    return None
+
+
+def on_run_until(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Step until the current operation finishes (or for max_cycles)'''
+    check_arg_count('run_until', 1, args)
+    max_cycles = read_word('max_cycles', args[0], 32)
+    _step_batch(sim, max_cycles, True)
+    return None
+
+
 def on_load_elf(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     '''Load contents of ELF at path given by only argument'''
     check_arg_count('load_elf', 1, args)
@@ -240,6 +314,23 @@ def on_load_d(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     return None
 
 
+def on_load_d_bin(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Load contents of data memory from raw bytes that follow on stdin'''
+    check_arg_count('load_d_bin', 1, args)
+
+    nbytes = read_word('nbytes', args[0], 32)
+    data = sys.stdin.buffer.read(nbytes)
+    if len(data) != nbytes:
+        raise RuntimeError('load_d_bin expected {} bytes of data, but only '
+                           'got {} before the end of input.'
+                           .format(nbytes, len(data)))
+
+    print('LOAD_D_BIN {}'.format(nbytes))
+    sim.load_data(data, has_validity=True)
+
+    return None
+
+
 def on_load_i(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     '''Load contents of insn memory from file at path given by only argument'''
     check_arg_count('load_i', 1, args)
@@ -247,7 +338,7 @@ def on_load_i(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     path = args[0]
 
     print('LOAD_I {!r}'.format(path))
-    sim.load_program(decode_file(0, path))
+    sim.load_program(decode_file(0, path, sim.isa_version))
 
     return None
 
@@ -266,6 +357,22 @@ def on_dump_d(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     return None
 
 
+def on_dump_d_bin(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
+    '''Dump contents of data memory as raw bytes to stdout'''
+    check_arg_count('dump_d_bin', 0, args)
+
+    data = sim.state.dmem.dump_le_words()
+    print('DUMP_D_BIN {}'.format(len(data)))
+
+    # Flush the text layer before writing to the buffer underneath it, so
+    # that the header comes first.
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
+
+    return None
+
+
 def on_print_regs(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     '''Print registers to stdout'''
     check_arg_count('print_regs', 0, args)
@@ -292,7 +399,7 @@ def on_print_call_stack(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
 
 def on_reset(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
     check_arg_count('reset', 0, args)
-    return OTBNSim()
+    return OTBNSim(sim.isa_version)
 
 
 def on_edn_rnd_step(sim: OTBNSim, args: List[str]) -> Optional[OTBNSim]:
@@ -407,12 +514,16 @@ _HANDLERS = {
     'start_operation': on_start_operation,
     'otp_key_cdc_done': on_otp_cdc_done,
     'step': on_step,
+    'step_n': on_step_n,
+    'run_until': on_run_until,
     'load_elf': on_load_elf,
     'add_loop_warp': on_add_loop_warp,
     'clear_loop_warps': on_clear_loop_warps,
     'load_d': on_load_d,
+    'load_d_bin': on_load_d_bin,
     'load_i': on_load_i,
     'dump_d': on_dump_d,
+    'dump_d_bin': on_dump_d_bin,
     'print_regs': on_print_regs,
     'print_call_stack': on_print_call_stack,
     'reset': on_reset,
@@ -455,8 +566,11 @@ def on_input(sim: OTBNSim, line: str) -> Optional[OTBNSim]:
 def main() -> int:
     sim = OTBNSim()
     try:
-        for line in sys.stdin:
-            ret = on_input(sim, line)
+        # Read commands from the binary stream under sys.stdin, which is also
+        # where load_d_bin reads its data (so nothing gets buffered in a text
+        # layer in between).
+        for line in sys.stdin.buffer:
+            ret = on_input(sim, line.decode())
             if ret is not None:
                 sim = ret
 
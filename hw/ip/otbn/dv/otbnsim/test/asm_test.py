@@ -0,0 +1,205 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check that otbn_as.py --otbn-direct gives the same objects as binutils
+
+Everything here runs otbn_as.py in this process (binutils and the C
+preprocessor are still subprocesses, but the preprocessor's output is cached
+in the directory that conftest.py sets up).
+
+'''
+
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import py
+import pytest
+from elftools.elf.elffile import ELFFile  # type: ignore
+
+import testutil  # noqa: F401 (puts the OTBN utilities on the path)
+import otbn_as
+from simple_test import find_simple_tests
+
+# The contents of a section: (type, flags, alignment, size, data), where data
+# is None for an SHT_NOBITS section
+_SectionDesc = Tuple[str, int, int, int, Optional[bytes]]
+
+# A symbol: (name, value, binding, type, section name)
+_SymbolDesc = Tuple[str, int, str, str, str]
+
+
+def _describe(obj_path: str) -> Tuple[Dict[str, _SectionDesc],
+                                      Set[_SymbolDesc]]:
+    '''The loaded sections and the named symbols of an object file
+
+    binutils also writes sections that never get to OTBN's memories (debug
+    information, .riscv.attributes and so on) and symbols that only matter to
+    other tools (mapping symbols like $x and local .L labels), so these are
+    left out.
+
+    '''
+    sections = {}
+    symbols = set()
+    with open(obj_path, 'rb') as handle:
+        elf = ELFFile(handle)
+        for section in elf.iter_sections():
+            if not section['sh_flags'] & 0x2:  # SHF_ALLOC
+                continue
+            nobits = section['sh_type'] == 'SHT_NOBITS'
+            sections[section.name] = (section['sh_type'],
+                                      section['sh_flags'],
+                                      section['sh_addralign'],
+                                      section['sh_size'],
+                                      None if nobits else section.data())
+
+        for sym in elf.get_section_by_name('.symtab').iter_symbols():
+            sym_type = sym['st_info']['type']
+            if (sym_type in ['STT_SECTION', 'STT_FILE'] or
+                    sym.name.startswith(('$', '.L')) or not sym.name):
+                continue
+            shndx = sym['st_shndx']
+            sec_name = (elf.get_section(shndx).name
+                        if isinstance(shndx, int) else shndx)
+            symbols.add((sym.name, sym['st_value'], sym['st_info']['bind'],
+                         sym_type, sec_name))
+    return sections, symbols
+
+
+def _assemble_direct(monkeypatch: pytest.MonkeyPatch,
+                     args: List[str]) -> Optional[int]:
+    '''Run otbn_as.py --otbn-direct with args
+
+    Returns None if the input needed binutils.
+
+    '''
+    fallbacks = []  # type: List[Any]
+
+    def no_binutils(*args: Any) -> int:
+        fallbacks.append(args)
+        return 1
+
+    with monkeypatch.context() as patch:
+        patch.setattr(otbn_as, 'run_binutils_as', no_binutils)
+        ret = otbn_as.main(['otbn_as.py', '--otbn-direct'] + args)
+    return None if fallbacks else ret
+
+
+def test_simple(tmpdir: py.path.local, asm_file: str,
+                monkeypatch: pytest.MonkeyPatch) -> None:
+    '''The in-process assembler matches binutils for a test in ./simple.'''
+    binutils = str(tmpdir.join('binutils.o'))
+    assert otbn_as.main(['otbn_as.py', '-o', binutils, asm_file]) == 0
+
+    direct = str(tmpdir.join('direct.o'))
+    ret = _assemble_direct(monkeypatch, ['-o', direct, asm_file])
+    if ret is None:
+        pytest.skip('The test needs binutils.')
+    assert ret == 0
+    assert _describe(direct) == _describe(binutils)
+
+
+# Instructions and data in sections other than .text, which binutils doesn't
+# align for instructions
+_CUSTOM_SECTIONS = '''
+  .section .text.start
+  .globl start
+  start:
+    bn.add  w1, w2, w3
+    addi    x1, x1, 1
+  again:
+    jal     x0, again
+  .section .rodata.tbl
+  table:
+    .word   1, 2
+  .balign 16
+    .half   3
+  .bss
+    .zero   12
+'''
+
+
+def test_custom_sections(tmpdir: py.path.local,
+                         monkeypatch: pytest.MonkeyPatch) -> None:
+    '''The in-process assembler lays out other sections like binutils.'''
+    asm_file = tmpdir.join('sections.s')
+    asm_file.write(_CUSTOM_SECTIONS)
+
+    binutils = str(tmpdir.join('binutils.o'))
+    assert otbn_as.main(['otbn_as.py', '-o', binutils, str(asm_file)]) == 0
+    direct = str(tmpdir.join('direct.o'))
+    assert _assemble_direct(monkeypatch, ['-o', direct, str(asm_file)]) == 0
+    assert _describe(direct) == _describe(binutils)
+
+    # binutils leaves a relocation for a jump to a global symbol, so that
+    # needs binutils too.
+    asm_file.write(_CUSTOM_SECTIONS.replace('jal     x0, again',
+                                            'jal     x0, start'))
+    assert _assemble_direct(monkeypatch, ['-o', direct, str(asm_file)]) is None
+
+
+def test_default_is_binutils(tmpdir: py.path.local,
+                             monkeypatch: pytest.MonkeyPatch) -> None:
+    '''Without --otbn-direct, binutils assembles everything.'''
+    asm_file, _ = find_simple_tests()[0]
+
+    def no_direct(*args: Any) -> bytes:
+        raise AssertionError('DirectAssembler used without --otbn-direct')
+
+    monkeypatch.setattr(otbn_as, 'assemble_direct', no_direct)
+    out = str(tmpdir.join('out.o'))
+    assert otbn_as.main(['otbn_as.py', '-o', out, asm_file]) == 0
+    assert os.path.exists(out)
+
+
+def test_batch(tmpdir: py.path.local,
+               monkeypatch: pytest.MonkeyPatch) -> None:
+    '''Assembling in a batch gives the same objects as one at a time.'''
+    asm_files = [asm_file for asm_file, _ in find_simple_tests()][:8]
+
+    jobs = []  # type: List[List[str]]
+    for idx, asm_file in enumerate(asm_files):
+        one = str(tmpdir.join('one{}.o'.format(idx)))
+        assert otbn_as.main(['otbn_as.py', '--otbn-direct', '-o', one,
+                             asm_file]) == 0
+        jobs.append(['--otbn-direct', '-o',
+                     str(tmpdir.join('batch{}.o'.format(idx))), asm_file])
+
+    jobs_file = tmpdir.join('jobs')
+    jobs_file.write(''.join(' '.join(job) + '\n' for job in jobs))
+    assert otbn_as.read_batch_file(str(jobs_file)) == jobs
+    assert otbn_as.assemble_batch(jobs) == 0
+
+    for idx in range(len(asm_files)):
+        assert (_describe(str(tmpdir.join('batch{}.o'.format(idx)))) ==
+                _describe(str(tmpdir.join('one{}.o'.format(idx)))))
+
+
+def test_batch_failure(tmpdir: py.path.local,
+                       capsys: pytest.CaptureFixture) -> None:
+    '''Failing and exiting jobs are reported, and the others still run.'''
+    good, _ = find_simple_tests()[0]
+    bad = tmpdir.join('bad.s')
+    bad.write('bn.notaninsn w0, w1\n')
+
+    ret = otbn_as.assemble_batch([
+        ['--otbn-direct', '-o', str(tmpdir.join('bad.o')), str(bad)],
+        ['--help'],
+        ['--otbn-direct', '-o', str(tmpdir.join('good.o')), good],
+    ])
+    assert ret == 1
+    assert tmpdir.join('good.o').exists()
+
+    err = capsys.readouterr().err
+    assert 'failed to assemble --otbn-direct -o {}'.format(
+        tmpdir.join('bad.o')) in err
+    assert 'Job exited with status 0.' in err
+    assert 'failed to assemble --help.' in err
+    assert '2 of 3 jobs failed.' in err
+
+
+def pytest_generate_tests(metafunc: Any) -> None:
+    if metafunc.function is test_simple:
+        asm_files = [asm_file for asm_file, _ in find_simple_tests()]
+        test_ids = [os.path.basename(asm_file) for asm_file in asm_files]
+        metafunc.parametrize("asm_file", asm_files, ids=test_ids)
@@ -0,0 +1,109 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the benchmark database in util/otbn_sim_py_bench_db.py'''
+
+import sqlite3
+from typing import Any, Dict
+
+import py
+import pytest
+
+import testutil  # noqa: F401 (puts the OTBN utilities on the path)
+from otbn_sim_py_bench_db import BenchmarkStore, connect, create_db
+
+# What ExecutionStatAnalyzer.get_stat_data() returns for one iteration (the
+# store only reads some of the keys)
+_RESULT = {
+    'insn_count': 100,
+    'stall_count': 7,
+    'func_instrs': {
+        'main': {'addi': (10, 0), 'jal': (2, 0)},
+        'helper': {'bn.mulqacc': (80, 7)},
+    },
+    'func_calls': {
+        'helper': {'main': 2},
+    },
+}  # type: Dict[str, Any]
+
+
+def _rows(path: str, query: str) -> Any:
+    con = sqlite3.connect(path)
+    try:
+        return con.execute(query).fetchall()
+    finally:
+        con.close()
+
+
+def test_create_db(tmpdir: py.path.local) -> None:
+    '''create_db adds the tables and indexes and can run again.'''
+    path = str(tmpdir.join('bench.db'))
+    con = sqlite3.connect(path)
+    cur = con.cursor()
+    create_db(cur)
+    create_db(cur)
+    con.commit()
+    con.close()
+
+    tables = {name for name, in _rows(
+        path, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'benchmark', 'benchmark_iteration', 'cycles', 'stalls',
+            'instr_counts', 'func_counts', 'func_instrs',
+            'func_calls'} <= tables
+    indexes = {name for name, in _rows(
+        path, "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_func_instrs_benchmark_iteration_id' in indexes
+
+    # connect() uses WAL and keeps the existing tables.
+    con = connect(path)
+    assert con.execute("PRAGMA journal_mode").fetchone() == ('wal',)
+    con.close()
+
+
+def test_store(tmpdir: py.path.local) -> None:
+    '''Each iteration is written with its cycles, stalls and functions.'''
+    path = str(tmpdir.join('bench.db'))
+    with BenchmarkStore(path, 'mlkem512_keypair') as store:
+        # The benchmark row is there before any iteration finishes.
+        assert _rows(path, "SELECT iterations, operation FROM benchmark") == [
+            (0, 'mlkem512_keypair')
+        ]
+        store.add_iteration(_RESULT)
+        store.add_iteration(_RESULT)
+        assert store.stored == 2
+
+    assert _rows(path, "SELECT id, iterations FROM benchmark") == [
+        (store.benchmark_id, 2)
+    ]
+    assert _rows(path, "SELECT cycles FROM cycles") == [(107,), (107,)]
+    assert _rows(path, "SELECT stalls FROM stalls") == [(7,), (7,)]
+    assert sorted(_rows(path,
+                        "SELECT func_name, instr_name, instr_count, "
+                        "stall_count FROM func_instrs "
+                        "WHERE benchmark_iteration_id = 1")) == [
+        ('helper', 'bn.mulqacc', 80, 7),
+        ('main', 'addi', 10, 0),
+        ('main', 'jal', 2, 0),
+    ]
+    assert _rows(path,
+                 "SELECT caller_func_name, callee_func_name, call_count, "
+                 "benchmark_iteration_id FROM func_calls") == [
+        ('main', 'helper', 2, 1),
+        ('main', 'helper', 2, 2),
+    ]
+
+
+def test_interrupted(tmpdir: py.path.local) -> None:
+    '''A failing run keeps its finished iterations and closes the database.'''
+    path = str(tmpdir.join('bench.db'))
+    with pytest.raises(KeyError):
+        with BenchmarkStore(path, 'mldsa44_sign') as store:
+            store.add_iteration(_RESULT)
+            store.add_iteration({'insn_count': 1})
+
+    # The broken iteration was rolled back as a whole.
+    assert _rows(path, "SELECT iterations FROM benchmark") == [(1,)]
+    assert _rows(path, "SELECT COUNT(*) FROM benchmark_iteration") == [(1,)]
+    with pytest.raises(sqlite3.ProgrammingError):
+        store.add_iteration(_RESULT)
@@ -0,0 +1,138 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the benchmark worker pool in util/otbn_sim_py_bench.py'''
+
+import os
+from typing import Any, List
+
+import py
+import pytest
+
+import testutil  # noqa: F401 (puts the OTBN utilities on the path)
+import otbn_sim_py_bench
+from otbn_sim_py_bench import IterationResult, iteration_seeds, run_iterations
+
+# The seed that _flaky and _raise_on_bad fail on
+_BAD_SEED = 3
+
+
+def _echo(seed: int) -> int:
+    return seed
+
+
+def _raise_on_bad(seed: int) -> int:
+    if seed == _BAD_SEED:
+        raise ValueError('bad seed')
+    return seed
+
+
+def _exit_once(marker: str) -> None:
+    '''Exit the process the first time this is called'''
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(3)
+
+
+def _flaky(marker: str, seed: int) -> int:
+    '''Kill the worker once for seed 1 and every time for _BAD_SEED'''
+    if seed == 1:
+        _exit_once(marker)
+    if seed == _BAD_SEED:
+        os._exit(4)
+    return seed
+
+
+def _always_exit() -> None:
+    os._exit(5)
+
+
+def _run(*args: Any, **kwargs: Any) -> List[IterationResult]:
+    return sorted(run_iterations(*args, **kwargs))
+
+
+def test_seed_order() -> None:
+    '''Seeds are repeatable, and each result says which seed it ran.'''
+    seeds = iteration_seeds(8, 42)
+    assert seeds == iteration_seeds(8, 42)
+    assert seeds != iteration_seeds(8, 43)
+    assert iteration_seeds(4, 42) == seeds[:4]
+
+    results = _run(_echo, (), seeds, 3)
+    assert [(it.index, it.seed, it.result, it.error) for it in results] == [
+        (idx, seed, seed, None) for idx, seed in enumerate(seeds)
+    ]
+
+    # With one worker, the iterations finish in order.
+    assert [it.index for it in run_iterations(_echo, (), seeds, 1)] == \
+        list(range(8))
+
+
+def test_exception() -> None:
+    '''An iteration that raises fails with its traceback.'''
+    results = _run(_raise_on_bad, (), [1, _BAD_SEED, 2], 2)
+    assert [it.result for it in results] == [1, None, 2]
+    assert results[0].error is None
+    assert results[1].error is not None
+    assert 'ValueError: bad seed' in results[1].error
+
+
+def test_worker_death(tmpdir: py.path.local) -> None:
+    '''Iterations whose worker dies are retried, per seed.'''
+    marker = str(tmpdir.join('died'))
+    results = _run(_flaky, (marker,), [0, 1, _BAD_SEED, 2], 2,
+                   max_retries=1)
+
+    # Seed 1 killed its first worker but worked on the retry. _BAD_SEED
+    # killed two workers and failed, but the other seeds still ran.
+    assert os.path.exists(marker)
+    assert [it.result for it in results] == [0, 1, None, 2]
+    assert results[2].error == 'worker process exited with code 4'
+
+    # Deaths count against the seed that caused them, so a few bad seeds
+    # before any iteration has finished don't abort the run.
+    results = _run(_flaky, (marker,), [_BAD_SEED] * 3 + [0], 1,
+                   max_retries=1)
+    assert [it.result for it in results] == [None] * 3 + [0]
+
+    # Without retries, the first death fails the iteration.
+    os.remove(marker)
+    results = _run(_flaky, (marker,), [0, 1], 1, max_retries=0)
+    assert [it.result for it in results] == [0, None]
+
+
+class _JoinFirstWorker(otbn_sim_py_bench._Worker):
+    '''A worker that waits for the first worker process to exit
+
+    This makes sure that the first seed is sent to a worker that has already
+    died.
+
+    '''
+    started = 0
+
+    def __init__(self, ctx: Any, worker_args: Any) -> None:
+        super().__init__(ctx, worker_args)
+        _JoinFirstWorker.started += 1
+        if _JoinFirstWorker.started == 1:
+            self.process.join(timeout=5)
+            assert not self.process.is_alive()
+
+
+def test_dead_before_send(tmpdir: py.path.local,
+                          monkeypatch: pytest.MonkeyPatch) -> None:
+    '''A worker that died before getting its seed is replaced.'''
+    monkeypatch.setattr(otbn_sim_py_bench, '_Worker', _JoinFirstWorker)
+    marker = str(tmpdir.join('died'))
+    results = _run(_echo, (), [5, 6, 7], 1, _exit_once, (marker,),
+                   max_retries=0)
+    assert _JoinFirstWorker.started == 2
+    assert [(it.result, it.error) for it in results] == [
+        (5, None), (6, None), (7, None)
+    ]
+
+
+def test_initializer_exits() -> None:
+    '''The run is aborted if workers keep dying in their initializer.'''
+    with pytest.raises(RuntimeError, match='keep exiting'):
+        list(run_iterations(_echo, (), [1, 2, 3], 2, _always_exit))
@@ -0,0 +1,79 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check that running basic blocks gives the same results as single-stepping.'''
+
+import io
+import os
+from typing import Any, Dict, Tuple
+
+import py
+
+from sim.standalonesim import StandaloneSim
+from simple_test import find_simple_tests
+import testutil
+
+_STATS_FIELDS = ['stall_count', 'stack_usage', 'insn_histo', 'func_instrs',
+                 'call_counts', 'call_site_counts', 'loop_counts',
+                 'basic_block_histo', 'ext_basic_block_histo']
+
+
+def _run(sim: StandaloneSim, use_blocks: bool) -> Tuple[Any, ...]:
+    '''Run sim, returning everything that we can see about how it went.'''
+    regs = io.StringIO()
+    cycles = sim.run(verbose=False, dump_file=regs, use_blocks=use_blocks)
+    stats: Dict[str, Any] = {}
+    if sim.stats is not None:
+        stats = {field: getattr(sim.stats, field) for field in _STATS_FIELDS}
+    return (cycles, regs.getvalue(), sim.state.pc, sim.dump_data(), stats)
+
+
+def test_simple(tmpdir: py.path.local, asm_file: str) -> None:
+    '''The results match for a test in ./simple.'''
+    # Some of these tests have errors that the statistics code doesn't expect
+    # (such as a LOOP with zero iterations), so don't collect statistics.
+    blocks = testutil.prepare_sim_for_asm_file(asm_file, tmpdir, False)
+    steps = testutil.prepare_sim_for_asm_file(asm_file, tmpdir, False)
+    assert _run(blocks, True) == _run(steps, False)
+
+
+def test_errors_in_block(tmpdir: py.path.local) -> None:
+    '''An error in the middle of a block stops at the same point.
+
+    This also checks that the statistics match, including the stall cycles
+    of the LW instructions.
+
+    '''
+    asm = '''
+      la x2, data
+      loopi 3, 4
+        addi x3, x3, 1
+        lw x4, 0(x2)
+        addi x2, x2, 2
+        addi x5, x5, 1
+      ecall
+
+    .data
+    data:
+      .word 0x12345678
+      .word 0x9abcdef0
+    '''
+    blocks = testutil.prepare_sim_for_asm_str(asm, tmpdir, True)
+    steps = testutil.prepare_sim_for_asm_str(asm, tmpdir, True)
+    result = _run(blocks, True)
+    assert result == _run(steps, False)
+
+    # The LW in the second iteration fails (with BAD_DATA_ADDR, since the
+    # address is misaligned), after one ADDI in that iteration.
+    assert 'ERR_BITS = 0x00000001' in result[1]
+    assert ' x3  = 0x00000002' in result[1]
+    assert ' x4  = 0x12345678' in result[1]
+    assert ' x5  = 0x00000001' in result[1]
+
+
+def pytest_generate_tests(metafunc: Any) -> None:
+    if metafunc.function is test_simple:
+        asm_files = [asm_file for asm_file, _ in find_simple_tests()]
+        test_ids = [os.path.basename(asm_file) for asm_file in asm_files]
+        metafunc.parametrize("asm_file", asm_files, ids=test_ids)
@@ -5,5 +5,20 @@
 import os
 import sys
 
+import pytest
+
 # Make tested code available for import
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+
+
+@pytest.fixture(autouse=True, scope='session')
+def otbn_cache_dir(tmp_path_factory: pytest.TempPathFactory) -> str:
+    '''Keep the OTBN tools' disk cache in a temporary directory.
+
+    Tests that run the tools (directly or as subprocesses) then neither use
+    nor fill the developer's own cache.
+
+    '''
+    path = str(tmp_path_factory.mktemp('otbn_cache'))
+    os.environ['OTBN_CACHE_DIR'] = path
+    return path
@@ -0,0 +1,238 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the audit mode of check_const_time.py'''
+
+import json
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+import py
+import pytest
+
+import testutil
+import check_const_time
+from check_const_time import AuditCheck, audit, read_manifest
+from shared.disk_cache import DiskCache, file_digest
+from shared.information_flow_analysis import IFlowCache
+
+# A subroutine whose control flow doesn't depend on its inputs, one that
+# branches on x5 and one that can only be analyzed if x5 (its loop count) is a
+# known constant.
+_ASM = '''
+  flat:
+    add   x6, x5, x7
+    ret
+
+  branchy:
+    beq   x5, x0, done
+    addi  x6, x6, 1
+  done:
+    ret
+
+  counted:
+    loop  x5, 1
+      addi  x6, x6, 1
+    ret
+'''
+
+
+@pytest.fixture(scope='module')
+def elfs(tmpdir_factory: pytest.TempdirFactory) -> List[str]:
+    '''Two copies of the program, named mlkem_prog.elf and mldsa_prog.elf'''
+    tmpdir = tmpdir_factory.mktemp('audit')
+    asm_path = str(tmpdir.join('prog.s'))
+    with open(asm_path, 'w') as handle:
+        handle.write(_ASM)
+    elf_path = testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+    paths = []
+    for name in ['mlkem_prog.elf', 'mldsa_prog.elf']:
+        path = tmpdir.join(name)
+        py.path.local(elf_path).copy(path)
+        paths.append(str(path))
+    return paths
+
+
+def _write_manifest(tmpdir: py.path.local, checks: Any) -> str:
+    path = tmpdir.join('manifest.json')
+    path.write(json.dumps({'checks': checks}))
+    return str(path)
+
+
+def _run_audit(tmpdir: py.path.local, elfs: List[str], checks: Any,
+               jobs: int) -> Tuple[int, Dict[str, Any]]:
+    '''Run an audit, returning its exit code and report'''
+    report = str(tmpdir.join('report.json'))
+    ret = audit(elfs, read_manifest(_write_manifest(tmpdir, checks)), jobs,
+                False, report)
+    with open(report) as handle:
+        return ret, json.load(handle)
+
+
+def test_read_manifest(tmpdir: py.path.local) -> None:
+    '''Manifest entries become AuditChecks.'''
+    checks = read_manifest(_write_manifest(tmpdir, [
+        {'subroutine': 'flat'},
+        {'subroutine': 'counted', 'secrets': ['x6'], 'constants': ['x5:2'],
+         'elfs': ['mlkem*']},
+        {'secrets': ['dmem']}
+    ]))
+    assert [(c.subroutine, c.secrets, c.constants, c.elfs)
+            for c in checks] == [
+        ('flat', None, {}, None),
+        ('counted', ['x6'], {'x5': 2}, ['mlkem*']),
+        (None, ['dmem'], {}, None)
+    ]
+
+
+@pytest.mark.parametrize('text', [
+    '{"checks": [',
+    '[]',
+    '{"checks": {}}',
+    '{"checks": ["flat"]}',
+    '{"checks": [{"subroutine": "flat", "secret": ["x5"]}]}',
+    '{"checks": [{"subroutine": 3}]}',
+    '{"checks": [{"subroutine": "flat", "secrets": "x5"}]}',
+    '{"checks": [{"subroutine": "flat", "elfs": [1]}]}',
+    '{"checks": [{"constants": ["x5:2"]}]}',
+])
+def test_bad_manifest(tmpdir: py.path.local, text: str) -> None:
+    '''Malformed manifests are rejected with a ValueError.'''
+    path = tmpdir.join('manifest.json')
+    path.write(text)
+    with pytest.raises(ValueError):
+        read_manifest(str(path))
+
+
+def test_elf_filters(elfs: List[str]) -> None:
+    '''A check with elfs patterns only applies to ELF files that match.'''
+    check = AuditCheck('flat', None, {}, ['mlkem*', '*_other.elf'])
+    assert [check.applies_to(elf) for elf in elfs] == [True, False]
+    # The patterns are matched against the file name, not the whole path.
+    check.elfs = ['*mlkem*']
+    assert check.applies_to('/mlkem/mldsa_prog.elf') is False
+
+
+_CHECKS = [
+    {'subroutine': 'flat'},
+    {'subroutine': 'branchy', 'elfs': ['mlkem*']},
+    {'subroutine': 'branchy', 'secrets': ['x6'], 'elfs': ['mldsa*']},
+    {'subroutine': 'counted', 'secrets': ['x6'], 'constants': ['x5:2']},
+    {'subroutine': 'missing'},
+]
+
+
+def _summary(report: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    return [(os.path.basename(record['elf']), record['subroutine'],
+             record['status'])
+            for record in report['results']]
+
+
+def test_report(tmpdir: py.path.local, elfs: List[str]) -> None:
+    '''The report lists every check that applies to each ELF file.'''
+    ret, report = _run_audit(tmpdir, elfs, _CHECKS, 1)
+    assert ret == 1
+    assert _summary(report) == [
+        ('mlkem_prog.elf', 'flat', 'pass'),
+        ('mlkem_prog.elf', 'branchy', 'fail'),
+        ('mlkem_prog.elf', 'counted', 'pass'),
+        ('mlkem_prog.elf', 'missing', 'error'),
+        ('mldsa_prog.elf', 'flat', 'pass'),
+        ('mldsa_prog.elf', 'branchy', 'pass'),
+        ('mldsa_prog.elf', 'counted', 'pass'),
+        ('mldsa_prog.elf', 'missing', 'error'),
+    ]
+    assert report['summary'] == {'pass': 5, 'fail': 1, 'error': 2}
+
+    failed = report['results'][1]
+    assert failed['control_deps'] == {'x5': ['0x8']}
+    assert failed['details'] == ['x5 (via beq at PC 0x8)']
+    assert report['results'][2]['constants'] == {'x5': 2}
+    assert report['results'][3]['error'] == ('Symbol missing not found in '
+                                             'program.')
+
+    # Every check passes without the ones that shouldn't.
+    ret, report = _run_audit(tmpdir, elfs, [_CHECKS[0], _CHECKS[2]], 1)
+    assert ret == 0
+    assert report['summary'] == {'pass': 3, 'fail': 0, 'error': 0}
+
+
+def test_jobs(tmpdir: py.path.local, elfs: List[str]) -> None:
+    '''Running the analyses on worker processes gives the same report.'''
+    _, serial = _run_audit(tmpdir, elfs, _CHECKS, 1)
+    _, parallel = _run_audit(tmpdir, elfs, _CHECKS, 4)
+    assert parallel == serial
+
+
+def test_saved_cache(tmpdir: py.path.local, elfs: List[str],
+                     monkeypatch: pytest.MonkeyPatch) -> None:
+    '''The audit saves what its workers found, once per ELF file.'''
+    monkeypatch.setenv('OTBN_CACHE_DIR', str(tmpdir.join('cache')))
+    saves = tmpdir.join('saves')
+    save = IFlowCache.save
+
+    def logged_save(cache: IFlowCache) -> None:
+        with open(str(saves), 'a') as handle:
+            handle.write('{}\n'.format(os.getpid()))
+        save(cache)
+
+    monkeypatch.setattr(IFlowCache, 'save', logged_save)
+    _run_audit(tmpdir, elfs, _CHECKS, 4)
+
+    # Only this process saved, and only once for each ELF file.
+    assert saves.read().split() == [str(os.getpid())] * len(elfs)
+    store = DiskCache.default('check_const_time')
+    for elf in elfs:
+        assert IFlowCache(store, file_digest(elf) or '').entries
+
+
+def _exit_on_branchy(analysis: Any) -> Any:
+    '''Stand-in for _run_analysis whose worker dies on one subroutine'''
+    if analysis[1] == 'branchy':
+        os._exit(1)
+    return (True, {})
+
+
+def test_broken_pool(tmpdir: py.path.local, elfs: List[str],
+                     monkeypatch: pytest.MonkeyPatch) -> None:
+    '''Analyses are reported as errors if a worker process dies.'''
+    monkeypatch.setattr(check_const_time, '_run_analysis', _exit_on_branchy)
+    ret, report = _run_audit(tmpdir, elfs, _CHECKS[:2], 2)
+    assert ret == 1
+
+    results = report['results']
+    assert results[1]['subroutine'] == 'branchy'
+    assert results[1]['status'] == 'error'
+    assert results[1]['error'] == 'A worker process exited unexpectedly.'
+    # Other analyses either finished before the worker died or were lost with
+    # it, but none of them is missing from the report.
+    assert len(results) == 3
+    assert all(record['status'] in ['pass', 'error'] for record in results)
+
+
+def test_command_line(tmpdir: py.path.local, elfs: List[str],
+                      monkeypatch: pytest.MonkeyPatch,
+                      capsys: pytest.CaptureFixture) -> None:
+    '''--manifest, --jobs and --report reach the audit.'''
+    report = tmpdir.join('report.json')
+    monkeypatch.setattr(sys, 'argv', [
+        'check_const_time.py', '--manifest',
+        _write_manifest(tmpdir, _CHECKS[:1]), '--jobs', '2', '--report',
+        str(report), '--verbose'
+    ] + elfs)
+    assert check_const_time.main() == 0
+    out = capsys.readouterr().out
+    assert 'PASS: mlkem_prog.elf (subroutine flat)' in out
+    assert '2 passed, 0 failed, 0 errors' in out
+    assert json.loads(report.read())['summary']['pass'] == 2
+
+    # The single-check arguments can't be mixed with a manifest.
+    monkeypatch.setattr(sys, 'argv', [
+        'check_const_time.py', '--manifest', 'manifest.json', '--subroutine',
+        'flat'
+    ] + elfs)
+    with pytest.raises(SystemExit):
+        check_const_time.main()
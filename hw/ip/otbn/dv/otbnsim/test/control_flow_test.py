@@ -0,0 +1,124 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the control-flow graph and the information-flow analysis on it'''
+
+from typing import Dict, List
+
+import py
+
+import testutil
+from shared.control_flow import (program_control_graph,
+                                 subroutine_control_graph)
+from shared.decode import OTBNProgram, decode_elf
+from shared.information_flow_analysis import (IFlowCache,
+                                              get_subroutine_iflow,
+                                              stringify_control_deps)
+from shared.instruction_count_range import program_insn_count_range
+
+
+def _build(tmpdir: py.path.local, asm: str) -> OTBNProgram:
+    asm_path = str(tmpdir.join('prog.s'))
+    with open(asm_path, 'w') as handle:
+        handle.write(asm)
+    return decode_elf(testutil.asm_and_link_one_file(asm_path, tmpdir))
+
+
+def _control_deps(program: OTBNProgram, subroutine: str,
+                  constants: Dict[str, int],
+                  cache: IFlowCache) -> List[str]:
+    graph = subroutine_control_graph(program, subroutine)
+    _, _, control_deps = get_subroutine_iflow(program, graph, subroutine,
+                                              constants, cache)
+    return sorted(stringify_control_deps(program, control_deps))
+
+
+def test_cycle_after_call(tmpdir: py.path.local) -> None:
+    '''A cycle after a call is found.
+
+    The search for cycles used to stop at the call, so the analysis
+    recursed forever around the cycle after it.
+    '''
+    program = _build(tmpdir, '''
+      main:
+        jal   x1, helper
+      again:
+        addi  x5, x5, -1
+        bne   x5, x0, again
+        ret
+
+      helper:
+        ret
+    ''')
+    again = program.get_pc_at_symbol('again')
+    graph = subroutine_control_graph(program, 'main')
+    assert graph.get_cycle_starts() == {again}
+    assert (_control_deps(program, 'main', {}, IFlowCache()) ==
+            ['x5 (via bne at PC {:#x})'.format(again + 4)])
+
+
+def test_split_before_cycle(tmpdir: py.path.local) -> None:
+    '''A section that runs into a cycle stops before the cycle starts.
+
+    The first instruction of the cycle used to be in both sections, so it
+    was counted twice: the minimum instruction count here was 5.
+    '''
+    program = _build(tmpdir, '''
+        lw    x7, 0(x0)
+      again:
+        addi  x7, x7, -1
+        bne   x7, x0, again
+        ecall
+
+      .data
+        .word 1
+    ''')
+    again = program.get_pc_at_symbol('again')
+    graph = program_control_graph(program)
+    assert graph.get_section(program.min_pc()).end == again - 4
+    assert program_insn_count_range(program) == (4, None)
+
+
+def test_constant_set_in_section(tmpdir: py.path.local) -> None:
+    '''A constant that a section sets for its last instruction isn't an input.
+
+    Constants used by the last instruction of a section used to count as
+    inputs even if the section set them itself. Here, the loop body sets x5,
+    which wasn't an input to the body, and updating the cache failed an
+    assertion.
+    '''
+    program = _build(tmpdir, '''
+      store:
+        loopi  2, 2
+          addi   x5, x0, 1
+          bn.sid x5, 0(x0)
+        ret
+    ''')
+    assert _control_deps(program, 'store', {}, IFlowCache()) == []
+
+
+def test_loop_count_is_used(tmpdir: py.path.local) -> None:
+    '''Results for different loop counts aren't mixed up by the cache.
+
+    The number of iterations decides whether x5 or x6 reaches the branch.
+    The loop count register didn't count as used, so a cached result for one
+    iteration was used for two once the body overwrote the register.
+    '''
+    program = _build(tmpdir, '''
+      shift:
+        loop  x10, 3
+          addi  x7, x6, 0
+          addi  x6, x5, 0
+          lw    x10, 0(x0)
+        bne   x7, x0, skip
+      skip:
+        ret
+    ''')
+    branch = program.get_pc_at_symbol('skip') - 4
+    cache = IFlowCache()
+    for count, source in [(1, 'x6'), (2, 'x5'), (1, 'x6')]:
+        assert _control_deps(program, 'shift', {'x10': count}, cache) == [
+            'x10 (via loop at PC {:#x})'.format(program.min_pc()),
+            '{} (via bne at PC {:#x})'.format(source, branch)
+        ]
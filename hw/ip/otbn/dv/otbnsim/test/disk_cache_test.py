@@ -0,0 +1,197 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the disk cache and how otbn_as.py uses it'''
+
+import io
+import os
+import subprocess
+from typing import Any, List
+
+import py
+import pytest
+
+import testutil  # noqa: F401 (puts the OTBN utilities on the path)
+import otbn_as
+from shared.disk_cache import DiskCache, hash_key
+
+
+def test_hit_and_miss(tmpdir: py.path.local) -> None:
+    '''Entries can be read back, and missing ones are None.'''
+    cache = DiskCache(str(tmpdir), 'test')
+    key = hash_key('a', 'b')
+    assert cache.get(key) is None
+    assert cache.get_pickle(key) is None
+
+    cache.put(key, b'value')
+    assert cache.get(key) == b'value'
+
+    cache.put_pickle(key, {'x': [1, 2]})
+    assert cache.get_pickle(key) == {'x': [1, 2]}
+
+    # Keys are made from the lengths of their parts as well as the contents.
+    assert hash_key('ab', 'c') != hash_key('a', 'bc')
+
+
+def test_corrupt_entry(tmpdir: py.path.local) -> None:
+    '''A damaged pickled entry reads as a miss.'''
+    cache = DiskCache(str(tmpdir), 'test')
+    key = hash_key('corrupt')
+    cache.put_pickle(key, [1, 2, 3])
+    cache.put(key, b'\x80not a pickle')
+    assert cache.get_pickle(key) is None
+
+
+def test_default_is_opt_in(monkeypatch: pytest.MonkeyPatch,
+                           tmpdir: py.path.local) -> None:
+    '''There's only a default cache if OTBN_CACHE_DIR is set.'''
+    monkeypatch.delenv('OTBN_CACHE_DIR', raising=False)
+    assert DiskCache.default('test') is None
+    monkeypatch.setenv('OTBN_CACHE_DIR', '')
+    assert DiskCache.default('test') is None
+
+    monkeypatch.setenv('OTBN_CACHE_DIR', str(tmpdir))
+    monkeypatch.setenv('OTBN_CACHE_MAX_MB', '3')
+    cache = DiskCache.default('test')
+    assert cache is not None
+    assert cache.path == os.path.join(str(tmpdir), 'test')
+    assert cache.max_bytes == 3 * 1024 * 1024
+
+    monkeypatch.setenv('OTBN_CACHE_MAX_MB', 'lots')
+    with pytest.raises(ValueError):
+        DiskCache.default('test')
+
+
+def test_trim(tmpdir: py.path.local) -> None:
+    '''The least recently used entries go when the cache is too big.'''
+    cache = DiskCache(str(tmpdir), 'test')
+    keys = [hash_key(str(idx)) for idx in range(5)]
+    for idx, key in enumerate(keys):
+        cache.put(key, bytes(300))
+        # Make the order of the entries unambiguous.
+        os.utime(cache._entry_path(key), (idx, idx))
+
+    # Reading an entry makes it the most recently used one.
+    assert cache.get(keys[0]) is not None
+    cache.max_bytes = 1000
+    cache.trim()
+
+    kept = [key for key in keys if cache.get(key) is not None]
+    assert kept == [keys[0], keys[4]]
+
+
+class _CountCalls:
+    '''Wraps a function, counting the calls to it'''
+    def __init__(self, func: Any) -> None:
+        self.func = func
+        self.calls = 0
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        self.calls += 1
+        return self.func(*args, **kwargs)
+
+
+def _preprocess(cache: DiskCache, in_path: str, out_dir: py.path.local,
+                copts: List[str] = []) -> str:
+    out_dir.ensure(dir=True)
+    out_path, = otbn_as.run_c_preprocessor(str(out_dir), [in_path], copts,
+                                           cache)
+    with open(out_path) as handle:
+        return handle.read()
+
+
+def test_preprocessor_cache(tmpdir: py.path.local,
+                            monkeypatch: pytest.MonkeyPatch) -> None:
+    '''Preprocessed inputs are reused until an input or the tool changes.'''
+    cache = DiskCache(str(tmpdir.join('cache')), 'otbn_as')
+    gcc = _CountCalls(subprocess.run)
+    monkeypatch.setattr(otbn_as.subprocess, 'run', gcc)
+
+    src_dir = tmpdir.join('a')
+    src_dir.join('inc', 'defs.h').write('#define VALUE 3\n', ensure=True)
+    src = src_dir.join('prog.s')
+    src.write('#include "inc/defs.h"\naddi x1, x0, VALUE\n')
+
+    first = _preprocess(cache, str(src), tmpdir.join('out1'))
+    assert 'addi x1, x0, 3' in first
+    assert gcc.calls == 1
+
+    # The same input again is a hit.
+    assert _preprocess(cache, str(src), tmpdir.join('out2')) == first
+    assert gcc.calls == 1
+
+    # So is a copy of the input and its header somewhere else, but the line
+    # markers name the copy.
+    copy_dir = tmpdir.join('b')
+    src_dir.copy(copy_dir)
+    copied = _preprocess(cache, str(copy_dir.join('prog.s')),
+                         tmpdir.join('out3'))
+    assert gcc.calls == 1
+    assert str(copy_dir.join('prog.s')) in copied
+    assert str(src) not in copied
+
+    # Changing the header is a miss.
+    src_dir.join('inc', 'defs.h').write('#define VALUE 4\n')
+    assert 'addi x1, x0, 4' in _preprocess(cache, str(src),
+                                           tmpdir.join('out4'))
+    assert gcc.calls == 2
+
+    # So is changing the options or the preprocessor itself.
+    _preprocess(cache, str(src), tmpdir.join('out5'), ['-DOTHER'])
+    assert gcc.calls == 3
+    gcc_name = otbn_as.find_tool('gcc')
+    monkeypatch.setitem(otbn_as._TOOL_FILE_DIGESTS, gcc_name, 'new gcc')
+    _preprocess(cache, str(src), tmpdir.join('out6'))
+    assert gcc.calls == 4
+
+    # A damaged entry is ignored and remade.
+    for entry in tmpdir.join('cache').visit(fil=lambda p: p.isfile()):
+        entry.write_binary(b'garbage')
+    assert 'addi x1, x0, 4' in _preprocess(cache, str(src),
+                                           tmpdir.join('out7'))
+    assert gcc.calls == 5
+
+
+def test_transform_cache(tmpdir: py.path.local,
+                         monkeypatch: pytest.MonkeyPatch) -> None:
+    '''Transformed inputs are reused until the input or the tables change.'''
+    cache = DiskCache(str(tmpdir), 'otbn_as')
+    tables = otbn_as.load_tables('0')
+    transform = _CountCalls(otbn_as.transform_input)
+    monkeypatch.setattr(otbn_as, 'transform_input', transform)
+
+    def run(text: str, tables_key: str) -> str:
+        out = io.StringIO()
+        otbn_as._transform_cached(out, 'prog.s', io.StringIO(text),
+                                  tables[0], tables[1], tables[2], cache,
+                                  tables_key)
+        return out.getvalue()
+
+    first = run('bn.add w0, w1, w2\n', 'tables1')
+    assert transform.calls == 1
+    assert run('bn.add w0, w1, w2\n', 'tables1') == first
+    assert transform.calls == 1
+
+    run('bn.add w0, w1, w3\n', 'tables1')
+    assert transform.calls == 2
+
+    # A change to the instruction tables or to the tool changes tables_key.
+    assert run('bn.add w0, w1, w2\n', 'tables2') == first
+    assert transform.calls == 3
+
+    # A damaged entry is remade.
+    for entry in tmpdir.visit(fil=lambda p: p.isfile()):
+        entry.write_binary(b'\xff\xfe')
+    assert run('bn.add w0, w1, w2\n', 'tables1') == first
+    assert transform.calls == 4
+
+
+def test_put_trims(tmpdir: py.path.local) -> None:
+    '''Writing entries keeps the cache within its limit.'''
+    cache = DiskCache(str(tmpdir), 'test', max_bytes=1000)
+    for idx in range(20):
+        cache.put(hash_key(str(idx)), bytes(300))
+    total = sum(entry.size()
+                for entry in tmpdir.visit(fil=lambda p: p.isfile()))
+    assert total <= 1000
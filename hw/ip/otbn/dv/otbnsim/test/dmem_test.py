@@ -0,0 +1,81 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Test the backdoor byte access to Dmem.'''
+
+import pytest
+
+from sim.dmem import Dmem
+
+
+def test_write_read_bytes() -> None:
+    '''Check unaligned writes and reads against a dump of the memory.'''
+    dmem = Dmem()
+    dmem.load_le_words(bytes(range(64)), False)
+
+    # An unaligned write that covers part of a valid word, a whole word and
+    # part of an invalid word (beyond the loaded data).
+    dmem.write_bytes(62, b'\xaa\xbb\xcc\xdd\xee')
+    assert dmem.read_bytes(60, 8) == b'\x3c\x3d\xaa\xbb\xcc\xdd\xee\x00'
+    assert dmem.load_u32(64) == 0x00eeddcc
+    assert dmem.load_u32(68) is None
+
+    dump = dmem.dump_le_words(include_validity=False)
+    assert dump[:64] == bytes(range(62)) + b'\xaa\xbb'
+    assert dmem.read_bytes(1, 10) == dump[1:11]
+
+    dump_vld = dmem.dump_le_words(include_validity=True)
+    assert len(dump_vld) == 5 * len(dump) // 4
+    assert dump_vld[5 * 16:5 * 18] == (b'\x01\xcc\xdd\xee\x00' +
+                                       b'\x00\x00\x00\x00\x00')
+
+
+def test_make_all_valid() -> None:
+    '''Marking DMEM valid matches reloading a dump without validity.'''
+    dmem = Dmem()
+    dmem.load_le_words(bytes(range(64)), False)
+    dmem.write_bytes(100, b'\xaa')
+
+    reloaded = Dmem()
+    reloaded.load_le_words(dmem.dump_le_words(include_validity=False), False)
+
+    dmem.make_all_valid()
+    assert dmem.load_u32(68) == 0
+    assert dmem.load_u256(96) == 0xaa << 32
+    assert dmem.dump_le_words() == reloaded.dump_le_words()
+
+
+def test_read_bytes_sees_pending() -> None:
+    '''A pending store is visible to read_bytes, as it is to dumps.'''
+    dmem = Dmem()
+    dmem.store_u32(8, 0x12345678)
+    dmem.commit()
+    assert dmem.read_bytes(8, 4) == b'\x78\x56\x34\x12'
+    assert dmem.dump_le_words(False)[8:12] == b'\x78\x56\x34\x12'
+
+
+def test_out_of_range() -> None:
+    dmem = Dmem()
+    size = len(dmem.dump_le_words(False))
+    with pytest.raises(ValueError):
+        dmem.write_bytes(size - 1, b'ab')
+    with pytest.raises(ValueError):
+        dmem.read_bytes(-1, 2)
+
+
+def test_pending_write_survives_invalidation() -> None:
+    '''A store that is still pending lands even if DMEM is invalidated.'''
+    dmem = Dmem()
+    dmem.load_le_words(bytes(64), False)
+    dmem.store_u256(32, (1 << 256) - 1)
+    dmem.commit()
+
+    dmem.empty_dmem()
+    assert dmem.load_u256(0) is None
+    assert dmem.load_u256(32) == (1 << 256) - 1
+
+    dmem.commit()
+    assert dmem.load_u256(0) is None
+    assert dmem.load_u256(32) == (1 << 256) - 1
+    assert dmem.load_u32(64) is None
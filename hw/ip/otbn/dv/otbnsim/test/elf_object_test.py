@@ -0,0 +1,125 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the object files that shared/elf_object.py writes'''
+
+import os
+import subprocess
+from typing import List, Optional, Tuple
+
+import py
+from elftools.elf.elffile import ELFFile  # type: ignore
+
+import testutil
+from shared.decode import decode_elf
+from shared.elf_object import (SHF_ALLOC, SHF_EXECINSTR, SHF_WRITE,
+                               SHT_NOBITS, SHT_PROGBITS, ElfSection,
+                               ElfSymbol, write_elf_object)
+
+# ADDI x5, x0, 1 and ECALL
+_CODE = bytes.fromhex('93021000' '73000000')
+
+
+def _sections() -> Tuple[List[ElfSection], List[ElfSymbol]]:
+    '''Code, data and bss sections, with symbols in a jumbled order'''
+    text = ElfSection('.text', SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR)
+    text.align = 4
+    text.data += _CODE
+    data = ElfSection('.data', SHT_PROGBITS, SHF_ALLOC | SHF_WRITE)
+    data.align = 32
+    data.data += bytes(range(5))
+    bss = ElfSection('.bss', SHT_NOBITS, SHF_ALLOC | SHF_WRITE)
+    bss.align = 8
+    bss.nobits_size = 64
+
+    symbols = [
+        ElfSymbol('start', text, 0, True),
+        ElfSymbol('local_code', text, 4, False),
+        ElfSymbol('table', data, 1, True),
+        ElfSymbol('scratch', bss, 8, False),
+    ]
+    return [text, data, bss], symbols
+
+
+def _write(tmpdir: py.path.local, file_name: Optional[str] = 'prog.s') -> str:
+    sections, symbols = _sections()
+    path = tmpdir.join('prog.o')
+    path.write_binary(write_elf_object(sections, symbols, file_name))
+    return str(path)
+
+
+def test_header(tmpdir: py.path.local) -> None:
+    '''The object is a little-endian ELF32 relocatable file for RISC-V.'''
+    with open(_write(tmpdir), 'rb') as handle:
+        elf = ELFFile(handle)
+        assert elf.elfclass == 32
+        assert elf.little_endian
+        assert elf['e_type'] == 'ET_REL'
+        assert elf['e_machine'] == 'EM_RISCV'
+        assert elf.get_section(elf['e_shstrndx']).name == '.shstrtab'
+
+
+def test_sections(tmpdir: py.path.local) -> None:
+    '''Sections keep their order, type, flags, alignment and contents.'''
+    with open(_write(tmpdir), 'rb') as handle:
+        elf = ELFFile(handle)
+        assert [sec.name for sec in elf.iter_sections()] == [
+            '', '.text', '.data', '.bss', '.symtab', '.strtab', '.shstrtab'
+        ]
+        descs = {}
+        for sec in list(elf.iter_sections())[1:4]:
+            assert sec['sh_offset'] % sec['sh_addralign'] == 0
+            descs[sec.name] = (sec['sh_type'], sec['sh_flags'],
+                               sec['sh_addralign'], sec['sh_size'])
+        assert descs == {
+            '.text': ('SHT_PROGBITS', SHF_ALLOC | SHF_EXECINSTR, 4, 8),
+            '.data': ('SHT_PROGBITS', SHF_ALLOC | SHF_WRITE, 32, 5),
+            '.bss': ('SHT_NOBITS', SHF_ALLOC | SHF_WRITE, 8, 64),
+        }
+        assert elf.get_section_by_name('.text').data() == _CODE
+        assert elf.get_section_by_name('.data').data() == bytes(range(5))
+
+
+def test_symbols(tmpdir: py.path.local) -> None:
+    '''Local symbols come before global ones, as the ELF spec requires.'''
+    with open(_write(tmpdir), 'rb') as handle:
+        elf = ELFFile(handle)
+        symtab = elf.get_section_by_name('.symtab')
+        assert elf.get_section(symtab['sh_link']).name == '.strtab'
+
+        syms = [(sym.name, sym['st_info']['bind'], sym['st_info']['type'],
+                 sym['st_shndx'], sym['st_value'])
+                for sym in symtab.iter_symbols()]
+        assert syms == [
+            ('', 'STB_LOCAL', 'STT_NOTYPE', 'SHN_UNDEF', 0),
+            ('prog.s', 'STB_LOCAL', 'STT_FILE', 'SHN_ABS', 0),
+            ('', 'STB_LOCAL', 'STT_SECTION', 1, 0),
+            ('', 'STB_LOCAL', 'STT_SECTION', 2, 0),
+            ('', 'STB_LOCAL', 'STT_SECTION', 3, 0),
+            ('local_code', 'STB_LOCAL', 'STT_NOTYPE', 1, 4),
+            ('scratch', 'STB_LOCAL', 'STT_NOTYPE', 3, 8),
+            ('start', 'STB_GLOBAL', 'STT_NOTYPE', 1, 0),
+            ('table', 'STB_GLOBAL', 'STT_NOTYPE', 2, 1),
+        ]
+        # sh_info is the index of the first global symbol.
+        assert symtab['sh_info'] == 7
+
+    # Without a file name, there's no STT_FILE symbol.
+    with open(_write(tmpdir, None), 'rb') as handle:
+        symtab = ELFFile(handle).get_section_by_name('.symtab')
+        types = [sym['st_info']['type'] for sym in symtab.iter_symbols()]
+        assert 'STT_FILE' not in types
+        assert symtab['sh_info'] == 6
+
+
+def test_link(tmpdir: py.path.local) -> None:
+    '''The linker accepts the object and places its symbols.'''
+    otbn_ld = os.path.join(testutil.UTIL_DIR, 'otbn_ld.py')
+    elf_path = str(tmpdir.join('prog'))
+    subprocess.run([otbn_ld, '-o', elf_path, _write(tmpdir)], check=True)
+
+    program = decode_elf(elf_path)
+    start = program.get_pc_at_symbol('start')
+    assert [program.get_insn(start + 4 * idx).mnemonic
+            for idx in range(2)] == ['addi', 'ecall']
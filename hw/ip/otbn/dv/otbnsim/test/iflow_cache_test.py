@@ -0,0 +1,157 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the cache that check_const_time.py keeps for information flow'''
+
+import py
+import pytest
+
+import testutil
+from shared import information_flow_analysis
+from shared.control_flow import subroutine_control_graph
+from shared.decode import OTBNProgram, decode_elf
+from shared.disk_cache import DiskCache
+from shared.information_flow_analysis import (IFlowCache,
+                                              get_subroutine_iflow)
+
+# Two subroutines that enter the same cycle (between p and q) at different
+# points, so each control graph marks a different edge as the back edge.
+_ASM = '''
+    jal   x1, entry_a
+    jal   x1, entry_b
+    ecall
+
+  entry_a:
+    lw    x5, 0(x0)
+  node_p:
+    addi  x5, x5, -1
+    beq   x5, x0, done
+  node_q:
+    addi  x6, x6, 1
+    bne   x6, x0, node_p
+  done:
+    ret
+
+  entry_b:
+    lw    x5, 0(x0)
+    jal   x0, node_q
+
+  .data
+    .word 3
+'''
+
+
+@pytest.fixture
+def program(tmpdir: py.path.local) -> OTBNProgram:
+    asm_path = str(tmpdir.join('prog.s'))
+    with open(asm_path, 'w') as handle:
+        handle.write(_ASM)
+    return decode_elf(testutil.asm_and_link_one_file(asm_path, tmpdir))
+
+
+def test_shared_cycle_digests(program: OTBNProgram) -> None:
+    '''Indices depend on the reachable graph, not on the order of lookups.'''
+    node_p = program.get_pc_at_symbol('node_p')
+    node_q = program.get_pc_at_symbol('node_q')
+    done = program.get_pc_at_symbol('done')
+
+    graph_a = subroutine_control_graph(program, 'entry_a')
+    graph_b = subroutine_control_graph(program, 'entry_b')
+
+    # Look the cycle up from each end, first through one graph and then the
+    # other, and check that a fresh cache gives the same indices.
+    cache = IFlowCache()
+    first = {(name, pc): cache.index(program, graph, pc, None)
+             for name, graph in [('a', graph_a), ('b', graph_b)]
+             for pc in [node_p, node_q, done]}
+    cache = IFlowCache()
+    second = {(name, pc): cache.index(program, graph, pc, None)
+              for name, graph in [('b', graph_b), ('a', graph_a)]
+              for pc in [done, node_q, node_p]}
+    assert first == second
+
+    # The graphs mark different back edges in the cycle, so it's explored
+    # differently from both of its nodes...
+    assert first[('a', node_p)] != first[('b', node_p)]
+    assert first[('a', node_q)] != first[('b', node_q)]
+    # ...but the code after it is the same.
+    assert first[('a', done)] == first[('b', done)]
+
+    # An index includes the loop end PC.
+    assert cache.index(program, graph_a, done, 0x10) != first[('a', done)]
+
+
+def _analyze(program: OTBNProgram, name: str, cache: IFlowCache) -> str:
+    graph = subroutine_control_graph(program, name)
+    _, _, control_deps = get_subroutine_iflow(program, graph, name, {}, cache)
+    return repr(sorted((node, sorted(pcs))
+                       for node, pcs in control_deps.items()))
+
+
+def test_shared_cache_results(program: OTBNProgram) -> None:
+    '''Sharing a cache between subroutines doesn't change their results.'''
+    expected = {name: _analyze(program, name, IFlowCache())
+                for name in ['entry_a', 'entry_b']}
+    cache = IFlowCache()
+    for name in ['entry_b', 'entry_a', 'entry_b']:
+        assert _analyze(program, name, cache) == expected[name]
+
+
+def test_round_trip(program: OTBNProgram, tmpdir: py.path.local) -> None:
+    '''Saved results are used by the next cache with the same key.'''
+    store = DiskCache(str(tmpdir.join('cache')), 'test')
+    cache = IFlowCache(store, 'elf1')
+    expected = _analyze(program, 'entry_a', cache)
+    assert cache.entries
+    cache.save()
+
+    loaded = IFlowCache(store, 'elf1')
+    assert loaded.entries.keys() == cache.entries.keys()
+    assert _analyze(program, 'entry_a', loaded) == expected
+
+    # Saving merges with what's in the store rather than replacing it.
+    other = IFlowCache(store, 'elf1')
+    _analyze(program, 'entry_b', other)
+    other.save()
+    merged = IFlowCache(store, 'elf1')
+    assert set(merged.entries) == set(cache.entries) | set(other.entries)
+
+
+def test_take_added(program: OTBNProgram) -> None:
+    '''Results found by one copy of a cache can be merged into another.'''
+    cache = IFlowCache()
+    _analyze(program, 'entry_a', cache)
+    added_a = cache.take_added()
+    assert added_a.keys() == cache.entries.keys()
+    assert not cache.take_added()
+
+    _analyze(program, 'entry_b', cache)
+    added_b = cache.take_added()
+    assert added_b
+
+    merged = IFlowCache()
+    merged.merge(added_a)
+    merged.merge(added_b)
+    assert merged.entries == cache.entries
+    # Merged results were found elsewhere, so they aren't passed on again.
+    assert not merged.take_added()
+
+
+def test_isolation(program: OTBNProgram, tmpdir: py.path.local,
+                   monkeypatch: pytest.MonkeyPatch) -> None:
+    '''Results aren't shared between ELF files or versions of the analysis.'''
+    store = DiskCache(str(tmpdir.join('cache')), 'test')
+    cache = IFlowCache(store, 'elf1')
+    _analyze(program, 'entry_a', cache)
+    cache.save()
+
+    other = IFlowCache(store, 'elf2')
+    assert not other.entries
+    _analyze(program, 'entry_b', other)
+    other.save()
+    assert IFlowCache(store, 'elf1').entries.keys() == cache.entries.keys()
+
+    monkeypatch.setattr(information_flow_analysis, '_analysis_digest',
+                        lambda: 'changed')
+    assert not IFlowCache(store, 'elf1').entries
@@ -0,0 +1,116 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Check the static instruction count ranges against the simulator.'''
+
+import py
+import pytest
+
+from sim.load_elf import load_elf
+from sim.standalonesim import StandaloneSim
+import testutil
+from shared.decode import decode_elf
+from shared.instruction_count_range import (InsnCount,
+                                            program_insn_count_bounds,
+                                            program_insn_count_range,
+                                            resolve_variable,
+                                            subroutine_insn_count_bounds)
+
+# A `loop` whose count is loaded from DMEM, and a subroutine that counts down
+# a loaded value with a branch back to `again`.
+_ASM = '''
+    lw    x5, 0(x0)
+    loop  x5, 2
+      addi  x6, x6, 1
+      addi  x6, x6, 1
+    jal   x1, retry
+    ecall
+
+  retry:
+    lw    x7, 4(x0)
+  again:
+    addi  x7, x7, -1
+    bne   x7, x0, again
+    ret
+
+  .data
+    .word 3
+    .word 2
+'''
+
+
+def _build(tmpdir: py.path.local, asm: str) -> str:
+    asm_path = str(tmpdir.join('prog.s'))
+    with open(asm_path, 'w') as handle:
+        handle.write(asm)
+    return testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+
+def _simulated_count(elf_path: str) -> int:
+    sim = StandaloneSim()
+    load_elf(sim, elf_path)
+    sim.state.ext_regs.commit()
+    sim.start(True)
+    sim.run(verbose=False, dump_file=None)
+    assert sim.stats is not None
+    return sim.stats.get_insn_count()
+
+
+def test_symbolic_bounds(tmpdir: py.path.local) -> None:
+    '''Data-dependent iteration counts become variables in the bounds.'''
+    elf_path = _build(tmpdir, _ASM)
+    program = decode_elf(elf_path)
+    loop_var = 'x5@0x4'
+    cycle_var = 'cycle@{:#x}'.format(program.get_pc_at_symbol('again'))
+
+    # Every path has the same length once the iteration counts are known.
+    expected = (InsnCount.constant(8) +
+                InsnCount.constant(2) * InsnCount.variable(loop_var) +
+                InsnCount.constant(2) * InsnCount.variable(cycle_var))
+    min_count, max_count = program_insn_count_bounds(program)
+    assert min_count == expected
+    assert max_count == expected
+
+    # The loop runs 3 times and the branch jumps back once.
+    values = {loop_var: 3, cycle_var: 1}
+    assert max_count.substitute(values).to_int() == _simulated_count(elf_path)
+
+    # The concrete range can only give a minimum.
+    assert program_insn_count_range(program) == (8, None)
+
+    # The subroutine on its own only depends on the cycle.
+    sub_min, sub_max = subroutine_insn_count_bounds(program, 'retry')
+    assert sub_min == sub_max == (InsnCount.constant(4) +
+                                  InsnCount.constant(2) *
+                                  InsnCount.variable(cycle_var))
+
+
+def test_constant_loop_count(tmpdir: py.path.local) -> None:
+    '''A loop count set just before the loop is constant.'''
+    elf_path = _build(tmpdir, '''
+        li    x5, 4
+        loop  x5, 1
+          addi  x6, x6, 1
+        beq   x6, x0, skip
+        addi  x6, x6, 1
+      skip:
+        ecall
+    ''')
+    program = decode_elf(elf_path)
+    assert program_insn_count_range(program) == (8, 9)
+    assert program_insn_count_range(program)[1] == _simulated_count(elf_path)
+
+
+def test_resolve_variable(tmpdir: py.path.local) -> None:
+    '''Variables can be named relative to a symbol, as in the legend.'''
+    program = decode_elf(_build(tmpdir, _ASM))
+    again = program.get_pc_at_symbol('again')
+    assert resolve_variable(program, 'x5@0x4') == 'x5@0x4'
+    assert resolve_variable(program, 'cycle@again') == f'cycle@{again:#x}'
+    assert (resolve_variable(program, 'cycle@retry+0x4') ==
+            f'cycle@{again:#x}')
+
+    for name in ['x5', 'x5@', '@again', 'x5@nosuch', 'x5@again+four']:
+        with pytest.raises(ValueError):
+            resolve_variable(program, name)
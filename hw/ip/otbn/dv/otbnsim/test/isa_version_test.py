@@ -0,0 +1,63 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+from sim import insn
+from sim.decode import decode_words
+from sim.isa_version import get_isa_version
+from sim.sim import OTBNSim
+
+
+def test_versions_coexist() -> None:
+    '''Check that different BNMULV versions can be used in one process.'''
+    ver0 = get_isa_version('0')
+    ver1 = get_isa_version('1')
+    ver2 = get_isa_version('2')
+
+    # Version 0 has a lane operand on bn.mulv, version 1 moved it into
+    # bn.mulv.l. Each version must see its own instruction table.
+    assert len(ver0.insn_class('bn.mulv').insn.operands) == 5
+    assert len(ver1.insn_class('bn.mulv').insn.operands) == 4
+    assert 'bn.mulv.l' not in ver0.mnem_to_class
+    assert 'bn.mulv.l' in ver1.mnem_to_class
+
+    # Decoding the same word picks the class from the right version.
+    encoding = ver1.insns_file.mnemonic_to_insn['bn.mulv.l'].encoding
+    assert encoding is not None
+    word = encoding.get_masks()[1]
+    insn0 = decode_words(0, [(True, word)], ver0)[0]
+    insn1 = decode_words(0, [(True, word)], ver1)[0]
+    assert insn0.insn.mnemonic != 'bn.mulv.l'
+    assert insn1.insn.mnemonic == 'bn.mulv.l'
+
+    # Versions are cached and only versions >= 2 trace ACCH.
+    assert get_isa_version('1') is ver1
+    assert not OTBNSim(ver1).state.wsrs._trace_acch
+    assert OTBNSim(ver2).state.wsrs._trace_acch
+
+
+def test_unknown_version() -> None:
+    with pytest.raises(ValueError):
+        get_isa_version('42')
+
+
+def test_variant_classes() -> None:
+    '''Check that each version binds its own variant implementations.'''
+    ver0 = get_isa_version('0')
+    ver2 = get_isa_version('2')
+    ver3 = get_isa_version('3')
+
+    assert issubclass(ver0.insn_class('bn.addv'), insn.BNADDVSigned)
+    assert issubclass(ver0.insn_class('bn.mulv'), insn.BNMULVMont)
+    assert issubclass(ver3.insn_class('bn.subv'), insn.BNSUBVCond)
+
+    # The shared implementations get a separate bound class per version,
+    # carrying that version's encoding and feature flags.
+    mulv2 = ver2.insn_class('bn.mulv')
+    mulv3 = ver3.insn_class('bn.mulv')
+    assert mulv2 is not mulv3
+    assert mulv2.insn is ver2.insns_file.mnemonic_to_insn['bn.mulv']
+    assert mulv2.has_acch and not get_isa_version('1').insn_class(
+        'bn.mulv.l').has_acch
@@ -0,0 +1,48 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import py
+
+from sim.isa_version import get_isa_version
+from sim.load_elf import PreparedProgram
+from sim.standalonesim import StandaloneSim
+import testutil
+
+
+def _run(sim: StandaloneSim) -> int:
+    sim.state.ext_regs.commit()
+    sim.start(False)
+    sim.run(verbose=False, dump_file=None)
+    assert sim.state.ext_regs.read('ERR_BITS', False) == 0
+    return sim.state.gprs.get_reg(3).read_unsigned()
+
+
+def test_prepared_program(tmpdir: py.path.local) -> None:
+    '''Check that a prepared program can be run repeatedly.'''
+    asm = """
+      la    x2, value
+      lw    x3, 0(x2)
+      addi  x3, x3, 1
+      sw    x3, 0(x2)
+      ecall
+    .data
+    value:
+      .word 41
+    """
+    asm_path = str(tmpdir.join('prog.s'))
+    with open(asm_path, 'w') as handle:
+        handle.write(asm)
+    elf_path = testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+    prepared = PreparedProgram(elf_path, get_isa_version())
+
+    # Each fresh simulator starts from the initial DMEM image, even though
+    # the previous run modified its own copy.
+    assert _run(prepared.new_sim()) == 42
+    sim = prepared.new_sim()
+    assert _run(sim) == 42
+
+    # Resetting an existing simulator does the same.
+    prepared.reset(sim)
+    assert _run(sim) == 42
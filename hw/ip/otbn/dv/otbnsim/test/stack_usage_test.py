@@ -0,0 +1,84 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+from typing import Tuple
+
+import py
+
+from sim.isa_version import get_isa_version
+from sim.load_elf import PreparedProgram
+from sim.standalonesim import StandaloneSim
+import testutil
+
+
+def _run(tmpdir: py.path.local, asm: str) -> Tuple[PreparedProgram,
+                                                  StandaloneSim]:
+    asm_path = str(tmpdir.join('prog.s'))
+    with open(asm_path, 'w') as handle:
+        handle.write(asm)
+    elf_path = testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+    prepared = PreparedProgram(elf_path, get_isa_version())
+    sim = prepared.new_sim()
+    sim.state.ext_regs.commit()
+    sim.start(True)
+    sim.run(verbose=False, dump_file=None)
+    return prepared, sim
+
+
+def test_stack_usage(tmpdir: py.path.local) -> None:
+    '''Check that the deepest stack pointer is reported.'''
+    asm = """
+      la    x2, stack_end
+      addi  x2, x2, -16
+      jal   x1, leaf
+      addi  x2, x2, 16
+      ecall
+    leaf:
+      li    x5, 32
+      sub   x2, x2, x5
+      add   x2, x2, x5
+      ret
+    .data
+    stack:
+      .zero 256
+    stack_end:
+      .word 0
+    """
+    prepared, sim = _run(tmpdir, asm)
+
+    assert sim.state.gprs.stack_usage() == 48
+    assert sim.stats is not None
+    assert sim.stats.stack_usage == 48
+
+    # The tracking starts afresh with each run.
+    prepared.reset(sim)
+    assert sim.state.gprs.stack_usage() == 0
+
+
+def test_other_writes(tmpdir: py.path.local) -> None:
+    '''Every write to x2 counts, measured from where the stack starts.
+
+    The stack pointer is set up with an "la" whose ADDI has a negative
+    immediate (which doesn't start the stack), aligned down with an ANDI,
+    restored with an LW and finally used as an ordinary register.
+    '''
+    asm = """
+      la    x2, stack_end
+      sw    x2, 0(x0)
+      addi  x2, x2, -8
+      andi  x2, x2, -64
+      lw    x2, 0(x0)
+      li    x2, 4000
+      ecall
+    .data
+      .word 0
+    .balign 64
+    stack:
+      .zero 3000
+    stack_end:
+      .word 0
+    """
+    _, sim = _run(tmpdir, asm)
+    assert sim.state.gprs.stack_usage() == 56
@@ -4,9 +4,12 @@
 
 import py
 import os
+from types import SimpleNamespace
+from typing import Any, List, Optional, Tuple
 
 from sim.standalonesim import StandaloneSim
-from sim.stats import ExecutionStats
+from sim.stats import (ElfDebugInfo, ExecutionStatAnalyzer, ExecutionStats,
+                       _DwarfLineTable)
 import testutil
 
 
@@ -140,20 +143,17 @@ def test_general_and_loop(tmpdir: py.path.local) -> None:
     assert stats.stall_count == 4
     assert stats.get_insn_count() == 28
     assert stats.insn_histo == {'addi': 22, 'loop': 4, 'loopi': 1, 'ecall': 1}
-    assert stats.func_calls == []
+    assert not stats.call_counts
 
-    # Loop statistics.
-    exp = [
+    # Loop statistics, counted by (loop_addr, loop_len, iterations).
+    exp = {
         # Outer LOOPI
-        {'iterations': 4, 'loop_addr': 8, 'loop_len': 4},
+        (8, 4, 4): 1,
 
         # Inner LOOP
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1},
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1},
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1},
-        {'iterations': 3, 'loop_addr': 16, 'loop_len': 1}
-    ]
-    assert stats.loops == exp
+        (16, 1, 3): 4
+    }
+    assert stats.loop_counts == exp
 
 
 def test_func_call_direct(tmpdir: py.path.local) -> None:
@@ -163,8 +163,8 @@ def test_func_call_direct(tmpdir: py.path.local) -> None:
                             'simple', 'subroutines', 'direct-call.s')
     stats = _simulate_asm_file(asm_file, tmpdir)
 
-    exp = [{'call_site': 4, 'callee_func': 12, 'caller_func': 0}]
-    assert stats.func_calls == exp
+    assert stats.call_counts == {(0, 12): 1}
+    assert stats.call_site_counts == {(12, 4): 1}
 
 
 def test_func_call_indirect(tmpdir: py.path.local) -> None:
@@ -174,5 +174,222 @@ def test_func_call_indirect(tmpdir: py.path.local) -> None:
                             'simple', 'subroutines', 'indirect-call.s')
     stats = _simulate_asm_file(asm_file, tmpdir)
 
-    exp = [{'call_site': 8, 'callee_func': 16, 'caller_func': 0}]
-    assert stats.func_calls == exp
+    assert stats.call_counts == {(0, 16): 1}
+    assert stats.call_site_counts == {(16, 8): 1}
+
+
+_PROFILE_ASM = """
+main:
+  jal x1, outer
+  jal x1, inner
+  ecall
+
+outer:
+  addi x2, x0, 1
+  jal x1, inner
+  jalr x0, x1, 0
+
+inner:
+  addi x3, x3, 1
+  jalr x0, x1, 0
+"""
+
+
+def _profile_asm_str(assembly: str, tmpdir: py.path.local
+                     ) -> Tuple[ExecutionStats, ExecutionStatAnalyzer]:
+    sim = testutil.prepare_sim_for_asm_str(assembly, tmpdir, True, True)
+    stats = _run_sim_for_stats(sim)
+    return stats, ExecutionStatAnalyzer(stats, str(tmpdir.join('tst')))
+
+
+def test_local_labels(tmpdir: py.path.local) -> None:
+    '''Check that addresses after local labels count for their function.'''
+    _, analyzer = _profile_asm_str("""
+    start:
+      addi x5, x0, 2
+    _start_loop:
+      jal x1, func
+      addi x5, x5, -1
+      bne x5, x0, _start_loop
+      ecall
+
+    func:
+      addi x6, x0, 1
+    _func_inner:
+      addi x6, x6, -1
+      jalr x0, x1, 0
+    """, tmpdir)
+
+    assert analyzer.dump_collapsed_stacks(insn_frames=False) == (
+        'start 14\n'
+        'start;func 8\n')
+
+
+def test_stack_samples(tmpdir: py.path.local) -> None:
+    '''Check that cycles are counted by call stack and PC.'''
+    stats, analyzer = _profile_asm_str(_PROFILE_ASM, tmpdir)
+
+    # Counted as [instructions, stalls]. Jumps (and the ECALL) stall for a
+    # cycle, and are counted in the function that they jump from. The first
+    # instruction also gets the stall of the initial fetch.
+    assert stats.stack_samples == {
+        ((), 0x0): [1, 2],
+        ((0x4,), 0xc): [1, 0],
+        ((0x4,), 0x10): [1, 1],
+        ((0x4, 0x14), 0x18): [1, 0],
+        ((0x4, 0x14), 0x1c): [1, 1],
+        ((0x4,), 0x14): [1, 1],
+        ((), 0x4): [1, 1],
+        ((0x8,), 0x18): [1, 0],
+        ((0x8,), 0x1c): [1, 1],
+        ((), 0x8): [1, 1],
+    }
+
+    assert analyzer.dump_collapsed_stacks(insn_frames=False) == (
+        'main 7\n'
+        'main;inner 3\n'
+        'main;outer 5\n'
+        'main;outer;inner 3\n')
+    assert 'main;outer;inner;0x1c:jalr 2\n' in analyzer.dump_collapsed_stacks()
+
+
+def _without_lines(callgrind: str) -> List[str]:
+    '''The lines of a callgrind profile, without source positions
+
+    Whether the ELF file has line information (and for which file) depends on
+    the assembler, so this drops the file names and line numbers.
+
+    '''
+    lines = []
+    for line in callgrind.splitlines():
+        if line.startswith(('fl=', 'fi=', 'cfl=')):
+            continue
+        if line.startswith(('0x', 'calls=')):
+            fields = line.split()
+            del fields[1 if line.startswith('0x') else 2]
+            line = ' '.join(fields)
+        lines.append(line)
+    return lines
+
+
+def test_callgrind(tmpdir: py.path.local) -> None:
+    '''Check the costs and calls in a callgrind profile.'''
+    _, analyzer = _profile_asm_str(_PROFILE_ASM, tmpdir)
+    lines = _without_lines(analyzer.dump_callgrind())
+
+    assert 'events: Cycles Instructions Stalls' in lines
+    assert 'summary: 18 10 8' in lines
+
+    # The self cost of inner and the two calls to it, each taking 3 cycles
+    # (2 instructions and a stall) in total.
+    fn_inner = lines.index('fn=inner')
+    assert lines[fn_inner + 1:fn_inner + 3] == ['0x18 2 2 0', '0x1c 4 2 2']
+    fn_main = lines.index('fn=main')
+    assert lines[fn_main + 4:fn_main + 10] == [
+        'cfn=outer', 'calls=1 0xc', '0x0 8 5 3',
+        'cfn=inner', 'calls=1 0x18', '0x4 3 2 1',
+    ]
+    fn_outer = lines.index('fn=outer')
+    assert lines[fn_outer + 4:fn_outer + 7] == [
+        'cfn=inner', 'calls=1 0x18', '0x10 3 2 1',
+    ]
+
+
+def test_shared_debug_info(tmpdir: py.path.local) -> None:
+    '''Check that ELF debug information can be read once for many runs.'''
+    stats, analyzer = _profile_asm_str(_PROFILE_ASM, tmpdir)
+    debug_info = ElfDebugInfo(str(tmpdir.join('tst')))
+
+    for _ in range(2):
+        shared = ExecutionStatAnalyzer(stats, str(tmpdir.join('tst')),
+                                       debug_info)
+        assert shared.dump_callgrind() == analyzer.dump_callgrind()
+        assert shared.dump() == analyzer.dump()
+
+
+class _LineProgram(dict):
+    '''A stand-in for a pyelftools line program
+
+    sequences is a list of (rows, end): rows are the (address, file index,
+    line) of the line states in a sequence, which is ended by an
+    end_sequence state at address end.
+
+    '''
+    def __init__(self, files: List[str],
+                 sequences: List[Tuple[List[Tuple[int, int, int]], int]]):
+        super().__init__(file_entry=[SimpleNamespace(name=name.encode())
+                                     for name in files])
+        self.entries = []
+        for rows, end in sequences:
+            # Entries that only change the registers have no state.
+            self.entries.append(SimpleNamespace(state=None))
+            for address, file_idx, line in rows:
+                self.entries.append(SimpleNamespace(state=SimpleNamespace(
+                    address=address, file=file_idx, line=line,
+                    end_sequence=False)))
+            self.entries.append(SimpleNamespace(state=SimpleNamespace(
+                address=end, file=1, line=0, end_sequence=True)))
+
+    def get_entries(self) -> List[Any]:
+        return self.entries
+
+
+def _walk_line_programs(dwarf_info: Any,
+                        address: int) -> Optional[Tuple[str, int]]:
+    '''The file and line of address, found by walking the line programs
+
+    This is how the analyzer looked up every address before it had a line
+    table, so the table should give the same answers.
+
+    '''
+    for CU in dwarf_info.iter_CUs():
+        lineprog = dwarf_info.line_program_for_CU(CU)
+        prevstate = None
+        for entry in lineprog.get_entries():
+            if entry.state is None:
+                continue
+            if entry.state.end_sequence:
+                prevstate = None
+                continue
+            if ((prevstate and
+                 prevstate.address <= address < entry.state.address)):
+                raw_name = lineprog['file_entry'][prevstate.file - 1].name
+                return raw_name.decode('utf-8'), prevstate.line
+            prevstate = entry.state
+    return None
+
+
+def test_line_table() -> None:
+    '''Check that the line table matches a walk of the line programs.'''
+    cus = [
+        _LineProgram(['a.s', 'b.s'], [
+            ([(0x0, 1, 1), (0x8, 1, 2), (0x10, 2, 7), (0x14, 2, 8)], 0x18),
+            # Overlaps the sequence above, which wins.
+            ([(0x4, 2, 20), (0xc, 2, 21)], 0x20),
+        ]),
+        _LineProgram(['c.s'], [
+            # Overlaps both sequences of the first unit, and has two states
+            # at the same address.
+            ([(0x10, 1, 3), (0x24, 1, 4), (0x24, 1, 5), (0x28, 1, 6)], 0x30),
+            # Starts after a gap.
+            ([(0x40, 1, 9), (0x44, 1, 10)], 0x48),
+        ]),
+    ]
+    dwarf_info = SimpleNamespace(iter_CUs=lambda: iter(cus),
+                                 line_program_for_CU=lambda cu: cu)
+    table = _DwarfLineTable(dwarf_info)
+
+    for address in range(0x50):
+        assert (table.lookup(address) ==
+                _walk_line_programs(dwarf_info, address)), hex(address)
+
+    assert table.lookup(0x4) == ('a.s', 1)
+    assert table.lookup(0xc) == ('a.s', 2)
+    assert table.lookup(0x10) == ('b.s', 7)
+    assert table.lookup(0x24) == ('c.s', 5)
+    assert table.lookup(0x42) == ('c.s', 9)
+    # As in the walk, the last state of a sequence (up to its end_sequence)
+    # doesn't cover anything, so later sequences fill in there.
+    assert table.lookup(0x14) == ('c.s', 3)
+    assert table.lookup(0x28) is None
+    assert table.lookup(0x44) is None
@@ -0,0 +1,141 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Test the batched and binary commands of the stepped simulator.'''
+
+import io
+import os
+import sys
+from typing import Any, List
+
+import py
+import pytest
+
+from sim.constants import Status
+from sim.load_elf import load_elf
+from sim.sim import OTBNSim
+import stepped
+import testutil
+
+_ASM = '''
+    addi x2, x0, 5
+    loopi 3, 2
+      addi x2, x2, 1
+      addi x3, x2, 0
+    la x4, data
+    lw x5, 0(x4)
+    sw x2, 4(x4)
+    ecall
+
+.data
+data:
+    .word 0x12345678
+    .word 0
+'''
+
+
+def _send_urnd_seed(sim: OTBNSim) -> None:
+    for idx in range(8):
+        stepped.on_input(sim, 'edn_urnd_step {:#x}'.format(0x1111 * idx))
+    stepped.on_input(sim, 'edn_urnd_cdc_done')
+
+
+def _start_sim(tmpdir: py.path.local) -> OTBNSim:
+    asm_path = os.path.join(tmpdir, 'tst.s')
+    with open(asm_path, 'w') as handle:
+        handle.write(_ASM)
+    elf_path = testutil.asm_and_link_one_file(asm_path, tmpdir)
+
+    sim = OTBNSim()
+    load_elf(sim, elf_path)
+    sim.state.complete_init_sec_wipe()
+    stepped.on_input(sim, 'start_operation Execute')
+    # The operation waits for a URND seed before it starts.
+    _send_urnd_seed(sim)
+    return sim
+
+
+def _output_lines(capsys: Any) -> List[str]:
+    return capsys.readouterr().out.splitlines()
+
+
+def _finish(sim: OTBNSim, capsys: Any) -> List[str]:
+    '''Run sim's operation to the end with run_until, returning the output
+
+    The secure wipe at the end of the operation waits for a new URND seed,
+    so the first run_until runs for all its cycles and then the seed is sent.
+
+    '''
+    stepped.on_input(sim, 'run_until 100')
+    lines = _output_lines(capsys)
+    assert lines[-2:] == ['STEPS 100', '.']
+    assert sim.state.ext_regs.read('STATUS', True) == \
+        Status.BUSY_SEC_WIPE_INT
+
+    _send_urnd_seed(sim)
+    stepped.on_input(sim, 'run_until 1000')
+    lines += _output_lines(capsys)
+    assert lines[-1] == '.'
+    assert lines[-2].startswith('STEPS ')
+    assert int(lines[-2].split()[1]) < 1000
+    return lines
+
+
+def test_step_n(tmpdir: py.path.local, capsys: Any) -> None:
+    '''step_n gives the same trace as lots of step commands.'''
+    one_by_one = _start_sim(tmpdir)
+    expected = []  # type: List[str]
+    for idx in range(100):
+        _output_lines(capsys)
+        stepped.on_input(one_by_one, 'step')
+        lines = _output_lines(capsys)
+        assert lines[-1] == '.'
+        if len(lines) > 1:
+            expected += ['@ {}'.format(idx)] + lines[:-1]
+
+    batched = _start_sim(tmpdir)
+    _output_lines(capsys)
+    stepped.on_input(batched, 'step_n 100')
+    assert _output_lines(capsys) == expected + ['STEPS 100', '.']
+
+
+def test_run_until(tmpdir: py.path.local, capsys: Any) -> None:
+    '''run_until stops once the operation (and its secure wipe) is done.'''
+    sim = _start_sim(tmpdir)
+    _output_lines(capsys)
+    lines = _finish(sim, capsys)
+    assert 'E PC: 0x00000020, insn: 0x00000073' in lines
+    assert lines[-3] == '! otbn.STATUS: 0x00000000'
+
+    # Once the operation is done, the model stays idle.
+    stepped.on_input(sim, 'run_until 10')
+    assert _output_lines(capsys) == ['STEPS 10', '.']
+
+
+def test_dmem_binary(tmpdir: py.path.local,
+                     capsysbinary: Any,
+                     monkeypatch: pytest.MonkeyPatch) -> None:
+    '''dump_d_bin and load_d_bin carry the same data as dump_d and load_d.'''
+    sim = _start_sim(tmpdir)
+    for _ in range(100):
+        stepped.on_input(sim, 'step')
+    capsysbinary.readouterr()
+
+    stepped.on_input(sim, 'dump_d_bin')
+    out = capsysbinary.readouterr().out
+    header, rest = out.split(b'\n', 1)
+    nbytes = int(header.split()[1])
+    assert header.split()[0] == b'DUMP_D_BIN'
+    data = rest[:nbytes]
+    assert rest[nbytes:] == b'.\n'
+    assert data == sim.state.dmem.dump_le_words()
+
+    # Load the data back into a fresh simulator, followed by another command
+    # on the same stream, to check that load_d_bin reads just its own bytes.
+    fresh = OTBNSim()
+    stdin = io.TextIOWrapper(io.BytesIO(data + b'print_regs\n'))
+    monkeypatch.setattr(sys, 'stdin', stdin)
+    stepped.on_input(fresh, 'load_d_bin {}'.format(nbytes))
+    assert fresh.state.dmem.dump_le_words() == data
+    assert sys.stdin.buffer.readline() == b'print_regs\n'
@@ -32,7 +32,8 @@ def asm_and_link_one_file(asm_path: str, work_dir: py.path.local) -> str:
 
 
 def prepare_sim_for_asm_file(asm_file: str, tmpdir: py.path.local,
-                             collect_stats: bool) -> StandaloneSim:
+                             collect_stats: bool,
+                             collect_profile: bool = False) -> StandaloneSim:
     '''Set up the simulation of a single assembly file.
 
     The returned simulation is ready to be run through the run() method.
@@ -45,12 +46,13 @@ def prepare_sim_for_asm_file(asm_file: str, tmpdir: py.path.local,
     load_elf(sim, elf_file)
 
     sim.state.ext_regs.commit()
-    sim.start(collect_stats)
+    sim.start(collect_stats, collect_profile)
     return sim
 
 
 def prepare_sim_for_asm_str(assembly: str, tmpdir: py.path.local,
-                            collect_stats: bool) -> StandaloneSim:
+                            collect_stats: bool,
+                            collect_profile: bool = False) -> StandaloneSim:
     '''Set up the simulation for an assembly snippet passed as string.
 
     The returned simulation is ready to be run through the run() method.
@@ -59,4 +61,5 @@ def prepare_sim_for_asm_str(assembly: str, tmpdir: py.path.local,
     with tempfile.NamedTemporaryFile('w', dir=tmpdir) as fp:
         fp.write(assembly)
         fp.flush()
-        return prepare_sim_for_asm_file(fp.name, tmpdir, collect_stats)
+        return prepare_sim_for_asm_file(fp.name, tmpdir, collect_stats,
+                                        collect_profile)
@@ -0,0 +1,66 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Test the (lazily stepped) URND PRNG model.'''
+
+from sim.state import OTBNState
+from sim.wsr import URNDWSR
+
+
+def _new_urnd() -> URNDWSR:
+    return OTBNState().wsrs.URND
+
+
+def _step(urnd: URNDWSR, cycles: int) -> None:
+    for _ in range(cycles):
+        urnd.step()
+        urnd.commit()
+
+
+def test_known_values() -> None:
+    '''Check values against ones from the per-cycle model.
+
+    The first value is read straight after seeding, the second one after
+    enough steps that the model jumps ahead rather than running the rounds.
+
+    '''
+    urnd = _new_urnd()
+    urnd.set_seed([1, 2, 3, 4])
+    urnd.commit()
+    assert urnd.read_unsigned() == \
+        0xee3008b6600c6000440000180007300000000030000260000000002800004
+
+    _step(urnd, 9999)
+    assert urnd.read_unsigned() == \
+        0xf39213506bac1449520ce98b1353b2294f771b8b3a6767bbb9fee20d7b0cc097
+
+
+def test_reads_do_not_disturb() -> None:
+    '''The values don't depend on when (or whether) URND was read.'''
+    seed = [0x0123456789abcdef, 0xfedcba9876543210,
+            0x0f1e2d3c4b5a6978, 0x8796a5b4c3d2e1f0]
+    read_often = _new_urnd()
+    read_once = _new_urnd()
+    read_often.set_seed(seed)
+    read_once.set_seed(seed)
+
+    for cycles in [1, 3, 70, 200, 1]:
+        _step(read_often, cycles)
+        read_often.read_unsigned()
+        _step(read_once, cycles)
+    assert read_often.read_unsigned() == read_once.read_unsigned()
+
+
+def test_value_survives_reseed() -> None:
+    '''A value committed before a new seed is kept until the next commit.'''
+    urnd = _new_urnd()
+    urnd.set_seed([1, 2, 3, 4])
+    _step(urnd, 9999)
+
+    urnd.running = False
+    urnd.step()
+    urnd.commit()
+    urnd.set_seed([5, 6, 7, 8])
+    assert urnd.read_unsigned() == \
+        0xf39213506bac1449520ce98b1353b2294f771b8b3a6767bbb9fee20d7b0cc097
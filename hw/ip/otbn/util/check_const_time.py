@@ -3,23 +3,353 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+'''Check whether secret data affects the control flow of OTBN code.
+
+By default, this checks one subroutine (or the whole program) of one ELF
+file. With --manifest, it audits any number of subroutines in one or more ELF
+files instead. The manifest is a JSON file of the form
+
+    {
+      "checks": [
+        {"subroutine": "poly_add"},
+        {"subroutine": "ntt", "secrets": ["dmem"], "elfs": ["mlkem*"]},
+        {"subroutine": "div", "constants": ["x30:4"]},
+        {"secrets": ["dmem"]}
+      ]
+    }
+
+where each check has the same meaning as the --subroutine, --secrets and
+--constants arguments (a check without a subroutine is of the whole program).
+The optional "elfs" entry is a list of glob patterns: if it is given, the
+check only applies to ELF files whose names match one of them.
+
+Each ELF file is decoded and each of its control graphs is built once, in
+this process. The information-flow analyses are then run on a pool of worker
+processes (which inherit the graphs when they are forked). Checks of the same
+subroutine with the same constants share an analysis, since the secrets only
+affect which of its results are reported. The results can be written to a
+JSON report with --report.
+
+If $OTBN_CACHE_DIR is set, intermediate results of the analysis are kept
+there between runs on the same ELF file (see shared/disk_cache.py). Without
+it, nothing is written outside the current run.
+
+'''
+
 import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from shared.check import CheckResult
 from shared.constants import parse_required_constants
-from shared.control_flow import program_control_graph, subroutine_control_graph
-from shared.decode import decode_elf
-from shared.information_flow_analysis import (get_program_iflow,
+from shared.control_flow import (ControlGraph, program_control_graph,
+                                 subroutine_control_graph)
+from shared.decode import OTBNProgram, decode_elf
+from shared.disk_cache import DiskCache, file_digest
+from shared.information_flow_analysis import (IFlowCache, get_program_iflow,
                                               get_subroutine_iflow,
                                               stringify_control_deps)
 
 
+class AuditCheck:
+    '''One check in an audit manifest.
+
+    If subroutine is None, the check is of the whole program. If secrets is
+    None, every information-flow node is treated as secret. If elfs is not
+    None, it is a list of glob patterns for the ELF files that the check
+    applies to.
+    '''
+    def __init__(self, subroutine: Optional[str],
+                 secrets: Optional[List[str]], constants: Dict[str, int],
+                 elfs: Optional[List[str]]) -> None:
+        self.subroutine = subroutine
+        self.secrets = secrets
+        self.constants = constants
+        self.elfs = elfs
+
+    def applies_to(self, elf: str) -> bool:
+        if self.elfs is None:
+            return True
+        name = os.path.basename(elf)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.elfs)
+
+
+def _get_str_list(entry: Dict[str, Any], key: str,
+                  what: str) -> Optional[List[str]]:
+    '''Get an optional list of strings from a manifest entry'''
+    value = entry.get(key)
+    if value is None:
+        return None
+    if not (isinstance(value, list) and
+            all(isinstance(item, str) for item in value)):
+        raise ValueError('The {} entry of {} is not a list of strings.'
+                         .format(key, what))
+    return value
+
+
+def read_manifest(path: str) -> List[AuditCheck]:
+    '''Read an audit manifest (see the docstring at the top of this file).
+
+    Raises a ValueError if the manifest is malformed.
+    '''
+    with open(path) as handle:
+        try:
+            manifest = json.load(handle)
+        except json.JSONDecodeError as err:
+            raise ValueError('Manifest at {} is not valid JSON: {}'
+                             .format(path, err)) from None
+
+    entries = (manifest.get('checks')
+               if isinstance(manifest, dict) else None)
+    if not isinstance(entries, list):
+        raise ValueError('Manifest at {} should be an object with a list of '
+                         'checks.'.format(path))
+
+    checks = []
+    for idx, entry in enumerate(entries):
+        what = 'check {} in the manifest at {}'.format(idx, path)
+        if not isinstance(entry, dict):
+            raise ValueError('{} is not an object.'.format(what.capitalize()))
+        unknown = set(entry) - {'subroutine', 'secrets', 'constants', 'elfs'}
+        if unknown:
+            raise ValueError('{} has unknown entries: {}.'
+                             .format(what.capitalize(),
+                                     ', '.join(sorted(unknown))))
+
+        subroutine = entry.get('subroutine')
+        if subroutine is not None and not isinstance(subroutine, str):
+            raise ValueError('The subroutine entry of {} is not a string.'
+                             .format(what))
+
+        constants = _get_str_list(entry, 'constants', what)
+        if constants and subroutine is None:
+            raise ValueError('Cannot require initial constants for a whole '
+                             'program (in {}).'.format(what))
+
+        checks.append(AuditCheck(subroutine,
+                                 _get_str_list(entry, 'secrets', what),
+                                 parse_required_constants(constants or []),
+                                 _get_str_list(entry, 'elfs', what)))
+    return checks
+
+
+# An information-flow analysis in audit mode: the ELF file, the subroutine (or
+# None for the whole program) and the required constants, as sorted (register,
+# value) pairs.
+_Analysis = Tuple[str, Optional[str], Tuple[Tuple[str, int], ...]]
+
+# The result of an analysis: either (True, control_deps) or (False, message)
+_AnalysisResult = Tuple[bool, Any]
+
+# The decoded programs, control graphs and caches for an audit. These are
+# filled in before the worker processes are forked, so that each worker
+# inherits them rather than building them again. The programs and caches are
+# keyed by ELF file and the graphs by ELF file and subroutine.
+_AUDIT_PROGRAMS: Dict[str, OTBNProgram] = {}
+_AUDIT_GRAPHS: Dict[Tuple[str, Optional[str]], ControlGraph] = {}
+_AUDIT_CACHES: Dict[str, IFlowCache] = {}
+
+
+def _build_graph(program: OTBNProgram,
+                 graph_key: Tuple[str, Optional[str]]) -> Optional[str]:
+    '''Build a control graph for _AUDIT_GRAPHS.
+
+    Returns None on success or a message if the graph can't be built.
+    '''
+    subroutine = graph_key[1]
+    if subroutine is not None and subroutine not in program.symbols:
+        # The error from subroutine_control_graph lists every symbol in the
+        # program, which is too much for a report.
+        return 'Symbol {} not found in program.'.format(subroutine)
+
+    try:
+        _AUDIT_GRAPHS[graph_key] = (
+            program_control_graph(program) if subroutine is None else
+            subroutine_control_graph(program, subroutine))
+    except (RuntimeError, ValueError) as err:
+        return '{}: {}'.format(type(err).__name__, err)
+    return None
+
+
+def _run_analysis(analysis: _Analysis) -> _AnalysisResult:
+    '''Run an analysis, using the graphs and caches set up by audit()'''
+    elf, subroutine, constants = analysis
+    program = _AUDIT_PROGRAMS[elf]
+    graph = _AUDIT_GRAPHS[(elf, subroutine)]
+    cache = _AUDIT_CACHES[elf]
+    try:
+        if subroutine is None:
+            _, control_deps = get_program_iflow(program, graph, cache)
+        else:
+            _, _, control_deps = get_subroutine_iflow(program, graph,
+                                                      subroutine,
+                                                      dict(constants), cache)
+    except Exception as err:
+        return (False, '{}: {}'.format(type(err).__name__, err))
+    return (True, control_deps)
+
+
+def _run_analysis_in_worker(
+        analysis: _Analysis) -> Tuple[_AnalysisResult, Dict[str, Any]]:
+    '''Run an analysis in a worker process
+
+    Also returns the results that the analysis added to the worker's copy of
+    the IFlowCache, for audit() to merge into its own copy and save. Passing
+    them back after each analysis means that they aren't lost if a later
+    analysis kills the worker, and only one process writes the cache.
+
+    '''
+    result = _run_analysis(analysis)
+    return result, _AUDIT_CACHES[analysis[0]].take_added()
+
+
+def _secret_control_deps(
+        control_deps: Dict[str, Set[int]],
+        secrets: Optional[List[str]]) -> Dict[str, Set[int]]:
+    '''Filter control_deps to the given secrets (all nodes if None)'''
+    if secrets is None:
+        return control_deps
+    return {node: pcs for node, pcs in control_deps.items() if node in secrets}
+
+
+def audit(elfs: List[str], checks: List[AuditCheck], jobs: int,
+          verbose: bool, report: Optional[str]) -> int:
+    '''Run every check in checks that applies to each ELF file in elfs.
+
+    Runs the analyses on jobs worker processes (one per CPU if jobs is zero
+    or negative). Prints a summary and, if report is not None, writes a JSON
+    report of every check to that path. Returns the exit code for the script:
+    0 if every check passed and 1 otherwise.
+    '''
+    # This is None (so nothing is kept between runs) unless OTBN_CACHE_DIR is
+    # set.
+    store = DiskCache.default('check_const_time')
+
+    # Don't use anything from an earlier audit in this process: the ELF files
+    # might have changed since.
+    _AUDIT_PROGRAMS.clear()
+    _AUDIT_GRAPHS.clear()
+    _AUDIT_CACHES.clear()
+
+    # The analysis for each check and ELF file, in order
+    audited: List[Tuple[str, AuditCheck, _Analysis]] = []
+    results: Dict[_Analysis, _AnalysisResult] = {}
+    to_run: List[_Analysis] = []
+
+    for elf in elfs:
+        program = decode_elf(elf)
+        _AUDIT_PROGRAMS[elf] = program
+        _AUDIT_CACHES[elf] = IFlowCache(store, file_digest(elf) or '')
+        graph_errors: Dict[Optional[str], str] = {}
+
+        for check in checks:
+            if not check.applies_to(elf):
+                continue
+            analysis = (elf, check.subroutine,
+                        tuple(sorted(check.constants.items())))
+            audited.append((elf, check, analysis))
+            if analysis in results or analysis in to_run:
+                continue
+
+            graph_key = (elf, check.subroutine)
+            if (graph_key not in _AUDIT_GRAPHS and
+                    check.subroutine not in graph_errors):
+                graph_error = _build_graph(program, graph_key)
+                if graph_error is not None:
+                    graph_errors[check.subroutine] = graph_error
+
+            if check.subroutine in graph_errors:
+                results[analysis] = (False, graph_errors[check.subroutine])
+            else:
+                to_run.append(analysis)
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(to_run))
+
+    if jobs <= 1:
+        for analysis in to_run:
+            results[analysis] = _run_analysis(analysis)
+    else:
+        ctx = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(jobs, mp_context=ctx) as pool:
+            futures = {pool.submit(_run_analysis_in_worker, analysis):
+                       analysis for analysis in to_run}
+            for future in as_completed(futures):
+                analysis = futures[future]
+                try:
+                    results[analysis], added = future.result()
+                except BrokenProcessPool:
+                    results[analysis] = (
+                        False, 'A worker process exited unexpectedly.')
+                else:
+                    _AUDIT_CACHES[analysis[0]].merge(added)
+
+    for cache in _AUDIT_CACHES.values():
+        cache.save()
+
+    records = []
+    counts = {'pass': 0, 'fail': 0, 'error': 0}
+    for elf, check, analysis in audited:
+        record: Dict[str, Any] = {
+            'elf': elf,
+            'subroutine': check.subroutine,
+            'secrets': check.secrets,
+            'constants': check.constants,
+        }
+        ok, value = results[analysis]
+        if not ok:
+            record['status'] = 'error'
+            record['error'] = value
+        else:
+            deps = dict(sorted(_secret_control_deps(value,
+                                                    check.secrets).items()))
+            record['status'] = 'fail' if len(deps) != 0 else 'pass'
+            record['control_deps'] = {
+                node: ['{:#x}'.format(pc) for pc in sorted(pcs)]
+                for node, pcs in deps.items()
+            }
+            record['details'] = stringify_control_deps(_AUDIT_PROGRAMS[elf],
+                                                       deps)
+        counts[record['status']] += 1
+        records.append(record)
+
+        if verbose or record['status'] != 'pass':
+            print('{}: {} ({})'.format(
+                record['status'].upper(), os.path.basename(elf),
+                'entire program' if check.subroutine is None else
+                'subroutine {}'.format(check.subroutine)))
+            if record['status'] == 'error':
+                print('  ' + record['error'].replace('\n', '\n  '))
+            for line in record.get('details', []):
+                print('  ' + line)
+
+    print('{} passed, {} failed, {} errors'.format(counts['pass'],
+                                                   counts['fail'],
+                                                   counts['error']))
+
+    if report is not None:
+        with open(report, 'w') as handle:
+            json.dump({'results': records, 'summary': counts}, handle,
+                      indent=2)
+            handle.write('\n')
+
+    return 0 if counts['pass'] == len(records) else 1
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(
         description='Analyze whether secret data affects the control flow of '
         'an OTBN program or subroutine.')
-    parser.add_argument('elf', help=('The .elf file to check.'))
+    parser.add_argument('elf', nargs='+',
+                        help=('The .elf file to check. More than one can be '
+                              'given with --manifest.'))
     parser.add_argument('--verbose', action='store_true')
     parser.add_argument(
         '--subroutine',
@@ -44,8 +374,36 @@ def main() -> int:
               'assume everything is secret; check that the subroutine or '
               'program has only one possible control-flow path regardless '
               'of input.'))
+    parser.add_argument(
+        '--manifest',
+        help=('Audit every ELF file with the checks listed in this JSON '
+              'file, instead of checking one subroutine. This cannot be '
+              'combined with --subroutine, --constants or --secrets.'))
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=0,
+        help=('Number of worker processes for --manifest (default: one per '
+              'CPU).'))
+    parser.add_argument(
+        '--report',
+        help='Write a JSON report of the checks for --manifest to this file.')
     args = parser.parse_args()
 
+    if args.manifest is not None:
+        if (args.subroutine is not None or args.constants is not None or
+                args.secrets is not None):
+            parser.error('--manifest cannot be combined with --subroutine, '
+                         '--constants or --secrets.')
+        return audit(args.elf, read_manifest(args.manifest), args.jobs,
+                     args.verbose, args.report)
+
+    if len(args.elf) != 1:
+        parser.error('Only one .elf file can be checked without --manifest.')
+    if args.report is not None:
+        parser.error('--report can only be used with --manifest.')
+    elf = args.elf[0]
+
     # Parse initial constants.
     if args.constants is None:
         constants = {}
@@ -57,33 +415,35 @@ def main() -> int:
         constants = parse_required_constants(args.constants)
 
     # Compute control graph and get all nodes that influence control flow.
-    program = decode_elf(args.elf)
+    # If OTBN_CACHE_DIR is set, intermediate results are kept between runs on
+    # the same ELF file (see shared/disk_cache.py).
+    program = decode_elf(elf)
+    cache = IFlowCache(DiskCache.default('check_const_time'),
+                       file_digest(elf) or '')
     if args.subroutine is None:
         graph = program_control_graph(program)
         to_analyze = 'entire program'
-        _, control_deps = get_program_iflow(program, graph)
+        _, control_deps = get_program_iflow(program, graph, cache)
     else:
         graph = subroutine_control_graph(program, args.subroutine)
         to_analyze = 'subroutine {}'.format(args.subroutine)
         _, _, control_deps = get_subroutine_iflow(program, graph,
-                                                  args.subroutine, constants)
+                                                  args.subroutine, constants,
+                                                  cache)
+    cache.save()
 
     if args.secrets is None:
         if args.verbose:
             print(
                 'No specific secrets provided; checking that {} has only one '
                 'control-flow path'.format(to_analyze))
-        secret_control_deps = control_deps
     else:
         if args.verbose:
             print('Analyzing {} with initial secrets {} and initial constants {}'.format(
                 to_analyze, args.secrets, constants))
-        # If secrets were provided, only show the ways in which those specific
-        # nodes could influence control flow.
-        secret_control_deps = {
-            node: pcs
-            for node, pcs in control_deps.items() if node in args.secrets
-        }
+    # If secrets were provided, only show the ways in which those specific
+    # nodes could influence control flow.
+    secret_control_deps = _secret_control_deps(control_deps, args.secrets)
 
     out = CheckResult()
 
@@ -3,11 +3,68 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+'''Get the range of possible instruction counts for OTBN code.
+
+Loops whose iteration counts come from a register and cycles in the control
+flow (e.g. rejection sampling written with branches) make the counts depend on
+data. Instead of giving up on the maximum, the counts are printed as
+polynomials in variables standing for those iteration counts:
+
+    xN@0x...     the value of loop-count register xN each time the `loop`
+                 instruction at that PC runs
+    cycle@0x...  the number of times control jumps back to that PC each time
+                 the code starting there is reached
+
+Values for the variables can be given with --bound to get concrete numbers,
+and --max-count turns the result into a check. In --bound, the PC of a
+variable can also be given as it appears in the legend, relative to a symbol
+(e.g. x5@keccak_send_message+0x8), which doesn't change when unrelated code
+moves.
+
+'''
+
 import argparse
+import sys
+from typing import Dict, List
+
+from shared.decode import OTBNProgram, decode_elf
+from shared.instruction_count_range import (InsnCount, describe_variable,
+                                            program_insn_count_bounds,
+                                            resolve_variable,
+                                            subroutine_insn_count_bounds)
+
+
+def _parse_bounds(program: OTBNProgram,
+                  bounds: List[str]) -> Dict[str, int]:
+    '''Parse NAME=VALUE arguments into a dictionary.'''
+    values = {}
+    for bound in bounds:
+        name, sep, value = bound.rpartition('=')
+        if not sep or not name:
+            raise ValueError(f'Bad --bound argument {bound!r}: expected '
+                             'NAME=VALUE.')
+        name = resolve_variable(program, name)
+        try:
+            values[name] = int(value, 0)
+        except ValueError:
+            raise ValueError(f'Bad value in --bound argument {bound!r}: '
+                             'expected an integer.') from None
+    return values
+
 
-from shared.decode import decode_elf
-from shared.instruction_count_range import (program_insn_count_range,
-                                            subroutine_insn_count_range)
+def _print_count(label: str, count: InsnCount) -> None:
+    '''Print a count, putting each symbolic term on its own line.'''
+    terms = str(count).split(' + ')
+    print(f'{label}: {terms[0]}')
+    for term in terms[1:]:
+        print(f'    + {term}')
+
+
+def _print_variables(program: OTBNProgram, variables: List[str]) -> None:
+    if variables:
+        print('where:')
+    for name in variables:
+        print(f'  {name}: {describe_variable(program, name)}')
 
 
 def main() -> int:
@@ -22,23 +79,61 @@ def main() -> int:
         required=False,
         help=('The specific subroutine to check. If not provided, the start '
               'point is _imem_start (whole program).'))
+    parser.add_argument(
+        '--bound',
+        action='append',
+        default=[],
+        metavar='NAME=VALUE',
+        help=('Substitute VALUE for the variable NAME (e.g. x5@0x1a4c=64 or '
+              'cycle@0x2ae0=3). Can be given more than once.'))
+    parser.add_argument(
+        '--max-count',
+        type=int,
+        required=False,
+        help=('Fail unless the maximum instruction count is known and at '
+              'most this many instructions.'))
     args = parser.parse_args()
+
     program = decode_elf(args.elf)
+    try:
+        values = _parse_bounds(program, args.bound)
+    except ValueError as err:
+        parser.error(str(err))
 
     # Compute instruction count range.
     if args.subroutine is None:
-        min_count, max_count = program_insn_count_range(program)
+        min_count, max_count = program_insn_count_bounds(program)
     else:
-        min_count, max_count = subroutine_insn_count_range(
+        min_count, max_count = subroutine_insn_count_bounds(
             program, args.subroutine)
 
+    # Every variable is at least zero, so any that are still unknown can be
+    # zero in the minimum.
+    min_count = min_count.substitute(values)
+    min_count = min_count.substitute({v: 0 for v in min_count.variables()})
+    max_count = max_count.substitute(values)
+
     # Print results.
-    print(f'Minimum instruction count: {min_count}')
-    if max_count is None:
+    _print_count('Minimum instruction count', min_count)
+    if max_count.is_unbounded():
         print('Maximum instruction count could not be calculated.')
     else:
-        print(f'Maximum instruction count: {max_count}')
+        _print_count('Maximum instruction count', max_count)
+        _print_variables(program, sorted(max_count.variables()))
+
+    if args.max_count is not None:
+        max_int = max_count.to_int()
+        if max_int is None:
+            print('Maximum instruction count is not known; use --bound to '
+                  'give values for the variables.', file=sys.stderr)
+            return 1
+        if max_int > args.max_count:
+            print(f'Maximum instruction count {max_int} exceeds the limit of '
+                  f'{args.max_count}.', file=sys.stderr)
+            return 1
+
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -11,6 +11,12 @@
 
 '''A wrapper around riscv32-unknown-elf-as for OTBN
 
+With --otbn-direct, inputs that don't need any relocations (as is the case
+for the output of the random instruction generator, for example) are
+assembled in-process by DirectAssembler, and binutils is only run for the
+others. To assemble lots of files at once, use --otbn-batch, which runs them
+all in one process.
+
 Partial support:
 
   - This doesn't currently support .include directives fully (the included file
@@ -21,16 +27,26 @@ Partial support:
   - Operands may not have embedded spaces or commas. Complicated immediate
     expressions are not currently supported.
 
+If $OTBN_CACHE_DIR is set, the results of preprocessing and transforming each
+input, and the instruction tables loaded from the YAML files, are kept in a
+content-addressed cache there (see shared/disk_cache.py).
+
 '''
 
+import io
 import os
 import re
+import shlex
 import subprocess
 import sys
 import tempfile
-from typing import Dict, List, Optional, Set, TextIO, Tuple
+from typing import Callable, Dict, List, Optional, Set, TextIO, Tuple
 
 from shared.bit_ranges import BitRanges
+from shared.disk_cache import DiskCache, file_digest, files_digest, hash_key
+from shared.elf_object import (SHF_ALLOC, SHF_EXECINSTR, SHF_WRITE,
+                               SHT_NOBITS, SHT_PROGBITS, ElfSection,
+                               ElfSymbol, write_elf_object)
 from shared.encoding import Encoding
 from shared.insn_yaml import Insn, InsnsFile, load_insns_yaml
 from shared.operand import ImmOperandType, Operand, RegOperandType
@@ -410,7 +426,7 @@ def parse_positionals(
     space_args = ['--debug-prefix-map', '--defsym', '-I', '-o']
 
     # OTBN-specific flags
-    otbn_flags = ['--otbn-translate']
+    otbn_flags = ['--otbn-translate', '--otbn-direct']
 
     flags = set()
 
@@ -423,6 +439,7 @@ def parse_positionals(
 
         if arg in otbn_flags:
             flags.add(arg)
+            continue
 
         if arg in space_args:
             others.append(arg)
@@ -442,7 +459,13 @@ def parse_positionals(
               'for more information.\n'
               '\n'
               '  --otbn-translate: Translate the input and dump to '
-              'stdout rather than calling as.\n')
+              'stdout rather than calling as.\n'
+              '  --otbn-direct: Assemble the input without calling as if '
+              'it needs no\n'
+              '      relocations.\n'
+              '  --otbn-batch FILE: Assemble several files in one process. '
+              'Each line of\n'
+              '      FILE holds the arguments for one run.\n')
         sys.exit(0)
 
     return (positionals, others, flags)
@@ -648,10 +671,6 @@ class Transformer:
         #    1: Waiting for body of statement (directive or instruction)
         self.state = 0
 
-        # Write .file and .line directives to tell the assembler where the code
-        # came from.
-        out_handle.write('.file "{}"\n.line 1\n'.format(in_path))
-
     def mk_raw_line(self, insn: Insn, op_to_expr: Dict[str,
                                                        Optional[str]]) -> str:
         '''Generate a .word-style raw line
@@ -1154,10 +1173,23 @@ class Transformer:
             raise RuntimeError('Reached EOF while still in a string.')
 
 
+def _file_directives(in_path: str) -> str:
+    '''The .file and .line directives that start a transformed input'''
+    return '.file "{}"\n.line 1\n'.format(in_path)
+
+
 def transform_input(out_handle: TextIO, in_path: str, in_handle: TextIO,
                     insns_file: InsnsFile, glued_insns_dec_len: List[Insn],
-                    mnem_to_rve: Dict[str, RVEncoding]) -> None:
-    '''Transform an input file to make it suitable for riscv as'''
+                    mnem_to_rve: Dict[str, RVEncoding],
+                    file_directives: bool = True) -> None:
+    '''Transform an input file to make it suitable for riscv as
+
+    Unless file_directives is false, the output starts with .file and .line
+    directives to tell the assembler where the code came from.
+
+    '''
+    if file_directives:
+        out_handle.write(_file_directives(in_path))
     transformer = Transformer(out_handle, in_path, insns_file,
                               glued_insns_dec_len, mnem_to_rve)
     for line in in_handle:
@@ -1165,11 +1197,51 @@ def transform_input(out_handle: TextIO, in_path: str, in_handle: TextIO,
     transformer.at_eof()
 
 
+def _transform_cached(out_handle: TextIO, in_path: str, in_handle: TextIO,
+                      insns_file: InsnsFile, glued_insns_dec_len: List[Insn],
+                      mnem_to_rve: Dict[str, RVEncoding],
+                      cache: DiskCache, tables_key: str) -> None:
+    '''Like transform_input, but look up the output in cache first
+
+    The cache key is the input text and tables_key (which identifies the
+    instruction tables and the code of this script). The .file directive
+    names in_path, which is usually a temporary file, so it isn't cached.
+
+    '''
+    text = in_handle.read()
+    key = hash_key('transform', tables_key, text)
+    body = None
+    cached = cache.get(key)
+    if cached is not None:
+        try:
+            body = cached.decode('utf-8')
+        except UnicodeDecodeError:
+            # A damaged entry: make it again.
+            pass
+    if body is None:
+        body_handle = io.StringIO()
+        transform_input(body_handle, in_path, io.StringIO(text), insns_file,
+                        glued_insns_dec_len, mnem_to_rve,
+                        file_directives=False)
+        body = body_handle.getvalue()
+        cache.put(key, body.encode('utf-8'))
+
+    out_handle.write(_file_directives(in_path))
+    out_handle.write(body)
+
+
 def transform_inputs(out_dir: str, inputs: List[str], insns_file: InsnsFile,
                      mnem_to_rve: Dict[str, RVEncoding],
                      glued_insns_dec_len: List[Insn],
-                     just_translate: bool) -> List[str]:
-    '''Transform inputs to make them suitable for riscv as'''
+                     just_translate: bool,
+                     cache: Optional[DiskCache] = None,
+                     tables_key: str = '') -> List[str]:
+    '''Transform inputs to make them suitable for riscv as
+
+    If cache is not None, transformed inputs are looked up there (see
+    _transform_cached).
+
+    '''
     out_paths = []
     for idx, in_path in enumerate(inputs):
         out_path = os.path.join(out_dir, str(idx))
@@ -1186,8 +1258,13 @@ def transform_inputs(out_dir: str, inputs: List[str], insns_file: InsnsFile,
             if not just_translate:
                 out_handle = open(out_path, 'w')
 
-            transform_input(out_handle, pretty_in_path, in_handle, insns_file,
-                            glued_insns_dec_len, mnem_to_rve)
+            if cache is None:
+                transform_input(out_handle, pretty_in_path, in_handle,
+                                insns_file, glued_insns_dec_len, mnem_to_rve)
+            else:
+                _transform_cached(out_handle, pretty_in_path, in_handle,
+                                  insns_file, glued_insns_dec_len,
+                                  mnem_to_rve, cache, tables_key)
 
         finally:
             if in_handle is not sys.stdin and in_handle is not None:
@@ -1198,13 +1275,91 @@ def transform_inputs(out_dir: str, inputs: List[str], insns_file: InsnsFile,
     return out_paths
 
 
-def run_c_preprocessor(out_dir: str, inputs: List[str], copts: List[str]) -> List[str]:
+def _read_depfile(path: str) -> List[str]:
+    '''The prerequisites of the Makefile rule that gcc -MD wrote to path'''
+    with open(path) as handle:
+        text = handle.read().replace('\\\n', ' ')
+    prereqs = text.split(': ', 1)[1] if ': ' in text else ''
+    return [dep.replace('\\ ', ' ')
+            for dep in re.findall(r'(?:\\ |\S)+', prereqs)]
+
+
+def _preprocessor_key(gcc_name: str, copts: List[str], in_path: str) -> str:
+    '''The cache key for running the C preprocessor on in_path
+
+    This covers the contents of in_path and of the preprocessor, but not the
+    files that in_path includes: the cache entry lists those, with their
+    hashes. No paths go into the key, so an entry can be used for a copy of
+    the same input somewhere else (as in another Bazel sandbox).
+
+    '''
+    with open(in_path, 'rb') as handle:
+        source = handle.read()
+    return hash_key('cpp', _file_digest_memo(gcc_name), source, *copts)
+
+
+# file_digest results for tools that we run (see _file_digest_memo)
+_TOOL_FILE_DIGESTS = {}  # type: Dict[str, str]
+
+
+def _file_digest_memo(path: str) -> str:
+    '''file_digest(path), computed at most once per process'''
+    digest = _TOOL_FILE_DIGESTS.get(path)
+    if digest is None:
+        digest = file_digest(path) or ''
+        _TOOL_FILE_DIGESTS[path] = digest
+    return digest
+
+
+# A line marker in the output of the C preprocessor, such as '# 12 "foo.s" 2'
+_LINE_MARKER_RE = re.compile(r'^(# \d+ )"([^"<][^"]*)"', re.MULTILINE)
+
+
+def _rebase_line_markers(text: str, rebase: Callable[[str], str]) -> str:
+    '''Apply rebase to the path in each of text's line markers
+
+    We use this to store preprocessor output in the cache with paths relative
+    to the input's directory, so that the entry can be used for an input
+    somewhere else.
+
+    '''
+    return _LINE_MARKER_RE.sub(
+        lambda match: '{}"{}"'.format(match.group(1), rebase(match.group(2))),
+        text)
+
+
+def run_c_preprocessor(out_dir: str, inputs: List[str], copts: List[str],
+                       cache: Optional[DiskCache] = None) -> List[str]:
+    '''Run the C preprocessor on each input, writing the results to out_dir
+
+    If cache is not None, the results are looked up there first. An entry is
+    only used if the files included by the input still have the contents
+    that they had when it was made. Included files are found relative to the
+    input's directory, so the entry stores their paths relative to that.
+
+    '''
     inputs_pre = []
     for idx, in_path in enumerate(inputs):
         out_path = os.path.join(out_dir, str(idx))
         inputs_pre.append(out_path)
 
         gcc_name = find_tool('gcc')
+        in_dir = os.path.dirname(in_path)
+
+        cache_key = None
+        if cache is not None and in_path != '--':
+            cache_key = _preprocessor_key(gcc_name, copts, in_path)
+            entry = cache.get_pickle(cache_key)
+            if entry is not None:
+                deps, text = entry
+                if all(file_digest(os.path.join(in_dir, dep)) == digest
+                       for dep, digest in deps):
+                    with open(out_path, 'w') as outfile:
+                        outfile.write(_rebase_line_markers(
+                            text, lambda path: os.path.normpath(
+                                os.path.join(in_dir, path))))
+                    continue
+
         default_args = ["-E"]
         default_args += copts
         default_args += [
@@ -1212,6 +1367,9 @@ def run_c_preprocessor(out_dir: str, inputs: List[str], copts: List[str]) -> Lis
             "-x", "assembler-with-cpp",
             "-o", out_path
         ]
+        if cache_key is not None:
+            # Make gcc list the files that the input includes.
+            default_args += ["-MD", "-MF", out_path + ".d"]
 
         cmd = [gcc_name] + default_args + [in_path]
 
@@ -1228,9 +1386,55 @@ def run_c_preprocessor(out_dir: str, inputs: List[str], copts: List[str]) -> Lis
             outfile.writelines(lines)
             outfile.truncate()
 
+        if cache is not None and cache_key is not None:
+            deps = [(os.path.relpath(dep, in_dir or '.'), file_digest(dep))
+                    for dep in _read_depfile(out_path + ".d")]
+            text = _rebase_line_markers(
+                ''.join(lines),
+                lambda path: os.path.relpath(path, in_dir or '.'))
+            cache.put_pickle(cache_key, (deps, text))
+
     return inputs_pre
 
 
+# A hash of the code and data that the output of this script depends on (see
+# _tool_digest).
+_TOOL_DIGEST: Optional[str] = None
+
+
+def _tool_digest() -> str:
+    '''A hash of this script, the shared modules and the ISA description'''
+    global _TOOL_DIGEST
+    if _TOOL_DIGEST is None:
+        util_dir = os.path.dirname(os.path.abspath(__file__))
+        data_dir = os.path.join(os.path.dirname(util_dir), 'data')
+        _TOOL_DIGEST = files_digest([os.path.abspath(__file__),
+                                     os.path.join(util_dir, 'shared', '*.py'),
+                                     os.path.join(data_dir, '*.yml')])
+    return _TOOL_DIGEST
+
+
+def load_insns_file(bnmulv_version_id: str,
+                    cache: Optional[DiskCache] = None,
+                    tables_key: str = '') -> InsnsFile:
+    '''Load the instruction tables (insns.yml) for an ISA version
+
+    Parsing and checking the YAML files takes most of the time of assembling
+    a typical input, so if cache is not None, the result is pickled there
+    (with key tables_key). Raises a RuntimeError if the YAML can't be loaded.
+
+    '''
+    if cache is not None:
+        insns_file = cache.get_pickle(tables_key)
+        if isinstance(insns_file, InsnsFile):
+            return insns_file
+
+    insns_file = load_insns_yaml(bnmulv_version_id)
+    if cache is not None:
+        cache.put_pickle(tables_key, insns_file)
+    return insns_file
+
+
 def run_binutils_as(other_args: List[str], inputs: List[str]) -> int:
     '''Run binutils' as on transformed inputs
 
@@ -1258,7 +1462,469 @@ def run_binutils_as(other_args: List[str], inputs: List[str]) -> int:
         return 127
 
 
+class _NeedsBinutils(Exception):
+    '''Raised by DirectAssembler on input that it leaves to binutils'''
+
+
+# The type and flags that a section gets if .section doesn't give any. These
+# are keyed by name prefix, matching what binutils does for sections like
+# .text.foo.
+_SECTION_DEFAULTS = [
+    ('.text', SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR),
+    ('.data', SHT_PROGBITS, SHF_ALLOC | SHF_WRITE),
+    ('.bss', SHT_NOBITS, SHF_ALLOC | SHF_WRITE),
+    ('.rodata', SHT_PROGBITS, SHF_ALLOC),
+]
+
+# Data directives and the width in bytes of each item
+_DATA_DIRECTIVES = {
+    '.byte': 1,
+    '.half': 2, '.2byte': 2, '.short': 2,
+    '.word': 4, '.4byte': 4, '.long': 4,
+    '.dword': 8, '.8byte': 8, '.quad': 8
+}
+
+# What binutils pads code with for alignment (ADDI x0, x0, 0)
+_NOP_BYTES = (0x00000013).to_bytes(4, 'little')
+
+
+def _int_arg(arg: str) -> int:
+    '''Parse a directive argument, which must be an integer literal'''
+    try:
+        return int(arg.strip(), 0)
+    except ValueError:
+        raise _NeedsBinutils() from None
+
+
+def _split_args(args: str) -> List[str]:
+    return [arg.strip() for arg in args.split(',')] if args.strip() else []
+
+
+class DirectAssembler:
+    '''An assembler for transformed OTBN code that doesn't need binutils
+
+    This understands the subset of GNU as syntax that Transformer usually
+    generates when mnem_to_rve is empty (so every custom instruction has
+    become a .word): labels, RV32I instructions, and section, symbol, data
+    and alignment directives. Instructions are encoded with the encoding
+    schemes in the InsnsFile.
+
+    Every operand must be a number, except that PC-relative operands can also
+    be a label in the same section or an offset from '.' (as generated by the
+    random instruction generator). This means there is never a relocation to
+    write, so the result can be written as an object file without binutils'
+    help. For anything else (macros, symbolic immediates, %hi/%lo, references
+    to other sections or files, ...), the methods raise _NeedsBinutils and
+    the caller should run binutils' as instead.
+
+    '''
+    def __init__(self, insns_file: InsnsFile,
+                 glued_insns_dec_len: List[Insn]) -> None:
+        self.insns_file = insns_file
+        self.glued_insns_dec_len = glued_insns_dec_len
+
+        self.sections = {}  # type: Dict[str, ElfSection]
+        self.cur_section = None  # type: Optional[ElfSection]
+        self.labels = {}  # type: Dict[str, Tuple[ElfSection, int]]
+        self.globals = []  # type: List[str]
+        self.file_name = None  # type: Optional[str]
+
+        # Instructions to encode once all the labels are known. Each item is
+        # (section, offset, insn, op_to_expr).
+        self.pending = [
+        ]  # type: List[Tuple[ElfSection, int, Insn, Dict[str, Optional[str]]]]
+
+        # binutils starts in .text, which is always in the object file.
+        self._switch_section('.text', None)
+
+    def take_text(self, text: str) -> None:
+        '''Consume the transformed text of an input file'''
+        for line in text.split('\n'):
+            self._take_line(line)
+
+    def _take_line(self, line: str) -> None:
+        if line.startswith('.file '):
+            match = re.match(r'\.file "([^"\\]*)"$', line)
+            if match is None:
+                raise _NeedsBinutils()
+            if self.file_name is None:
+                self.file_name = match.group(1)
+            return
+
+        # Comments in the transformed text are ones written by Transformer,
+        # so they never contain anything that we care about.
+        line = re.sub(r'[\t ]+', ' ', line.split('#', 1)[0]).strip()
+        while True:
+            match = re.match(r'([0-9a-zA-Z_$.]+): ?', line)
+            if match is None:
+                break
+            self._define_label(match.group(1))
+            line = line[match.end():]
+
+        if not line:
+            return
+        if ';' in line:
+            raise _NeedsBinutils()
+
+        match = re.match(r'[0-9a-zA-Z_$.]+', line)
+        if match is None:
+            raise _NeedsBinutils()
+        key_sym = match.group(0)
+        rest = line[match.end():]
+        if key_sym.startswith('.'):
+            self._take_directive(key_sym.lower(), rest)
+        else:
+            self._take_insn(key_sym, rest)
+
+    def _define_label(self, name: str) -> None:
+        # Numeric local labels (like "1:") can be defined many times, which
+        # needs more work than seems worthwhile.
+        if name.isdigit() or name in self.labels:
+            raise _NeedsBinutils()
+        section = self._section()
+        self.labels[name] = (section, section.size)
+
+    def _section(self) -> ElfSection:
+        '''The current section (binutils starts in .text)'''
+        if self.cur_section is None:
+            self._switch_section('.text', None)
+        assert self.cur_section is not None
+        return self.cur_section
+
+    def _switch_section(self, name: str,
+                        type_flags: Optional[Tuple[int, int]]) -> None:
+        section = self.sections.get(name)
+        if section is None:
+            if type_flags is None:
+                for prefix, sh_type, flags in _SECTION_DEFAULTS:
+                    if name == prefix or name.startswith(prefix + '.'):
+                        type_flags = (sh_type, flags)
+                        break
+                else:
+                    raise _NeedsBinutils()
+            section = ElfSection(name, *type_flags)
+            if name == '.text':
+                # binutils aligns .text for instructions from the start. Other
+                # sections keep the alignment their directives give them, even
+                # if they hold instructions.
+                section.align = 4
+            self.sections[name] = section
+        self.cur_section = section
+
+    def _section_directive(self, args: str) -> None:
+        match = re.match(r'([0-9a-zA-Z_$.]+)'
+                         r'(?: ?, ?"([awx]*)"'
+                         r'(?: ?, ?[@%](progbits|nobits))?)?$', args.strip())
+        if match is None:
+            raise _NeedsBinutils()
+        name, flag_chars, type_name = match.groups()
+        if flag_chars is None:
+            self._switch_section(name, None)
+            return
+
+        flags = ((SHF_ALLOC if 'a' in flag_chars else 0) |
+                 (SHF_WRITE if 'w' in flag_chars else 0) |
+                 (SHF_EXECINSTR if 'x' in flag_chars else 0))
+        sh_type = SHT_NOBITS if type_name == 'nobits' else SHT_PROGBITS
+        self._switch_section(name, (sh_type, flags))
+
+    def _emit(self, data: bytes) -> None:
+        section = self._section()
+        if section.sh_type == SHT_NOBITS:
+            if any(data):
+                raise _NeedsBinutils()
+            section.nobits_size += len(data)
+        else:
+            section.data += data
+
+    def _pad(self, count: int, fill: Optional[int]) -> None:
+        '''Pad the current section with count bytes
+
+        If fill is None, code sections are padded with NOPs and other
+        sections with zeros.
+
+        '''
+        if fill is not None:
+            self._emit(bytes([fill & 0xff]) * count)
+        elif self._section().flags & SHF_EXECINSTR:
+            if count % 4 or self._section().size % 4:
+                raise _NeedsBinutils()
+            self._emit(_NOP_BYTES * (count // 4))
+        else:
+            self._emit(bytes(count))
+
+    def _take_directive(self, name: str, args: str) -> None:
+        if name == '.line':
+            return
+
+        if name == '.section':
+            self._section_directive(args)
+            return
+
+        if '"' in args:
+            raise _NeedsBinutils()
+        arg_list = _split_args(args)
+
+        if name in ['.text', '.data', '.bss']:
+            if arg_list:
+                raise _NeedsBinutils()
+            self._switch_section(name, None)
+
+        elif name in ['.globl', '.global']:
+            self.globals += arg_list
+
+        elif name in _DATA_DIRECTIVES:
+            width = _DATA_DIRECTIVES[name]
+            for arg in arg_list:
+                value = _int_arg(arg)
+                if not -(1 << (8 * width - 1)) <= value < (1 << (8 * width)):
+                    raise _NeedsBinutils()
+                self._emit((value & ((1 << (8 * width)) - 1)).to_bytes(
+                    width, 'little'))
+
+        elif name in ['.zero', '.space', '.skip']:
+            if not 1 <= len(arg_list) <= (1 if name == '.zero' else 2):
+                raise _NeedsBinutils()
+            count = _int_arg(arg_list[0])
+            if count < 0:
+                raise _NeedsBinutils()
+            fill = _int_arg(arg_list[1]) if len(arg_list) > 1 else 0
+            self._emit(bytes([fill & 0xff]) * count)
+
+        elif name in ['.balign', '.p2align', '.align']:
+            # The RISC-V port of binutils treats .align like .p2align.
+            if not 1 <= len(arg_list) <= 2:
+                raise _NeedsBinutils()
+            align = _int_arg(arg_list[0])
+            if name != '.balign':
+                align = 1 << align if 0 <= align < 32 else 0
+            if align <= 0 or align & (align - 1):
+                raise _NeedsBinutils()
+            fill = _int_arg(arg_list[1]) if len(arg_list) > 1 else None
+            section = self._section()
+            section.align = max(section.align, align)
+            self._pad(-section.size % align, fill)
+
+        elif name == '.org':
+            if not 1 <= len(arg_list) <= 2:
+                raise _NeedsBinutils()
+            target = _int_arg(arg_list[0])
+            fill = _int_arg(arg_list[1]) if len(arg_list) > 1 else 0
+            if target < self._section().size:
+                raise _NeedsBinutils()
+            self._emit(bytes([fill & 0xff]) * (target - self._section().size))
+
+        else:
+            raise _NeedsBinutils()
+
+    def _take_insn(self, key_sym: str, rest: str) -> None:
+        low_key_sym = key_sym.lower()
+        insn = self.insns_file.mnemonic_to_insn.get(low_key_sym)
+        if insn is None:
+            for glued_insn in self.glued_insns_dec_len:
+                if low_key_sym.startswith(glued_insn.mnemonic):
+                    insn = glued_insn
+                    break
+        if insn is None or insn.encoding is None:
+            raise _NeedsBinutils()
+
+        match = insn.asm_pattern.match(key_sym[len(insn.mnemonic):] + rest)
+        if match is None:
+            raise _NeedsBinutils()
+
+        op_to_expr = {}  # type: Dict[str, Optional[str]]
+        for op, grp in insn.pattern_op_to_grp.items():
+            op_to_expr[op] = match.group(grp)
+
+        section = self._section()
+        if section.sh_type == SHT_NOBITS:
+            raise _NeedsBinutils()
+        self.pending.append((section, section.size, insn, op_to_expr))
+        self._emit(bytes(4))
+
+    def _pc_rel_target(self, section: ElfSection, offset: int,
+                       expr: str) -> int:
+        '''The offset in section of a PC-relative operand's target'''
+        match = re.match(r'\.(?: ?([+-]) ?(\w+))?$', expr)
+        if match is not None:
+            sign, delta = match.groups()
+            if sign is None:
+                return offset
+            return offset + (_int_arg(delta) if sign == '+'
+                             else -_int_arg(delta))
+
+        # binutils leaves a relocation for a jump or branch to a global
+        # symbol, since the symbol might be defined somewhere else as well.
+        target = self.labels.get(expr)
+        if (target is None or target[0] is not section or
+                expr in self.globals):
+            raise _NeedsBinutils()
+        return target[1]
+
+    def _encode(self, section: ElfSection, offset: int, insn: Insn,
+                op_to_expr: Dict[str, Optional[str]]) -> int:
+        '''Encode an instruction at offset in section'''
+        assert insn.encoding is not None
+
+        op_to_enc_val = {}
+        for op_name, expr in op_to_expr.items():
+            op_type = insn.name_to_operand[op_name].op_type
+            try:
+                if expr is None:
+                    op_val = 0  # type: Optional[int]
+                elif isinstance(op_type, ImmOperandType) and op_type.pc_rel:
+                    op_val = self._pc_rel_target(section, offset,
+                                                 expr.strip())
+                else:
+                    op_val = op_type.str_to_op_val(expr.strip())
+                if op_val is None:
+                    raise _NeedsBinutils()
+                enc_val = op_type.op_val_to_enc_val(op_val, offset)
+            except ValueError:
+                # Leave binutils to report the error.
+                raise _NeedsBinutils() from None
+            if enc_val is None:
+                raise _NeedsBinutils()
+            op_to_enc_val[op_name] = enc_val
+
+        try:
+            return insn.encoding.assemble(op_to_enc_val)
+        except ValueError:
+            raise _NeedsBinutils() from None
+
+    def object_bytes(self) -> bytes:
+        '''Encode the instructions and return the ELF object file'''
+        for section, offset, insn, op_to_expr in self.pending:
+            word = self._encode(section, offset, insn, op_to_expr)
+            section.data[offset:offset + 4] = word.to_bytes(4, 'little')
+
+        global_names = set(self.globals)
+        if not global_names <= set(self.labels):
+            # A global that we don't define is an external reference.
+            raise _NeedsBinutils()
+
+        # Like binutils, don't put .L labels in the symbol table unless
+        # they are global.
+        symbols = [ElfSymbol(name, section, offset, name in global_names)
+                   for name, (section, offset) in self.labels.items()
+                   if name in global_names or not name.startswith('.L')]
+        return write_elf_object(list(self.sections.values()), symbols,
+                                self.file_name)
+
+
+def assemble_direct(inputs: List[str], insns_file: InsnsFile,
+                    glued_insns_dec_len: List[Insn],
+                    cache: Optional[DiskCache] = None,
+                    tables_key: str = '') -> Optional[bytes]:
+    '''Assemble inputs in this process with DirectAssembler
+
+    Returns the object file, or None if the inputs need binutils (which is
+    also the case if they have errors: running binutils will report them).
+
+    '''
+    assembler = DirectAssembler(insns_file, glued_insns_dec_len)
+    for in_path in inputs:
+        out_handle = io.StringIO()
+        try:
+            with open(in_path, 'r') as in_handle:
+                # Transform with no .insn schemes, so that every custom
+                # instruction comes out as a .word.
+                if cache is None:
+                    transform_input(out_handle, in_path, in_handle,
+                                    insns_file, glued_insns_dec_len, {})
+                else:
+                    _transform_cached(out_handle, in_path, in_handle,
+                                      insns_file, glued_insns_dec_len, {},
+                                      cache, hash_key('direct', tables_key))
+            assembler.take_text(out_handle.getvalue())
+        except (RuntimeError, _NeedsBinutils):
+            return None
+
+    try:
+        return assembler.object_bytes()
+    except _NeedsBinutils:
+        return None
+
+
+# The instruction tables for each ISA version that we've loaded in this
+# process (see load_tables)
+_Tables = Tuple[InsnsFile, List[Insn], Dict[str, RVEncoding]]
+_TABLES = {}  # type: Dict[str, _Tables]
+
+
+def load_tables(bnmulv_version_id: str,
+                cache: Optional[DiskCache] = None,
+                tables_key: str = '') -> _Tables:
+    '''Load the tables needed to transform inputs for an ISA version
+
+    Returns (insns_file, glued_insns_dec_len, mnem_to_rve). The tables are
+    kept for the rest of the process, so assembling many files in one
+    process (see assemble_batch) only loads them once. Raises a RuntimeError
+    if the instruction tables are broken.
+
+    '''
+    tables = _TABLES.get(bnmulv_version_id)
+    if tables is not None:
+        return tables
+
+    insns_file = load_insns_file(bnmulv_version_id, cache, tables_key)
+
+    # A list of instructions that have "glued operations" (which means their
+    # syntax doesn't require a space between the mnemonic and the first
+    # operation). Ordered from longest to shortest mnemonic, so that you can
+    # find a maximal prefix by linearly searching through the list and calling
+    # startswith.
+    glued_insns_dec_len = []
+    for insn in insns_file.insns:
+        if insn.glued_ops:
+            glued_insns_dec_len.append(insn)
+    glued_insns_dec_len.sort(key=lambda insn: len(insn.mnemonic), reverse=True)
+
+    # Check that any instruction that claims to have a Python pseudo-op
+    # assembler really does.
+    for insn in insns_file.insns:
+        if insn.python_pseudo_op:
+            if insn.mnemonic not in _PSEUDO_OP_ASSEMBLERS:
+                raise RuntimeError(
+                    "Instruction {!r} has python-pseudo-op true, "
+                    "but otbn_as.py doesn't have a custom assembler "
+                    "for it.".format(insn.mnemonic))
+
+    # Try to match up OTBN instruction encodings with .insn schemes (as stored
+    # in RISCV_FORMATS).
+    mnem_to_rve = find_insn_schemes(insns_file.mnemonic_to_insn)
+
+    tables = (insns_file, glued_insns_dec_len, mnem_to_rve)
+    _TABLES[bnmulv_version_id] = tables
+    return tables
+
+
+def _direct_output_path(other_args: List[str]) -> Optional[str]:
+    '''The output path for assemble_direct, given the arguments for as
+
+    Returns None if there are arguments that only binutils understands
+    (such as -g, which asks for debug information).
+
+    '''
+    out_path = 'a.out'
+    for idx in range(0, len(other_args), 2):
+        if (other_args[idx] not in ['-o', '-I'] or
+                idx + 1 == len(other_args)):
+            return None
+        if other_args[idx] == '-o':
+            out_path = other_args[idx + 1]
+    return out_path
+
+
 def main(argv: List[str]) -> int:
+    if len(argv) == 3 and argv[1] == '--otbn-batch':
+        try:
+            jobs = read_batch_file(argv[2])
+        except OSError as err:
+            sys.stderr.write('Failed to read batch file: {}\n'.format(err))
+            return 1
+        return assemble_batch(jobs)
+
     files, other_args, flags = parse_positionals(argv)
     files = files or ['--']
     just_translate = '--otbn-translate' in flags
@@ -1280,52 +1946,52 @@ def main(argv: List[str]) -> int:
             other_args.remove(arg)
             break
 
+    # The preprocessed and transformed inputs and the instruction tables are
+    # cached if that's turned on (see shared/disk_cache.py).
+    cache = DiskCache.default('otbn_as')
+    tables_key = hash_key('tables', _tool_digest(), bnmulv_version_id)
+
     # files is now a nonempty list of input files. Rather unusually, '--'
     # (rather than '-') denotes standard input.
     with tempfile.TemporaryDirectory(suffix='.otbn-gcc') as tmpdir:
         try:
-            files = run_c_preprocessor(tmpdir, files, copts)  # add copts = -D for preprocessor
+            # add copts = -D for preprocessor
+            files = run_c_preprocessor(tmpdir, files, copts, cache)
         except RuntimeError as err:
             sys.stderr.write('{}\n'.format(err))
             return 1
 
         try:
-            insns_file = load_insns_yaml(bnmulv_version_id)
+            insns_file, glued_insns_dec_len, mnem_to_rve = \
+                load_tables(bnmulv_version_id, cache, tables_key)
         except RuntimeError as err:
             sys.stderr.write('{}\n'.format(err))
             return 1
 
-        # A list of instructions that have "glued operations" (which means their
-        # syntax doesn't require a space between the mnemonic and the first
-        # operation). Ordered from longest to shortest mnemonic, so that you can
-        # find a maximal prefix by linearly searching through the list and calling
-        # startswith.
-        glued_insns_dec_len = []
-        for insn in insns_file.insns:
-            if insn.glued_ops:
-                glued_insns_dec_len.append(insn)
-        glued_insns_dec_len.sort(key=lambda insn: len(insn.mnemonic), reverse=True)
-
-        # Check that any instruction that claims to have a Python pseudo-op
-        # assembler really does.
-        for insn in insns_file.insns:
-            if insn.python_pseudo_op:
-                if insn.mnemonic not in _PSEUDO_OP_ASSEMBLERS:
-                    sys.stderr.write(
-                        "Instruction {!r} has python-pseudo-op true, "
-                        "but otbn_as.py doesn't have a custom assembler "
-                        "for it.\n".format(insn.mnemonic))
+        # If asked to, try to assemble the inputs ourselves, which saves
+        # running binutils. If that doesn't work (for example, because there's
+        # a relocation), we fall back on binutils.
+        direct_path = _direct_output_path(other_args)
+        if ('--otbn-direct' in flags and not just_translate and
+                direct_path is not None):
+            obj = assemble_direct(files, insns_file, glued_insns_dec_len,
+                                  cache, tables_key)
+            if obj is not None:
+                try:
+                    with open(direct_path, 'wb') as out_file:
+                        out_file.write(obj)
+                except OSError as err:
+                    sys.stderr.write('Failed to write {!r}: {}\n'
+                                     .format(direct_path, err))
                     return 1
-
-        # Try to match up OTBN instruction encodings with .insn schemes (as stored
-        # in RISCV_FORMATS).
-        mnem_to_rve = find_insn_schemes(insns_file.mnemonic_to_insn)
+                return 0
 
         with tempfile.TemporaryDirectory(suffix='.otbn-as') as tmpdir:
             try:
                 transformed = transform_inputs(tmpdir, files, insns_file,
                                                mnem_to_rve, glued_insns_dec_len,
-                                               just_translate)
+                                               just_translate, cache,
+                                               tables_key)
             except RuntimeError as err:
                 sys.stderr.write('{}\n'.format(err))
                 return 1
@@ -1338,5 +2004,53 @@ def main(argv: List[str]) -> int:
             return run_binutils_as(transformed, other_args)
 
 
+def read_batch_file(path: str) -> List[List[str]]:
+    '''Read a file of jobs for assemble_batch
+
+    Each line holds the arguments for one run of otbn_as.py, split like a
+    shell would. Blank lines and lines starting with '#' are ignored.
+
+    '''
+    jobs = []
+    with open(path) as handle:
+        for line in handle:
+            if line.strip() and not line.lstrip().startswith('#'):
+                jobs.append(shlex.split(line))
+    return jobs
+
+
+def assemble_batch(jobs: List[List[str]]) -> int:
+    '''Run otbn_as.py once for each job, all in this process
+
+    Each job is a list of arguments (not including the program name). The
+    instruction tables are only loaded once and, for jobs with --otbn-direct,
+    inputs that DirectAssembler can handle don't need a subprocess, so this
+    is much faster than running otbn_as.py for each job when assembling lots
+    of small files. Returns 0 if every job succeeded and 1 otherwise.
+
+    '''
+    failed = 0
+    for job in jobs:
+        try:
+            ret = main(['otbn_as.py'] + job)
+        except SystemExit as err:
+            # A job that exits (for example, after printing the usage for
+            # --help) doesn't assemble anything, but mustn't end the batch.
+            sys.stderr.write('Job exited with status {}.\n'.format(err.code))
+            ret = 1
+        except Exception as err:
+            sys.stderr.write('{}\n'.format(err))
+            ret = 1
+        if ret != 0:
+            sys.stderr.write('otbn_as.py: failed to assemble {}.\n'
+                             .format(shlex.join(job)))
+            failed += 1
+
+    if failed:
+        sys.stderr.write('otbn_as.py: {} of {} jobs failed.\n'
+                         .format(failed, len(jobs)))
+    return 1 if failed else 0
+
+
 if __name__ == '__main__':
     sys.exit(main(sys.argv))
@@ -9,18 +9,18 @@
 '''Run a test on the OTBN simulator.'''
 
 import sys
-import struct
 from enum import IntEnum
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from io import StringIO
 
 from hw.ip.otbn.util import otbn_sim_py_shared
 from hw.ip.otbn.util.shared.check import CheckResult
 from hw.ip.otbn.util.shared.reg_dump import parse_reg_dump
 # Import the simulator as python module for injecting dmem
-from hw.ip.otbn.dv.otbnsim.sim.stats import ExecutionStatAnalyzer
+from hw.ip.otbn.dv.otbnsim.sim.isa_version import get_isa_version
+from hw.ip.otbn.dv.otbnsim.sim.stats import ElfDebugInfo, ExecutionStatAnalyzer
 from hw.ip.otbn.dv.otbnsim.sim.standalonesim import StandaloneSim
-from hw.ip.otbn.dv.otbnsim.sim.load_elf import load_elf
+from hw.ip.otbn.dv.otbnsim.sim.load_elf import PreparedProgram
 
 
 # Names of special registers
@@ -60,34 +60,81 @@ def get_err_names(err: int) -> List[str]:
 
 
 def inject_dmem(sim: StandaloneSim, additional_data: List[Tuple[int, bytes]]):
-    dmem = sim.dump_data(include_validity=False)
-    new_dmem = bytearray()
-    for w in struct.iter_unpack("<32s", dmem):
-        for v in struct.iter_unpack("<I", w[0]):
-            assert len(v) == 1
-            new_dmem += v[0].to_bytes(4, 'little')
+    '''Write each (offset, data) pair into the DMEM of sim.
 
-    assert len(dmem) == len(new_dmem)
+    Like loading a whole DMEM image, this leaves every word of DMEM valid
+    (words that neither the ELF file nor additional_data wrote read as zero).
 
+    '''
     for offset, data in additional_data:
-        if offset > len(dmem) or offset < 0:
-            raise ValueError("Writing past dmem!")
-        new_dmem[offset:offset + len(data)] = bytearray(data)
+        try:
+            sim.state.dmem.write_bytes(offset, data)
+        except ValueError:
+            raise ValueError("Writing past dmem!") from None
+    sim.state.dmem.make_all_valid()
 
-    if len(new_dmem) != len(dmem):
-        raise ValueError("Too many or little dmem bytes written!")
 
-    sim.load_data(bytes(new_dmem), False)
+# Programs that have already been read and decoded, keyed by the test name
+# (as used in ELF_MAP) and the BNMULV version
+_PREPARED_PROGRAMS: Dict[Tuple[str, str], PreparedProgram] = {}
 
+# The symbols and line information that the statistics are reported with,
+# keyed by the test name
+_DEBUG_INFO: Dict[str, ElfDebugInfo] = {}
 
-def run_sim(elf: str, additional_data: List[Tuple[int, int, bytes]]) -> Tuple[
+
+def get_prepared_program(elf: str,
+                         bnmulv_version_id: Optional[str] = None
+                         ) -> PreparedProgram:
+    '''Get the (cached) prepared program for the ELF registered as elf.
+
+    Calling this before forking worker processes means that the workers
+    inherit the decoded program (and its symbols and line information, see
+    get_debug_info()) rather than each loading the ELF again.
+
+    '''
+    isa_version = get_isa_version(bnmulv_version_id)
+    key = (elf, isa_version.version_id)
+    prepared = _PREPARED_PROGRAMS.get(key)
+    if prepared is None:
+        prepared = PreparedProgram(otbn_sim_py_shared.ELF_MAP[elf],
+                                   isa_version)
+        _PREPARED_PROGRAMS[key] = prepared
+        get_debug_info(elf)
+    return prepared
+
+
+def get_debug_info(elf: str) -> ElfDebugInfo:
+    '''Get the (cached) symbols and line information of the ELF registered
+    as elf.
+
+    ExecutionStatAnalyzer names functions and source lines with these when it
+    reports the statistics of a run.
+
+    '''
+    debug_info = _DEBUG_INFO.get(elf)
+    if debug_info is None:
+        debug_info = ElfDebugInfo(otbn_sim_py_shared.ELF_MAP[elf])
+        _DEBUG_INFO[elf] = debug_info
+    return debug_info
+
+
+def run_sim(elf: str, additional_data: List[Tuple[int, int, bytes]],
+            bnmulv_version_id: Optional[str] = None) -> Tuple[
         Dict[str, int], List[int]]:
+    '''Run the ELF registered as elf in ELF_MAP with extra DMEM contents.
+
+    The simulator runs the BNMULV version given by bnmulv_version_id, falling
+    back to the BNMULV_VER environment variable if it is None.
+
+    '''
     # Parse expected values.
     result = CheckResult()
-    # Run the simulation and produce a register dump.
-    sim = StandaloneSim()
-
-    exp_end_addr = load_elf(sim, otbn_sim_py_shared.ELF_MAP[elf])
+    # Run the simulation and produce a register dump. The ELF is only read
+    # and decoded the first time we see it.
+    prepared = get_prepared_program(elf, bnmulv_version_id)
+    sim = prepared.new_sim()
+    exp_end_addr = prepared.exp_end_addr
 
     if len(additional_data) > 0:
         inject_dmem(sim, additional_data)
@@ -102,7 +149,9 @@ def run_sim(elf: str, additional_data: List[Tuple[int, int, bytes]]) -> Tuple[
 
     reg_dump = StringIO()
     sim.run(verbose=False, dump_file=reg_dump)
-    analyzer = ExecutionStatAnalyzer(sim.stats, otbn_sim_py_shared.ELF_MAP[elf])
+    analyzer = ExecutionStatAnalyzer(sim.stats,
+                                     otbn_sim_py_shared.ELF_MAP[elf],
+                                     get_debug_info(elf))
     print(analyzer.dump())
     stat_data = analyzer.get_stat_data()
     if exp_end_addr is not None:
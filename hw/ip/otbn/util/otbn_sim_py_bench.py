@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Run many iterations of an OTBN benchmark on a pool of worker processes.
+
+Each worker process is started once, runs an optional initializer (to load
+the ELF and ISA) and then runs one iteration per seed that it is sent. The
+results are yielded as soon as they arrive, so the caller can store them as
+it goes. If a worker process dies, it is replaced and no finished iterations
+are lost. The iteration it was running is retried on the replacement, up to
+max_retries times for each seed. A worker that dies before its initializer
+finishes isn't counted against any seed, but if that keeps happening the run
+is aborted.
+
+'''
+
+import argparse
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+import os
+import random
+import traceback
+from collections import deque
+from typing import (Any, Callable, Deque, Dict, Iterator, List, NamedTuple,
+                    Optional, Sequence)
+
+
+class IterationResult(NamedTuple):
+    '''The outcome of one benchmark iteration.
+
+    If the iteration raised an exception or its worker process died, error
+    is a description of what went wrong and result is None.
+
+    '''
+    index: int
+    seed: int
+    result: Any
+    error: Optional[str]
+
+
+def add_bench_args(parser: argparse.ArgumentParser) -> None:
+    '''Add the --iterations, --workers and --seed arguments to parser.'''
+    parser.add_argument('--iterations', type=int, default=1,
+                        help='Number of benchmark iterations to run.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of worker processes (0 means one per '
+                              'CPU).'))
+    parser.add_argument('--seed', type=int, default=None,
+                        help=('Seed for the per-iteration seeds. A random '
+                              'seed is used (and printed) by default.'))
+
+
+def iteration_seeds(iterations: int, seed: Optional[int]) -> List[int]:
+    '''Get a seed for each iteration, derived from seed.
+
+    If seed is None, a random one is picked and printed, so that a run can
+    be repeated.
+
+    '''
+    if seed is None:
+        seed = int.from_bytes(os.urandom(8), 'little')
+        print(f'Benchmark seed: {seed}')
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(iterations)]
+
+
+def _worker_main(conn: Connection,
+                 func: Callable[..., Any],
+                 args: Sequence[Any],
+                 initializer: Optional[Callable[..., None]],
+                 initargs: Sequence[Any]) -> None:
+    '''The body of a worker process.
+
+    Sends None once the initializer has run. Then runs func(*args, seed) for
+    each seed received on conn and sends back (True, result) or (False,
+    traceback). Stops when it receives None.
+
+    '''
+    if initializer is not None:
+        initializer(*initargs)
+    conn.send(None)
+    while True:
+        seed = conn.recv()
+        if seed is None:
+            return
+        try:
+            conn.send((True, func(*args, seed)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+
+
+class _Worker:
+    '''A worker process and the iteration that it is running (if any).'''
+    def __init__(self, ctx: Any, worker_args: Sequence[Any]) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child_conn,) + tuple(worker_args),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.index: Optional[int] = None
+        # Set once the initializer has finished
+        self.ready = False
+
+    def stop(self) -> None:
+        '''Ask the worker to stop, killing it if it doesn't.'''
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+def run_iterations(func: Callable[..., Any],
+                   args: Sequence[Any],
+                   seeds: Sequence[int],
+                   workers: int,
+                   initializer: Optional[Callable[..., None]] = None,
+                   initargs: Sequence[Any] = (),
+                   max_retries: int = 1) -> Iterator[IterationResult]:
+    '''Run func(*args, seed) for each seed on workers worker processes.
+
+    func and the contents of args must be picklable (or inherited by
+    forking). Results are yielded in the order they finish. An iteration
+    that raises an exception fails straight away. One whose worker dies is
+    retried on a new worker, failing once its worker has died max_retries + 1
+    times.
+
+    Workers that die before their initializer finishes are replaced without
+    counting against the seed they were sent. If more than workers +
+    max_retries of them die in a row (without any worker finishing its
+    initializer in between), the initializer is probably broken and this
+    raises a RuntimeError.
+
+    If workers is zero or negative, there is one worker per CPU.
+
+    '''
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(seeds)))
+
+    ctx = multiprocessing.get_context()
+    worker_args = (func, args, initializer, initargs)
+    pool = [_Worker(ctx, worker_args) for _ in range(workers)]
+
+    pending: Deque[int] = deque(range(len(seeds)))
+    # The number of times that a worker died while running each seed
+    deaths: Dict[int, int] = {}
+    finished = 0
+    # Workers that died before finishing their initializer, since the last
+    # one that did finish it
+    init_deaths = 0
+
+    def replace(pos: int) -> Optional[IterationResult]:
+        '''Replace the dead worker at pool[pos] and retry its iteration
+
+        Returns the failed iteration if it has run out of retries.
+
+        '''
+        nonlocal init_deaths
+        worker = pool[pos]
+        worker.stop()
+        exitcode = worker.process.exitcode
+        pool[pos] = _Worker(ctx, worker_args)
+
+        index = worker.index
+        if not worker.ready:
+            init_deaths += 1
+            if init_deaths > workers + max_retries:
+                raise RuntimeError('Benchmark worker processes keep exiting '
+                                   'before they are initialized (last exit '
+                                   'code: {}).'.format(exitcode))
+        elif index is not None:
+            deaths[index] = deaths.get(index, 0) + 1
+            if deaths[index] > max_retries:
+                return IterationResult(index, seeds[index], None,
+                                       'worker process exited with code {}'
+                                       .format(exitcode))
+        if index is not None:
+            pending.appendleft(index)
+        return None
+
+    try:
+        while finished < len(seeds):
+            done: List[IterationResult] = []
+
+            # Hand out seeds to idle workers. If a worker has already died,
+            # the send fails: that is handled like any other death.
+            for pos, worker in enumerate(pool):
+                if worker.index is None and pending:
+                    worker.index = pending.popleft()
+                    try:
+                        worker.conn.send(seeds[worker.index])
+                    except (BrokenPipeError, OSError):
+                        failed = replace(pos)
+                        if failed is not None:
+                            finished += 1
+                            done.append(failed)
+
+            if not done:
+                wait([w.conn for w in pool] +
+                     [w.process.sentinel for w in pool])
+
+            for pos, worker in enumerate(pool):
+                # Check this before reading, so that everything a dead worker
+                # sent before it died has been read by the time it's replaced.
+                alive = worker.process.is_alive()
+                try:
+                    while worker.conn.poll():
+                        msg = worker.conn.recv()
+                        if msg is None:
+                            worker.ready = True
+                            init_deaths = 0
+                            continue
+                        ok, value = msg
+                        index = worker.index
+                        assert index is not None
+                        worker.index = None
+                        finished += 1
+                        done.append(IterationResult(index, seeds[index],
+                                                    value if ok else None,
+                                                    None if ok else value))
+                except (EOFError, OSError):
+                    pass
+
+                if not alive:
+                    failed = replace(pos)
+                    if failed is not None:
+                        finished += 1
+                        done.append(failed)
+
+            yield from done
+    finally:
+        for worker in pool:
+            worker.stop()
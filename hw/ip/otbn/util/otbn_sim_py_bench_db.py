@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Store the results of OTBN benchmarks in an SQLite database.
+
+The database is opened in WAL mode and has indexes on the columns that the
+evaluation (util/get_benchmark.py) joins on. Each iteration is written with
+bound parameters and executemany() in its own transaction, as soon as it
+finishes, so a long run never has a big backlog of rows to write at the end.
+
+'''
+
+import sqlite3
+import time
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+_TABLES = [
+    "benchmark(id INTEGER PRIMARY KEY AUTOINCREMENT, start_time INTEGER, "
+    "end_time INTEGER, iterations INTEGER, operation TEXT)",
+    "benchmark_iteration(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "benchmark_id INTEGER, "
+    "FOREIGN KEY (benchmark_id) REFERENCES benchmark (id))",
+    "cycles(cycles INTEGER, benchmark_iteration_id INTEGER, "
+    "FOREIGN KEY (benchmark_iteration_id) REFERENCES benchmark_iteration (id))",
+    "stalls(stalls INTEGER, benchmark_iteration_id INTEGER, "
+    "FOREIGN KEY (benchmark_iteration_id) REFERENCES benchmark_iteration (id))",
+    "instr_counts(instr_name TEXT, count INTEGER, "
+    "benchmark_iteration_id INTEGER, "
+    "FOREIGN KEY (benchmark_iteration_id) REFERENCES benchmark_iteration (id))",
+    "func_counts(func_name TEXT, instr_count INTEGER, stall_count INTEGER, "
+    "benchmark_iteration_id INTEGER, "
+    "FOREIGN KEY (benchmark_iteration_id) REFERENCES benchmark_iteration (id))",
+    "func_instrs(func_name TEXT, instr_name TEXT, instr_count INTEGER, "
+    "stall_count INTEGER, benchmark_iteration_id INTEGER, "
+    "FOREIGN KEY (benchmark_iteration_id) REFERENCES benchmark_iteration (id))",
+    "func_calls(caller_func_name TEXT, callee_func_name TEXT, "
+    "call_count INTEGER, benchmark_iteration_id INTEGER, "
+    "FOREIGN KEY (benchmark_iteration_id) REFERENCES benchmark_iteration (id))",
+]
+
+# (table, column) pairs that the evaluation joins or filters on.
+_INDEXED_COLUMNS = [
+    ('benchmark_iteration', 'benchmark_id'),
+    ('cycles', 'benchmark_iteration_id'),
+    ('stalls', 'benchmark_iteration_id'),
+    ('instr_counts', 'benchmark_iteration_id'),
+    ('func_counts', 'benchmark_iteration_id'),
+    ('func_instrs', 'benchmark_iteration_id'),
+    ('func_calls', 'benchmark_iteration_id'),
+]
+
+
+def create_db(cur: sqlite3.Cursor) -> None:
+    '''Create the benchmark tables and indexes, unless they already exist.
+
+    This also adds the indexes to databases that were created without them.
+
+    '''
+    for table in _TABLES:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {table}")
+    for table, column in _INDEXED_COLUMNS:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} "
+                    f"ON {table} ({column})")
+
+
+def connect(path: str) -> sqlite3.Connection:
+    '''Open (and if needed, create) the benchmark database at path.'''
+    con = sqlite3.connect(path)
+    # With WAL, readers (such as the evaluation) don't block the benchmark
+    # writing its results and vice versa. NORMAL is safe with WAL: a crash
+    # can lose the last transactions, but never corrupts the database.
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    create_db(con.cursor())
+    con.commit()
+    return con
+
+
+class BenchmarkStore:
+    '''Writes the iterations of one benchmark run to the database.
+
+    The benchmark row is written straight away and updated with each
+    iteration, so the iterations that finished are kept even if the run gets
+    interrupted. Use it as a context manager, so that the database is closed
+    however the run ends.
+
+    '''
+    def __init__(self, path: str, operation: str) -> None:
+        self._con = connect(path)
+        self._stored = 0
+        start_time = int(time.time())
+        with self._con:
+            cur = self._con.execute(
+                "INSERT INTO benchmark (start_time, end_time, iterations, "
+                "operation) VALUES (?, ?, 0, ?)",
+                (start_time, start_time, operation))
+        self.benchmark_id = cur.lastrowid
+
+    @property
+    def stored(self) -> int:
+        '''The number of iterations that have been stored.'''
+        return self._stored
+
+    def add_iteration(self, result: Dict[str, Any]) -> None:
+        '''Store the statistics of one iteration and commit them.
+
+        result is a dictionary as returned by
+        ExecutionStatAnalyzer.get_stat_data().
+
+        '''
+        with self._con:
+            cur = self._con.execute(
+                "INSERT INTO benchmark_iteration (benchmark_id) VALUES (?)",
+                (self.benchmark_id,))
+            iteration_id = cur.lastrowid
+
+            cur.execute(
+                "INSERT INTO cycles (cycles, benchmark_iteration_id) "
+                "VALUES (?, ?)",
+                (result['insn_count'] + result['stall_count'], iteration_id))
+            cur.execute(
+                "INSERT INTO stalls (stalls, benchmark_iteration_id) "
+                "VALUES (?, ?)",
+                (result['stall_count'], iteration_id))
+
+            func_instrs: List[Tuple[str, str, int, int, int]] = [
+                (func_name, instr_name, counts[0], counts[1], iteration_id)
+                for func_name, per_instr in result['func_instrs'].items()
+                for instr_name, counts in per_instr.items()
+            ]
+            cur.executemany(
+                "INSERT INTO func_instrs (func_name, instr_name, instr_count, "
+                "stall_count, benchmark_iteration_id) VALUES (?, ?, ?, ?, ?)",
+                func_instrs)
+
+            func_calls: List[Tuple[str, str, int, int]] = [
+                (caller_func_name, callee_func_name, call_count, iteration_id)
+                for callee_func_name, callers in result['func_calls'].items()
+                for caller_func_name, call_count in callers.items()
+            ]
+            cur.executemany(
+                "INSERT INTO func_calls (caller_func_name, callee_func_name, "
+                "call_count, benchmark_iteration_id) VALUES (?, ?, ?, ?)",
+                func_calls)
+
+            self._stored += 1
+            cur.execute(
+                "UPDATE benchmark SET end_time = ?, iterations = ? "
+                "WHERE id = ?",
+                (int(time.time()), self._stored, self.benchmark_id))
+
+    def close(self) -> None:
+        '''Close the database connection.'''
+        self._con.close()
+
+    def __enter__(self) -> 'BenchmarkStore':
+        return self
+
+    def __exit__(self,
+                 exc_type: Optional[Type[BaseException]],
+                 exc_value: Optional[BaseException],
+                 traceback: Optional[TracebackType]) -> None:
+        self.close()
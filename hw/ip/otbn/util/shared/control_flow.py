@@ -3,7 +3,7 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 from .decode import OTBNProgram
 from .insn_yaml import Insn
@@ -271,6 +271,17 @@ def _clip_to_32(value: int) -> int:
     return value & ((1 << 32) - 1)
 
 
+def loop_end_pc(insn: Insn, operands: Dict[str, int],
+                pc: int) -> Optional[int]:
+    '''Returns the last PC of the loop body if insn (at pc) starts a loop.
+
+    If insn is not a LOOP or LOOPI instruction, returns None.
+    '''
+    if insn.mnemonic == 'loopi' or insn.mnemonic == 'loop':
+        return pc + (operands['bodysize'] * 4)
+    return None
+
+
 def _get_next_control_locations(insn: Insn, operands: Dict[str, int],
                                 pc: int) -> List[ControlLoc]:
     '''Given a control-flow instruction, returns the possible destinations.
@@ -303,8 +314,9 @@ def _get_next_control_locations(insn: Insn, operands: Dict[str, int],
         # This jump returns to whatever's on top of the call stack
         return [Ret()]
     elif insn.mnemonic == 'loopi' or insn.mnemonic == 'loop':
-        loop_end_pc = pc + (operands['bodysize'] * 4)
-        return [LoopStart(pc + 4, loop_end_pc)]
+        end_pc = loop_end_pc(insn, operands, pc)
+        assert end_pc is not None
+        return [LoopStart(pc + 4, end_pc)]
     elif insn.mnemonic == 'ecall':
         return [Ecall()]
 
@@ -425,6 +437,16 @@ def _label_cycles(program: OTBNProgram, graph: ControlGraph, start_pc: int,
         else:
             _label_cycles(program, graph, edge.pc, visited_pcs.copy())
 
+    # If the section ends with a jump that pushed to the call stack, the code
+    # after it runs once the callee returns, so traverse that as well.
+    # Otherwise, loops in the caller after its first call never get labelled.
+    last_insn = program.get_insn(sec.end)
+    if (last_insn.mnemonic == 'jal' and
+            program.get_operands(sec.end)['grd'] == 1):
+        ret_pc = sec.end + 4
+        if ret_pc in graph.graph and ret_pc not in visited_pcs:
+            _label_cycles(program, graph, ret_pc, visited_pcs.copy())
+
 
 def _fix_cycles(program: OTBNProgram, graph: ControlGraph) -> None:
     '''Labels cycles and splits them from other CodeSections in the graph.
@@ -436,12 +458,29 @@ def _fix_cycles(program: OTBNProgram, graph: ControlGraph) -> None:
     # The new_entries dictionary will have the same structure as graph.graph.
     new_entries = {}
     for start_pc in graph.graph:
-        sec, _edges = graph.get_entry(start_pc)
+        sec, edges = graph.get_entry(start_pc)
         for pc in sec:
             if pc in cycle_start_pcs and pc != sec.start:
                 # Split this section and create a new edge leading to the cycle
-                new_entries[start_pc] = (CodeSection(start_pc,
-                                                     pc), [ControlLoc(pc)])
+                # (the section ends just before the cycle's first instruction)
+                new_entries[start_pc] = (CodeSection(start_pc, pc - 4),
+                                         [ControlLoc(pc)])
+                # The rest of this section is usually the same code as the
+                # entry at the cycle start, but that entry might never have
+                # been reached by _label_cycles, so keep the Cycle labels
+                # found here, matching edges by their target. (The code
+                # differs if this section ends at the end of a loop that the
+                # entry at the cycle start is not inside.)
+                tail_sec, tail_edges = new_entries.get(pc, graph.get_entry(pc))
+                if tail_sec.end == sec.end:
+                    cycles = {edge.pc: edge for edge in edges
+                              if isinstance(edge, Cycle) and
+                              not isinstance(edge, LoopEnd)}
+                    new_entries[pc] = (tail_sec, [
+                        (tail_edge if tail_edge.is_special()
+                         else cycles.get(tail_edge.pc, tail_edge))
+                        for tail_edge in tail_edges
+                    ])
                 break
     graph.graph.update(new_entries)
 
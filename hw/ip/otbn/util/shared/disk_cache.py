@@ -0,0 +1,204 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''A content-addressed cache for the OTBN tools, stored on disk
+
+Entries are named by a hash of everything that went into making them (see
+hash_key), so they never need invalidating: if an input changes, so does the
+name of the entry.
+
+The cache is off unless $OTBN_CACHE_DIR names the directory to keep it in.
+(Build systems that run the tools in a sandbox, such as Bazel, shouldn't set
+it.) Each tool's part of the cache is kept below $OTBN_CACHE_MAX_MB megabytes
+(256 by default) by deleting the least recently used entries. Failing to read
+or write an entry is never an error: the caller just makes the result again.
+
+'''
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Any, List, Optional, Tuple, Union
+
+# The default size limit for each namespace (see DiskCache.trim)
+_DEFAULT_MAX_MB = 256
+
+
+def hash_key(*parts: Union[str, bytes]) -> str:
+    '''The hex SHA-256 hash of a sequence of strings or byte strings'''
+    hasher = hashlib.sha256()
+    for part in parts:
+        data = part.encode('utf-8') if isinstance(part, str) else part
+        # Prefix each part with its length, so that (say) ('ab', 'c') and
+        # ('a', 'bc') hash differently.
+        hasher.update(len(data).to_bytes(8, 'little'))
+        hasher.update(data)
+    return hasher.hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    '''The hex SHA-256 hash of a file's contents (None if unreadable)'''
+    try:
+        with open(path, 'rb') as handle:
+            return hashlib.sha256(handle.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def files_digest(patterns: List[str]) -> str:
+    '''A hash of the names and contents of the files matching patterns
+
+    This is used to fingerprint the code and data that a tool's results
+    depend on.
+
+    '''
+    paths = sorted({path
+                    for pattern in patterns
+                    for path in glob.glob(pattern)})
+    return hash_key(*[part
+                      for path in paths
+                      for part in (os.path.basename(path),
+                                   file_digest(path) or '')])
+
+
+class DiskCache:
+    '''A directory of cache entries for one tool
+
+    Entries are stored in a subdirectory called namespace, in files named by
+    their key. If max_bytes is not None, the entries are trimmed to fit in
+    that many bytes as new ones are written (see trim).
+
+    '''
+    def __init__(self, root: str, namespace: str,
+                 max_bytes: Optional[int] = None) -> None:
+        self.path = os.path.join(root, namespace)
+        self.max_bytes = max_bytes
+        # The number of bytes written since we last trimmed the cache (or
+        # None if we haven't trimmed it yet in this process).
+        self._written_since_trim = None  # type: Optional[int]
+
+    @staticmethod
+    def default(namespace: str) -> Optional['DiskCache']:
+        '''The cache configured by the environment (None if it is disabled)
+
+        Raises a ValueError if $OTBN_CACHE_MAX_MB isn't a number.
+
+        '''
+        root = os.environ.get('OTBN_CACHE_DIR')
+        if not root:
+            return None
+        max_mb_str = os.environ.get('OTBN_CACHE_MAX_MB')
+        try:
+            max_mb = (_DEFAULT_MAX_MB
+                      if max_mb_str is None else int(max_mb_str))
+        except ValueError:
+            raise ValueError('OTBN_CACHE_MAX_MB is {!r}, not a number of '
+                             'megabytes.'.format(max_mb_str)) from None
+        return DiskCache(root, namespace, max_mb * 1024 * 1024)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        '''Get the entry with the given key (None if there isn't one)'''
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as handle:
+                value = handle.read()
+        except OSError:
+            return None
+        # Mark the entry as recently used, so that trim keeps it.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        '''Store an entry
+
+        The entry is written to a temporary file and then renamed, so that
+        concurrent readers (such as parallel builds) see either all of it or
+        nothing.
+
+        '''
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as handle:
+                    handle.write(value)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            return
+
+        if self.max_bytes is not None:
+            # Scanning the whole cache for every entry would be slow, so only
+            # trim it when this process first writes to it and then each time
+            # it has written another tenth of the limit.
+            written = self._written_since_trim
+            if written is None or written + len(value) > self.max_bytes // 10:
+                self.trim()
+            else:
+                self._written_since_trim = written + len(value)
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        '''(mtime, size, path) for each entry, oldest first'''
+        entries = []
+        for dir_path, _, file_names in os.walk(self.path):
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def trim(self) -> None:
+        '''Delete the least recently used entries until we fit in max_bytes
+
+        When we have to delete something, we go down to three quarters of the
+        limit, so that the next few entries don't each need a trim.
+
+        '''
+        self._written_since_trim = 0
+        if self.max_bytes is None:
+            return
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 3 // 4
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+    def get_pickle(self, key: str) -> Optional[Any]:
+        '''Get an entry stored with put_pickle (None if there isn't one)'''
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # A damaged entry, or one that pickled classes which have since
+            # changed. Either way, it's no use.
+            return None
+
+    def put_pickle(self, key: str, value: Any) -> None:
+        '''Pickle value and store it as an entry'''
+        self.put(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
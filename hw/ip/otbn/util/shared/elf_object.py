@@ -0,0 +1,170 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+'''Writing ELF relocatable object files for OTBN
+
+This writes just enough of the format for the objects that otbn_as.py can
+assemble without binutils: sections of code and data, and a symbol table.
+There are no relocations, so the contents of each section must be final.
+
+'''
+
+import struct
+from typing import Dict, List, Optional
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_NOBITS = 8
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+_EM_RISCV = 243
+_ET_REL = 1
+
+_STB_LOCAL = 0
+_STB_GLOBAL = 1
+_STT_NOTYPE = 0
+_STT_SECTION = 3
+_STT_FILE = 4
+_SHN_ABS = 0xfff1
+
+_EHDR_SIZE = 52
+_SHDR_SIZE = 40
+_SYM_SIZE = 16
+
+
+class ElfSection:
+    '''A section of code or data in an object file'''
+    def __init__(self, name: str, sh_type: int, flags: int) -> None:
+        self.name = name
+        self.sh_type = sh_type
+        self.flags = flags
+        self.align = 1
+
+        # The contents of the section. This stays empty for an SHT_NOBITS
+        # section, whose size is nobits_size instead.
+        self.data = bytearray()
+        self.nobits_size = 0
+
+    @property
+    def size(self) -> int:
+        return (self.nobits_size
+                if self.sh_type == SHT_NOBITS else len(self.data))
+
+
+class ElfSymbol:
+    '''A symbol defined at an offset in a section'''
+    def __init__(self, name: str, section: ElfSection, value: int,
+                 is_global: bool) -> None:
+        self.name = name
+        self.section = section
+        self.value = value
+        self.is_global = is_global
+
+
+class _StrTab:
+    '''A string table, built up one name at a time'''
+    def __init__(self) -> None:
+        self.data = bytearray(b'\0')
+        self._offsets = {'': 0}  # type: Dict[str, int]
+
+    def add(self, name: str) -> int:
+        offset = self._offsets.get(name)
+        if offset is None:
+            offset = len(self.data)
+            self.data += name.encode('utf-8') + b'\0'
+            self._offsets[name] = offset
+        return offset
+
+
+def _align(offset: int, align: int) -> int:
+    return (offset + align - 1) & ~(align - 1)
+
+
+def write_elf_object(sections: List[ElfSection], symbols: List[ElfSymbol],
+                     file_name: Optional[str] = None) -> bytes:
+    '''Make a little-endian ELF32 relocatable object for RISC-V
+
+    The sections appear in the order given, followed by the symbol table and
+    string tables. Each section gets a section symbol and, if file_name is
+    not None, there is an STT_FILE symbol with that name.
+
+    '''
+    shstrtab = _StrTab()
+    strtab = _StrTab()
+    sec_idx = {id(sec): 1 + idx for idx, sec in enumerate(sections)}
+    symtab_idx = 1 + len(sections)
+
+    # The symbol table: a null symbol, then local symbols, then global ones
+    # (the ELF spec requires locals to come first).
+    syms = [struct.pack('<IIIBBH', 0, 0, 0, 0, 0, 0)]
+    if file_name is not None:
+        syms.append(struct.pack('<IIIBBH', strtab.add(file_name), 0, 0,
+                                (_STB_LOCAL << 4) | _STT_FILE, 0, _SHN_ABS))
+    for sec in sections:
+        syms.append(struct.pack('<IIIBBH', 0, 0, 0,
+                                (_STB_LOCAL << 4) | _STT_SECTION, 0,
+                                sec_idx[id(sec)]))
+    ordered = ([sym for sym in symbols if not sym.is_global] +
+               [sym for sym in symbols if sym.is_global])
+    first_global = len(syms) + sum(1 for sym in symbols if not sym.is_global)
+    for sym in ordered:
+        bind = _STB_GLOBAL if sym.is_global else _STB_LOCAL
+        syms.append(struct.pack('<IIIBBH', strtab.add(sym.name), sym.value,
+                                0, (bind << 4) | _STT_NOTYPE, 0,
+                                sec_idx[id(sym.section)]))
+    symtab_data = b''.join(syms)
+
+    # Lay out the file: the ELF header, the contents of each section and then
+    # the section header table. Each entry of headers is (name, type, flags,
+    # offset, size, link, info, align, entsize).
+    headers = [(0, 0, 0, 0, 0, 0, 0, 0, 0)]
+    chunks = []
+    offset = _EHDR_SIZE
+
+    def place(data: bytes, align: int) -> int:
+        nonlocal offset
+        start = _align(offset, align)
+        chunks.append(bytes(start - offset) + data)
+        offset = start + len(data)
+        return start
+
+    for sec in sections:
+        align = max(sec.align, 1)
+        if sec.sh_type == SHT_NOBITS:
+            sec_offset = _align(offset, align)
+        else:
+            sec_offset = place(bytes(sec.data), align)
+        headers.append((shstrtab.add(sec.name), sec.sh_type, sec.flags,
+                        sec_offset, sec.size, 0, 0, align, 0))
+
+    symtab_name = shstrtab.add('.symtab')
+    strtab_name = shstrtab.add('.strtab')
+    shstrtab_name = shstrtab.add('.shstrtab')
+
+    headers.append((symtab_name, SHT_SYMTAB, 0, place(symtab_data, 4),
+                    len(symtab_data), symtab_idx + 1, first_global, 4,
+                    _SYM_SIZE))
+    headers.append((strtab_name, SHT_STRTAB, 0, place(bytes(strtab.data), 1),
+                    len(strtab.data), 0, 0, 1, 0))
+    shstrtab_data = bytes(shstrtab.data)
+    headers.append((shstrtab_name, SHT_STRTAB, 0, place(shstrtab_data, 1),
+                    len(shstrtab_data), 0, 0, 1, 0))
+
+    shoff = _align(offset, 4)
+    chunks.append(bytes(shoff - offset))
+    for (name, sh_type, flags, sh_offset, size,
+         link, info, align, entsize) in headers:
+        chunks.append(struct.pack('<IIIIIIIIII', name, sh_type, flags, 0,
+                                  sh_offset, size, link, info, align,
+                                  entsize))
+
+    ident = b'\x7fELF' + bytes([1, 1, 1, 0]) + bytes(8)
+    ehdr = ident + struct.pack('<HHIIIIIHHHHHH', _ET_REL, _EM_RISCV, 1, 0, 0,
+                               shoff, 0, _EHDR_SIZE, 0, 0, _SHDR_SIZE,
+                               len(headers), len(headers) - 1)
+    return ehdr + b''.join(chunks)
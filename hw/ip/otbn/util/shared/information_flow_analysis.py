@@ -3,14 +3,15 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import os
 from copy import deepcopy
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple, cast
 
-from .cache import Cache, CacheEntry
 from .constants import ConstantContext, get_op_val_str
 from .control_flow import (ControlLoc, ControlGraph, Cycle, Ecall,
                            ImemEnd, LoopStart, Ret)
 from .decode import OTBNProgram
+from .disk_cache import DiskCache, files_digest, hash_key
 from .information_flow import InformationFlowGraph
 from .insn_yaml import Insn
 
@@ -39,28 +40,237 @@ IFlowResult = Tuple[Set[str], InformationFlowGraph, InformationFlowGraph,
                     Dict[str, Set[int]]]
 
 
-class IFlowCacheEntry(CacheEntry[ConstantContext, IFlowResult]):
-    '''Represents an entry in the cache for _get_iflow.
+# The cached results for one index of an IFlowCache. Results are grouped by
+# the (sorted) names of the constants that they used. Each group maps the
+# values of those constants to the result.
+_IFlowCacheIndex = Dict[Tuple[str, ...], Dict[Tuple[int, ...], IFlowResult]]
 
-    The key for the cache entry is the values of certain constants in the input
-    `constants` dictionary for the _get_iflow call that produced the cached
-    result. Only constants that were actually used in the process of computing
-    the result are stored in the key; if another call to _get_iflow has the
-    same values for those constants but different values for others, the result
-    should not change.
+
+def _graph_section(program: OTBNProgram, graph: ControlGraph,
+                   cycle_starts: Set[int], pc: int) -> Tuple[str, List[int]]:
+    '''A description of the section at pc and the PCs that follow it
+
+    The description covers the bounds of the section, its edges and whether
+    it starts a cycle, which is everything that _get_iflow looks at in the
+    graph (the instructions themselves are covered by the program key of the
+    cache). As well as the edges in the graph, the PCs that follow include the
+    ones that _get_iflow adds itself: the instruction after a loop and the
+    return address of a call.
     '''
-    def is_match(self, constants: ConstantContext) -> bool:
-        return constants.includes(self.key)
+    section, edges = graph.get_entry(pc)
+    parts = [hex(pc), hex(section.start), hex(section.end),
+             str(pc in cycle_starts)]
+    next_pcs = []
+    for edge in edges:
+        parts.append('{}:{:#x}'.format(type(edge).__name__, edge.pc))
+        if isinstance(edge, LoopStart):
+            parts.append(hex(edge.loop_end_pc))
+            next_pcs += [edge.loop_start_pc, edge.loop_end_pc + 4]
+        elif not edge.is_special():
+            next_pcs.append(edge.pc)
+
+    last_insn = program.get_insn(section.end)
+    if (last_insn.mnemonic == 'jal' and
+            program.get_operands(section.end)['grd'] == 1):
+        next_pcs.append(section.end + 4)
+
+    return ' '.join(parts), [p for p in next_pcs if p in graph.graph]
+
+
+def _graph_digests(program: OTBNProgram,
+                   graph: ControlGraph) -> Dict[int, str]:
+    '''Hashes of the part of the control graph reachable from each PC
 
+    The digest for a PC depends on exactly the sections reachable from it (as
+    described by _graph_section), so two graphs give the same digest for a PC
+    if and only if _get_iflow would explore the same code from there.
 
-class IFlowCache(Cache[int, ConstantContext, IFlowResult]):
+    Sections that can reach each other (a cycle, whether or not it is marked
+    in the graph) can all reach the same code, so the graph is split into
+    strongly connected components and each component is hashed together with
+    the hashes of the components that it leads to. The digest for a PC is
+    then its component's hash, tagged with the PC itself.
+    '''
+    cycle_starts = graph.get_cycle_starts()
+    descs = {}
+    succs = {}
+    for pc in graph.graph:
+        descs[pc], succs[pc] = _graph_section(program, graph, cycle_starts, pc)
+
+    # Tarjan's algorithm (without recursion, since the graphs can be deep).
+    # This finishes each component after every component that it leads to.
+    order: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: Set[int] = set()
+    component_of: Dict[int, str] = {}
+    for root in sorted(graph.graph):
+        if root in order:
+            continue
+        work = [(root, 0)]
+        while work:
+            pc, idx = work.pop()
+            if idx == 0:
+                order[pc] = low[pc] = len(order)
+                stack.append(pc)
+                on_stack.add(pc)
+            if idx < len(succs[pc]):
+                work.append((pc, idx + 1))
+                next_pc = succs[pc][idx]
+                if next_pc not in order:
+                    work.append((next_pc, 0))
+                elif next_pc in on_stack:
+                    low[pc] = min(low[pc], order[next_pc])
+                continue
+
+            if low[pc] == order[pc]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack.remove(member)
+                    members.append(member)
+                    if member == pc:
+                        break
+                members.sort()
+                below = {component_of[next_pc]
+                         for member in members
+                         for next_pc in succs[member]
+                         if next_pc in component_of}
+                digest = hash_key(*[descs[member] for member in members],
+                                  '', *sorted(below))
+                for member in members:
+                    component_of[member] = digest
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[pc])
+
+    return {pc: hash_key(hex(pc), digest)
+            for pc, digest in component_of.items()}
+
+
+def _analysis_digest() -> str:
+    '''A hash of the code and ISA description that iflow results depend on'''
+    shared_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(shared_dir)),
+                            'data')
+    return files_digest([os.path.join(shared_dir, '*.py'),
+                         os.path.join(data_dir, '*.yml')])
+
+
+class IFlowCache:
     '''Represents the cache for _get_iflow.
 
-    The index of the cache is the start PC for the call to _get_iflow. If this
-    index and the values of the constants used in the call match a new call,
-    the cached result is returned.
+    A result is indexed by a hash of the part of the control graph that
+    _get_iflow explores from its start PC (see _graph_digests) and the loop end
+    PC. This means that the cache can be shared between analyses of different
+    subroutines of a program: their graphs might differ, but a result is only
+    reused for a call that would explore the same code.
+
+    Each result also has a key: the values of the constants in the input
+    `constants` dictionary that were actually used in computing it. If
+    another call to _get_iflow has the same values for those constants but
+    different values for others, the result should not change. To avoid
+    checking every entry for an index, results are grouped by the names of
+    the constants that they used and then hashed by their values.
+
+    If store is not None, the cache is loaded from there (using program_key,
+    which should be a hash of the ELF file) and save() writes it back, so that
+    later runs can use the results.
+
+    A copy of the cache in another process (a forked worker, say) can pass
+    the results that it found back with take_added() and merge(), so that
+    only one process needs to save them.
     '''
-    pass
+    def __init__(self,
+                 store: Optional[DiskCache] = None,
+                 program_key: str = '') -> None:
+        self.entries: Dict[str, _IFlowCacheIndex] = {}
+        self._store = store
+        self._store_key = ''
+        self._dirty = False
+
+        # The results added since the last call to take_added()
+        self._added: Dict[str, _IFlowCacheIndex] = {}
+
+        # For each control graph that we've seen (keyed by the id of the
+        # graph, which is kept alive by the stored reference), the digests
+        # from _graph_digests.
+        self._digests: Dict[int, Tuple[ControlGraph, Dict[int, str]]] = {}
+
+        if store is not None:
+            self._store_key = hash_key('iflow', _analysis_digest(),
+                                       program_key)
+            loaded = store.get_pickle(self._store_key)
+            if isinstance(loaded, dict):
+                self.entries = loaded
+
+    def index(self, program: OTBNProgram, graph: ControlGraph, pc: int,
+              loop_end_pc: Optional[int]) -> str:
+        '''The index for a call to _get_iflow'''
+        memo = self._digests.get(id(graph))
+        if memo is None:
+            memo = (graph, _graph_digests(program, graph))
+            self._digests[id(graph)] = memo
+        return '{}:{}'.format(memo[1][pc], loop_end_pc)
+
+    def add(self, index: str, constants: ConstantContext,
+            result: IFlowResult) -> None:
+        '''Add a result whose key is constants'''
+        # Only add if there's no matching entry already
+        if self.lookup(index, constants) is not None:
+            return
+        names = tuple(sorted(constants.values))
+        values = tuple(constants.values[name] for name in names)
+        by_names = self.entries.setdefault(index, {})
+        by_names.setdefault(names, {})[values] = result
+        added = self._added.setdefault(index, {})
+        added.setdefault(names, {})[values] = result
+        self._dirty = True
+
+    def take_added(self) -> Dict[str, _IFlowCacheIndex]:
+        '''Get the results added since the last call, for merge()'''
+        added = self._added
+        self._added = {}
+        return added
+
+    def merge(self, entries: Dict[str, _IFlowCacheIndex]) -> None:
+        '''Add results taken from another copy of the cache'''
+        if entries:
+            _merge_entries(self.entries, entries)
+            self._dirty = True
+
+    def lookup(self, index: str,
+               constants: ConstantContext) -> Optional[IFlowResult]:
+        '''Find a result whose key matches constants'''
+        for names, by_values in self.entries.get(index, {}).items():
+            values = tuple(constants.get(name) for name in names)
+            result = by_values.get(cast(Tuple[int, ...], values))
+            if result is not None:
+                return result
+        return None
+
+    def save(self) -> None:
+        '''Write the cache back to its store (if it has one)'''
+        if self._store is None or not self._dirty:
+            return
+
+        # Merge with anything that another run saved in the meantime.
+        entries = self._store.get_pickle(self._store_key)
+        if not isinstance(entries, dict):
+            entries = {}
+        _merge_entries(entries, self.entries)
+
+        self._store.put_pickle(self._store_key, entries)
+        self._dirty = False
+
+
+def _merge_entries(entries: Dict[str, _IFlowCacheIndex],
+                   other: Dict[str, _IFlowCacheIndex]) -> None:
+    '''Add the IFlowCache entries in other to entries'''
+    for index, by_names in other.items():
+        old_by_names = entries.setdefault(index, {})
+        for names, by_values in by_names.items():
+            old_by_names.setdefault(names, {}).update(by_values)
 
 
 # The information flow of a subroutine is represented as a tuple whose entries
@@ -188,7 +398,7 @@ def _get_constant_loop_iterations(insn: Insn, op_vals: Dict[str, int],
     assert False
 
 
-def _get_iflow_cache_update(pc: int, constants: ConstantContext,
+def _get_iflow_cache_update(index: str, constants: ConstantContext,
                             result: IFlowResult, cache: IFlowCache) -> None:
     '''Updates the cache for _get_iflow.'''
     used_constants = result[0]
@@ -198,7 +408,7 @@ def _get_iflow_cache_update(pc: int, constants: ConstantContext,
         assert value is not None
         used_constant_values.set(name, value)
 
-    cache.add(pc, IFlowCacheEntry(used_constant_values, result))
+    cache.add(index, used_constant_values, result)
 
     return
 
@@ -286,7 +496,8 @@ def _get_iflow(program: OTBNProgram, graph: ControlGraph, start_pc: int,
     Caches results from recursive calls (updating input cache). Does not modify
     start_constants.
     '''
-    cached = cache.lookup(start_pc, start_constants)
+    cache_index = cache.index(program, graph, start_pc, loop_end_pc)
+    cached = cache.lookup(cache_index, start_constants)
     if cached is not None:
         return cached
 
@@ -340,9 +551,9 @@ def _get_iflow(program: OTBNProgram, graph: ControlGraph, start_pc: int,
     last_insn_used_constants, last_insn_iflow = _build_iflow_insn(
         last_insn, last_op_vals, section.end, constants)
 
-    # Update used constants to include last instruction
-    used_constants.update(
-        last_insn_iflow.sources_for_any(last_insn_used_constants))
+    # Update used constants to include last instruction (tracing the
+    # constants it uses back through the rest of the section)
+    used_constants.update(iflow.sources_for_any(last_insn_used_constants))
 
     # Update control_deps to include last instruction
     last_insn_control_deps = {
@@ -364,6 +575,12 @@ def _get_iflow(program: OTBNProgram, graph: ControlGraph, start_pc: int,
         iterations = _get_constant_loop_iterations(last_insn, last_op_vals,
                                                    constants)
 
+        # The result depends on the number of iterations, so the register
+        # holding it (if any) counts as a used constant.
+        if iterations is not None and last_insn.mnemonic == 'loop':
+            used_constants.update(iflow.sources(
+                get_op_val_str(last_insn, last_op_vals, 'grs')))
+
         # Update the constants to include the loop instruction
         constants.update_insn(last_insn, last_op_vals)
 
@@ -525,16 +742,21 @@ def _get_iflow(program: OTBNProgram, graph: ControlGraph, start_pc: int,
     out = (used_constants, return_iflow, program_end_iflow, common_consts,
            cycles, control_deps)
 
-    _get_iflow_cache_update(start_pc, start_constants, out, cache)
+    _get_iflow_cache_update(cache_index, start_constants, out, cache)
     return out
 
 
-def get_subroutine_iflow(program: OTBNProgram,
-                         graph: ControlGraph,
-                         subroutine_name: str,
-                         start_constants: Dict[str, int]) -> SubroutineIFlow:
+def get_subroutine_iflow(
+        program: OTBNProgram,
+        graph: ControlGraph,
+        subroutine_name: str,
+        start_constants: Dict[str, int],
+        cache: Optional[IFlowCache] = None) -> SubroutineIFlow:
     '''Gets the information-flow graphs for the subroutine.
 
+    If cache is not None, it is used for (and updated with) the results of
+    the analysis, so that they can be reused by other calls.
+
     Returns three items:
     1. The combined information flow for control paths that return from the
        subroutine to its caller (None if there are no such paths)
@@ -551,7 +773,8 @@ def get_subroutine_iflow(program: OTBNProgram,
     constants = ConstantContext(start_constants)
     start_pc = program.get_pc_at_symbol(subroutine_name)
     _, ret_iflow, end_iflow, _, cycles, control_deps = _get_iflow(
-        program, graph, start_pc, constants, None, IFlowCache())
+        program, graph, start_pc, constants, None,
+        IFlowCache() if cache is None else cache)
     if cycles:
         for pc in cycles:
             print(cycles[pc].pretty())
@@ -565,9 +788,12 @@ def get_subroutine_iflow(program: OTBNProgram,
 
 
 def get_program_iflow(program: OTBNProgram,
-                      graph: ControlGraph) -> ProgramIFlow:
+                      graph: ControlGraph,
+                      cache: Optional[IFlowCache] = None) -> ProgramIFlow:
     '''Gets the information-flow graph for the whole program.
 
+    If cache is not None, it is used as for get_subroutine_iflow.
+
     Returns two items:
     1. The combined information flow for control paths ending in the end of the
        program (e.g. ECALL or the end of IMEM)
@@ -576,7 +802,7 @@ def get_program_iflow(program: OTBNProgram,
     '''
     _, ret_iflow, end_iflow, _, cycles, control_deps = _get_iflow(
         program, graph, program.min_pc(), ConstantContext.empty(), None,
-        IFlowCache())
+        IFlowCache() if cache is None else cache)
     if cycles:
         raise RuntimeError('Unresolved cycles; start PCs: {}'.format(', '.join(
             ['{:#x}'.format(k) for k in cycles.keys()])))
@@ -606,7 +832,7 @@ def stringify_control_deps(program: OTBNProgram,
         pc_strings = []
         if len(pcs) == 0:
             continue
-        for pc in pcs:
+        for pc in sorted(pcs):
             insn = program.get_insn(pc)
             pc_strings.append('{} at PC {:#x}'.format(insn.mnemonic, pc))
         out.append('{} (via {})'.format(node, ', '.join(pc_strings)))
@@ -11,7 +11,7 @@
 import itertools
 import os
 import re
-from typing import Dict, List, Optional, Tuple, cast
+from typing import Dict, List, Optional, Pattern, Tuple, cast
 
 from serialize.parse_helpers import (check_keys, check_str, check_bool,
                                      check_list, index_list, get_optional_str,
@@ -114,8 +114,11 @@ class Insn:
             self.syntax = InsnSyntax.from_list([op.name
                                                 for op in self.operands])
 
+        # The regex that matches the operands in assembly code is compiled on
+        # first use (see asm_pattern): most users only need a few of them.
         pattern, op_to_grp = self.syntax.asm_pattern()
-        self.asm_pattern = re.compile(pattern)
+        self._asm_pattern_str = pattern
+        self._asm_pattern: Optional[Pattern[str]] = None
         self.pattern_op_to_grp = op_to_grp
 
         # Make sure we have exactly the operands we expect.
@@ -174,6 +177,13 @@ class Insn:
         self.iflow = InsnInformationFlow.from_yaml(yd.get('iflow', None),
                                                    iflow_what, self.operands)
 
+    @property
+    def asm_pattern(self) -> Pattern[str]:
+        '''A regex that matches the operands of the instruction'''
+        if self._asm_pattern is None:
+            self._asm_pattern = re.compile(self._asm_pattern_str)
+        return self._asm_pattern
+
     def enc_vals_to_op_vals(self,
                             cur_pc: int,
                             enc_vals: Dict[str, int]) -> Dict[str, int]:
@@ -283,6 +293,81 @@ class InsnGroups:
                                        self.groups, lambda ig: ig.key)
 
 
+class _DecodeNode:
+    '''A node in the decision tree that maps instruction words to mnemonics
+
+    An internal node has a nonzero mask, which is a set of bits that are fixed
+    (either always zero or always one) for every instruction that can reach
+    it. Its children are keyed by the value of the word under that mask. A
+    leaf node has a mask of zero and holds the (few) remaining candidates,
+    which are checked one by one.
+
+    The tree is built once per InsnsFile, so decoding a word costs a handful of
+    dictionary lookups rather than a scan over every instruction's masks.
+
+    '''
+    def __init__(self,
+                 mask: int,
+                 children: Dict[int, '_DecodeNode'],
+                 candidates: List[Tuple[str, int, int]]) -> None:
+        self.mask = mask
+        self.children = children
+        self.candidates = candidates
+
+    @staticmethod
+    def build(candidates: List[Tuple[str, int, int]],
+              used: int) -> '_DecodeNode':
+        '''Build a decision tree for candidates
+
+        Each candidate is a triple (mnem, m0, m1) where m0 and m1 are the
+        exclusive zeros/ones masks returned by InsnsFile._get_masks. used is
+        the set of bits that have already been examined by the nodes above
+        this one.
+
+        '''
+        if len(candidates) <= 1:
+            return _DecodeNode(0, {}, candidates)
+
+        # Find the bits that every candidate fixes to some value and that we
+        # haven't looked at already. If there aren't any, we can't split the
+        # candidates any further.
+        mask = ((1 << 32) - 1) & ~used
+        for _, m0, m1 in candidates:
+            mask &= m0 | m1
+        if mask == 0:
+            return _DecodeNode(0, {}, candidates)
+
+        groups: Dict[int, List[Tuple[str, int, int]]] = {}
+        for cand in candidates:
+            groups.setdefault(cand[2] & mask, []).append(cand)
+
+        children = {key: _DecodeNode.build(grp, used | mask)
+                    for key, grp in groups.items()}
+        return _DecodeNode(mask, children, [])
+
+    def lookup(self, word: int) -> Optional[str]:
+        '''Find the mnemonic for word, or None if there is none'''
+        node = self
+        while node.mask:
+            child = node.children.get(word & node.mask)
+            if child is None:
+                return None
+            node = child
+
+        ret = None
+        for mnem, m0, m1 in node.candidates:
+            # If any bit is set that should be zero or if any bit is clear that
+            # should be one, ignore this instruction.
+            if word & m0 or (~ word) & m1:
+                continue
+
+            # Belt-and-braces ambiguity check
+            assert ret is None
+            ret = mnem
+
+        return ret
+
+
 class InsnsFile:
     def __init__(self,
                  path: str,
@@ -326,6 +411,8 @@ class InsnsFile:
                              ', '.join(ambiguities))
 
         self._masks = masks_exc
+        self._decode_tree = _DecodeNode.build(
+            [(mnem, m0, m1) for mnem, (m0, m1) in masks_exc.items()], 0)
 
     def grouped_insns(self) -> List[Tuple[InsnGroup, List[Insn]]]:
         '''Return the instructions in groups'''
@@ -378,18 +465,7 @@ class InsnsFile:
         If there is no such instruction, return None.
 
         '''
-        ret = None
-        for mnem, (m0, m1) in self._masks.items():
-            # If any bit is set that should be zero or if any bit is clear that
-            # should be one, ignore this instruction.
-            if word & m0 or (~ word) & m1:
-                continue
-
-            # Belt-and-braces ambiguity check
-            assert ret is None
-            ret = mnem
-
-        return ret
+        return self._decode_tree.lookup(word)
 
 
 def load_file(path: str, isrs: Optional[IsrMaps]) -> InsnsFile:
@@ -421,18 +497,21 @@ def make_isr_dict(path: str) -> IsrMap:
                            .format(path, err)) from None
 
 
-_DEFAULT_INSNS_FILE: Optional[InsnsFile] = None
+# Loaded instruction files, keyed by BNMULV version id
+_DEFAULT_INSNS_FILES: Dict[str, InsnsFile] = {}
 
 
 def load_insns_yaml(bnmulv_version_id: str = '0') -> InsnsFile:
     '''Load the insns.yml file from its default location.
 
-    Caches its result. Raises a RuntimeError on syntax or schema error.
+    The file that gets loaded depends on bnmulv_version_id: version 0 uses
+    insns.yml and any other version uses insns-ver<N>.yml. Caches its result
+    for each version. Raises a RuntimeError on syntax or schema error.
 
     '''
-    global _DEFAULT_INSNS_FILE
-    if _DEFAULT_INSNS_FILE is not None:
-        return _DEFAULT_INSNS_FILE
+    cached = _DEFAULT_INSNS_FILES.get(bnmulv_version_id)
+    if cached is not None:
+        return cached
 
     dirname = os.path.dirname(__file__)
     data_path = os.path.normpath(os.path.join(dirname, '..', '..', 'data'))
@@ -441,11 +520,15 @@ def load_insns_yaml(bnmulv_version_id: str = '0') -> InsnsFile:
     wsrs = make_isr_dict(os.path.join(data_path, 'wsr.yml'))
 
     if bnmulv_version_id == '0':
-        _DEFAULT_INSNS_FILE = load_file(os.path.join(data_path, 'insns.yml'),
-                                        IsrMaps(csrs, wsrs))
+        insns_path = os.path.join(data_path, 'insns.yml')
     else:
-        _DEFAULT_INSNS_FILE = load_file(os.path.join(data_path,
-                                        f'insns-ver{bnmulv_version_id}.yml'),
-                                        IsrMaps(csrs, wsrs))
-
-    return _DEFAULT_INSNS_FILE
+        insns_path = os.path.join(data_path,
+                                  f'insns-ver{bnmulv_version_id}.yml')
+    if not os.path.exists(insns_path):
+        raise RuntimeError('Unknown BNMULV version {!r}: no instruction '
+                           'file at {!r}.'
+                           .format(bnmulv_version_id, insns_path))
+
+    insns_file = load_file(insns_path, IsrMaps(csrs, wsrs))
+    _DEFAULT_INSNS_FILES[bnmulv_version_id] = insns_file
+    return insns_file
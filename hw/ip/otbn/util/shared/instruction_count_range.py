@@ -5,12 +5,14 @@
 
 from enum import Enum
 from math import inf
-from typing import Optional, Tuple
+from typing import Dict, Optional, Set, Tuple, Union
 
+from .constants import ConstantContext, get_op_val_str
 from .control_flow import (ControlGraph, Cycle, Ecall, ImemEnd, LoopEnd,
                            LoopStart, Ret, program_control_graph,
                            subroutine_control_graph)
 from .decode import OTBNProgram
+from .section import CodeSection
 
 
 class StopPoint(Enum):
@@ -19,138 +21,404 @@ class StopPoint(Enum):
     ECALL = 'ecall'
 
 
-def _get_insn_count_range(program: OTBNProgram, graph: ControlGraph,
-                          start_pc: int,
-                          stop_at: StopPoint) -> Tuple[int, int]:
-    '''Return minimum and maximum instruction counts across control paths.
+# A monomial is a sorted tuple of variable names; the empty tuple is the
+# constant term.
+Monomial = Tuple[str, ...]
+
+
+class InsnCount:
+    '''An instruction count that may depend on symbolic loop bounds.
+
+    The count is a polynomial with non-negative coefficients over variables
+    that stand for iteration counts which cannot be read off the program
+    text:
+
+      - `xN@0x...` is the value of loop-count register xN each time the `loop`
+        instruction at that PC runs
+      - `cycle@0x...` is the number of times control jumps back to that PC each
+        time the code starting there is reached (e.g. the retries of a
+        rejection-sampling loop written with branches)
+
+    If a variable takes different values at different times, the maximum is
+    still an upper bound when evaluated with the largest value and the minimum
+    is still a lower bound when evaluated with the smallest one, because every
+    coefficient is non-negative.
+
+    A count with no upper bound at all (e.g. from recursion) is represented by
+    an infinite constant term and no other terms.
+    '''
+    def __init__(self, terms: Dict[Monomial, Union[int, float]]) -> None:
+        if inf in terms.values():
+            self.terms = {(): inf}  # type: Dict[Monomial, Union[int, float]]
+        else:
+            self.terms = {m: c for m, c in terms.items() if c != 0}
+
+    @staticmethod
+    def constant(value: Union[int, float]) -> 'InsnCount':
+        return InsnCount({(): value})
+
+    @staticmethod
+    def variable(name: str) -> 'InsnCount':
+        return InsnCount({(name, ): 1})
+
+    def is_unbounded(self) -> bool:
+        return self.terms.get((), 0) == inf
+
+    def variables(self) -> Set[str]:
+        return {name for monomial in self.terms for name in monomial}
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, InsnCount) and self.terms == other.terms
+
+    def __add__(self, other: 'InsnCount') -> 'InsnCount':
+        terms = self.terms.copy()
+        for monomial, coeff in other.terms.items():
+            terms[monomial] = terms.get(monomial, 0) + coeff
+        return InsnCount(terms)
+
+    def __mul__(self, other: 'InsnCount') -> 'InsnCount':
+        terms = {}  # type: Dict[Monomial, Union[int, float]]
+        for m1, c1 in self.terms.items():
+            for m2, c2 in other.terms.items():
+                monomial = tuple(sorted(m1 + m2))
+                terms[monomial] = terms.get(monomial, 0) + c1 * c2
+        return InsnCount(terms)
+
+    def lower(self, other: 'InsnCount') -> 'InsnCount':
+        '''Return a count that is at most both self and other.
+
+        Takes the smaller coefficient for each monomial; since variables are
+        non-negative, the result is a lower bound for both inputs.
+        '''
+        monomials = set(self.terms) | set(other.terms)
+        return InsnCount({
+            m: min(self.terms.get(m, 0), other.terms.get(m, 0))
+            for m in monomials
+        })
+
+    def upper(self, other: 'InsnCount') -> 'InsnCount':
+        '''Return a count that is at least both self and other.
 
-    In the presence of control-flow cycles or loops with a non-constant
-    number of iterations, the maximum number of iterations will be
-    None, because there's no clear maximum number of times the loop/cycle
-    could run.
+        Takes the larger coefficient for each monomial; since variables are
+        non-negative, the result is an upper bound for both inputs.
+        '''
+        monomials = set(self.terms) | set(other.terms)
+        return InsnCount({
+            m: max(self.terms.get(m, 0), other.terms.get(m, 0))
+            for m in monomials
+        })
+
+    def substitute(self, values: Dict[str, int]) -> 'InsnCount':
+        '''Replace the variables in `values` by their values.'''
+        terms = {}  # type: Dict[Monomial, Union[int, float]]
+        for monomial, coeff in self.terms.items():
+            remaining = []
+            for name in monomial:
+                if name in values:
+                    coeff *= values[name]
+                else:
+                    remaining.append(name)
+            terms[tuple(remaining)] = terms.get(tuple(remaining), 0) + coeff
+        return InsnCount(terms)
+
+    def to_int(self) -> Optional[int]:
+        '''Return the count as an integer if it is constant and bounded.'''
+        if self.variables() or self.is_unbounded():
+            return None
+        return int(self.terms.get((), 0))
+
+    def __str__(self) -> str:
+        if self.is_unbounded():
+            return 'unbounded'
+        parts = [str(self.terms.get((), 0))]
+        for monomial in sorted(m for m in self.terms if m):
+            parts.append('*'.join([str(self.terms[monomial])] +
+                                  list(monomial)))
+        return ' + '.join(parts)
+
+
+InsnCountRange = Tuple[InsnCount, InsnCount]
+
+# Instruction count ranges from a PC, keyed by where the paths end: a
+# StopPoint, the start PC of an enclosing cycle that the path jumps back to, or
+# None for paths whose length cannot be bounded at all.
+_EndKey = Union[StopPoint, int, None]
+_CountRanges = Dict[_EndKey, InsnCountRange]
+
+_ZERO = InsnCount.constant(0)
+_UNBOUNDED = InsnCount.constant(inf)
+
+
+def _shift(ranges: _CountRanges, lo: InsnCount,
+           hi: InsnCount) -> _CountRanges:
+    '''Add (lo, hi) to every range in `ranges`.'''
+    return {key: (key_lo + lo, key_hi + hi)
+            for key, (key_lo, key_hi) in ranges.items()}
+
+
+def _finish(ranges: _CountRanges, stop_at: StopPoint,
+            where: int) -> InsnCountRange:
+    '''Combine the ranges for a region that should end at `stop_at`.
 
     The `stop_at` parameter indicates the expected end point of the control
     flow path(s) from this starting point. It is not currently supported for
     control flow paths from a single start point to have different endings --
     for instance, for one branch to end the program with `ecall` and another to
-    return to the caller with `ret`. This is because, for instance, if this
-    function is called recursively on a subroutine (stop_at = RET), then the
-    caller needs to know the min/max instruction count *after the subroutine
-    call returns*, and it would require substantial additional tracking to
-    account for some additional, separate path that ends the program entirely.
-
-    In all cases, the function will raise an error if it encounters one of the
-    other stopping points; for instance, if an `ecall` instruction appears when
-    `stop_at` = RET, then there will be an error. The function will return the
-    min/max instruction counts across *all control-flow paths* from the given
-    start point to the stopping point.
+    return to the caller with `ret`. This is because, for instance, if a
+    subroutine is called (stop_at = RET), then the caller needs to know the
+    min/max instruction count *after the subroutine call returns*, and it would
+    require substantial additional tracking to account for some additional,
+    separate path that ends the program entirely.
+
+    Paths that jump back to a cycle outside the region or cannot be bounded
+    end up at `stop_at` after an unknown number of instructions, so they only
+    contribute to the minimum.
     '''
+    lo = None  # type: Optional[InsnCount]
+    hi = _ZERO
+    for key, (key_lo, key_hi) in ranges.items():
+        if isinstance(key, StopPoint):
+            assert key == stop_at, (
+                f'Unexpected {key.value} reached from PC {where:#x} '
+                f'(expected {stop_at.value})')
+        else:
+            key_hi = _UNBOUNDED
+        lo = key_lo if lo is None else lo.lower(key_lo)
+        hi = hi.upper(key_hi)
+    assert lo is not None, (
+        f'No control-flow path from PC {where:#x} reaches a {stop_at.value}')
+    return (lo, hi)
+
+
+def _describe_pc(program: OTBNProgram, pc: int) -> str:
+    '''Name a PC relative to the closest preceding symbol, for humans.'''
+    best = None  # type: Optional[Tuple[int, int, str]]
+    for symbol, addr in program.symbols.items():
+        if not symbol or '/' in symbol or addr > pc:
+            continue
+        # Prefer the closest symbol, then the longest name over short aliases
+        # like register names that happen to share the address.
+        cand = (addr, len(symbol), symbol)
+        if best is None or cand > best:
+            best = cand
+    if best is None:
+        return f'{pc:#x}'
+    addr, _, symbol = best
+    return symbol if addr == pc else f'{symbol}+{pc - addr:#x}'
+
+
+def resolve_variable(program: OTBNProgram, name: str) -> str:
+    '''Return the InsnCount variable for a name given by a user.
+
+    As well as a PC, the location after the @ can be a symbol with an optional
+    offset, as printed by _describe_pc (e.g. x5@keccak_send_message+0x8).
+    Raises a ValueError if the name is malformed or the symbol is unknown.
+    '''
+    what, sep, where = name.partition('@')
+    if not sep or not what or not where:
+        raise ValueError(f'Bad variable name {name!r}: expected '
+                         'NAME@LOCATION.')
+    symbol, plus, offset = where.partition('+')
+    if plus or not where.startswith('0x'):
+        if symbol not in program.symbols:
+            raise ValueError(f'Unknown symbol {symbol!r} in variable name '
+                             f'{name!r}.')
+        pc = program.symbols[symbol]
+        where = offset if plus else '0'
+    else:
+        pc = 0
+    try:
+        pc += int(where, 0)
+    except ValueError:
+        raise ValueError(f'Bad offset in variable name {name!r}.') from None
+    return f'{what}@{pc:#x}'
+
+
+def describe_variable(program: OTBNProgram, name: str) -> str:
+    '''Return a human-readable explanation of an InsnCount variable.'''
+    what, _, pc_str = name.partition('@')
+    where = _describe_pc(program, int(pc_str, 16))
+    if what == 'cycle':
+        return f'times control jumps back to {where}'
+    return f'{what} at the loop instruction at {where}'
+
+
+def _loop_iterations(program: OTBNProgram,
+                     section: CodeSection) -> InsnCount:
+    '''Return the iteration count of the loop ending `section`.
+
+    For `loop`, the count register is resolved if the section itself sets it
+    to a constant; otherwise the count is a variable named after the register
+    and the PC of the `loop` instruction.
+    '''
+    insn = program.get_insn(section.end)
+    op_vals = program.get_operands(section.end)
+    if insn.mnemonic == 'loopi':
+        return InsnCount.constant(op_vals['iterations'])
+
+    grs = get_op_val_str(insn, op_vals, 'grs')
+    constants = ConstantContext.empty()
+    for pc in range(section.start, section.end, 4):
+        constants.update_insn(program.get_insn(pc), program.get_operands(pc))
+    value = constants.get(grs)
+    if value is not None:
+        return InsnCount.constant(value)
+    return InsnCount.variable(f'{grs}@{section.end:#x}')
+
+
+def _get_insn_count_ranges(program: OTBNProgram, graph: ControlGraph,
+                           start_pc: int,
+                           memo: Dict[int, _CountRanges]) -> _CountRanges:
+    '''Return minimum and maximum instruction counts across control paths.
+
+    The result maps each way the paths from `start_pc` can end (see
+    `_CountRanges`) to the range of instruction counts for those paths. The
+    result at a PC does not depend on how it was reached, so it is memoised in
+    `memo` and every subroutine or shared tail is only analysed once per graph.
+
+    When `start_pc` is the target of Cycle edges, the paths that jump back to
+    it are folded into the others: each pass round the cycle costs one of
+    their counts and the number of passes is a `cycle@` variable.
+    '''
+    cached = memo.get(start_pc)
+    if cached is not None:
+        return cached
+
     section, edges = graph.get_entry(start_pc)
-    sec_count = len(section.get_insn_sequence(program))
+    sec_count = InsnCount.constant(len(section.get_insn_sequence(program)))
 
     # Special case for when we're in a loop; if we have the loop end and one
     # other edge, this represents the option to either continue the loop or
     # stop. In this case, we don't want to follow the "stop" branch, but rather
     # simply return the min/max from ending the loop here.
     if any([isinstance(e, LoopEnd) for e in edges]):
-        assert stop_at == StopPoint.LOOP_END
         # At a loop end, we expect exactly two edges; one to end the loop and
         # one to go back to the start and do another iteration.
         assert len(edges) == 2
-        return (sec_count, sec_count)
+        memo[start_pc] = {StopPoint.LOOP_END: (sec_count, sec_count)}
+        return memo[start_pc]
 
     # Find the minimum/maximum instruction counts for all next edges.
-    min_count = inf
-    max_count = sec_count
+    ranges: _CountRanges = {}
     for loc in edges:
+        loc_ranges: _CountRanges
         if isinstance(loc, Ecall) or isinstance(loc, ImemEnd):
-            assert stop_at == StopPoint.ECALL
-            loc_min, loc_max = 0, 0
+            loc_ranges = {StopPoint.ECALL: (_ZERO, _ZERO)}
         elif isinstance(loc, Ret):
-            assert stop_at == StopPoint.RET
-            loc_min, loc_max = 0, 0
+            loc_ranges = {StopPoint.RET: (_ZERO, _ZERO)}
         elif isinstance(loc, LoopEnd):
             # All LoopEnds should have been handled above!
             assert False, f'Unexpected loop end at PC {section.end:#x}'
         elif isinstance(loc, LoopStart):
-            # Calculate the number of iterations if possible.
-            insn = program.get_insn(section.end)
-            if insn.mnemonic == 'loopi':
-                op_vals = program.get_operands(section.end)
-                num_iterations = op_vals['iterations']
-                loop_min, loop_max = _get_insn_count_range(
-                    program, graph, loc.loop_start_pc, StopPoint.LOOP_END)
-                loop_min *= num_iterations
-                loop_max *= num_iterations
-            else:
-                # Cannot determine # iterations statically.
-                loop_min, loop_max = 0, inf
-
-            # Calculate the instruction count range after the loop.
-            post_loop_min, post_loop_max = _get_insn_count_range(
-                program, graph, loc.loop_end_pc + 4, stop_at)
-            loc_min = loop_min + post_loop_min
-            loc_max = loop_max + post_loop_max
+            # Count one iteration of the loop body and scale it by the number
+            # of iterations, then add the range after the loop.
+            iterations = _loop_iterations(program, section)
+            body_min, body_max = _finish(
+                _get_insn_count_ranges(program, graph, loc.loop_start_pc,
+                                       memo),
+                StopPoint.LOOP_END, loc.loop_start_pc)
+            loc_ranges = _shift(
+                _get_insn_count_ranges(program, graph, loc.loop_end_pc + 4,
+                                       memo), body_min * iterations,
+                body_max * iterations)
         elif isinstance(loc, Cycle):
-            # For cycles, the minimum is 0 (if the cycle is never traversed)
-            # and the maximum is None (because we can't easily calculate
-            # statically how many times the cycle will be traversed).
-            loc_min, loc_max = 0, inf
+            operands = program.get_operands(section.end)
+            if (program.get_insn(section.end).mnemonic == 'jal' and
+                    operands['grd'] == 1):
+                # A recursive call; we can't bound how deep it goes.
+                loc_ranges = {None: (_ZERO, _UNBOUNDED)}
+            else:
+                # Jumping back to the start of the cycle; this is resolved
+                # once we get back out to the cycle's start PC.
+                loc_ranges = {loc.pc: (_ZERO, _ZERO)}
         else:
             insn = program.get_insn(section.end)
             operands = program.get_operands(section.end)
             if insn.mnemonic == 'jal' and operands['grd'] == 1:
                 # Jumping to another subroutine; count the range for the
-                # subroutine itself.
-                jump_min, jump_max = _get_insn_count_range(
-                    program, graph, loc.pc, StopPoint.RET)
-                # Calculate the instruction count range after returning from
-                # the jump.
-                post_jump_min, post_jump_max = _get_insn_count_range(
-                    program, graph, section.end + 4, stop_at)
-                loc_min = jump_min + post_jump_min
-                loc_max = jump_max + post_jump_max
+                # subroutine itself, then add the range after it returns.
+                jump_min, jump_max = _finish(
+                    _get_insn_count_ranges(program, graph, loc.pc, memo),
+                    StopPoint.RET, loc.pc)
+                loc_ranges = _shift(
+                    _get_insn_count_ranges(program, graph, section.end + 4,
+                                           memo), jump_min, jump_max)
             else:
                 # If not a jump, then this is just a normal PC (i.e. a branch).
                 # Follow the branch to get the min/max range.
-                loc_min, loc_max = _get_insn_count_range(
-                    program, graph, loc.pc, stop_at)
+                loc_ranges = _get_insn_count_ranges(program, graph, loc.pc,
+                                                    memo)
 
         # Merge the min/max for this location into the final result
-        min_count = min(min_count, sec_count + loc_min)
-        max_count = max(max_count, sec_count + loc_max)
+        for key, (loc_min, loc_max) in loc_ranges.items():
+            loc_min, loc_max = sec_count + loc_min, sec_count + loc_max
+            if key in ranges:
+                old_min, old_max = ranges[key]
+                loc_min, loc_max = old_min.lower(loc_min), old_max.upper(
+                    loc_max)
+            ranges[key] = (loc_min, loc_max)
+
+    # Fold in any paths that jump back here (see docstring).
+    if start_pc in ranges:
+        cycle_min, cycle_max = ranges.pop(start_pc)
+        passes = InsnCount.variable(f'cycle@{start_pc:#x}')
+        ranges = _shift(ranges, cycle_min * passes, cycle_max * passes)
+
+    memo[start_pc] = ranges
+    return ranges
+
+
+def program_insn_count_bounds(program: OTBNProgram) -> InsnCountRange:
+    '''Return symbolic minimum and maximum instruction counts for the program.
+
+    Starts at graph.start and returns the instruction counts for all paths
+    that lead to the end of the program.
+    '''
+    graph = program_control_graph(program)
+    return _finish(_get_insn_count_ranges(program, graph, graph.start, {}),
+                   StopPoint.ECALL, graph.start)
+
 
-    return (min_count, max_count)
+def subroutine_insn_count_bounds(program: OTBNProgram,
+                                 subroutine: str) -> InsnCountRange:
+    '''Return symbolic minimum and maximum instruction counts for a subroutine.
+
+    Starts at graph.start and returns the instruction counts for all paths
+    that lead to a return to the original caller. If a path leads to the
+    program ending (i.e. an `ecall` instruction), then there will be an error.
+    '''
+    graph = subroutine_control_graph(program, subroutine)
+    return _finish(_get_insn_count_ranges(program, graph, graph.start, {}),
+                   StopPoint.RET, graph.start)
+
+
+def _concrete_range(bounds: InsnCountRange) -> Tuple[int, Optional[int]]:
+    '''Turn symbolic bounds into the best concrete ones.
+
+    Every variable is at least 0, so the minimum with all variables set to 0 is
+    still a lower bound. The maximum is None unless it is a constant.
+    '''
+    min_count, max_count = bounds
+    lo = min_count.substitute({v: 0 for v in min_count.variables()}).to_int()
+    assert lo is not None
+    return lo, max_count.to_int()
 
 
 def program_insn_count_range(
         program: OTBNProgram) -> Tuple[int, Optional[int]]:
     '''Return minimum and maximum instruction counts for the program.
 
-    Wrapper for `_get_insn_count_range` that works on the full program; it
-    starts at graph.start and returns the instruction counts for all paths that
-    lead to the end of the program.
+    Concrete version of `program_insn_count_bounds`; the maximum is None if it
+    depends on data-dependent loops or cycles.
     '''
-    graph = program_control_graph(program)
-    min_count, max_count = _get_insn_count_range(program, graph, graph.start,
-                                                 StopPoint.ECALL)
-    if max_count == inf:
-        max_count = None
-    return min_count, max_count
+    return _concrete_range(program_insn_count_bounds(program))
 
 
 def subroutine_insn_count_range(program: OTBNProgram,
                                 subroutine: str) -> Tuple[int, Optional[int]]:
     '''Return minimum and maximum instruction counts for the subroutine.
 
-    Wrapper for `_get_insn_count_range` that works on a subroutine; it starts
-    at graph.start and returns the instruction counts for all paths that lead
-    to a return to the original caller. If a path leads to the program ending
-    (i.e. an `ecall` instruction), then there will be an error.
+    Concrete version of `subroutine_insn_count_bounds`; the maximum is None if
+    it depends on data-dependent loops or cycles.
     '''
-    graph = subroutine_control_graph(program, subroutine)
-    min_count, max_count = _get_insn_count_range(program, graph, graph.start,
-                                                 StopPoint.RET)
-    if max_count == inf:
-        max_count = None
-    return min_count, max_count
+    return _concrete_range(subroutine_insn_count_bounds(program, subroutine))
@@ -330,8 +330,45 @@ def _otbn_consttime_test_impl(ctx):
     runfiles = runfiles.merge(ctx.attr._checker[DefaultInfo].default_runfiles)
     return [DefaultInfo(runfiles = runfiles)]
 
+def _otbn_consttime_audit_test_impl(ctx):
+    """This rule audits subroutines of several programs for constant time.
+
+    It runs the same check as otbn_consttime_test, but for every check in a
+    JSON manifest (see the Python script's documentation for the format) and
+    on every `.elf` file provided by the dependencies, in one run of the
+    checker. The analyses are spread over worker processes.
+    """
+
+    # Extract the output .elf files from the output groups.
+    elfs = [f for t in ctx.attr.deps for f in t[OutputGroupInfo].elf.to_list()]
+    if len(elfs) == 0:
+        fail("Expected at least one .elf file in dependencies")
+
+    # Write a very simple script that runs the checker.
+    script_content = "{} --manifest {} {}".format(
+        ctx.executable._checker.short_path,
+        ctx.file.manifest.short_path,
+        " ".join([elf.short_path for elf in elfs]),
+    )
+    ctx.actions.write(
+        output = ctx.outputs.executable,
+        content = script_content,
+    )
+
+    # The .elf files and the manifest must be added to runfiles in order to be
+    # visible to the test at runtime, along with the checker's runfiles.
+    runfiles = ctx.runfiles(files = elfs + [ctx.file.manifest])
+    runfiles = runfiles.merge(ctx.attr._checker[DefaultInfo].default_runfiles)
+    return [DefaultInfo(runfiles = runfiles)]
+
 def _otbn_insn_count_range(ctx):
     """This rule gets min/max possible instruction counts for an OTBN program.
+
+    If `subroutine` is set, the counts are for that subroutine instead. The
+    counts can depend on variables for data-dependent iteration counts, and
+    `bounds` substitutes values for them ("NAME=VALUE"). Unless `max_count` is
+    -1 (the default), the build fails unless the maximum is known and at most
+    `max_count`.
     """
 
     # Extract the .elf file to check from the dependency list.
@@ -340,12 +377,23 @@ def _otbn_insn_count_range(ctx):
         fail("Expected only one .elf file in dependencies, got: " + str(elf))
     elf = elf[0]
 
-    # Command to run the counter script and extract the min/max values.
+    # Command to run the counter script and extract the min/max values. The
+    # first argument is the output file, and the rest are the command.
     out = ctx.actions.declare_file(ctx.attr.name + ".txt")
+    args = ctx.actions.args()
+    args.add(out)
+    args.add(ctx.file._counter)
+    args.add(elf)
+    if ctx.attr.subroutine:
+        args.add("--subroutine", ctx.attr.subroutine)
+    args.add_all(ctx.attr.bounds, before_each = "--bound")
+    if ctx.attr.max_count >= 0:
+        args.add("--max-count", ctx.attr.max_count)
     ctx.actions.run_shell(
         outputs = [out],
         inputs = [ctx.file._counter, elf],
-        command = "{} {} > {}".format(ctx.file._counter.path, elf.path, out.path),
+        arguments = [args],
+        command = 'out="$1"; shift; "$@" > "$out"',
     )
 
     runfiles = ctx.runfiles(files = ([out]))
@@ -596,10 +644,27 @@ otbn_consttime_test = rule(
     },
 )
 
+otbn_consttime_audit_test = rule(
+    implementation = _otbn_consttime_audit_test_impl,
+    test = True,
+    attrs = {
+        "deps": attr.label_list(providers = [OutputGroupInfo]),
+        "manifest": attr.label(allow_single_file = [".json"], mandatory = True),
+        "_checker": attr.label(
+            default = "//hw/ip/otbn/util:check_const_time",
+            executable = True,
+            cfg = "exec",
+        ),
+    },
+)
+
 otbn_insn_count_range = rule(
     implementation = _otbn_insn_count_range,
     attrs = {
         "deps": attr.label_list(providers = [OutputGroupInfo]),
+        "subroutine": attr.string(),
+        "bounds": attr.string_list(),
+        "max_count": attr.int(default = -1),
         "_counter": attr.label(
             default = "//hw/ip/otbn/util:get_instruction_count_range.py",
             allow_single_file = True,
@@ -7,15 +7,14 @@
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
 import os
-from multiprocessing import Pool
-import sqlite3
-import time
+import random
+from typing import Optional
 from dilithiumpy.src.dilithium_py.ml_dsa.default_parameters import ML_DSA_44, ML_DSA_65, ML_DSA_87
 from otbn_interface import key_pair_otbn, sign_otbn, verify_otbn
-from create_db import create_db
+from hw.ip.otbn.util.otbn_sim_py import get_prepared_program
+from hw.ip.otbn.util.otbn_sim_py_bench import iteration_seeds, run_iterations
+from hw.ip.otbn.util.otbn_sim_py_bench_db import BenchmarkStore
 
-NPROC = 1
-ITERATIONS = 1
 
 CTX=b"\x00"*4+b"\x11"*4+b"\x22"*4+b"\x33"*4+b"\x44"*4+b"\x55"*4+b"\x66"*4+b"\x77"*4
 CTXLEN = 32
@@ -24,8 +23,9 @@ DATABASE_PATH = os.path.realpath(os.path.dirname(os.path.realpath(__file__)) +
                                  '../../../../../../../mldsa_bench.db')
 
 
-def bench_key_pair(operation, ref):
-    rand = os.urandom(32)
+def bench_key_pair(operation, ref, seed):
+    rng = random.Random(seed)
+    rand = rng.randbytes(32)
     # reference computation
     # use internal keygen to pass randomness
     pk, sk = ref._keygen_internal(rand)
@@ -47,9 +47,10 @@ def bench_key_pair(operation, ref):
     return stat_data
 
 
-def bench_sign(operation, ref):
-    rand = os.urandom(32)
-    msg = os.urandom(64)
+def bench_sign(operation, ref, seed):
+    rng = random.Random(seed)
+    rand = rng.randbytes(32)
+    msg = rng.randbytes(64)
     # reference keys
     # use internal keygen to pass randomness
     _, sk = ref._keygen_internal(rand)
@@ -71,9 +72,10 @@ def bench_sign(operation, ref):
     return stat_data
 
 
-def bench_verify(operation, ref):
-    rand = os.urandom(32)
-    msg = os.urandom(64)
+def bench_verify(operation, ref, seed):
+    rng = random.Random(seed)
+    rand = rng.randbytes(32)
+    msg = rng.randbytes(64)
     # reference keys
     # use internal keygen to pass randomness
     pk, sk = ref._keygen_internal(rand)
@@ -96,11 +98,9 @@ def bench_verify(operation, ref):
     return stat_data
 
 
-def run_bench(operation: str):
+def run_bench(operation: str, iterations: int = 1, workers: int = 1,
+              seed: Optional[int] = None):
     if __name__ == "sw.otbn.crypto.tests.mldsa.dilithiumpy_bench_otbn.bench_dilithium":
-        con = sqlite3.connect(DATABASE_PATH)
-        cur = con.cursor()
-        create_db(cur)
         print(f"Benchmark {operation}")
 
         # select funciton
@@ -124,30 +124,28 @@ def run_bench(operation: str):
             print("No ref function detected")
             exit(-1)
 
-        results = []
-        start_time = int(time.time())
-        for _ in range(ITERATIONS // NPROC):
-            with Pool(NPROC) as p:
-                results += p.starmap(func, [(operation, ref_func)]*NPROC)
-        end_time = int(time.time())
-
-        if -1 in results:
-            print("Error in Computation")
+        # Read and decode the ELF once, here. The worker processes are forked
+        # from this one, so they inherit the prepared program.
+        get_prepared_program(operation)
+
+        # The benchmark row is written first and updated as iterations come
+        # in, so the iterations that finished are kept even if some fail or
+        # the run gets interrupted.
+        seeds = iteration_seeds(iterations, seed)
+        failed = 0
+        with BenchmarkStore(DATABASE_PATH, operation) as store:
+            for it in run_iterations(func, (operation, ref_func), seeds,
+                                     workers):
+                if it.error is not None or it.result == -1:
+                    failed += 1
+                    print(f"Error in iteration {it.index} (seed {it.seed})")
+                    if it.error is not None:
+                        print(it.error)
+                    continue
+
+                store.add_iteration(it.result)
+                print(f"{store.stored + failed}/{iterations} iterations done")
+
+        if failed:
+            print(f"Error in Computation ({failed} of {iterations} iterations failed)")
             exit(-1)
-
-        cur.execute(f"INSERT INTO benchmark (start_time, end_time, iterations, operation) VALUES({start_time}, {end_time}, {ITERATIONS}, '{operation}')")
-        current_benchmark_id = cur.lastrowid
-        for result in results:
-            if result == -1:
-                continue
-            cur.execute(f"INSERT INTO benchmark_iteration (benchmark_id) VALUES({current_benchmark_id})")
-            current_benchmark_iteration_id = cur.lastrowid
-            cur.execute(f"INSERT INTO cycles (cycles, benchmark_iteration_id) VALUES({result['insn_count'] + result['stall_count']}, {current_benchmark_iteration_id})")
-            cur.execute(f"INSERT INTO stalls (stalls, benchmark_iteration_id) VALUES({result['stall_count']}, {current_benchmark_iteration_id})")
-            for func_name, per_instr_data in result["func_instrs"].items():
-                for instr_name, cyc_stall in per_instr_data.items():
-                    cur.execute(f"INSERT INTO func_instrs (func_name, instr_name, instr_count, stall_count, benchmark_iteration_id) VALUES('{func_name}', '{instr_name}', {cyc_stall[0]}, {cyc_stall[1]}, {current_benchmark_iteration_id})")
-            for callee_func_name, caller_data in result["func_calls"].items():
-                for caller_func_name, call_count in caller_data.items():
-                    cur.execute(f"INSERT INTO func_calls (caller_func_name, callee_func_name, call_count, benchmark_iteration_id) VALUES('{caller_func_name}', '{callee_func_name}', {call_count}, {current_benchmark_iteration_id})")
-        con.commit()
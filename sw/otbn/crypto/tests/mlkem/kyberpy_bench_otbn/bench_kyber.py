@@ -7,23 +7,23 @@
 # Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
 
 import os
-from multiprocessing import Pool
-import sqlite3
-import time
+import random
+from typing import Optional
 
 from kyberpy.src.kyber_py.ml_kem import ML_KEM_512, ML_KEM_768, ML_KEM_1024
 from otbn_interface import mlkem_keypair_otbn, mlkem_encaps_otbn, mlkem_decaps_otbn
-from create_db import create_db
+from hw.ip.otbn.util.otbn_sim_py import get_prepared_program
+from hw.ip.otbn.util.otbn_sim_py_bench import iteration_seeds, run_iterations
+from hw.ip.otbn.util.otbn_sim_py_bench_db import BenchmarkStore
 
-NPROC = 1
-ITERATIONS = 1
 
 DATABASE_PATH = os.path.realpath(os.path.dirname(os.path.realpath(__file__)) +
                                  '../../../../../../../mlkem_bench.db')
 
-def bench_mlkem_keypair(operation, ref):
-    d = os.urandom(32)
-    z = os.urandom(32)
+def bench_mlkem_keypair(operation, ref, seed):
+    rng = random.Random(seed)
+    d = rng.randbytes(32)
+    z = rng.randbytes(32)
 
     ek, dk = ref._keygen_internal(d, z)
 
@@ -48,10 +48,11 @@ def bench_mlkem_keypair(operation, ref):
     return stat_data
 
 
-def bench_mlkem_encaps(operation, ref):
-    d = os.urandom(32)
-    z = os.urandom(32)
-    m = os.urandom(32)
+def bench_mlkem_encaps(operation, ref, seed):
+    rng = random.Random(seed)
+    d = rng.randbytes(32)
+    z = rng.randbytes(32)
+    m = rng.randbytes(32)
 
     ek, dk = ref._keygen_internal(d, z)
     K, c = ref._encaps_internal(ek, m)
@@ -79,10 +80,11 @@ def bench_mlkem_encaps(operation, ref):
     return stat_data
 
 
-def bench_mlkem_decaps(operation, ref):
-    d = os.urandom(32)
-    z = os.urandom(32)
-    m = os.urandom(32)
+def bench_mlkem_decaps(operation, ref, seed):
+    rng = random.Random(seed)
+    d = rng.randbytes(32)
+    z = rng.randbytes(32)
+    m = rng.randbytes(32)
 
     ek, dk = ref._keygen_internal(d, z)
     K, c = ref._encaps_internal(ek, m)
@@ -103,12 +105,10 @@ def bench_mlkem_decaps(operation, ref):
     return stat_data
 
 
-def run_bench(operation: str):
+def run_bench(operation: str, iterations: int = 1, workers: int = 1,
+              seed: Optional[int] = None):
     if __name__ == "sw.otbn.crypto.tests.mlkem.kyberpy_bench_otbn.bench_kyber":
         print(DATABASE_PATH)
-        con = sqlite3.connect(DATABASE_PATH)
-        cur = con.cursor()
-        create_db(cur)
         print(f"Benchmark {operation}")
 
         # select funciton
@@ -132,30 +132,28 @@ def run_bench(operation: str):
             print("No ref function detected")
             exit(-1)
 
-        results = []
-        start_time = int(time.time())
-        for _ in range(ITERATIONS // NPROC):
-            with Pool(NPROC) as p:
-                results += p.starmap(func, [(operation, ref_func)]*NPROC)
-        end_time = int(time.time())
-
-        if -1 in results:
-            print("Error in Computation")
+        # Read and decode the ELF once, here. The worker processes are forked
+        # from this one, so they inherit the prepared program.
+        get_prepared_program(operation)
+
+        # The benchmark row is written first and updated as iterations come
+        # in, so the iterations that finished are kept even if some fail or
+        # the run gets interrupted.
+        seeds = iteration_seeds(iterations, seed)
+        failed = 0
+        with BenchmarkStore(DATABASE_PATH, operation) as store:
+            for it in run_iterations(func, (operation, ref_func), seeds,
+                                     workers):
+                if it.error is not None or it.result == -1:
+                    failed += 1
+                    print(f"Error in iteration {it.index} (seed {it.seed})")
+                    if it.error is not None:
+                        print(it.error)
+                    continue
+
+                store.add_iteration(it.result)
+                print(f"{store.stored + failed}/{iterations} iterations done")
+
+        if failed:
+            print(f"Error in Computation ({failed} of {iterations} iterations failed)")
             exit(-1)
-
-        cur.execute(f"INSERT INTO benchmark (start_time, end_time, iterations, operation) VALUES({start_time}, {end_time}, {ITERATIONS}, '{operation}')")
-        current_benchmark_id = cur.lastrowid
-        for result in results:
-            if result == -1:
-                continue
-            cur.execute(f"INSERT INTO benchmark_iteration (benchmark_id) VALUES({current_benchmark_id})")
-            current_benchmark_iteration_id = cur.lastrowid
-            cur.execute(f"INSERT INTO cycles (cycles, benchmark_iteration_id) VALUES({result['insn_count'] + result['stall_count']}, {current_benchmark_iteration_id})")
-            cur.execute(f"INSERT INTO stalls (stalls, benchmark_iteration_id) VALUES({result['stall_count']}, {current_benchmark_iteration_id})")
-            for func_name, per_instr_data in result["func_instrs"].items():
-                for instr_name, cyc_stall in per_instr_data.items():
-                    cur.execute(f"INSERT INTO func_instrs (func_name, instr_name, instr_count, stall_count, benchmark_iteration_id) VALUES('{func_name}', '{instr_name}', {cyc_stall[0]}, {cyc_stall[1]}, {current_benchmark_iteration_id})")
-            for callee_func_name, caller_data in result["func_calls"].items():
-                for caller_func_name, call_count in caller_data.items():
-                    cur.execute(f"INSERT INTO func_calls (caller_func_name, callee_func_name, call_count, benchmark_iteration_id) VALUES('{caller_func_name}', '{callee_func_name}', {call_count}, {current_benchmark_iteration_id})")
-        con.commit()
@@ -14,6 +14,7 @@ sys.path.append(os.path.realpath(os.path.dirname(os.path.realpath(__file__)) +
                                  '../../../../../../../.venv/lib/python3.10/site-packages'))
 
 from hw.ip.otbn.util import otbn_sim_py_shared
+from hw.ip.otbn.util.otbn_sim_py_bench import add_bench_args
 
 def main() -> int:
     otbn_sim_py_shared.init()
@@ -31,6 +32,7 @@ def main() -> int:
     parser.add_argument('test_name',
                         help='Name of the test.')
     parser.add_argument('-v', '--verbose', action='store_true')
+    add_bench_args(parser)
 
     args = parser.parse_args()
     print(args)
@@ -46,7 +48,8 @@ def main() -> int:
     from sw.otbn.crypto.tests.mlkem.kyberpy_bench_otbn import bench_kyber
 
     # Run the simulator
-    bench_kyber.run_bench(args.test_name)
+    bench_kyber.run_bench(args.test_name, args.iterations, args.workers,
+                          args.seed)
 
     print("Done")
 
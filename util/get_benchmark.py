@@ -9,6 +9,7 @@
 
 import sqlite3
 import argparse
+import json
 from operator import add
 from collections import defaultdict
 from typing import List
@@ -96,14 +97,171 @@ def grouping(scheme):
 
     return group
 
+# Reads and writes of WSRs account to Keccak only for us, so the cycles of
+# these instructions are counted for "SHAKE" rather than the function.
+_SHAKE_INSTRS = ('bn.wsrr', 'bn.wsrw')
+
+# The version of the summaries that _summarize_iterations() computes. Bump it
+# whenever their contents change (for example, _SHAKE_INSTRS or the grouping
+# in SQL), so that summaries cached by an older version aren't used.
+_SUMMARY_VERSION = 1
+
+_CACHE_TABLE = (
+    "CREATE TABLE IF NOT EXISTS evaluation_cache("
+    "benchmark_id INTEGER, version INTEGER, last_iteration_id INTEGER, "
+    "summary TEXT, PRIMARY KEY (benchmark_id, version))"
+)
+
+
+def _open_cache(cur):
+    '''Create the evaluation_cache table, replacing one without versions.'''
+    columns = [row[1] for row in
+               cur.execute("PRAGMA table_info(evaluation_cache)")]
+    if columns and "version" not in columns:
+        # Written before summaries had versions: nothing in it can be trusted.
+        cur.execute("DROP TABLE evaluation_cache")
+    cur.execute(_CACHE_TABLE)
+
+
+def _summarize_iterations(cur, benchmark_id, after_iteration_id):
+    '''Summarize the iterations of a benchmark with ids above after_iteration_id.
+
+    The grouping and summing is done by SQLite. The result has, per iteration,
+    the cycle count, the [instructions, stalls] of each function (plus SHAKE)
+    and the count of each instruction. Functions and instructions are listed
+    in the order they were stored. It also has the call count rows of each
+    function.
+
+    '''
+    # A benchmark can store more iterations while this runs, so only read
+    # the ones that were there at the start. Otherwise a later query could
+    # see an iteration that the first one missed.
+    last_iteration_id, = cur.execute(
+        "SELECT MAX(id) FROM benchmark_iteration WHERE benchmark_id = ?",
+        (benchmark_id,)).fetchone()
+    if last_iteration_id is None:
+        last_iteration_id = after_iteration_id
+    params = (benchmark_id, after_iteration_id, last_iteration_id)
+    iterations = {}
+
+    res = cur.execute(
+        "SELECT benchmark_iteration.id, cycles FROM cycles JOIN benchmark_iteration "
+        "ON benchmark_iteration.id = cycles.benchmark_iteration_id "
+        "WHERE benchmark_iteration.benchmark_id = ? AND benchmark_iteration.id > ? "
+        "AND benchmark_iteration.id <= ? "
+        "ORDER BY benchmark_iteration.id", params)
+    for iteration_id, cycles in res:
+        iterations[iteration_id] = {"cycles": cycles, "funcs": None, "instrs": []}
+
+    shake = ','.join(['?'] * len(_SHAKE_INSTRS))
+    res = cur.execute(
+        "SELECT benchmark_iteration_id, func_name, "
+        f"SUM(CASE WHEN instr_name IN ({shake}) THEN 0 ELSE instr_count END), "
+        f"SUM(CASE WHEN instr_name IN ({shake}) THEN 0 ELSE stall_count END), "
+        f"SUM(CASE WHEN instr_name IN ({shake}) THEN instr_count ELSE 0 END), "
+        f"SUM(CASE WHEN instr_name IN ({shake}) THEN stall_count ELSE 0 END), "
+        f"COUNT(CASE WHEN instr_name IN ({shake}) THEN 1 END) "
+        "FROM func_instrs JOIN benchmark_iteration "
+        "ON benchmark_iteration.id = func_instrs.benchmark_iteration_id "
+        "WHERE benchmark_iteration.benchmark_id = ? AND benchmark_iteration.id > ? "
+        "AND benchmark_iteration.id <= ? "
+        "GROUP BY benchmark_iteration_id, func_name "
+        "ORDER BY benchmark_iteration_id, MIN(func_instrs.rowid)",
+        _SHAKE_INSTRS * 5 + params)
+    for iteration_id, func_name, instrs, stalls, shake_instrs, shake_stalls, has_shake in res:
+        funcs = iterations[iteration_id]["funcs"]
+        if funcs is None:
+            funcs = iterations[iteration_id]["funcs"] = {}
+        if has_shake:
+            funcs.setdefault("SHAKE", [0, 0])
+            funcs["SHAKE"] = [funcs["SHAKE"][0] + shake_instrs, funcs["SHAKE"][1] + shake_stalls]
+        funcs[func_name] = [instrs, stalls]
+
+    res = cur.execute(
+        "SELECT benchmark_iteration_id, instr_name, SUM(instr_count) "
+        "FROM func_instrs JOIN benchmark_iteration "
+        "ON benchmark_iteration.id = func_instrs.benchmark_iteration_id "
+        "WHERE benchmark_iteration.benchmark_id = ? AND benchmark_iteration.id > ? "
+        "AND benchmark_iteration.id <= ? "
+        "GROUP BY benchmark_iteration_id, instr_name "
+        "ORDER BY benchmark_iteration_id, MIN(func_instrs.rowid)", params)
+    for iteration_id, instr_name, count in res:
+        iterations[iteration_id]["instrs"].append([instr_name, count])
+
+    res = cur.execute(
+        "SELECT callee_func_name, call_count FROM func_calls JOIN benchmark_iteration "
+        "ON benchmark_iteration.id = func_calls.benchmark_iteration_id "
+        "WHERE benchmark_iteration.benchmark_id = ? AND benchmark_iteration.id > ? "
+        "AND benchmark_iteration.id <= ? "
+        "AND substr(callee_func_name, 1, 1) != '_'", params)
+    func_calls = [list(row) for row in res]
+
+    return {
+        "iterations": [[i, it["cycles"], it["funcs"], it["instrs"]]
+                       for i, it in iterations.items()],
+        "func_calls": func_calls,
+    }
+
+
+def _load_summary(con, benchmark_id, use_cache=True):
+    '''Get the summary of a benchmark, updating the cached one if needed.
+
+    Summaries are cached in the evaluation_cache table of the database, keyed
+    by the benchmark and _SUMMARY_VERSION. A cached summary is extended with
+    the iterations that were stored after it was computed, so the raw data of
+    each iteration is only read once.
+
+    '''
+    cur = con.cursor()
+    summary = {"iterations": [], "func_calls": []}
+    last_iteration_id = 0
+    if use_cache:
+        try:
+            _open_cache(cur)
+            row = cur.execute(
+                "SELECT last_iteration_id, summary FROM evaluation_cache "
+                "WHERE benchmark_id = ? AND version = ?",
+                (benchmark_id, _SUMMARY_VERSION)).fetchone()
+        except sqlite3.OperationalError:
+            # Probably a read-only database: go without the cache.
+            use_cache = False
+            row = None
+        if row is not None:
+            last_iteration_id = row[0]
+            summary = json.loads(row[1])
+
+    new = _summarize_iterations(cur, benchmark_id, last_iteration_id)
+    if not new["iterations"]:
+        return summary
+
+    summary["iterations"] += new["iterations"]
+    summary["func_calls"] += new["func_calls"]
+    if use_cache:
+        last_iteration_id = max(it[0] for it in summary["iterations"])
+        try:
+            with con:
+                # Summaries of other versions are never used again.
+                con.execute(
+                    "DELETE FROM evaluation_cache "
+                    "WHERE benchmark_id = ? AND version != ?",
+                    (benchmark_id, _SUMMARY_VERSION))
+                con.execute(
+                    "INSERT OR REPLACE INTO evaluation_cache "
+                    "(benchmark_id, version, last_iteration_id, summary) "
+                    "VALUES (?, ?, ?, ?)",
+                    (benchmark_id, _SUMMARY_VERSION, last_iteration_id,
+                     json.dumps(summary)))
+        except sqlite3.OperationalError:
+            pass
+    return summary
+
+
 class Evaluation:
-    def __init__(self, benchmark_ids: List, file_name: str = "dilithium_bench.db"):
+    def __init__(self, benchmark_ids: List, file_name: str = "dilithium_bench.db",
+                 use_cache: bool = True):
         self.benchmark_ids = benchmark_ids
-        self.iter_func_instr_to_perf = {}
         self.instr_hist_median = {}
-        self.func_instr_hist = {}
         self.iter_func_to_perf = {}
-        self.func_to_perf = {}
         self.iter_cycles = {}
         self.func_names = []
         self.func_calls = {}
@@ -123,97 +281,42 @@ class Evaluation:
             assert len(set(operations)) == 1
             self.operation = operations[0]
 
-            # Get cycles per iteration
-            query = (
-                "SELECT benchmark_iteration_id, cycles FROM cycles JOIN benchmark_iteration "
-                "ON benchmark_iteration.id = cycles.benchmark_iteration_id "
-                f"WHERE benchmark_iteration.benchmark_id IN ({','.join(['?']*len(benchmark_ids))})"
-            )
-            res = cur.execute(query, benchmark_ids)
-            el = res.fetchone()
-            while el is not None:
-                self.iter_cycles[el[0]] = el[1]
-                el = res.fetchone()
+            summaries = [_load_summary(con, i, use_cache) for i in benchmark_ids]
 
-            query = (
-                "SELECT benchmark_iteration_id, func_name, instr_name, instr_count, stall_count "
-                "FROM func_instrs JOIN benchmark_iteration "
-                "ON benchmark_iteration.id = func_instrs.benchmark_iteration_id "
-                f"WHERE benchmark_iteration.benchmark_id IN ({','.join(['?']*len(benchmark_ids))})"
-            )
-            res = cur.execute(query, benchmark_ids)
-            el = res.fetchone()
-            while el is not None:
-                if el[0] not in self.iter_func_instr_to_perf:
-                    self.iter_func_instr_to_perf[el[0]] = {}
-                if el[1] not in self.iter_func_instr_to_perf[el[0]]:
-                    self.iter_func_instr_to_perf[el[0]][el[1]] = {}
-                if el[2] not in self.iter_func_instr_to_perf[el[0]][el[1]]:
-                    self.iter_func_instr_to_perf[el[0]][el[1]][el[2]] = {}
-                self.iter_func_instr_to_perf[el[0]][el[1]][el[2]] = el[3:5]
-
-                el = res.fetchone()
-
-            # Initialize iter_func_to_perf
-            for i, func_stats in self.iter_func_instr_to_perf.items():
-                if i not in self.iter_func_to_perf:
-                    self.iter_func_to_perf[i] = {}
-                    self.iter_func_to_perf[i] = defaultdict(lambda: [0, 0], self.iter_func_to_perf[i])
-                for func_name, instruction_data in func_stats.items():
-                    # Treat the cycles for SHAKE as a special case
-                    _instruction_data = dict(instruction_data)
-                    # Reads/Writes from/to WSRs account to Keccak only for us
-                    shake_cycles = _instruction_data.pop('bn.wsrr', None)
-                    if shake_cycles is not None:
-                        self.iter_func_to_perf[i]["SHAKE"] = \
-                            list(map(add, self.iter_func_to_perf[i]["SHAKE"], shake_cycles))
-                    shake_cycles = _instruction_data.pop('bn.wsrw', None)
-                    if shake_cycles is not None:
-                        self.iter_func_to_perf[i]["SHAKE"] = \
-                            list(map(add, self.iter_func_to_perf[i]["SHAKE"], shake_cycles))
-                    self.iter_func_to_perf[i][func_name] = \
-                        [sum(x) for x in zip(*_instruction_data.values())]
-
-            # Verify no cycle got lost
-            for i, func_cycles in self.iter_func_to_perf.items():
-                assert self.iter_cycles[i] == sum([sum(x) for x in zip(*func_cycles.values())])
-
-            # Assume all function calls call the same function
-            self.func_names = list(next(iter(self.iter_func_to_perf.values())).keys())
-
-            # Get number of function calls total
-            query = (
-                "SELECT callee_func_name, call_count FROM func_calls JOIN benchmark_iteration "
-                "ON benchmark_iteration.id = func_calls.benchmark_iteration_id "
-                f"WHERE benchmark_iteration.benchmark_id IN ({','.join(['?']*len(benchmark_ids))})"
-            )
-            res = cur.execute(query, benchmark_ids)
-            el = res.fetchone()
-            while el is not None:
-                if not el[0].startswith("_"):
-                    self.func_calls[el[0]].append(el[1])
-                el = res.fetchone()
-            self.func_calls["SHAKE"] = [1]
-            self.func_calls["main"] = [1]
-            self.func_calls = dict(self.func_calls)
-
-            # Instruction Histogram Median
-            _instr_hist = {}
-            _instr_hist = defaultdict(lambda: [], _instr_hist)
-            for _, func_stats in self.iter_func_instr_to_perf.items():
-                instr_count = {}
-                instr_count = defaultdict(lambda: 0, instr_count)
-                for _, instruction_data in func_stats.items():
-                    for instr, instrcount_stalls in instruction_data.items():
-                        instr_count[instr] += instrcount_stalls[0]
-                for instr, instr_count in instr_count.items():
-                    _instr_hist[instr].append(instr_count)
-
-            for instr, instr_counts in _instr_hist.items():
-                self.instr_hist_median[instr] = round(median(instr_counts))
-
-            self.instr_hist_median = \
-                dict(sorted(self.instr_hist_median.items(), key=lambda item: item[1], reverse=True))
+        # Iterations in the order they were stored
+        iterations = sorted((it for s in summaries for it in s["iterations"]),
+                            key=lambda it: it[0])
+
+        _instr_hist = {}
+        _instr_hist = defaultdict(lambda: [], _instr_hist)
+        for i, cycles, funcs, instrs in iterations:
+            self.iter_cycles[i] = cycles
+            if funcs is not None:
+                self.iter_func_to_perf[i] = funcs
+            for instr, count in instrs:
+                _instr_hist[instr].append(count)
+
+        # Verify no cycle got lost
+        for i, func_cycles in self.iter_func_to_perf.items():
+            assert self.iter_cycles[i] == sum([sum(x) for x in zip(*func_cycles.values())])
+
+        # Assume all function calls call the same function
+        self.func_names = list(next(iter(self.iter_func_to_perf.values())).keys())
+
+        # Get number of function calls total
+        for s in summaries:
+            for callee_func_name, call_count in s["func_calls"]:
+                self.func_calls[callee_func_name].append(call_count)
+        self.func_calls["SHAKE"] = [1]
+        self.func_calls["main"] = [1]
+        self.func_calls = dict(self.func_calls)
+
+        # Instruction Histogram Median
+        for instr, instr_counts in _instr_hist.items():
+            self.instr_hist_median[instr] = round(median(instr_counts))
+
+        self.instr_hist_median = \
+            dict(sorted(self.instr_hist_median.items(), key=lambda item: item[1], reverse=True))
 
     def cycles(self, stat_func):
         return round(stat_func(self.iter_cycles.values()))
@@ -274,6 +377,12 @@ def main():
         action="store_true",
         help="If given, output latex file with \\DefineVar format"
     )
+    parser.add_argument(
+        '--no-cache',
+        action="store_true",
+        help=("Recompute the summary of each benchmark from the raw iteration data instead of "
+              "using (and updating) the summaries cached in the database")
+    )
     parser.add_argument(
         '--latex_filename',
         help="<Optional> Define the output latex file. Default: eval_result.tex",
@@ -295,7 +404,7 @@ def main():
     data = ""
     latex = ""
     for dben in entries:
-        e = Evaluation([dben], file_name=args.filename)
+        e = Evaluation([dben], file_name=args.filename, use_cache=not args.no_cache)
         data += (f" --- {e.operation}: index {dben} in {args.filename} ---\n")
 
         per_func_stat = e.per_func_stat(lambda x: round(STAT_FUNC(x)), per_call=False)
@@ -0,0 +1,192 @@
+# Copyright Ruben Niederhagen and Hoang Nguyen Hien Pham.
+# Licensed under the Apache License, Version 2.0, see LICENSE for details.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sqlite3
+import unittest
+
+import get_benchmark
+
+# The parts of the benchmark database (see
+# hw/ip/otbn/util/otbn_sim_py_bench_db.py) that the evaluation reads
+_SCHEMA = [
+    "CREATE TABLE benchmark_iteration(id INTEGER PRIMARY KEY, "
+    "benchmark_id INTEGER)",
+    "CREATE TABLE cycles(cycles INTEGER, benchmark_iteration_id INTEGER)",
+    "CREATE TABLE func_instrs(func_name TEXT, instr_name TEXT, "
+    "instr_count INTEGER, stall_count INTEGER, "
+    "benchmark_iteration_id INTEGER)",
+    "CREATE TABLE func_calls(caller_func_name TEXT, callee_func_name TEXT, "
+    "call_count INTEGER, benchmark_iteration_id INTEGER)",
+]
+
+# (func_name, instr_name, instr_count, stall_count) of one iteration
+_FUNC_INSTRS = [
+    ("main", "addi", 4, 0),
+    ("ntt", "bn.mulv", 10, 2),
+    ("main", "bn.wsrw", 3, 1),
+    ("ntt", "addi", 5, 0),
+    ("keccak_send_message", "bn.wsrw", 6, 0),
+]
+
+# (caller_func_name, callee_func_name, call_count) of one iteration
+_FUNC_CALLS = [
+    ("main", "ntt", 2),
+    ("ntt", "_ntt_inner", 8),
+    ("main", "keccak_send_message", 1),
+]
+
+
+class TestEvaluationCache(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        for statement in _SCHEMA:
+            self.con.execute(statement)
+
+    def tearDown(self):
+        self.con.close()
+
+    def add_iteration(self, iteration_id, benchmark_id=1):
+        cycles = sum(row[2] + row[3] for row in _FUNC_INSTRS)
+        with self.con:
+            self.con.execute("INSERT INTO benchmark_iteration VALUES (?, ?)",
+                             (iteration_id, benchmark_id))
+            self.con.execute("INSERT INTO cycles VALUES (?, ?)",
+                             (cycles, iteration_id))
+            self.con.executemany(
+                "INSERT INTO func_instrs VALUES (?, ?, ?, ?, ?)",
+                [row + (iteration_id,) for row in _FUNC_INSTRS])
+            self.con.executemany(
+                "INSERT INTO func_calls VALUES (?, ?, ?, ?)",
+                [row + (iteration_id,) for row in _FUNC_CALLS])
+
+    def cached(self):
+        return self.con.execute(
+            "SELECT benchmark_id, version, last_iteration_id "
+            "FROM evaluation_cache").fetchall()
+
+    def test_summarize_iterations(self):
+        """Functions, SHAKE instructions and calls are summed per iteration.
+        """
+        self.add_iteration(1)
+        self.add_iteration(2)
+        self.add_iteration(3, benchmark_id=2)
+
+        summary = get_benchmark._summarize_iterations(self.con.cursor(), 1, 0)
+        funcs = {
+            "SHAKE": [9, 1],
+            "main": [4, 0],
+            "ntt": [15, 2],
+            "keccak_send_message": [0, 0],
+        }
+        instrs = [["addi", 9], ["bn.mulv", 10], ["bn.wsrw", 9]]
+        self.assertEqual(summary["iterations"], [
+            [1, 31, funcs, instrs],
+            [2, 31, funcs, instrs],
+        ])
+        # Functions keep the order they were stored in, with SHAKE before the
+        # first function that used it.
+        self.assertEqual(list(summary["iterations"][0][2]),
+                         ["SHAKE", "main", "ntt", "keccak_send_message"])
+        # Calls to local labels are left out.
+        self.assertEqual(summary["func_calls"],
+                         [["ntt", 2], ["keccak_send_message", 1]] * 2)
+
+        # Only iterations after after_iteration_id are summarized.
+        summary = get_benchmark._summarize_iterations(self.con.cursor(), 1, 1)
+        self.assertEqual([it[0] for it in summary["iterations"]], [2])
+        summary = get_benchmark._summarize_iterations(self.con.cursor(), 1, 2)
+        self.assertEqual(summary, {"iterations": [], "func_calls": []})
+
+    def test_concurrent_iteration(self):
+        """An iteration stored while summarizing is left for the next time.
+        """
+        self.add_iteration(1)
+        test = self
+
+        class WritingCursor:
+            """A cursor that stores iteration 2 after the first query"""
+            def __init__(self):
+                self.cur = test.con.cursor()
+                self.queries = 0
+
+            def execute(self, *args):
+                res = self.cur.execute(*args)
+                self.queries += 1
+                if self.queries == 1:
+                    test.add_iteration(2)
+                return res
+
+        summary = get_benchmark._summarize_iterations(WritingCursor(), 1, 0)
+        self.assertEqual([it[0] for it in summary["iterations"]], [1])
+        self.assertEqual(summary["func_calls"],
+                         [["ntt", 2], ["keccak_send_message", 1]])
+
+        # The next summary has iteration 2 (and its calls) exactly once.
+        summary = get_benchmark._summarize_iterations(self.con.cursor(), 1, 1)
+        self.assertEqual([it[0] for it in summary["iterations"]], [2])
+        self.assertEqual(len(summary["func_calls"]), 2)
+
+    def test_load_summary(self):
+        """Cached summaries are extended with new iterations.
+        """
+        self.add_iteration(1)
+        first = get_benchmark._load_summary(self.con, 1)
+        self.assertEqual(self.cached(),
+                         [(1, get_benchmark._SUMMARY_VERSION, 1)])
+
+        self.add_iteration(2)
+        summary = get_benchmark._load_summary(self.con, 1)
+        self.assertEqual(summary,
+                         get_benchmark._load_summary(self.con, 1, False))
+        self.assertEqual(summary["iterations"][:1], first["iterations"])
+        self.assertEqual(self.cached(),
+                         [(1, get_benchmark._SUMMARY_VERSION, 2)])
+
+    def test_stale_version(self):
+        """Summaries cached by another version are recomputed.
+        """
+        self.add_iteration(1)
+        get_benchmark._load_summary(self.con, 1)
+        with self.con:
+            self.con.execute("UPDATE evaluation_cache SET version = ?, "
+                             "summary = ?",
+                             (get_benchmark._SUMMARY_VERSION - 1,
+                              json.dumps({"iterations": [],
+                                          "func_calls": []})))
+
+        summary = get_benchmark._load_summary(self.con, 1)
+        self.assertEqual(len(summary["iterations"]), 1)
+        self.assertEqual(self.cached(),
+                         [(1, get_benchmark._SUMMARY_VERSION, 1)])
+
+    def test_unversioned_cache(self):
+        """A cache table from before summaries had versions is replaced.
+        """
+        self.add_iteration(1)
+        with self.con:
+            self.con.execute(
+                "CREATE TABLE evaluation_cache(benchmark_id INTEGER PRIMARY "
+                "KEY, last_iteration_id INTEGER, summary TEXT)")
+            self.con.execute(
+                "INSERT INTO evaluation_cache VALUES (1, 1, ?)",
+                (json.dumps({"iterations": [], "func_calls": []}),))
+
+        summary = get_benchmark._load_summary(self.con, 1)
+        self.assertEqual(len(summary["iterations"]), 1)
+        self.assertEqual(self.cached(),
+                         [(1, get_benchmark._SUMMARY_VERSION, 1)])
+
+    def test_no_cache(self):
+        """Without the cache, nothing is written to the database.
+        """
+        self.add_iteration(1)
+        get_benchmark._load_summary(self.con, 1, use_cache=False)
+        tables = [row[0] for row in self.con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")]
+        self.assertNotIn("evaluation_cache", tables)
+
+
+if __name__ == '__main__':
+    unittest.main()
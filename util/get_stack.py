@@ -5,6 +5,7 @@
 # Licensed under the Apache License, Version 2.0, see LICENSE for details.
 # SPDX-License-Identifier: Apache-2.0
 
+import os
 import sys
 import re
 import argparse
@@ -16,9 +17,7 @@ from itertools import islice
 from tqdm import tqdm
 
 REPO_TOP = Path.cwd()
-STACK_SIZE_MLKEM = 20000
-STACK_SIZE_MLDSA = 112000
-STACK_SIZE_MLDSA_SIGN = {'44': 51200, '65': 78848, '87': 120832}
+OTBN_SIM = REPO_TOP / 'hw/ip/otbn/dv/otbnsim/standalone.py'
 
 def print_info(s):
     """Print info or error message
@@ -77,6 +76,27 @@ def target_list(scheme, verbose):
     return targets
 
 
+def target_elf(target):
+    """Get the path of the .elf file that bazel builds for a test target
+    """
+    package, name = target.lstrip('/').split(':', 1)
+    return REPO_TOP / 'bazel-bin' / package / f'{name}.elf'
+
+
+def target_bnmulv_version(target, verbose):
+    """Get the BNMULV version from the copts of a test target
+
+    This is the value of the --bnmulv_version_id option, or None if the
+    target doesn't set it.
+    """
+    query_cmd = ['./bazelisk.sh', 'query', '--output=build', target]
+    if verbose:
+        print_info(f'INFO: Running command {" ".join(query_cmd)}')
+    result = subprocess.run(query_cmd, stdout=subprocess.PIPE, text=True, check=True)
+    match = re.search(r'"--bnmulv_version_id=(\w+)"', result.stdout)
+    return match.group(1) if match else None
+
+
 def dict_print(stacks):
     """Pretty-print a dictionary
     """
@@ -139,17 +159,12 @@ def main() -> int:
     parser.add_argument(
         '-t', '--test_target',
         type=str,
-        metavar="[TEST_TARGET, STACK_SIZE]",
+        metavar="TEST_TARGET",
         help=(
-            "Specify a bazel 'otbn_sim_test' target and its stack size to get its stack usage\n"
-            "The BNMULV_VER must be given in the target 'copts' field as '--bnmulv_version_id='\n" \
-            "Otherwise, all targets will be built with BNMULV_VER = 0")
-    )
-    parser.add_argument(
-        '-ts', '--test_target_stack_size',
-        type=int,
-        metavar="STACK_SIZE",
-        help=("Specify the stack size of the given target to get its stack usage")
+            "Specify a bazel 'otbn_sim_test' target to get its stack usage\n"
+            "The BNMULV_VER is taken from the --bnmulv_version_id option in the copts of\n"
+            "the target. Otherwise, the target is built and run with the BNMULV_VER\n"
+            "environment variable, or with BNMULV_VER = 0 if that isn't set")
     )
     parser.add_argument(
         '--mlkem',
@@ -192,11 +207,6 @@ def main() -> int:
         print_info('ERROR: Please provide at least one of --test_target or --mlkem or --mldsa')
         return 1
 
-    # Abort if --test_target is not given with --test_target_stack_size
-    if args.test_target and not args.test_target_stack_size:
-        print_info('ERROR: --test_target must be used with --test_target_stack_size')
-        return 1
-
     # Abort if --test_target is given with --mlkem or --mldsa
     if args.test_target and (args.mlkem or args.mldsa):
         print_info('ERROR: --test_target cannot be used with --mlkem or --mldsa')
@@ -207,11 +217,6 @@ def main() -> int:
         print_info('ERROR: --output_latex must be used with --latex_filename')
         return 1
 
-    # Create a new file for logging stack usage
-    filename = f'{REPO_TOP}/stack_benchmark.txt'
-    filepath = Path(filename)
-    filepath.touch(exist_ok=True)
-
     # List supported targets
     targets = []
     schemes = []
@@ -230,52 +235,35 @@ def main() -> int:
         print('\n'.join(targets))
         return 0
 
-    # Assign correct STACK_SIZE for each target
-    targets_dict = {}
-    if args.test_target:
-        targets_dict[args.test_target] = args.test_target_stack_size
-    else:
-        for target in targets:
-            if 'mlkem' in target:
-                targets_dict[target] = STACK_SIZE_MLKEM
-            if 'mldsa' in target:
-                targets_dict[target] = STACK_SIZE_MLDSA
-                if 'sign' in target:
-                    if 'mldsa44' in target:
-                        targets_dict[target] = STACK_SIZE_MLDSA_SIGN['44']
-                    elif 'mldsa65' in target:
-                        targets_dict[target] = STACK_SIZE_MLDSA_SIGN['65']
-                    elif 'mldsa87' in target:
-                        targets_dict[target] = STACK_SIZE_MLDSA_SIGN['87']
-
-    # Run a bazel test target to get stack usage. We must add command argument --action_env since
-    # bazel test is sandboxed, and thus insn_ver*.py doesn't see "stack_benchmark.txt" created in
-    # REPO_TOP. Then, read the result logged in {REPO_TOP}/stack_benchmark.txt.
+    # Build each target and run its .elf file on the simulator, which reports
+    # how far the stack pointer moved.
     stacks = {'TARGET': 'STACK USAGE'}
     for target in tqdm(targets):
         print_info(f'INFO: Get stack usage for {target}')
-        cmd = (
-            f'./bazelisk.sh test --action_env=REPO_TOP={REPO_TOP} --action_env=STACK_BENCH=1 '
-            f'--action_env=STACK_SIZE={targets_dict[target]} --sandbox_writable_path={REPO_TOP} '
-            f'--cache_test_results=no {target}'
-        )
+        cmd = f'./bazelisk.sh build {target}'
+        bnmulv_ver = target_bnmulv_version(target, verbose)
+        if bnmulv_ver is None:
+            # Like the simulator, fall back on BNMULV_VER, and build for the
+            # same version that we run.
+            bnmulv_ver = os.environ.get('BNMULV_VER', '0')
+            if 'BNMULV_VER' in os.environ:
+                cmd += f' --copt=--bnmulv_version_id={bnmulv_ver}'
         if verbose:
             print_info(f'INFO: Running command {cmd}')
         subprocess.run(cmd, shell=True, check=True)
 
-        # Read out stack usage
-        stack = int(filepath.read_text().strip())
+        sim_cmd = [
+            sys.executable, str(OTBN_SIM),
+            '--bnmulv_version_id', bnmulv_ver,
+            '--dump-stack-usage', '-',
+            str(target_elf(target)),
+        ]
+        if verbose:
+            print_info(f'INFO: Running command {" ".join(sim_cmd)}')
+        result = subprocess.run(sim_cmd, stdout=subprocess.PIPE, text=True, check=True)
 
         # Add stack to stacks
-        stacks[target] = stack
-
-        # Write 0 to stack_benchmark.txt
-        filepath.write_text('0')
-        print_info(f'INFO: Reset to 0 in {filename}')
-
-    # Once done, we delete stack_benchmark.txt
-    filepath.unlink()
-    print_info(f'INFO: {filename} deleted')
+        stacks[target] = int(result.stdout.strip())
 
     # Print out stacks
     if not args.output_latex: